@@ -0,0 +1,50 @@
+"""
+Add sales.idempotency_key with a unique index.
+
+Checkout retries carry a client-generated key; the unique index makes a
+second insert with the same key fail so the retry is answered with the
+original sale.
+
+PostgreSQL:
+- add the nullable column if missing (no rewrite, existing rows stay NULL)
+- create the unique index concurrently
+
+Run:
+    python add_sale_idempotency_key.py
+"""
+import os
+import sys
+
+from sqlalchemy import text
+
+os.environ['FLASK_RUN_FROM_CLI'] = '1'
+sys.path.insert(0, os.getcwd())
+
+from app import create_app, db  # noqa: E402
+
+
+INDEX_NAME = 'uq_sales_idempotency_key'
+
+
+def ensure_sale_idempotency_key(app=None):
+    app = app or create_app(os.environ.get('FLASK_ENV', 'development'))
+
+    with app.app_context():
+        if db.engine.dialect.name != 'postgresql':
+            raise RuntimeError('This migration requires PostgreSQL.')
+
+        with db.engine.begin() as conn:
+            conn.execute(text(
+                "ALTER TABLE sales ADD COLUMN IF NOT EXISTS idempotency_key VARCHAR(64)"
+            ))
+
+        with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+            conn.execute(text(f"""
+                CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS {INDEX_NAME}
+                ON sales (idempotency_key)
+            """))
+        return 'created_postgresql'
+
+
+if __name__ == '__main__':
+    print(ensure_sale_idempotency_key())
@@ -5,7 +5,9 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_caching import Cache
 from flask_socketio import SocketIO
 
-db = SQLAlchemy()
+from app.utils.replica import RoutingSession
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 cache = Cache()
 socketio = SocketIO()
 
@@ -36,6 +38,10 @@ def create_app(config_name='default'):
     engine_options = dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
     app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options
 
+    # Optional reporting replica: a second bind with its own pool
+    from app.utils.replica import replica_binds
+    app.config['SQLALCHEMY_BINDS'] = {**(app.config.get('SQLALCHEMY_BINDS') or {}), **replica_binds(app)}
+
     app.logger.info(f"Strict PostgreSQL Mode: {app.config['SQLALCHEMY_DATABASE_URI']}")
 
     # ── Logging ───────────────────────────────────────────────────
@@ -49,6 +55,18 @@ def create_app(config_name='default'):
 
     db.init_app(app)
     cache.init_app(app)
+
+    from app.billing.cart_store import init_cart_store
+    init_cart_store(app)
+
+    from app.billing.events import init_sale_events
+    init_sale_events(app)
+
+    from app.inventory.barcode_cache import init_barcode_cache
+    init_barcode_cache(app)
+
+    from app.utils.replica import init_reporting_replica
+    init_reporting_replica(app)
     
     # Enable Redis message queue for SocketIO if REDIS_URL is present (critical for multi-worker prod)
     # Force websocket transport only to avoid Engine.IO polling session churn behind non-sticky balancing.
@@ -127,6 +145,8 @@ def create_app(config_name='default'):
     def db_error(e):
         """Handle lost DB connections gracefully."""
         db.session.rollback()
+        from app.utils.replica import replica_failed
+        replica_failed(e)
         # Log critical database failure
         app.logger.error(f"Database Connectivity Lost: {e}")
         from flask import render_template
@@ -142,18 +162,13 @@ def create_app(config_name='default'):
     def inject_current_user():
         """
         Makes `current_user` available in every Jinja template.
-        Fetches the User row from DB using session['user_id'].
+        A cached CurrentUser snapshot for session['user_id'] (see
+        app/auth/identity.py), not the ORM row.
         Returns None when not logged in — templates must guard with:
             {% if current_user %}
         """
-        from flask import session
-        from app.auth.models import User
-        user_id = session.get('user_id')
-        if user_id:
-            user = db.session.get(User, user_id)
-        else:
-            user = None
-        return {'current_user': user}
+        from app.auth.identity import get_current_user
+        return {'current_user': get_current_user()}
 
     # ── CLI Commands ──────────────────────────────────────────────
     register_commands(app)
@@ -187,16 +202,79 @@ def register_commands(app):
     @app.cli.command('show-sequences')
     def show_sequences():
         """Show current invoice sequence counters (diagnostic)."""
-        from app.billing.models import InvoiceSequence
+        from app.billing.models import InvoiceSequence, InvoiceSeriesSequence
         rows = InvoiceSequence.query.order_by(InvoiceSequence.year.desc()).all()
-        if not rows:
+        series_rows = (
+            InvoiceSeriesSequence.query
+            .order_by(InvoiceSeriesSequence.year.desc(), InvoiceSeriesSequence.series.asc())
+            .all()
+        )
+        click.echo(f'Invoice series mode: {app.config.get("INVOICE_SERIES_MODE", "global")}')
+        if not rows and not series_rows:
             click.echo('No sequence rows found. Run flask init-db first.')
             return
-        click.echo(f'{"Year":<8} {"Last Seq":<12} {"Next Invoice"}')
-        click.echo('─' * 35)
-        for row in rows:
-            next_inv = f'{row.year}-{row.last_seq + 1:04d}'
-            click.echo(f'{row.year:<8} {row.last_seq:<12} {next_inv}')
+        if rows:
+            click.echo(f'{"Year":<8} {"Last Seq":<12} {"Next Invoice"}')
+            click.echo('─' * 35)
+            for row in rows:
+                next_inv = f'{row.year}-{row.last_seq + 1:04d}'
+                click.echo(f'{row.year:<8} {row.last_seq:<12} {next_inv}')
+        if series_rows:
+            click.echo('')
+            click.echo(f'{"Year":<8} {"Counter":<10} {"Last Seq":<12} {"Next Invoice"}')
+            click.echo('─' * 50)
+            for row in series_rows:
+                next_inv = f'{row.year}-{row.series}-{row.last_seq + 1:06d}'
+                click.echo(f'{row.year:<8} {row.series:<10} {row.last_seq:<12} {next_inv}')
+
+    @app.cli.command('process-sale-events')
+    @click.option('--limit', default=500, show_default=True, help='Maximum events to apply')
+    def process_sale_events_command(limit):
+        """Apply pending post-sale side effects and list failing ones."""
+        from app.billing.events import MAX_ATTEMPTS, process_sale_events
+        from app.billing.models import SaleEvent
+        applied = process_sale_events(limit=limit)
+        click.echo(f'✅  Applied {applied} sale event(s).')
+        failing = (
+            SaleEvent.query
+            .filter(SaleEvent.processed_at.is_(None), SaleEvent.attempts > 0)
+            .order_by(SaleEvent.id.asc())
+            .all()
+        )
+        for event in failing:
+            state = 'DEAD' if event.attempts >= MAX_ATTEMPTS else 'retry'
+            click.echo(f'⚠️  #{event.id} sale {event.sale_id} {event.event_type} '
+                       f'[{state}, {event.attempts} attempts]: {event.last_error}')
+
+    @app.cli.command('prune-catalog-changes')
+    @click.option('--days', default=30, show_default=True, help='Keep changes newer than this')
+    def prune_catalog_changes_command(days):
+        """Trim the terminal catalog change log (older terminals re-download the snapshot)."""
+        from app.inventory.catalog import prune_catalog_changes
+        deleted = prune_catalog_changes(older_than_days=days)
+        click.echo(f'✅  Pruned {deleted} catalog change(s).')
+
+    @app.cli.command('rebuild-rollups')
+    @click.option('--start', type=click.DateTime(formats=['%Y-%m-%d']), default=None,
+                  help='First day to rebuild (default: all history)')
+    @click.option('--end', type=click.DateTime(formats=['%Y-%m-%d']), default=None,
+                  help='Last day to rebuild (default: all history)')
+    @click.option('--verify-only', is_flag=True, help='Compare rollups with the raw tables; change nothing')
+    def rebuild_rollups_command(start, end, verify_only):
+        """Backfill the dashboard sales rollups from the raw tables and verify them."""
+        from app.reporting.rollups import rebuild_rollups, verify_rollups
+        start_day = start.date() if start else None
+        end_day = end.date() if end else None
+        if not verify_only:
+            written = rebuild_rollups(start_day, end_day)
+            for table_name, rows in written.items():
+                click.echo(f'✅  {table_name}: {rows} row(s) written.')
+        mismatches = verify_rollups(start_day, end_day)
+        for table_name, day, measure, expected, actual in mismatches[:50]:
+            click.echo(f'⚠️  {table_name} {day} {measure}: raw {expected} ≠ rollup {actual}')
+        if mismatches:
+            raise click.ClickException(f'{len(mismatches)} rollup mismatch(es); run without --verify-only to rebuild.')
+        click.echo('✅  Rollups match the raw tables.')
 
 
     @app.cli.command('seed-admin')
@@ -288,6 +366,7 @@ def register_commands(app):
         """Populate database with demo data."""
         from app.auth.models import User, RoleEnum
         from app.inventory.models import Product, InventoryLog
+        from app.inventory.catalog import record_catalog_change
         from app.billing.models import Sale, SaleItem, CashSession
         from app.billing.invoice import generate_invoice_number
         import random
@@ -334,6 +413,7 @@ def register_commands(app):
                 
                 log = InventoryLog(product_id=p.id, old_stock=0, new_stock=stock, reason="Initial Demo Stock")
                 db.session.add(log)
+                record_catalog_change(p.id)
             
             db.session.commit()
             click.echo("✅ Products seeded.")
@@ -344,6 +424,8 @@ def register_commands(app):
             s = CashSession(cashier_id=c1.id, opening_cash=Decimal('1000.00'), system_total=0)
             db.session.add(s)
             db.session.commit()
+            from app.auth.identity import invalidate_cash_session
+            invalidate_cash_session(c1.id)
             click.echo("✅ Active session created for cashier1.")
 
         click.echo("✅ Demo seed complete.")
@@ -0,0 +1,160 @@
+"""
+app/auth/identity.py
+--------------------
+Cached lookups for the logged-in user and their open cash session.
+
+Every template render used to run db.session.get(User, …) for
+`current_user`, and every billing request ran a CashSession query in
+enforce_session(), so an HTMX scan paid two queries before doing any
+real work. Both are now resolved in two tiers:
+
+  1. request scope — flask.g, so repeated calls within one request are free
+  2. shared cache  — Flask-Caching, keyed by user id, with a short TTL
+
+The cached user is a CurrentUser snapshot (plain values, safe to pickle
+into Redis), not an ORM instance. Entries are keyed by user id rather
+than stored in the cookie so an admin can invalidate another user's
+entry, e.g. when disabling the account.
+
+Invalidate explicitly whenever the underlying rows change:
+  - invalidate_user()          on logout and user enable/disable
+  - invalidate_cash_session()  on opening or closing a cash session
+The TTL only bounds staleness for changes made outside those paths.
+"""
+from dataclasses import dataclass
+from typing import Optional
+
+from flask import g, session
+
+from app import cache, db
+from app.auth.models import RoleEnum
+
+
+IDENTITY_TTL = 60        # seconds
+CASH_SESSION_TTL = 30    # seconds
+
+NO_CASH_SESSION = 0      # cached "no open session" (None means cache miss)
+
+
+@dataclass(frozen=True)
+class CurrentUser:
+    """Template-facing snapshot of a User row."""
+    id:        int
+    name:      str
+    username:  str
+    role:      RoleEnum
+    is_active: bool
+
+    @classmethod
+    def from_model(cls, user) -> 'CurrentUser':
+        return cls(
+            id=user.id,
+            name=user.name,
+            username=user.username,
+            role=user.role,
+            is_active=user.is_active,
+        )
+
+    @property
+    def is_admin(self) -> bool:
+        return self.role == RoleEnum.admin
+
+    @property
+    def is_authenticated(self) -> bool:
+        return True
+
+    @property
+    def is_anonymous(self) -> bool:
+        return False
+
+    def get_id(self) -> str:
+        return str(self.id)
+
+
+def _user_key(user_id) -> str:
+    return f"identity_user_{user_id}"
+
+
+def _cash_session_key(user_id) -> str:
+    return f"identity_cash_session_{user_id}"
+
+
+def _cache_get(key):
+    try:
+        return cache.get(key)
+    except Exception:
+        return None
+
+
+def _cache_set(key, value, timeout) -> None:
+    try:
+        cache.set(key, value, timeout=timeout)
+    except Exception:
+        pass
+
+
+def _cache_delete(key) -> None:
+    try:
+        cache.delete(key)
+    except Exception:
+        pass
+
+
+def get_current_user() -> Optional[CurrentUser]:
+    """Snapshot of the logged-in user, or None when not logged in."""
+    user_id = session.get('user_id')
+    if not user_id:
+        return None
+
+    cached = g.get('identity_user')
+    if cached is not None and cached.id == user_id:
+        return cached
+
+    snapshot = _cache_get(_user_key(user_id))
+    if snapshot is None:
+        from app.auth.models import User
+        user = db.session.get(User, user_id)
+        if user is None:
+            return None
+        snapshot = CurrentUser.from_model(user)
+        _cache_set(_user_key(user_id), snapshot, IDENTITY_TTL)
+
+    g.identity_user = snapshot
+    return snapshot
+
+
+def get_active_cash_session_id(user_id) -> Optional[int]:
+    """Id of the user's open cash session, or None."""
+    memo = g.setdefault('identity_cash_sessions', {})
+    if user_id in memo:
+        return memo[user_id]
+
+    session_id = _cache_get(_cash_session_key(user_id))
+    if session_id is None:
+        from app.billing.models import CashSession
+        session_id = (
+            db.session.query(CashSession.id)
+            .filter(
+                CashSession.cashier_id == user_id,
+                CashSession.end_time.is_(None),
+            )
+            .order_by(CashSession.id.desc())
+            .limit(1)
+            .scalar()
+        ) or NO_CASH_SESSION
+        _cache_set(_cash_session_key(user_id), session_id, CASH_SESSION_TTL)
+
+    memo[user_id] = session_id or None
+    return memo[user_id]
+
+
+def invalidate_user(user_id) -> None:
+    _cache_delete(_user_key(user_id))
+    cached = g.get('identity_user')
+    if cached is not None and cached.id == user_id:
+        g.pop('identity_user', None)
+
+
+def invalidate_cash_session(user_id) -> None:
+    _cache_delete(_cash_session_key(user_id))
+    g.get('identity_cash_sessions', {}).pop(user_id, None)
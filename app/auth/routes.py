@@ -2,6 +2,7 @@ from flask import render_template, redirect, url_for, request, session, flash, c
 from app.auth import auth
 from app.auth.models import User
 from app.auth.decorators import login_required, admin_required
+from app.auth.identity import invalidate_user
 
 
 @auth.route('/login', methods=['GET', 'POST'])
@@ -52,6 +53,7 @@ def login():
 @login_required
 def logout():
     """Clear the session and redirect to login."""
+    invalidate_user(session['user_id'])
     session.clear()
     flash('You have been logged out.', 'info')
     return redirect(url_for('auth.login'))
@@ -109,6 +111,7 @@ def toggle_user_status(user_id):
 
     user.is_active = not user.is_active
     db.session.commit()
+    invalidate_user(user.id)
     
     status = "enabled" if user.is_active else "disabled"
     flash(f'User {user.username} has been {status}.', 'success')
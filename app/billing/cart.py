@@ -1,30 +1,187 @@
+import secrets
 from decimal import Decimal
 
-from flask import session
+from flask import current_app, session
 
 
-CART_KEY = 'cart'
+CART_KEY = 'cart'             # legacy: whole cart inside the signed cookie
+CART_META_KEY = 'cart_meta'   # legacy: running totals next to the cookie cart
+CART_ID_KEY = 'cart_id'       # server-side store: only this id lives in the cookie
 
+Q = Decimal('0.01')
 
-def get_cart() -> dict:
-    return session.get(CART_KEY, {})
+
+def _line_amounts(item) -> tuple:
+    """(line_subtotal, line_gst) for one cart line, rounded per line."""
+    price = Decimal(item['price'])
+    qty = Decimal(item['quantity'])
+    gst_rate = Decimal(item['gst_percent']) / Decimal('100')
+
+    line_subtotal = (price * qty).quantize(Q)
+    line_gst = (line_subtotal * gst_rate).quantize(Q)
+    return line_subtotal, line_gst
+
+
+class Cart(dict):
+    """
+    Cart lines keyed by str(variant_id), with maintained running totals.
+
+    Reads exactly like the plain dict it replaces. Every line carries its
+    own ``line_subtotal`` / ``line_gst``; writes go through put_line() /
+    drop_line(), which adjust ``subtotal`` / ``gst_total`` by the touched
+    line only and bump ``version``. ``token`` (cart id + version) identifies
+    this exact cart content for caching derived results such as promotions.
+    """
+
+    def __init__(self, lines=None, meta=None, cart_id=None):
+        super().__init__(lines or {})
+        meta = meta or {}
+        self.cart_id = cart_id
+        self.version = int(meta.get('version', 0))
+
+        if 'subtotal' in meta and 'gst_total' in meta:
+            self.subtotal = Decimal(meta['subtotal'])
+            self.gst_total = Decimal(meta['gst_total'])
+        else:
+            # Cart saved before totals were maintained: price every line once.
+            self.subtotal = Decimal('0')
+            self.gst_total = Decimal('0')
+            for item in self.values():
+                line_subtotal, line_gst = self._stamp(item)
+                self.subtotal += line_subtotal
+                self.gst_total += line_gst
+
+    @staticmethod
+    def _stamp(item) -> tuple:
+        line_subtotal, line_gst = _line_amounts(item)
+        item['line_subtotal'] = str(line_subtotal)
+        item['line_gst'] = str(line_gst)
+        return line_subtotal, line_gst
+
+    def _unstamp(self, item) -> None:
+        self.subtotal -= Decimal(item['line_subtotal'])
+        self.gst_total -= Decimal(item['line_gst'])
+
+    def put_line(self, key: str, item: dict) -> None:
+        """Insert or replace one line; totals move by the difference only."""
+        old = self.get(key)
+        if old is not None:
+            self._unstamp(old)
+        line_subtotal, line_gst = self._stamp(item)
+        self.subtotal += line_subtotal
+        self.gst_total += line_gst
+        self[key] = item
+        self.version += 1
+
+    def drop_line(self, key: str) -> None:
+        old = self.pop(key, None)
+        if old is not None:
+            self._unstamp(old)
+            self.version += 1
+
+    @property
+    def token(self):
+        return f"{self.cart_id}.{self.version}" if self.cart_id else None
+
+    def meta(self) -> dict:
+        return {
+            'version': self.version,
+            'subtotal': str(self.subtotal),
+            'gst_total': str(self.gst_total),
+        }
+
+    def totals(self) -> dict:
+        return {
+            'subtotal': self.subtotal,
+            'gst_total': self.gst_total,
+            'grand_total': self.subtotal + self.gst_total,
+        }
+
+
+def _store():
+    return current_app.extensions.get('cart_store')
+
+
+def _cart_from_payload(payload, cart_id) -> Cart:
+    if payload and 'lines' in payload:
+        return Cart(payload['lines'], payload.get('meta'), cart_id)
+    # Stored before running totals existed: the payload is the bare lines dict.
+    return Cart(payload, None, cart_id)
+
+
+def load_cart(cart_id) -> Cart:
+    """Read a cart straight from the server-side store (diagnostics/tests)."""
+    store = _store()
+    if store is None or not cart_id:
+        return Cart(cart_id=cart_id)
+    return _cart_from_payload(store.load(cart_id), cart_id)
+
+
+def get_cart() -> Cart:
+    store = _store()
+    if store is None:
+        return Cart(session.get(CART_KEY), session.get(CART_META_KEY), session.get(CART_ID_KEY))
+
+    # A cart still carried in the cookie (pre-upgrade session, or saved
+    # while the store was down) is moved into the store on first touch.
+    if CART_KEY in session:
+        cart = Cart(session.pop(CART_KEY), session.pop(CART_META_KEY, None))
+        _save_cart(cart)
+        return cart
+
+    return load_cart(session.get(CART_ID_KEY))
+
+
+def _save_cart(cart: Cart) -> None:
+    cart_id = session.get(CART_ID_KEY)
+    if not cart_id:
+        cart_id = secrets.token_urlsafe(12)
+        session[CART_ID_KEY] = cart_id
+    cart.cart_id = cart_id
+
+    store = _store()
+    if store is None:
+        session[CART_KEY] = dict(cart)
+        session[CART_META_KEY] = cart.meta()
+        session.modified = True
+        return
+
+    payload = {'lines': dict(cart), 'meta': cart.meta()}
+    if store.save(cart_id, payload):
+        return
+    # Store unavailable: carry the cart in the cookie until it is back.
+    session[CART_KEY] = payload['lines']
+    session[CART_META_KEY] = payload['meta']
+    session.modified = True
 
 
 def add_to_cart(variant) -> None:
+    add_many_to_cart([(variant, 1)])
+
+
+def add_many_to_cart(entries) -> None:
+    """Add ``[(variant, quantity), …]`` with one cart load and one save."""
     cart = get_cart()
+    for variant, quantity in entries:
+        _add_line(cart, variant, quantity)
+    _save_cart(cart)
+
+
+def _add_line(cart, variant, quantity: int) -> None:
     key = str(variant.id)
     product = variant.product
 
     if key in cart:
-        cart[key]['quantity'] += 1
+        item = dict(cart[key])
+        item['quantity'] += quantity
     else:
-        cart[key] = {
+        item = {
             'product_id': product.id,
             'name': product.name,
             'barcode': variant.barcode,
             'price': str(variant.price),
             'gst_percent': product.gst_percent,
-            'quantity': 1,
+            'quantity': quantity,
             'is_weighed': False,
             'weight_kg': None,
             'price_per_kg': None,
@@ -33,8 +190,7 @@ def add_to_cart(variant) -> None:
             'color': variant.color,
         }
 
-    session[CART_KEY] = cart
-    session.modified = True
+    cart.put_line(key, item)
 
 
 def add_weighed_to_cart(variant, weight_kg: Decimal) -> None:
@@ -44,10 +200,11 @@ def add_weighed_to_cart(variant, weight_kg: Decimal) -> None:
     line_price = (Decimal(str(product.price_per_kg)) * weight_kg).quantize(Decimal('0.01'))
 
     if key in cart and cart[key].get('is_weighed'):
-        cart[key]['weight_kg'] = str(weight_kg)
-        cart[key]['price'] = str(line_price)
+        item = dict(cart[key])
+        item['weight_kg'] = str(weight_kg)
+        item['price'] = str(line_price)
     else:
-        cart[key] = {
+        item = {
             'product_id': product.id,
             'name': product.name,
             'barcode': variant.barcode,
@@ -62,8 +219,8 @@ def add_weighed_to_cart(variant, weight_kg: Decimal) -> None:
             'color': variant.color,
         }
 
-    session[CART_KEY] = cart
-    session.modified = True
+    cart.put_line(key, item)
+    _save_cart(cart)
 
 
 def update_cart_quantity(variant_id: int, quantity: int) -> None:
@@ -72,38 +229,41 @@ def update_cart_quantity(variant_id: int, quantity: int) -> None:
 
     if key in cart:
         if quantity <= 0:
-            cart.pop(key)
+            cart.drop_line(key)
         else:
-            cart[key]['quantity'] = quantity
+            item = dict(cart[key])
+            item['quantity'] = quantity
+            cart.put_line(key, item)
 
-        session[CART_KEY] = cart
-        session.modified = True
+        _save_cart(cart)
 
 
 def remove_from_cart(variant_id: int) -> None:
     cart = get_cart()
-    cart.pop(str(variant_id), None)
-    session[CART_KEY] = cart
-    session.modified = True
+    cart.drop_line(str(variant_id))
+    _save_cart(cart)
 
 
 def clear_cart() -> None:
     session.pop(CART_KEY, None)
+    session.pop(CART_META_KEY, None)
+    # Rotate the id so the next cart never shares a cache token with this one.
+    cart_id = session.pop(CART_ID_KEY, None)
     session.modified = True
+    store = _store()
+    if store is not None and cart_id:
+        store.delete(cart_id)
 
 
 def cart_totals(cart: dict) -> dict:
+    if isinstance(cart, Cart):
+        return cart.totals()
+
     subtotal = Decimal('0')
     gst_total = Decimal('0')
 
     for item in cart.values():
-        price = Decimal(item['price'])
-        qty = Decimal(item['quantity'])
-        gst_rate = Decimal(item['gst_percent']) / Decimal('100')
-
-        line_subtotal = (price * qty).quantize(Decimal('0.01'))
-        line_gst = (line_subtotal * gst_rate).quantize(Decimal('0.01'))
-
+        line_subtotal, line_gst = _line_amounts(item)
         subtotal += line_subtotal
         gst_total += line_gst
 
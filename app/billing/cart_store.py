@@ -0,0 +1,138 @@
+"""
+app/billing/cart_store.py
+-------------------------
+Server-side storage for billing carts.
+
+The signed session cookie only carries a short random cart id; the cart
+itself (names, barcodes, prices, sizes, colours per line) lives here, so a
+scan no longer re-serialises and re-signs the whole basket into the
+cookie, and large apparel baskets no longer run into the ~4 KB cookie cap.
+
+Backends (CART_BACKEND config):
+  'server'  → RedisCartStore when REDIS_URL is set (shared by all workers),
+              InProcessCartStore without it under debug/testing, and the
+              cookie cart otherwise (see below)
+  'session' → no store; cart.py falls back to the legacy cookie cart
+
+InProcessCartStore lives and dies with the worker: every open cart would
+be lost when gunicorn recycles it (the Procfile's --max-requests does so
+every ~1000 requests, i.e. scans) or on a deploy. So it is only used for
+the dev server and tests; a production app without REDIS_URL keeps carts
+in the cookie, as it does while Redis is unreachable.
+
+When Redis is unreachable, RedisCartStore logs and degrades instead of
+failing the request: load() finds no cart and save() returns False, so
+cart.py keeps that cart in the session cookie until Redis is back.
+
+Both stores hold carts as JSON text so callers always get a private copy
+and the in-process store behaves exactly like Redis.
+"""
+import json
+import logging
+import threading
+import time
+
+
+CART_KEY_PREFIX = 'cart:'
+
+logger = logging.getLogger(__name__)
+
+
+class InProcessCartStore:
+    """Thread-safe dict store with per-cart expiry."""
+
+    def __init__(self, ttl_seconds: int):
+        self.ttl = ttl_seconds
+        self._data = {}          # cart_id -> (expires_at, json_text)
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def load(self, cart_id: str):
+        with self._lock:
+            entry = self._data.get(cart_id)
+            if entry is None:
+                return None
+            expires_at, payload = entry
+            if expires_at < time.monotonic():
+                self._data.pop(cart_id, None)
+                return None
+        return json.loads(payload)
+
+    def save(self, cart_id: str, cart: dict) -> bool:
+        payload = json.dumps(cart, separators=(',', ':'))
+        with self._lock:
+            self._data[cart_id] = (time.monotonic() + self.ttl, payload)
+            self._writes += 1
+            if self._writes % 1000 == 0:
+                self._purge_expired()
+        return True
+
+    def delete(self, cart_id: str) -> None:
+        with self._lock:
+            self._data.pop(cart_id, None)
+
+    def _purge_expired(self) -> None:
+        now = time.monotonic()
+        for key in [k for k, (exp, _) in self._data.items() if exp < now]:
+            del self._data[key]
+
+
+class RedisCartStore:
+    """Redis-backed store; each cart is one key with a sliding TTL."""
+
+    def __init__(self, redis_url: str, ttl_seconds: int):
+        import redis
+        self.ttl = ttl_seconds
+        self._redis = redis.Redis.from_url(redis_url)
+        self._errors = redis.RedisError
+
+    def load(self, cart_id: str):
+        try:
+            payload = self._redis.get(CART_KEY_PREFIX + cart_id)
+        except self._errors as exc:
+            logger.warning(f"Cart {cart_id} not loaded, Redis unavailable: {exc}")
+            return None
+        if payload is None:
+            return None
+        return json.loads(payload)
+
+    def save(self, cart_id: str, cart: dict) -> bool:
+        try:
+            self._redis.setex(
+                CART_KEY_PREFIX + cart_id,
+                self.ttl,
+                json.dumps(cart, separators=(',', ':')),
+            )
+        except self._errors as exc:
+            logger.warning(f"Cart {cart_id} kept in the session, Redis unavailable: {exc}")
+            return False
+        return True
+
+    def delete(self, cart_id: str) -> None:
+        try:
+            self._redis.delete(CART_KEY_PREFIX + cart_id)
+        except self._errors as exc:
+            # The key still expires with its TTL.
+            logger.warning(f"Cart {cart_id} not deleted, Redis unavailable: {exc}")
+
+
+def init_cart_store(app):
+    """Pick the cart backend from config and register it on ``app.extensions``."""
+    backend = app.config.get('CART_BACKEND', 'server')
+    if backend != 'server':
+        app.extensions['cart_store'] = None
+        return None
+
+    ttl = int(app.config['PERMANENT_SESSION_LIFETIME'].total_seconds())
+    redis_url = app.config.get('CART_REDIS_URL')
+    if redis_url:
+        store = RedisCartStore(redis_url, ttl)
+    elif app.debug or app.testing:
+        store = InProcessCartStore(ttl)
+    else:
+        app.logger.warning("No REDIS_URL for the cart store; carts are kept in the session cookie.")
+        app.extensions['cart_store'] = None
+        return None
+    app.extensions['cart_store'] = store
+    app.logger.info(f"Cart store: {type(store).__name__}")
+    return store
@@ -0,0 +1,228 @@
+"""
+app/billing/checkout.py
+-----------------------
+Round-trip-bounded persistence helpers for billing.complete().
+
+Checkout holds row locks on every variant in the basket (and on the
+invoice sequence row) until COMMIT, so every extra statement issued
+inside that window lengthens the wait for other counters selling the
+same SKUs. The helpers here keep the number of statements independent
+of basket size:
+
+  lock_variants()            one ordered SELECT … WHERE id IN (…) FOR UPDATE
+                             with the parent product joined in
+  decrement_stock_atomic()   one conditional UPDATE … WHERE stock >= qty
+                             RETURNING for the whole basket (CHECKOUT_STOCK_MODE
+                             = 'atomic'), replacing lock-then-check-then-write
+  bulk_insert()              one executemany INSERT per table
+  increment_promotion_uses() one UPDATE for all applied promotions
+
+CheckoutTrace records wall time and SQL statement count per phase so the
+"O(1) round trips" claim can be checked from the logs or from the
+Server-Timing header on the /billing/complete response.
+"""
+import time
+import weakref
+from contextlib import contextmanager
+
+from flask import g, has_request_context
+from sqlalchemy import event, insert, text, update
+from sqlalchemy.orm import contains_eager
+
+
+def lock_variants(db_session, variant_ids) -> dict:
+    """
+    Lock all ``variant_ids`` with a single SELECT … FOR UPDATE.
+
+    Rows are locked in ascending id order (ORDER BY id), which prevents
+    deadlocks when two baskets share SKUs. The product is fetched in the
+    same statement via an inner join; only the variant rows are locked
+    (FOR UPDATE OF product_variants) so product edits are not blocked.
+
+    Returns:
+        dict — {variant_id: ProductVariant}; ids that no longer exist are absent.
+    """
+    from app.inventory.models import Product, ProductVariant
+
+    ids = sorted({int(vid) for vid in variant_ids})
+    if not ids:
+        return {}
+
+    variants = (
+        db_session.query(ProductVariant)
+        .join(Product, ProductVariant.product_id == Product.id)
+        .options(contains_eager(ProductVariant.product))
+        .filter(ProductVariant.id.in_(ids))
+        .order_by(ProductVariant.id.asc())
+        .with_for_update(of=ProductVariant)
+        .all()
+    )
+    return {v.id: v for v in variants}
+
+
+def decrement_stock_atomic(db_session, quantities) -> dict:
+    """
+    Deduct stock for the whole basket in a single conditional UPDATE.
+
+    ``quantities`` maps variant_id → quantity. The statement joins the
+    requested quantities as a VALUES list, locks the target rows in id
+    order (same deadlock-avoidance rule as lock_variants()) and only
+    updates rows where ``stock >= qty`` and both variant and product are
+    active. A requested id missing from RETURNING means the sale cannot
+    go through; a ValueError is raised with the same wording as the
+    lock-based path and the caller MUST roll back, because rows that did
+    qualify have already been decremented.
+
+    Returns:
+        dict — {variant_id: ProductVariant} with product loaded and the
+        post-decrement stock value.
+    """
+    from app.inventory.models import Product, ProductVariant
+
+    wanted = {int(vid): int(qty) for vid, qty in quantities.items()}
+    if not wanted:
+        return {}
+    ids = sorted(wanted)
+
+    params = {}
+    values_rows = []
+    for i, vid in enumerate(ids):
+        params[f'id{i}'] = vid
+        params[f'qty{i}'] = wanted[vid]
+        values_rows.append(f'(CAST(:id{i} AS INTEGER), CAST(:qty{i} AS INTEGER))')
+
+    updated_ids = set(db_session.execute(text(f"""
+        WITH req(id, qty) AS (VALUES {', '.join(values_rows)}),
+        locked AS (
+            SELECT pv.id
+            FROM product_variants pv
+            JOIN req ON req.id = pv.id
+            ORDER BY pv.id
+            FOR UPDATE OF pv
+        )
+        UPDATE product_variants pv
+        SET stock = pv.stock - req.qty
+        FROM req, locked, products p
+        WHERE pv.id = req.id
+          AND locked.id = pv.id
+          AND p.id = pv.product_id
+          AND pv.is_active
+          AND p.is_active
+          AND pv.stock >= req.qty
+        RETURNING pv.id
+    """), params).scalars().all())
+
+    variants = (
+        db_session.query(ProductVariant)
+        .join(Product, ProductVariant.product_id == Product.id)
+        .options(contains_eager(ProductVariant.product))
+        .filter(ProductVariant.id.in_(ids))
+        .order_by(ProductVariant.id.asc())
+        .populate_existing()
+        .all()
+    )
+    by_id = {v.id: v for v in variants}
+
+    for vid in ids:
+        if vid in updated_ids:
+            continue
+        variant = by_id.get(vid)
+        if variant is None or not variant.is_active or not variant.product.is_active:
+            raise ValueError(f'Variant ID {vid} no longer exists.')
+        raise ValueError(
+            f'Insufficient stock for "{variant.product.name}". '
+            f'Available: {variant.stock}, requested: {wanted[vid]}.'
+        )
+
+    return by_id
+
+
+def bulk_insert(db_session, model, rows) -> None:
+    """INSERT every dict in ``rows`` into ``model``'s table in one executemany call."""
+    if rows:
+        db_session.execute(insert(model), rows)
+
+
+def increment_promotion_uses(db_session, promo_ids) -> None:
+    """
+    Bump Promotion.current_uses by one for each id in a single UPDATE.
+
+    If that uses up a promotion's max_uses, the session is flagged so the
+    compiled promotion set is invalidated once the sale commits.
+    """
+    from app.promotions.models import Promotion, PROMOTIONS_CHANGED_KEY
+
+    ids = sorted({int(pid) for pid in promo_ids if pid})
+    if not ids:
+        return
+    usage = db_session.execute(
+        update(Promotion)
+        .where(Promotion.id.in_(ids))
+        .values(current_uses=Promotion.current_uses + 1)
+        .returning(Promotion.current_uses, Promotion.max_uses)
+        .execution_options(synchronize_session=False)
+    ).all()
+    if any(max_uses is not None and uses >= max_uses for uses, max_uses in usage):
+        db_session.info[PROMOTIONS_CHANGED_KEY] = True
+
+
+# ── Phase timing ──────────────────────────────────────────────────
+
+_TRACE_KEY = '_checkout_trace'
+_instrumented_engines = weakref.WeakSet()
+
+
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    if not has_request_context():
+        return
+    trace = g.get(_TRACE_KEY)
+    if trace is not None:
+        trace.statements += 1
+
+
+class CheckoutTrace:
+    """Per-request phase timer with SQL statement counts."""
+
+    def __init__(self):
+        self.phases = []        # [(name, elapsed_ms, statements)]
+        self.statements = 0
+        self._started = time.perf_counter()
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        before = self.statements
+        try:
+            yield
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            self.phases.append((name, elapsed_ms, self.statements - before))
+
+    @property
+    def total_ms(self) -> float:
+        return (time.perf_counter() - self._started) * 1000
+
+    def summary(self) -> str:
+        parts = [f'{name}={ms:.1f}ms/{stmts}q' for name, ms, stmts in self.phases]
+        parts.append(f'total={self.total_ms:.1f}ms/{self.statements}q')
+        return ' '.join(parts)
+
+    def server_timing(self) -> str:
+        """Render as an HTTP Server-Timing header value."""
+        return ', '.join(
+            f'{name};dur={ms:.2f};desc="{stmts}q"' for name, ms, stmts in self.phases
+        )
+
+
+def start_checkout_trace(engine) -> CheckoutTrace:
+    """Attach a fresh CheckoutTrace to the current request and start counting SQL."""
+    if engine not in _instrumented_engines:
+        event.listen(engine, 'before_cursor_execute', _count_statement)
+        _instrumented_engines.add(engine)
+    trace = CheckoutTrace()
+    setattr(g, _TRACE_KEY, trace)
+    return trace
+
+
+def stop_checkout_trace() -> None:
+    g.pop(_TRACE_KEY, None)
@@ -0,0 +1,275 @@
+"""
+app/billing/events.py
+---------------------
+Post-commit sale side effects via a transactional outbox.
+
+complete() used to apply loyalty accrual, promotion usage counts and the
+cash-session running total inline, taking a row lock on the customer,
+each promotion and the cash session for the whole sale transaction. The
+hot promotion row in particular serialised every counter at peak.
+
+Now complete() only writes one sale_events row per side effect, in the
+same transaction as the sale (sale_event_rows() + one bulk INSERT), and
+after COMMIT hands the sale to dispatch_sale_events():
+
+  SALE_EVENTS_MODE = 'async'   → SaleEventWorker thread pool (default)
+  SALE_EVENTS_MODE = 'inline'  → processed in the request right after
+                                 commit (tests, single-user setups)
+
+Delivery is at-least-once: the post-commit dispatch can be lost (crash,
+restart), so a sweeper thread and `flask process-sale-events` pick up
+anything still pending. Handlers are made idempotent by claiming the
+event (UPDATE … SET processed_at WHERE processed_at IS NULL) in the same
+transaction that applies its effect — a second delivery finds nothing to
+claim, and a failed handler rolls its claim back for a later retry.
+
+Checks that can reject a sale (loyalty redemption, gift card balance,
+stock) stay inline; only effects that cannot fail the sale are deferred.
+"""
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from flask import current_app
+from sqlalchemy import update
+
+from app import db
+
+
+HANDLERS = {}
+
+MAX_ATTEMPTS = 10   # after this an event is left for manual inspection
+
+
+def handler(event_type):
+    """Register ``fn(payload, event)`` as the handler for ``event_type``."""
+    def register(fn):
+        HANDLERS[event_type] = fn
+        return fn
+    return register
+
+
+def sale_event_rows(sale_id, effects) -> list:
+    """Rows for bulk_insert(SaleEvent, …) from [(event_type, payload_dict), …]."""
+    return [
+        {'sale_id': sale_id, 'event_type': event_type, 'payload': json.dumps(payload)}
+        for event_type, payload in effects
+    ]
+
+
+# ── Processing ────────────────────────────────────────────────────
+
+def process_event(event) -> bool:
+    """
+    Claim and apply one event (a row with id, sale_id, event_type,
+    payload) in its own transaction.
+
+    Returns True if this call applied it, False if it was already claimed
+    elsewhere or the handler failed (failure is recorded on the row).
+    """
+    from app.billing.models import SaleEvent
+
+    event_id = event.id
+    try:
+        claimed = db.session.execute(
+            update(SaleEvent)
+            .where(SaleEvent.id == event_id, SaleEvent.processed_at.is_(None))
+            .values(processed_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if not claimed:
+            db.session.rollback()
+            return False
+
+        fn = HANDLERS.get(event.event_type)
+        if fn is None:
+            raise LookupError(f'No handler for sale event type {event.event_type!r}.')
+        fn(json.loads(event.payload or '{}'), event)
+        db.session.commit()
+        return True
+
+    except Exception as exc:
+        db.session.rollback()
+        current_app.logger.error(f"Sale event {event_id} ({event.event_type}) failed: {exc}")
+        db.session.execute(
+            update(SaleEvent)
+            .where(SaleEvent.id == event_id)
+            .values(attempts=SaleEvent.attempts + 1, last_error=str(exc)[:1000])
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        return False
+
+
+def process_sale_events(sale_id=None, cashier_id=None, event_types=None,
+                        older_than=None, limit=500) -> int:
+    """Apply pending events (optionally filtered); returns how many were applied."""
+    from app.billing.models import Sale, SaleEvent
+
+    query = db.session.query(
+        SaleEvent.id, SaleEvent.sale_id, SaleEvent.event_type, SaleEvent.payload,
+    ).filter(
+        SaleEvent.processed_at.is_(None),
+        SaleEvent.attempts < MAX_ATTEMPTS,
+    )
+    if sale_id is not None:
+        query = query.filter(SaleEvent.sale_id == sale_id)
+    if cashier_id is not None:
+        query = query.join(Sale, Sale.id == SaleEvent.sale_id).filter(Sale.cashier_id == cashier_id)
+    if event_types:
+        query = query.filter(SaleEvent.event_type.in_(event_types))
+    if older_than is not None:
+        query = query.filter(SaleEvent.created_at < datetime.utcnow() - older_than)
+
+    events = query.order_by(SaleEvent.id.asc()).limit(limit).all()
+    return sum(1 for event in events if process_event(event))
+
+
+def dispatch_sale_events(sale_id) -> None:
+    """Call right after the sale commits."""
+    if current_app.config.get('SALE_EVENTS_MODE', 'async') == 'inline':
+        process_sale_events(sale_id=sale_id)
+        return
+    current_app.extensions['sale_events'].submit(sale_id)
+
+
+class SaleEventWorker:
+    """In-process thread pool plus a periodic sweeper for missed dispatches."""
+
+    def __init__(self, app, max_workers: int, sweep_seconds: int):
+        self.app = app
+        self.max_workers = max_workers
+        self.sweep_seconds = sweep_seconds
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self) -> None:
+        # Started on first use so CLI commands and tests never spawn threads.
+        with self._lock:
+            if self._pool is not None:
+                return
+            self._pool = ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix='sale-events',
+            )
+            if self.sweep_seconds > 0:
+                threading.Thread(
+                    target=self._sweep_loop, name='sale-events-sweeper', daemon=True,
+                ).start()
+
+    def submit(self, sale_id) -> None:
+        self._ensure_started()
+        self._pool.submit(self._run, sale_id=sale_id)
+
+    def _run(self, **filters) -> None:
+        with self.app.app_context():
+            try:
+                process_sale_events(**filters)
+            except Exception:
+                self.app.logger.exception(f"Sale event processing failed for {filters}")
+            finally:
+                db.session.remove()
+
+    def _sweep_loop(self) -> None:
+        grace = timedelta(seconds=self.sweep_seconds)
+        while True:
+            self._run(older_than=grace)
+            time.sleep(self.sweep_seconds)
+
+
+def init_sale_events(app):
+    worker = SaleEventWorker(
+        app,
+        max_workers=int(app.config.get('SALE_EVENT_WORKERS', 2)),
+        sweep_seconds=int(app.config.get('SALE_EVENT_SWEEP_SECONDS', 30)),
+    )
+    app.extensions['sale_events'] = worker
+    return worker
+
+
+# ── Handlers ──────────────────────────────────────────────────────
+
+@handler('loyalty.accrue')
+def _accrue_loyalty(payload, event):
+    from app.customers.models import Customer
+
+    db.session.execute(
+        update(Customer)
+        .where(Customer.id == int(payload['customer_id']))
+        .values(points=Customer.points + int(payload['points']))
+    )
+
+
+@handler('promotions.count_uses')
+def _count_promotion_uses(payload, event):
+    from app.billing.checkout import increment_promotion_uses
+
+    increment_promotion_uses(db.session, payload['promotion_ids'])
+
+
+@handler('cash_session.add_revenue')
+def _add_cash_revenue(payload, event):
+    """Credit the open cash session the sale was made in; closed sessions are never touched."""
+    from app.billing.models import CashSession, Sale
+
+    sale = db.session.get(Sale, event.sale_id)
+    session_id = (
+        db.session.query(CashSession.id)
+        .filter(
+            CashSession.cashier_id == sale.cashier_id,
+            CashSession.start_time <= sale.created_at,
+            CashSession.end_time.is_(None),
+        )
+        .order_by(CashSession.id.desc())
+        .limit(1)
+        .scalar()
+    )
+    if session_id is None:
+        current_app.logger.warning(f"No cash session for sale {sale.id}; cash revenue not credited.")
+        return
+    db.session.execute(
+        update(CashSession)
+        .where(CashSession.id == session_id)
+        .values(system_total=CashSession.system_total + Decimal(payload['amount']))
+    )
+
+
+@handler('inventory.broadcast')
+def _broadcast_stock(payload, event):
+    """Push post-sale stock to other screens (same payload as inventory routes)."""
+    from app import socketio
+    from app.inventory.models import ProductVariant
+    from sqlalchemy.orm import joinedload
+
+    variants = (
+        db.session.query(ProductVariant)
+        .options(joinedload(ProductVariant.product))
+        .filter(ProductVariant.id.in_(payload['variant_ids']))
+        .all()
+    )
+    for v in variants:
+        socketio.emit('inventory_update', {
+            'variant_id': v.id,
+            'barcode': v.barcode,
+            'new_stock': v.stock,
+            'new_price': str(v.price),
+            'product_name': v.product.name,
+            'is_active': v.is_active and v.product.is_active,
+        }, namespace='/')
+
+
+@handler('rollups.sale')
+def _rollup_sale(payload, event):
+    """Add the sale to the dashboard rollups (app/reporting/rollups.py)."""
+    from app.reporting.rollups import apply_sale
+
+    apply_sale(event.sale_id)
+
+
+@handler('rollups.return')
+def _rollup_return(payload, event):
+    from app.reporting.rollups import apply_return
+
+    apply_return(int(payload['return_id']))
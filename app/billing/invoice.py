@@ -3,12 +3,15 @@ app/billing/invoice.py
 -----------------------
 Concurrency-safe invoice number generation.
 
-Format:  YYYY-NNNN
+Format:  YYYY-NNNN                (INVOICE_SERIES_MODE = 'global', default)
 Example: 2026-0001, 2026-0002, … 2026-9999, 2026-10000
 
+Format:  YYYY-<COUNTER>-NNNNNN    (INVOICE_SERIES_MODE = 'counter')
+Example: 2026-C03-000001, 2026-C03-000002, 2026-C04-000001
+
 Algorithm
 ─────────
-1. Ensure a row exists for the current year using UPSERT-style insert.
+1. Ensure a row exists for the current year (and series) using UPSERT-style insert.
    - PostgreSQL: INSERT ... ON CONFLICT DO NOTHING
 
 2. Lock the row with SELECT ... FOR UPDATE.
@@ -21,6 +24,15 @@ The lock is released when the caller's transaction commits (or rolls back).
 Because the entire billing complete() route runs in one transaction,
 the sequence increment and the Sale INSERT are atomic.
 
+Per-counter series
+──────────────────
+In 'global' mode every sale in the store queues on the single
+invoice_sequences row for the year. In 'counter' mode each counter
+(CashSession.counter_code, defaulting to C<cashier_id>) owns its own
+invoice_series_sequences row, so a counter only ever waits on itself.
+The gap-free guarantee is unchanged: each series is still advanced by the
+same lock → increment → commit-with-the-sale transaction.
+
 Why not PostgreSQL SEQUENCE?
 ─────────────────────────────
 PostgreSQL native sequences are non-transactional by design (they never
@@ -29,11 +41,51 @@ a rolled-back sale would still consume a sequence number, leaving gaps
 in the invoice series — which can be a compliance issue for Indian GST
 invoicing. The table approach only advances when the sale actually commits.
 """
+import re
 from datetime import datetime
+from typing import Optional
+
 from sqlalchemy import text
 
 
-def generate_invoice_number(db_session) -> str:
+COUNTER_CODE_RE = re.compile(r'^[A-Z0-9]{1,6}$')
+
+
+def normalize_counter_code(raw) -> Optional[str]:
+    """Upper-case and validate a counter code; returns None if unusable."""
+    code = (raw or '').strip().upper()
+    return code if COUNTER_CODE_RE.match(code) else None
+
+
+def default_counter_code(cashier_id) -> str:
+    return f"C{int(cashier_id):02d}"
+
+
+def resolve_invoice_series(db_session, cashier_id) -> Optional[str]:
+    """
+    Return the invoice series for ``cashier_id``'s open cash session,
+    or None when INVOICE_SERIES_MODE is 'global'.
+    """
+    from flask import current_app
+    from app.billing.models import CashSession
+
+    if current_app.config.get('INVOICE_SERIES_MODE', 'global') != 'counter':
+        return None
+
+    code = (
+        db_session.query(CashSession.counter_code)
+        .filter(
+            CashSession.cashier_id == cashier_id,
+            CashSession.end_time.is_(None),
+        )
+        .order_by(CashSession.id.desc())
+        .limit(1)
+        .scalar()
+    )
+    return code or default_counter_code(cashier_id)
+
+
+def generate_invoice_number(db_session, series: Optional[str] = None) -> str:
     """
     Generate the next invoice number for the current year.
 
@@ -42,10 +94,15 @@ def generate_invoice_number(db_session) -> str:
 
     Args:
         db_session: the active SQLAlchemy session (db.session)
+        series:     counter code from resolve_invoice_series(); None uses
+                    the store-wide yearly series
 
     Returns:
-        str — e.g. "2026-0042"
+        str — e.g. "2026-0042" or "2026-C03-000042"
     """
+    if series:
+        return _generate_series_invoice_number(db_session, series)
+
     from app.billing.models import InvoiceSequence
 
     year = datetime.now().year
@@ -75,3 +132,37 @@ def generate_invoice_number(db_session) -> str:
 
     # Zero-pad to 4 digits; grows naturally beyond 4 for high-volume years
     return f"{year}-{seq_row.last_seq:04d}"
+
+
+def _generate_series_invoice_number(db_session, series: str) -> str:
+    """Same algorithm as the global series, keyed by (year, series)."""
+    from app.billing.models import InvoiceSeriesSequence
+
+    code = normalize_counter_code(series)
+    if code is None:
+        raise RuntimeError(f'Invalid invoice series {series!r}.')
+
+    year = datetime.now().year
+    db_session.execute(text("""
+        INSERT INTO invoice_series_sequences (year, series, last_seq)
+        VALUES (:year, :series, 0)
+        ON CONFLICT (year, series) DO NOTHING
+    """), {'year': year, 'series': code})
+
+    seq_row = (
+        db_session.query(InvoiceSeriesSequence)
+        .filter(
+            InvoiceSeriesSequence.year == year,
+            InvoiceSeriesSequence.series == code,
+        )
+        .with_for_update()
+        .first()
+    )
+
+    if seq_row is None:
+        raise RuntimeError(f'Failed to load invoice sequence row for {year}-{code}.')
+
+    seq_row.last_seq += 1
+    db_session.flush()
+
+    return f"{year}-{code}-{seq_row.last_seq:06d}"
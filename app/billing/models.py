@@ -16,6 +16,18 @@ class InvoiceSequence(db.Model):
         return f"<InvoiceSequence year={self.year} last_seq={self.last_seq}>"
 
 
+class InvoiceSeriesSequence(db.Model):
+    """Per-counter invoice counter (INVOICE_SERIES_MODE = 'counter')."""
+    __tablename__ = 'invoice_series_sequences'
+
+    year = db.Column(db.Integer, primary_key=True)
+    series = db.Column(db.String(6), primary_key=True)
+    last_seq = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<InvoiceSeriesSequence {self.year}-{self.series} last_seq={self.last_seq}>"
+
+
 class Sale(db.Model):
     __tablename__ = 'sales'
     __table_args__ = (
@@ -24,6 +36,10 @@ class Sale(db.Model):
         db.CheckConstraint('discount_amount >= 0', name='check_sale_discount_amount_non_negative'),
         db.CheckConstraint('discount_percent >= 0 AND discount_percent <= 100', name='check_sale_discount_percent_range'),
         db.CheckConstraint('grand_total IS NULL OR grand_total >= 0', name='check_sale_grand_total_non_negative'),
+        # Print backlog (app/billing/print_jobs.py): only unprinted rows.
+        db.Index('ix_sales_unprinted', 'created_at', postgresql_where=db.text('is_printed = false')),
+        # Retried / offline checkouts (same name as the startup schema patch)
+        db.Index('uq_sales_idempotency_key', 'idempotency_key', unique=True),
     )
 
     id = db.Column(db.Integer, primary_key=True)
@@ -36,8 +52,12 @@ class Sale(db.Model):
     gst_total = db.Column(db.Numeric(12, 2), nullable=False)
     grand_total = db.Column(db.Numeric(10, 2))
     payment_method = db.Column(db.String(20), nullable=False, default='cash')
-    print_html = db.Column(db.Text)
+    # Legacy inline invoice snapshot. New snapshots live in sale_snapshots;
+    # migrate_sale_snapshots.py moves old rows there. Deferred so sale
+    # listings never read it.
+    legacy_print_html = db.Column('print_html', db.Text, deferred=True)
     is_printed = db.Column(db.Boolean, default=False)
+    idempotency_key = db.Column(db.String(64), nullable=True)   # client key for retried checkouts
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
 
     cashier = db.relationship('User', backref='sales', lazy='select')
@@ -48,6 +68,20 @@ class Sale(db.Model):
         lazy='select',
         cascade='all, delete-orphan',
     )
+    snapshot = db.relationship(
+        'SaleSnapshot',
+        uselist=False,
+        lazy='select',
+        cascade='all, delete-orphan',
+        passive_deletes=True,
+    )
+
+    @property
+    def print_html(self):
+        """Frozen invoice HTML, or None if not frozen yet (loaded on access)."""
+        if self.snapshot is not None:
+            return self.snapshot.html
+        return self.legacy_print_html
 
     @property
     def computed_grand_total(self) -> Decimal:
@@ -59,6 +93,26 @@ class Sale(db.Model):
         return f"<Sale {self.invoice_number!r} {self.computed_grand_total}>"
 
 
+class SaleSnapshot(db.Model):
+    """Compressed invoice snapshot, one per sale (app/billing/snapshot.py)."""
+    __tablename__ = 'sale_snapshots'
+
+    sale_id = db.Column(db.Integer, db.ForeignKey('sales.id', ondelete='CASCADE'), primary_key=True)
+    encoding = db.Column(db.String(10), nullable=False, default='zlib')
+    body = db.Column(db.LargeBinary, nullable=False)
+    raw_size = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    @property
+    def html(self) -> str:
+        from app.billing.snapshot import decompress_snapshot
+
+        return decompress_snapshot(self.body, self.encoding)
+
+    def __repr__(self):
+        return f"<SaleSnapshot sale={self.sale_id} {len(self.body)}/{self.raw_size} bytes>"
+
+
 class SaleItem(db.Model):
     __tablename__ = 'sale_items'
     __table_args__ = (
@@ -67,7 +121,7 @@ class SaleItem(db.Model):
     )
 
     id = db.Column(db.Integer, primary_key=True)
-    sale_id = db.Column(db.Integer, db.ForeignKey('sales.id'), nullable=False)
+    sale_id = db.Column(db.Integer, db.ForeignKey('sales.id'), nullable=False, index=True)
     product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
     variant_id = db.Column(db.Integer, db.ForeignKey('product_variants.id'), nullable=False, index=True)
     quantity = db.Column(db.Integer, nullable=False)
@@ -182,6 +236,36 @@ class SalePayment(db.Model):
     sale = db.relationship('Sale', backref='payments', lazy='select')
 
 
+class SaleEvent(db.Model):
+    """
+    Transactional outbox row for a post-commit sale side effect.
+
+    Written in the same transaction as the Sale; applied afterwards by
+    app.billing.events. processed_at is set in the same transaction that
+    applies the effect, so a redelivered event is a no-op.
+    """
+    __tablename__ = 'sale_events'
+    __table_args__ = (
+        db.Index(
+            'ix_sale_events_pending', 'id',
+            postgresql_where=db.text('processed_at IS NULL'),
+        ),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    sale_id = db.Column(db.Integer, db.ForeignKey('sales.id'), nullable=False, index=True)
+    event_type = db.Column(db.String(40), nullable=False)
+    payload = db.Column(db.Text, nullable=False, default='{}')   # JSON
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    processed_at = db.Column(db.DateTime, nullable=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.Text, nullable=True)
+
+    def __repr__(self):
+        state = 'done' if self.processed_at else f'pending x{self.attempts}'
+        return f"<SaleEvent {self.id} {self.event_type} sale={self.sale_id} {state}>"
+
+
 class CashSession(db.Model):
     __tablename__ = 'cash_sessions'
     __table_args__ = (
@@ -196,6 +280,7 @@ class CashSession(db.Model):
     system_total = db.Column(db.Numeric(12, 2), nullable=False, default=0.00)
     closing_cash = db.Column(db.Numeric(10, 2), nullable=True)
     closing_notes = db.Column(db.String(255), nullable=True)
+    counter_code = db.Column(db.String(6), nullable=True)   # invoice series, e.g. "C03"
     start_time = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     end_time = db.Column(db.DateTime, nullable=True)
 
@@ -0,0 +1,449 @@
+"""
+app/billing/offline.py
+----------------------
+Server side of offline billing: ingest sales that terminals captured
+while the uplink was down (static/js/offline_pos.js) and queued in
+IndexedDB with a client-generated idempotency key.
+
+POST /billing/api/sync hands a batch to ingest_offline_sales(), which
+records it in ONE transaction:
+
+  - keys already on a Sale (an earlier sync, or a checkout that did reach
+    the server) are answered as duplicates with the original invoice
+  - every variant in the batch is locked with one ordered SELECT … FOR
+    UPDATE, as in complete()
+  - each sale is recorded at the unit prices the terminal captured (what
+    the customer paid). A captured price must match (within
+    OFFLINE_PRICE_TOLERANCE) a price the catalog served between the
+    terminal's catalog_version and now, per the price history on
+    catalog_changes. A lower price is recorded at the current list price
+    with the difference booked as the sale's discount_amount, so it shows
+    up in the discount reports; a higher one is rejected.
+  - stock is the one real conflict: a sale it no longer covers is
+    reported and left in the terminal's queue. A tender that does not
+    cover the sale at its own prices is rejected; the terminal never
+    produces one.
+  - invoice numbers are allocated here, in batch order
+
+Sales keep the capture time as created_at. It must fall inside the
+cashier's open cash session and within OFFLINE_MAX_AGE_HOURS, so the
+cash-session revenue event credits that open session and never one that
+was already closed and reconciled. Without an open session the batch is
+held back as conflicts until one is opened. Promotions are not applied:
+the terminal cannot evaluate them offline, so it never discounted for
+them.
+"""
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+from flask import current_app
+from sqlalchemy import or_
+
+from app import db
+
+
+Q = Decimal('0.01')
+
+OFFLINE_TENDERS = ('cash', 'card', 'upi')
+MAX_KEY_LENGTH = 64
+MAX_LINES = 500
+MAX_QTY = 999
+
+
+class OfflineSaleRejected(ValueError):
+    """The queued sale contradicts itself or the catalog; resending cannot help."""
+
+
+def _decimal(value, what) -> Decimal:
+    try:
+        amount = Decimal(str(value if value not in (None, '') else '0'))
+    except (InvalidOperation, TypeError, ValueError):
+        raise ValueError(f'Invalid {what}.')
+    if not amount.is_finite() or amount < 0:
+        raise ValueError(f'Invalid {what}.')
+    return amount
+
+
+def _captured_at(raw) -> datetime:
+    now = datetime.utcnow()
+    if not raw:
+        return now
+    try:
+        captured = datetime.fromisoformat(str(raw).replace('Z', '+00:00'))
+    except ValueError:
+        raise ValueError('Invalid captured_at timestamp.')
+    if captured.tzinfo is not None:
+        captured = captured.astimezone(timezone.utc).replace(tzinfo=None)
+    return min(captured, now)
+
+
+def parse_offline_sale(raw) -> dict:
+    """
+    Validate one queued sale:
+
+        {"key": "…", "captured_at": "2026-01-31T10:15:00Z",
+         "catalog_version": 812,
+         "items": [{"variant_id": 12, "qty": 2, "price": "199.00"},
+                   {"variant_id": 40, "weight_kg": "0.750", "price": "120.00"}],
+         "payments": {"cash": "500.00", "card": "0", "upi": "0"}}
+
+    ``price`` is the unit price (per kg for weighed lines) the terminal
+    charged, ``catalog_version`` the catalog it was priced from. Sales
+    queued before terminals sent them are priced at current prices.
+
+    Raises ValueError on malformed input.
+    """
+    if not isinstance(raw, dict):
+        raise ValueError('Each sale must be an object.')
+
+    key = str(raw.get('key') or '').strip()
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise ValueError(f'Each sale needs a key of 1-{MAX_KEY_LENGTH} characters.')
+
+    items = raw.get('items')
+    if not isinstance(items, list) or not items:
+        raise ValueError('Sale has no items.')
+    if len(items) > MAX_LINES:
+        raise ValueError(f'At most {MAX_LINES} lines per sale.')
+
+    lines = {}   # variant_id -> {'qty', 'weight_kg'}, first-scan order
+    for item in items:
+        if not isinstance(item, dict):
+            raise ValueError('Each item must be an object.')
+        try:
+            variant_id = int(item.get('variant_id'))
+            qty = int(item.get('qty', 1))
+        except (TypeError, ValueError):
+            raise ValueError('Invalid item.')
+        price = item.get('price')
+        price = _decimal(price, 'price').quantize(Q) if price not in (None, '') else None
+        if price is not None and price <= 0:
+            raise ValueError('Invalid price.')
+        weight_kg = item.get('weight_kg')
+        if weight_kg not in (None, ''):
+            weight_kg = _decimal(weight_kg, 'weight').quantize(Decimal('0.001'))
+            if weight_kg <= 0:
+                raise ValueError('Invalid weight.')
+            qty = 1
+        else:
+            weight_kg = None
+        if not 1 <= qty <= MAX_QTY:
+            raise ValueError(f'Quantity must be 1-{MAX_QTY}.')
+
+        line = lines.get(variant_id)
+        if line is None:
+            lines[variant_id] = {'qty': qty, 'weight_kg': weight_kg, 'price': price}
+        elif weight_kg is not None:
+            line['weight_kg'] = weight_kg
+        else:
+            line['qty'] += qty
+
+    payments = raw.get('payments') or {}
+    if not isinstance(payments, dict):
+        raise ValueError('Invalid payments.')
+
+    catalog_version = raw.get('catalog_version')
+    try:
+        catalog_version = int(catalog_version) if catalog_version not in (None, '') else None
+    except (TypeError, ValueError):
+        raise ValueError('Invalid catalog_version.')
+
+    return {
+        'key': key,
+        'captured_at': _captured_at(raw.get('captured_at')),
+        'catalog_version': catalog_version,
+        'lines': lines,
+        'payments': {t: _decimal(payments.get(t), f'{t} amount') for t in OFFLINE_TENDERS},
+    }
+
+
+def _price_history(variants) -> dict:
+    """
+    ('price', variant_id) / ('per_kg', product_id) -> [(version, price), …]
+    from catalog_changes, oldest first.
+    """
+    from app.inventory.models import CatalogChange
+
+    product_ids = {variant.product_id for variant in variants.values()}
+    rows = (
+        db.session.query(
+            CatalogChange.id, CatalogChange.product_id, CatalogChange.variant_id,
+            CatalogChange.price, CatalogChange.price_per_kg,
+        )
+        .filter(or_(
+            CatalogChange.variant_id.in_(list(variants)),
+            CatalogChange.product_id.in_(product_ids),
+        ))
+        .order_by(CatalogChange.id.asc())
+        .all()
+    )
+    history = {}
+    for version, product_id, variant_id, price, price_per_kg in rows:
+        if variant_id in variants and price is not None:
+            history.setdefault(('price', variant_id), []).append((version, price))
+        if price_per_kg is not None:
+            history.setdefault(('per_kg', product_id), []).append((version, price_per_kg))
+    return history
+
+
+def _prices_since(history, version, current) -> set:
+    """Prices in effect at catalog ``version`` and any time after it."""
+    prices = {current}
+    if version is None:
+        return prices
+    served = None
+    for change_version, price in history:
+        if change_version <= version:
+            served = price
+        else:
+            prices.add(price)
+    if served is not None:
+        prices.add(served)
+    return prices
+
+
+def _line_price(captured, served, current, name, tolerance):
+    """
+    (list price, charged price) for one unit. A captured price within
+    ``tolerance`` of a ``served`` price is taken as is; a lower one is
+    charged as captured but listed at ``current``, the difference being
+    discount; a higher one is rejected.
+    """
+    if captured is None:
+        return current, current
+    if any(abs(captured - price) <= price * tolerance for price in served):
+        return captured, captured
+    if captured < current:
+        return current, captured
+    raise OfflineSaleRejected(
+        f'Captured price {captured} for "{name}" is above every catalog price since the terminal synced.'
+    )
+
+
+def _price_sale(sale, variants, history, tolerance) -> dict:
+    """
+    Price ``sale`` at its captured prices against the locked ``variants``
+    (whose stock already reflects earlier sales in the batch) and their
+    price ``history`` (_price_history). Raises ValueError describing the
+    conflict when stock no longer covers it, or OfflineSaleRejected when
+    the sale itself is implausible.
+    """
+    line_items = []
+    subtotal = gst_total = discount = Decimal('0.00')
+    for variant_id, line in sale['lines'].items():
+        variant = variants.get(variant_id)
+        if variant is None or not variant.is_active or not variant.product.is_active:
+            raise ValueError(f'Variant ID {variant_id} no longer exists.')
+
+        product = variant.product
+        qty = line['qty']
+        if variant.stock < qty:
+            raise ValueError(
+                f'Insufficient stock for "{product.name}". '
+                f'Available: {variant.stock}, requested: {qty}.'
+            )
+
+        if product.is_weighed:
+            if line['weight_kg'] is None or not product.price_per_kg:
+                raise ValueError(f'"{product.name}" must be weighed.')
+            current = Decimal(str(product.price_per_kg))
+            served = _prices_since(history.get(('per_kg', product.id), ()), sale['catalog_version'], current)
+            list_per_kg, charged_per_kg = _line_price(line['price'], served, current, product.name, tolerance)
+            price = (list_per_kg * line['weight_kg']).quantize(Q)
+            line_subtotal = (charged_per_kg * line['weight_kg']).quantize(Q)
+        else:
+            current = Decimal(str(variant.price))
+            served = _prices_since(history.get(('price', variant.id), ()), sale['catalog_version'], current)
+            price, charged = _line_price(line['price'], served, current, product.name, tolerance)
+            line_subtotal = (charged * qty).quantize(Q)
+
+        discount += (price * qty).quantize(Q) - line_subtotal
+        line_gst = (
+            line_subtotal * Decimal(product.gst_percent) / Decimal('100')
+        ).quantize(Q, rounding=ROUND_HALF_UP)
+        subtotal += line_subtotal
+        gst_total += line_gst
+        line_items.append({
+            'variant': variant,
+            'qty': qty,
+            'price': price,
+            'subtotal': line_subtotal,
+            'weight_kg': line['weight_kg'] if product.is_weighed else None,
+            'unit_label': 'kg' if product.is_weighed else None,
+        })
+
+    grand_total = subtotal + gst_total
+    payments = sale['payments']
+    tendered = sum(payments.values())
+    if tendered < grand_total - Decimal('0.05'):
+        raise OfflineSaleRejected(f'Payments do not cover the sale. Paid: {tendered}, Total: {grand_total}.')
+
+    non_cash = payments['card'] + payments['upi']
+    cash_revenue = grand_total - non_cash
+    if cash_revenue < 0:
+        raise OfflineSaleRejected('Card/UPI payments exceed the sale total.')
+
+    payment_rows = [
+        {'payment_method': method, 'amount': payments[method]}
+        for method in ('card', 'upi') if payments[method] > 0
+    ]
+    if cash_revenue > 0:
+        payment_rows.append({'payment_method': 'cash', 'amount': cash_revenue})
+
+    return {
+        'line_items': line_items,
+        'subtotal': subtotal,
+        'discount': discount,
+        'gst_total': gst_total,
+        'grand_total': grand_total,
+        'cash_revenue': cash_revenue,
+        'payment_rows': payment_rows,
+    }
+
+
+def ingest_offline_sales(raw_sales, cashier_id) -> list:
+    """
+    Record a batch of queued sales for ``cashier_id`` in one transaction.
+
+    Returns one result per input, in order:
+      {'key', 'status': 'recorded',  'sale_id', 'invoice_number'}
+      {'key', 'status': 'duplicate', 'sale_id', 'invoice_number'}
+      {'key', 'status': 'conflict',  'error'}   — valid, but stock no longer covers it
+                                                  (or no cash session is open)
+      {'key', 'status': 'rejected',  'error'}   — malformed or implausible; will never sync
+
+    Raises IntegrityError if a concurrent sync recorded one of the keys
+    first; the whole batch rolls back and is safe to resend.
+    """
+    from app.billing.checkout import bulk_insert, lock_variants
+    from app.billing.events import dispatch_sale_events, sale_event_rows
+    from app.billing.invoice import generate_invoice_number, resolve_invoice_series
+    from app.billing.models import CashSession, Sale, SaleEvent, SaleItem, SalePayment
+    from app.billing.snapshot import freeze_invoice_snapshot
+
+    results = [None] * len(raw_sales)
+    pending = []   # (index, parsed sale)
+    for index, raw in enumerate(raw_sales):
+        key = str(raw.get('key') or '') if isinstance(raw, dict) else None
+        try:
+            pending.append((index, parse_offline_sale(raw)))
+        except ValueError as exc:
+            results[index] = {'key': key, 'status': 'rejected', 'error': str(exc)}
+
+    # ── Already recorded (earlier sync, or a checkout that got through) ──
+    keys = {sale['key'] for _index, sale in pending}
+    existing = {
+        key: (sale_id, invoice_number)
+        for key, sale_id, invoice_number in db.session.query(
+            Sale.idempotency_key, Sale.id, Sale.invoice_number,
+        ).filter(Sale.idempotency_key.in_(keys)).all()
+    } if keys else {}
+
+    # ── Capture times: inside the open cash session and the offline window ──
+    session_start = (
+        db.session.query(CashSession.start_time)
+        .filter(CashSession.cashier_id == cashier_id, CashSession.end_time.is_(None))
+        .order_by(CashSession.id.desc())
+        .limit(1)
+        .scalar()
+    )
+    earliest = datetime.utcnow() - timedelta(hours=current_app.config['OFFLINE_MAX_AGE_HOURS'])
+
+    fresh, seen = [], set()
+    for index, sale in pending:
+        key = sale['key']
+        if key in existing:
+            sale_id, invoice_number = existing[key]
+            results[index] = {'key': key, 'status': 'duplicate',
+                              'sale_id': sale_id, 'invoice_number': invoice_number}
+        elif key in seen:
+            results[index] = {'key': key, 'status': 'rejected', 'error': 'Key repeated in batch.'}
+        elif session_start is None:
+            results[index] = {'key': key, 'status': 'conflict',
+                              'error': 'No open cash session; open one and sync again.'}
+        elif sale['captured_at'] < max(session_start, earliest):
+            results[index] = {'key': key, 'status': 'rejected',
+                              'error': 'Captured before the open cash session or the offline window.'}
+        else:
+            seen.add(key)
+            fresh.append((index, sale))
+
+    if not fresh:
+        db.session.rollback()
+        return results
+
+    # ── One lock for every variant in the batch ───────────────────
+    variants = lock_variants(db.session, {
+        variant_id for _index, sale in fresh for variant_id in sale['lines']
+    })
+
+    history = _price_history(variants)
+    tolerance = current_app.config['OFFLINE_PRICE_TOLERANCE']
+    recorded = []   # (index, key, sale_id, invoice_number)
+    invoice_series = resolve_invoice_series(db.session, cashier_id)
+    for index, parsed in fresh:
+        try:
+            priced = _price_sale(parsed, variants, history, tolerance)
+        except OfflineSaleRejected as exc:
+            results[index] = {'key': parsed['key'], 'status': 'rejected', 'error': str(exc)}
+            continue
+        except ValueError as exc:
+            results[index] = {'key': parsed['key'], 'status': 'conflict', 'error': str(exc)}
+            continue
+
+        sale = Sale(
+            invoice_number=generate_invoice_number(db.session, series=invoice_series),
+            cashier_id=cashier_id,
+            customer_id=None,
+            total_amount=priced['subtotal'],
+            discount_percent=Decimal('0.00'),
+            discount_amount=priced['discount'],
+            gst_total=priced['gst_total'],
+            grand_total=priced['grand_total'],
+            idempotency_key=parsed['key'],
+            created_at=parsed['captured_at'],
+        )
+        db.session.add(sale)
+        db.session.flush()
+
+        for line in priced['line_items']:
+            line['variant'].stock -= line['qty']
+
+        bulk_insert(db.session, SaleItem, [
+            {
+                'sale_id': sale.id,
+                'product_id': int(line['variant'].product_id),
+                'variant_id': int(line['variant'].id),
+                'quantity': line['qty'],
+                'price_at_sale': line['price'],
+                'snapshot_size': line['variant'].size,
+                'snapshot_color': line['variant'].color,
+                'gst_percent': int(line['variant'].product.gst_percent),
+                'subtotal': line['subtotal'],
+                'weight_kg': line['weight_kg'],
+                'unit_label': line['unit_label'],
+            }
+            for line in priced['line_items']
+        ])
+        bulk_insert(db.session, SalePayment, [
+            {'sale_id': sale.id, 'reference': None, **row} for row in priced['payment_rows']
+        ])
+
+        effects = [
+            ('inventory.broadcast', {'variant_ids': [line['variant'].id for line in priced['line_items']]}),
+            ('rollups.sale', {}),
+        ]
+        if priced['cash_revenue'] > 0:
+            effects.append(('cash_session.add_revenue', {'amount': str(priced['cash_revenue'])}))
+        bulk_insert(db.session, SaleEvent, sale_event_rows(sale.id, effects))
+
+        recorded.append((index, parsed['key'], sale.id, sale.invoice_number))
+
+    db.session.commit()
+
+    for index, key, sale_id, invoice_number in recorded:
+        freeze_invoice_snapshot(sale_id)
+        dispatch_sale_events(sale_id)
+        results[index] = {'key': key, 'status': 'recorded',
+                          'sale_id': sale_id, 'invoice_number': invoice_number}
+    return results
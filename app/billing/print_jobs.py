@@ -0,0 +1,194 @@
+"""
+app/billing/print_jobs.py
+-------------------------
+Receipt printing pushed over Socket.IO instead of polling /billing/print-queue.
+
+Terminals (the billing screen, which relays jobs to the local hardware
+agent, and the print queue page) emit ``print_subscribe`` once
+connected. Every user, admins included, joins ``print:<user_id>`` and
+gets only their own sales, so a billing screen relays nothing but its
+own receipts to its printer. The print queue page of an admin subscribes
+with ``{"scope": "all"}`` and joins ``print:all``, which receives every
+job.
+
+  - Right after a sale commits, complete() and exchanges call
+    push_print_job(), which emits ``print_job`` to the cashier's room and
+    ``print:all``. The payload is built from what the checkout already
+    holds in memory, so pushing costs no query.
+  - On subscribe (and on every reconnect) the terminal gets
+    ``print_backlog``: unprinted sales from the last PRINT_BACKLOG_DAYS,
+    read through the partial index ix_sales_unprinted, so a terminal that
+    was offline misses nothing.
+  - Printed jobs are acknowledged in batches with ``print_ack``
+    ({"sale_ids": [...]}, one UPDATE per batch); ``print_done`` then tells
+    the other screens to drop them.
+"""
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from flask import current_app, session, url_for
+from flask_socketio import emit, join_room
+from sqlalchemy import update
+
+from app import db, socketio
+
+
+PRINT_BACKLOG_DAYS = 7
+PRINT_BACKLOG_MAX = 200
+PRINT_ACK_MAX = 200
+ALL_ROOM = 'print:all'
+
+
+def print_room(cashier_id) -> str:
+    return f'print:{int(cashier_id)}'
+
+
+def print_job(sale, items) -> dict:
+    """
+    Job payload; same receipt fields as the JSON checkout response.
+    ``items`` are {'name', 'qty', 'price', 'subtotal'} dicts.
+    """
+    return {
+        'sale_id': sale.id,
+        'cashier_id': sale.cashier_id,
+        'invoice_number': sale.invoice_number,
+        'created_at': sale.created_at.isoformat() if sale.created_at else None,
+        'subtotal': float(sale.total_amount),
+        'gst_total': float(sale.gst_total),
+        'grand_total': float(sale.computed_grand_total),
+        'items': items,
+        'invoice_url': url_for('billing.invoice', sale_id=sale.id),
+    }
+
+
+def push_print_job(sale, items) -> None:
+    """Call right after the sale commits. Never raises: the sale stands."""
+    try:
+        job = print_job(sale, items)
+        socketio.emit('print_job', job, to=print_room(sale.cashier_id), namespace='/')
+        socketio.emit('print_job', job, to=ALL_ROOM, namespace='/')
+    except Exception as e:
+        current_app.logger.error(f"Failed to push print job for sale {sale.id}: {e}")
+
+
+def unprinted_sales_query(cashier_id=None):
+    """Unprinted sales, newest first; matches the ix_sales_unprinted predicate."""
+    from app.billing.models import Sale
+
+    query = Sale.query.filter(
+        Sale.is_printed == False,  # noqa: E712 — partial index predicate
+        Sale.created_at >= datetime.utcnow() - timedelta(days=PRINT_BACKLOG_DAYS),
+    )
+    if cashier_id is not None:
+        query = query.filter(Sale.cashier_id == cashier_id)
+    return query.order_by(Sale.created_at.desc())
+
+
+def backlog_jobs(cashier_id=None) -> list:
+    """Jobs for unprinted sales (two queries), oldest first."""
+    from app.billing.models import SaleItem
+    from app.inventory.models import Product
+
+    sales = unprinted_sales_query(cashier_id).limit(PRINT_BACKLOG_MAX).all()
+    if not sales:
+        return []
+
+    items = defaultdict(list)
+    rows = (
+        db.session.query(
+            SaleItem.sale_id, Product.name, SaleItem.quantity,
+            SaleItem.price_at_sale, SaleItem.subtotal,
+        )
+        .join(Product, SaleItem.product_id == Product.id)
+        .filter(SaleItem.sale_id.in_([s.id for s in sales]))
+        .order_by(SaleItem.id.asc())
+        .all()
+    )
+    for sale_id, name, qty, price, subtotal in rows:
+        items[sale_id].append({'name': name, 'qty': qty, 'price': float(price), 'subtotal': float(subtotal)})
+    return [print_job(sale, items[sale.id]) for sale in reversed(sales)]
+
+
+def parse_sale_ids(raw) -> list:
+    """Validate an ack batch; raises ValueError."""
+    if not isinstance(raw, list) or not raw:
+        raise ValueError('No sale ids to acknowledge.')
+    if len(raw) > PRINT_ACK_MAX:
+        raise ValueError(f'At most {PRINT_ACK_MAX} sale ids per acknowledgement.')
+    try:
+        return sorted({int(sale_id) for sale_id in raw})
+    except (TypeError, ValueError):
+        raise ValueError('Invalid sale id.')
+
+
+def mark_sales_printed(sale_ids, cashier_id=None) -> dict:
+    """
+    Mark a batch printed in one UPDATE (only the caller's own sales unless
+    ``cashier_id`` is None). Returns {cashier_id: [sale_id, …]} of the rows
+    that changed and tells every screen via ``print_done``.
+    """
+    from app.billing.models import Sale
+
+    stmt = (
+        update(Sale)
+        .where(Sale.id.in_(sale_ids), Sale.is_printed.isnot(True))
+        .values(is_printed=True)
+        .returning(Sale.id, Sale.cashier_id)
+        .execution_options(synchronize_session=False)
+    )
+    if cashier_id is not None:
+        stmt = stmt.where(Sale.cashier_id == cashier_id)
+    rows = db.session.execute(stmt).all()
+    db.session.commit()
+
+    done = defaultdict(list)
+    for sale_id, owner_id in rows:
+        done[owner_id].append(sale_id)
+    for owner_id, ids in done.items():
+        socketio.emit('print_done', {'sale_ids': ids}, to=print_room(owner_id), namespace='/')
+    if done:
+        socketio.emit('print_done', {'sale_ids': [i for ids in done.values() for i in ids]},
+                      to=ALL_ROOM, namespace='/')
+    return dict(done)
+
+
+# ── Socket.IO events ──────────────────────────────────────────────
+
+def _scope(data=None):
+    """
+    Cashier id whose jobs the connected user handles, or None for every
+    job when an admin asks for ``{"scope": "all"}``. Raises PermissionError.
+    """
+    user_id = session.get('user_id')
+    if user_id is None:
+        raise PermissionError('Not logged in.')
+    if isinstance(data, dict) and data.get('scope') == 'all':
+        if session.get('role') != 'admin':
+            raise PermissionError('Only admins can follow every print job.')
+        return None
+    return int(user_id)
+
+
+@socketio.on('print_subscribe')
+def on_print_subscribe(data=None):
+    try:
+        scope = _scope(data)
+    except PermissionError as exc:
+        return {'ok': False, 'error': str(exc)}
+
+    room = ALL_ROOM if scope is None else print_room(scope)
+    join_room(room)
+    emit('print_backlog', {'jobs': backlog_jobs(scope)})
+    return {'ok': True, 'room': room}
+
+
+@socketio.on('print_ack')
+def on_print_ack(data=None):
+    try:
+        scope = _scope(data)
+        sale_ids = parse_sale_ids((data or {}).get('sale_ids') if isinstance(data, dict) else None)
+    except (PermissionError, ValueError) as exc:
+        return {'ok': False, 'error': str(exc)}
+
+    done = mark_sales_printed(sale_ids, cashier_id=scope)
+    return {'ok': True, 'sale_ids': sorted(i for ids in done.values() for i in ids)}
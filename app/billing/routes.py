@@ -6,73 +6,80 @@ from flask import (
 from sqlalchemy.exc import IntegrityError
 
 from app.billing import billing
-from app.billing.models import Return, ReturnItem, Sale, SaleItem, SalePayment
+from app.billing.models import Return, ReturnItem, Sale, SaleEvent, SaleItem, SalePayment
 from app.billing.cart import (
-    get_cart, add_to_cart, remove_from_cart,
+    get_cart, add_to_cart, add_many_to_cart, remove_from_cart,
     clear_cart, cart_totals, update_cart_quantity,
     add_weighed_to_cart
 )
-from app.billing.invoice import generate_invoice_number
-from sqlalchemy.orm import joinedload
+from app.billing.invoice import (
+    generate_invoice_number, resolve_invoice_series,
+    normalize_counter_code, default_counter_code,
+)
+from app.billing.snapshot import freeze_invoice_snapshot
+from app.billing.print_jobs import (
+    mark_sales_printed, parse_sale_ids, push_print_job, unprinted_sales_query,
+)
+from app.billing.events import dispatch_sale_events, process_sale_events, sale_event_rows
+from app.billing.offline import ingest_offline_sales
+from app.billing.checkout import (
+    lock_variants, decrement_stock_atomic, bulk_insert,
+    start_checkout_trace, stop_checkout_trace,
+)
 from app.inventory.models import InventoryLog, ProductVariant
+from app.inventory.barcode_cache import (
+    get_variant_snapshot, get_variant_snapshots, refresh_stock_hint, refresh_stock_hints,
+)
 from app.customers.models import Customer, GiftCard
 from app.billing.models import CashSession
 from app.auth.decorators import login_required, admin_required
+from app.auth.identity import get_active_cash_session_id, invalidate_cash_session
 from app import db, cache
 
 # ── Promo engine (lazy import to avoid circular deps) ─────────────
-def _get_promo_result(cart):
+PROMO_RESULT_TTL = 900   # seconds; entries are also orphaned by any cart change
+
+
+def _get_promo_result(cart, use_cache=True):
+    """
+    Evaluate promotions for ``cart`` against the process-wide compiled set.
+
+    The result is cached per cart token (cart id + version) and promotion
+    set generation, so re-rendering an unchanged cart (refresh, rejected
+    scan, weight modal) does not re-evaluate promotions. Checkout passes
+    use_cache=False and evaluates fresh promotions from the database.
+    """
     try:
         from app.promotions.engine import evaluate_promotions
-        from app.promotions.routes import get_active_promotions
-        promos = get_active_promotions()
-        return evaluate_promotions(cart, promos)
+        from app.promotions.cache import get_compiled_promotions, promotion_set_token
+
+        cache_key = None
+        token = getattr(cart, 'token', None)
+        if use_cache and token:
+            cache_key = f"promo_result_{token}_{promotion_set_token()}"
+            cached = cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+        promos = get_compiled_promotions(refresh=not use_cache)
+        result = evaluate_promotions(cart, promos)
+        if cache_key:
+            cache.set(cache_key, result, timeout=PROMO_RESULT_TTL)
+        return result
     except Exception:
         return None
-from datetime import datetime, timedelta
+from datetime import datetime
 
 # ── HELPERS ───────────────────────────────────────────────────────
 
 def get_variant_by_barcode(barcode):
-    """Cached lookup for a variant by its barcode."""
-    cache_key = f"barcode_lookup_{barcode}"
-    try:
-        variant_id = cache.get(cache_key)
-    except Exception:
-        variant_id = None
-    if variant_id is None:
-        variant_id = (
-            db.session.query(ProductVariant.id)
-            .filter(
-                ProductVariant.barcode == barcode,
-                ProductVariant.is_active.is_(True),
-            )
-            .scalar()
-        )
-        if variant_id is not None:
-            try:
-                cache.set(cache_key, variant_id, timeout=3600)
-            except Exception:
-                pass
-        else:
-            return None
+    """
+    Cached lookup for an active variant by its barcode.
 
-    variant = (
-        db.session.query(ProductVariant)
-        .options(joinedload(ProductVariant.product))
-        .filter(
-            ProductVariant.id == variant_id,
-            ProductVariant.is_active.is_(True),
-        )
-        .first()
-    )
-    if variant is None or variant.product is None or not variant.product.is_active:
-        try:
-            cache.delete(cache_key)
-        except Exception:
-            pass
-        return None
-    return variant
+    Returns a read-only VariantSnapshot (see app/inventory/barcode_cache.py)
+    whose ``stock`` is only a hint; checkout re-verifies stock under lock.
+    """
+    return get_variant_snapshot(barcode)
 
 def get_stock_map(cart):
     """
@@ -94,6 +101,59 @@ def get_stock_map(cart):
     return {str(v.id): v.stock for v in variants}
 
 
+def _scan_barcode(cart, barcode):
+    """
+    Add one unit of the scanned variant to the cart.
+
+    Returns (variant, error). Weighed products come back with no error and
+    are NOT added — the caller has to ask for a weight first.
+    """
+    if not barcode:
+        return None, 'Please enter a barcode.'
+
+    variant = get_variant_by_barcode(barcode)
+    product = variant.product if variant else None
+
+    if variant is None or product is None or not product.is_active:
+        return None, f'No product found for barcode "{barcode}".'
+
+    current_qty = cart.get(str(variant.id), {}).get('quantity', 0)
+    needed = 1 if product.is_weighed else current_qty + 1
+    if variant.stock < needed:
+        # The cached stock hint says no; check the real figure before refusing.
+        variant = refresh_stock_hint(variant)
+
+    if variant.stock <= 0:
+        return variant, f'"{product.name}" is out of stock.'
+    if product.is_weighed:
+        return variant, None
+    if current_qty + 1 > variant.stock:
+        return variant, f'Insufficient stock for "{product.name}". Only {variant.stock} available.'
+    add_to_cart(variant)
+    return variant, None
+
+
+def _step_quantity(cart, variant_id, action):
+    """Apply 'incr' / 'decr' to a cart line. Returns (variant, error)."""
+    if not variant_id or str(variant_id) not in cart:
+        return None, None
+
+    # Fetch fresh variant to ensure stock check is real-time
+    variant = db.session.get(ProductVariant, variant_id)
+    if not variant:
+        return None, "Product not found."
+
+    current_qty = cart[str(variant_id)]['quantity']
+    if action == 'incr':
+        # Check: (current + 1) vs Stock
+        if current_qty + 1 > variant.stock:
+            return variant, f"Limit reached. Only {variant.stock} in stock."
+        update_cart_quantity(variant_id, current_qty + 1)
+    elif action == 'decr':
+        update_cart_quantity(variant_id, current_qty - 1)
+    return variant, None
+
+
 def _build_returned_map(sale_obj):
     returned = {}
     for ret in sale_obj.returns:
@@ -118,13 +178,13 @@ def enforce_session():
     endpoint = request.endpoint
     if not endpoint or 'open_session' in endpoint or 'close_session' in endpoint or 'sessions' in endpoint:
         return
+    # Offline sales are credited to the session open when they were captured.
+    if endpoint == 'billing.api_sync':
+        return
 
     # For billing actions (index, add/remove, complete), require active session
     if 'billing.' in endpoint:
-        active = CashSession.query.filter(
-            CashSession.cashier_id == session['user_id'],
-            CashSession.end_time == None
-        ).first()
+        active = get_active_cash_session_id(session['user_id'])
         
         if not active:
             flash('Please open a cash session to start billing.', 'warning')
@@ -147,13 +207,19 @@ def open_session():
     if request.method == 'POST':
         try:
             opening = Decimal(request.form['opening_cash'])
+            counter_raw = request.form.get('counter_code', '').strip()
+            counter_code = normalize_counter_code(counter_raw) if counter_raw else default_counter_code(session['user_id'])
+            if counter_code is None:
+                raise ValueError('Counter code must be 1-6 letters or digits.')
             new_session = CashSession(
                 cashier_id=session['user_id'],
                 opening_cash=opening,
-                system_total=0
+                system_total=0,
+                counter_code=counter_code,
             )
             db.session.add(new_session)
             db.session.commit()
+            invalidate_cash_session(session['user_id'])
             flash('Cash session opened.', 'success')
             return redirect(url_for('billing.index'))
         except Exception as e:
@@ -174,6 +240,11 @@ def close_session():
     if not active:
         flash('No active session found.', 'warning')
         return redirect(url_for('billing.index'))
+
+    # Cash revenue reaches system_total through the sale event worker;
+    # apply anything still pending so the expected total is complete.
+    if process_sale_events(cashier_id=session['user_id'], event_types=('cash_session.add_revenue',)):
+        db.session.refresh(active)
         
     if request.method == 'POST':
         try:
@@ -195,6 +266,7 @@ def close_session():
                 )
             
             db.session.commit()
+            invalidate_cash_session(session['user_id'])
             flash(f'Session closed. Discrepancy: ₹{diff}', 'info')
             return redirect(url_for('main.index'))
         except Exception as e:
@@ -267,19 +339,10 @@ def add_item():
     """
     barcode = request.form.get('barcode', '').strip()
     cart    = get_cart()
-    error   = None
 
-    if not barcode:
-        error = 'Please enter a barcode.'
-    else:
-        variant = get_variant_by_barcode(barcode)
-        product = variant.product if variant else None
-
-        if variant is None or product is None or not product.is_active:
-            error = f'No product found for barcode "{barcode}".'
-        elif variant.stock <= 0:
-            error = f'"{product.name}" is out of stock.'
-        elif product.is_weighed:
+    variant, error = _scan_barcode(cart, barcode)
+    if variant is not None and error is None:
+        if variant.product.is_weighed:
             # Return HTMX OOB swap to open the weight modal
             totals    = cart_totals(cart)
             stock_map = get_stock_map(cart)
@@ -289,18 +352,12 @@ def add_item():
             )
             modal_html = render_template(
                 'billing/_weight_modal.html',
-                product=product,
+                product=variant.product,
                 variant=variant,
             )
             # Combine both via HTMX OOB — cart stays as is, modal opens
             return cart_html + modal_html
-        else:
-            current_qty = cart.get(str(variant.id), {}).get('quantity', 0)
-            if current_qty + 1 > variant.stock:
-                error = f'Insufficient stock for "{product.name}". Only {variant.stock} available.'
-            else:
-                add_to_cart(variant)
-                cart = get_cart()
+        cart = get_cart()
 
     totals       = cart_totals(cart)
     stock_map    = get_stock_map(cart)
@@ -408,27 +465,8 @@ def update_item():
     if variant_id is None:
         variant_id = request.form.get('product_id', type=int)
     action     = request.form.get('action')  # 'incr' or 'decr'
-    error      = None
-    cart       = get_cart()
 
-    if variant_id and str(variant_id) in cart:
-        # Fetch fresh variant to ensure stock check is real-time
-        variant = db.session.get(ProductVariant, variant_id)
-        
-        if not variant:
-            error = "Product not found."
-        else:
-            current_qty = cart[str(variant_id)]['quantity']
-            
-            if action == 'incr':
-                # Check: (current + 1) vs Stock
-                if current_qty + 1 > variant.stock:
-                    error = f"Limit reached. Only {variant.stock} in stock."
-                else:
-                    update_cart_quantity(variant_id, current_qty + 1)
-            
-            elif action == 'decr':
-                update_cart_quantity(variant_id, current_qty - 1)
+    _variant, error = _step_quantity(get_cart(), variant_id, action)
     
     # Re-render cart with updated state
     cart         = get_cart()
@@ -470,6 +508,318 @@ def new_sale():
     )
 
 
+# ── CART JSON API ─────────────────────────────────────────────────
+# Compact deltas for the scanner screen (static/js/cart_api.js). A
+# mutation answers with only the lines it touched plus totals, applied
+# promotions and stock for those lines, so response size and rendering
+# work stay flat as the basket grows. The client sends the cart token it
+# last saw; if the cart changed underneath it (another tab, a cleared
+# sale) the answer carries every line with full=true instead.
+
+Q = Decimal('0.01')
+
+
+def _cart_line_json(key, item, stock=None) -> dict:
+    return {
+        'id': key,
+        'barcode': item.get('barcode'),
+        'name': item.get('name'),
+        'size': item.get('size'),
+        'color': item.get('color'),
+        'is_weighed': bool(item.get('is_weighed')),
+        'quantity': item['quantity'],
+        'price': str(item['price']),
+        'line_subtotal': str(item.get('line_subtotal', '')),
+        'gst_percent': item.get('gst_percent'),
+        'stock': stock,
+        'at_limit': stock is not None and item['quantity'] >= stock,
+    }
+
+
+def _cart_summary_json(cart, promo_result) -> dict:
+    """Footer figures, computed exactly like billing/_cart.html."""
+    totals = cart_totals(cart)
+    subtotal = Decimal(totals['subtotal'])
+    base_gst = Decimal(totals['gst_total'])
+    applied = promo_result.applied if promo_result else []
+    promo_discount = promo_result.total_discount if applied else Decimal('0')
+
+    after_promo = max(Decimal('0'), subtotal - promo_discount)
+    gst = (base_gst * after_promo / subtotal).quantize(Q) if subtotal > 0 else Decimal('0')
+    return {
+        'items': len(cart),
+        'subtotal': str(subtotal.quantize(Q)),
+        'base_gst': str(base_gst.quantize(Q)),
+        'gst': str(gst),
+        'promo_discount': str(Decimal(promo_discount).quantize(Q)),
+        'payable': str((after_promo + gst).quantize(Q)),
+    }
+
+
+def _cart_delta(cart, touched=(), stock=None, error=None, full=False, **extra):
+    """
+    JSON response for ``cart`` after a change to the ``touched`` line keys;
+    ``stock`` maps touched keys to current stock. full=True sends every line.
+    """
+    promo_result = _get_promo_result(cart)
+
+    if full:
+        stock = get_stock_map(cart)
+        keys = list(cart.keys())
+        removed = []
+    else:
+        stock = stock or {}
+        keys = [k for k in touched if k in cart]
+        removed = [k for k in touched if k not in cart]
+
+    return jsonify({
+        'token': cart.token or '',
+        'full': full,
+        'lines': [_cart_line_json(k, cart[k], stock.get(k)) for k in keys],
+        'removed': removed,
+        'totals': _cart_summary_json(cart, promo_result),
+        'promotions': {
+            'applied': [
+                {
+                    'id': e.promo_id,
+                    'name': e.promo_name,
+                    'description': e.description,
+                    'discount': str(e.discount_amount),
+                }
+                for e in (promo_result.applied if promo_result else [])
+            ],
+        },
+        'error': error,
+        **extra,
+    })
+
+
+def _client_token() -> str:
+    body = request.get_json(silent=True) if request.is_json else None
+    if isinstance(body, dict):
+        return str(body.get('token') or '')
+    return request.values.get('token', '')
+
+
+def _mutate_cart(mutation):
+    """
+    Run ``mutation(cart) -> (touched_keys, stock, error, extra)`` and
+    answer with the delta, or with every line if the client's token was
+    not the cart the mutation started from.
+    """
+    before = get_cart()
+    stale = _client_token() != (before.token or '')
+    touched, stock, error, extra = mutation(before)
+    return _cart_delta(get_cart(), touched, stock, error, full=stale, **extra)
+
+
+@billing.route('/api/cart')
+@login_required
+def api_cart():
+    """Every line, totals and promotions (initial load / resync)."""
+    return _cart_delta(get_cart(), full=True)
+
+
+@billing.route('/api/cart/add', methods=['POST'])
+@login_required
+def api_cart_add():
+    """Scan one barcode. Weighed products answer needs_weight=true."""
+    barcode = request.values.get('barcode', '').strip()
+
+    def mutation(cart):
+        variant, error = _scan_barcode(cart, barcode)
+        if variant is None:
+            return (), None, error, {}
+        key = str(variant.id)
+        if error is None and variant.product.is_weighed:
+            return (), None, None, {'needs_weight': True, 'variant_id': variant.id}
+        return (key,), {key: variant.stock}, error, {}
+
+    return _mutate_cart(mutation)
+
+
+MAX_BATCH_SCANS = 200
+MAX_SCAN_QTY = 999
+
+
+def _parse_scan_batch():
+    """
+    Ordered [(barcode, qty), …] from a JSON body
+    ``{"items": [{"barcode": "…", "qty": 2}, …]}`` or repeated form
+    ``barcode`` fields (qty 1 each). Raises ValueError on bad input.
+    """
+    body = request.get_json(silent=True) if request.is_json else None
+    if isinstance(body, dict):
+        raw = body.get('items') or []
+    else:
+        raw = [{'barcode': b} for b in request.form.getlist('barcode')]
+    if not isinstance(raw, list):
+        raise ValueError('items must be a list.')
+    if len(raw) > MAX_BATCH_SCANS:
+        raise ValueError(f'At most {MAX_BATCH_SCANS} scans per request.')
+
+    scans = []
+    for entry in raw:
+        if isinstance(entry, str):
+            entry = {'barcode': entry}
+        if not isinstance(entry, dict):
+            raise ValueError('Each scan must be a barcode or {"barcode": …, "qty": …}.')
+        barcode = str(entry.get('barcode') or '').strip()
+        try:
+            qty = int(entry.get('qty', 1))
+        except (TypeError, ValueError):
+            raise ValueError(f'Invalid quantity for barcode "{barcode}".')
+        if not barcode:
+            raise ValueError('Every scan needs a barcode.')
+        if not 1 <= qty <= MAX_SCAN_QTY:
+            raise ValueError(f'Quantity for barcode "{barcode}" must be 1-{MAX_SCAN_QTY}.')
+        scans.append((barcode, qty))
+    if not scans:
+        raise ValueError('No barcodes to add.')
+    return scans
+
+
+@billing.route('/api/cart/add-many', methods=['POST'])
+@login_required
+def api_cart_add_many():
+    """
+    Add a burst of scans in one round trip (buffered / tunnel scanners).
+
+    Barcodes are resolved together (cache, then one IN query for misses)
+    and applied in order with a stock check per line; a refused line is
+    reported in ``errors`` and does not stop the rest. Promotions are
+    evaluated once, for the final cart.
+    """
+    try:
+        scans = _parse_scan_batch()
+    except ValueError as exc:
+        return jsonify({'error': str(exc)}), 400
+
+    def mutation(cart):
+        snapshots = get_variant_snapshots([barcode for barcode, _qty in scans])
+
+        # Re-read real stock, in one query, for every variant whose cached
+        # hint cannot cover what is already in the cart plus this batch.
+        demand = {}
+        for barcode, qty in scans:
+            variant = snapshots.get(barcode)
+            if variant is not None:
+                demand[variant.id] = demand.get(variant.id, 0) + qty
+        variants = {v.id: v for v in snapshots.values()}
+        short = [
+            v for v in variants.values()
+            if v.stock < (1 if v.product.is_weighed
+                          else cart.get(str(v.id), {}).get('quantity', 0) + demand[v.id])
+        ]
+        variants.update(refresh_stock_hints(short))
+
+        in_cart = {}
+        accepted = {}   # variant_id -> [variant, qty], first-scan order
+        errors = []
+        for index, (barcode, qty) in enumerate(scans):
+            variant = snapshots.get(barcode)
+            variant = variants[variant.id] if variant is not None else None
+            if variant is None:
+                errors.append({'index': index, 'barcode': barcode,
+                               'error': f'No product found for barcode "{barcode}".'})
+                continue
+
+            name = variant.product.name
+            current = in_cart.get(variant.id, cart.get(str(variant.id), {}).get('quantity', 0))
+            if variant.stock <= 0:
+                errors.append({'index': index, 'barcode': barcode,
+                               'error': f'"{name}" is out of stock.'})
+            elif variant.product.is_weighed:
+                errors.append({'index': index, 'barcode': barcode, 'needs_weight': True,
+                               'variant_id': variant.id, 'error': f'"{name}" must be weighed.'})
+            elif current + qty > variant.stock:
+                errors.append({'index': index, 'barcode': barcode,
+                               'error': f'Insufficient stock for "{name}". Only {variant.stock} available.'})
+            else:
+                in_cart[variant.id] = current + qty
+                accepted.setdefault(variant.id, [variant, 0])[1] += qty
+
+        if accepted:
+            add_many_to_cart([(variant, qty) for variant, qty in accepted.values()])
+
+        error = None
+        if errors:
+            error = errors[0]['error']
+            if len(errors) > 1:
+                error += f' (+{len(errors) - 1} more)'
+        return (
+            [str(vid) for vid in accepted],
+            {str(vid): variant.stock for vid, (variant, _qty) in accepted.items()},
+            error,
+            {'errors': errors},
+        )
+
+    return _mutate_cart(mutation)
+
+
+@billing.route('/api/sync', methods=['POST'])
+@login_required
+def api_sync():
+    """
+    Ingest sales queued by a terminal while offline (see app/billing/offline.py).
+
+    Body: {"sales": [...]}; answers one result per sale, in order. The
+    terminal drops recorded / duplicate / rejected entries from its queue
+    and keeps conflicts for a manager to resolve.
+    """
+    body = request.get_json(silent=True)
+    sales = body.get('sales') if isinstance(body, dict) else None
+    max_batch = current_app.config.get('OFFLINE_SYNC_MAX_BATCH', 50)
+    if not isinstance(sales, list) or not sales:
+        return jsonify({'error': 'No sales to sync.'}), 400
+    if len(sales) > max_batch:
+        return jsonify({'error': f'At most {max_batch} sales per sync.'}), 400
+
+    try:
+        results = ingest_offline_sales(sales, session['user_id'])
+    except IntegrityError as exc:
+        db.session.rollback()
+        current_app.logger.warning(f"Offline sync collided with a concurrent sync: {exc}")
+        return jsonify({'error': 'Another sync is recording these sales; retry shortly.'}), 409
+
+    counts = {}
+    for result in results:
+        counts[result['status']] = counts.get(result['status'], 0) + 1
+    current_app.logger.info(f"Offline sync by User ID {session['user_id']}: {counts}")
+    return jsonify({'results': results})
+
+
+@billing.route('/api/cart/update', methods=['POST'])
+@login_required
+def api_cart_update():
+    """Step a line's quantity: action=incr|decr."""
+    variant_id = request.values.get('variant_id', type=int)
+    action = request.values.get('action')
+
+    def mutation(cart):
+        variant, error = _step_quantity(cart, variant_id, action)
+        if variant is None:
+            return (), None, error, {}
+        key = str(variant.id)
+        return (key,), {key: variant.stock}, error, {}
+
+    return _mutate_cart(mutation)
+
+
+@billing.route('/api/cart/remove', methods=['POST'])
+@login_required
+def api_cart_remove():
+    variant_id = request.values.get('variant_id', type=int)
+
+    def mutation(cart):
+        if not variant_id:
+            return (), None, None, {}
+        remove_from_cart(variant_id)
+        return (str(variant_id),), None, None, {}
+
+    return _mutate_cart(mutation)
+
+
 # ── CUSTOMER MANAGEMENT ─────────────────────────────────────────
 
 @billing.route('/customer/attach', methods=['POST'])
@@ -496,57 +846,160 @@ def detach_customer():
 
 # ── COMPLETE SALE ─────────────────────────────────────────────────
 
+IDEMPOTENCY_KEY_MAX = 64
+
+
+def _idempotency_key():
+    """
+    Client-generated key for this checkout attempt, from the
+    ``Idempotency-Key`` header or the ``idempotency_key`` form field.
+    Terminals send the same key when they retry a timed-out checkout.
+    """
+    key = (request.headers.get('Idempotency-Key') or request.form.get('idempotency_key') or '').strip()
+    if not key:
+        return None
+    if len(key) > IDEMPOTENCY_KEY_MAX:
+        raise ValueError(f'Idempotency key must be at most {IDEMPOTENCY_KEY_MAX} characters.')
+    return key
+
+
+def _completed_sale_response(sale, receipt_items, replayed=False):
+    """Redirect (HTML) or receipt payload (JSON) for a committed sale."""
+    receipt_data = {
+        'invoice_number': sale.invoice_number,
+        'subtotal': float(sale.total_amount),
+        'gst_total': float(sale.gst_total),
+        'grand_total': float(sale.grand_total),
+        'items': receipt_items
+    }
+
+    if request.headers.get('Accept') == 'application/json':
+        response = jsonify({
+            'status': 'success',
+            'sale_id': sale.id,
+            'redirect': url_for('billing.invoice', sale_id=sale.id),
+            'receipt': receipt_data,
+            'replayed': replayed,
+        })
+    else:
+        if replayed:
+            flash(f'Invoice {sale.invoice_number} was already completed.', 'info')
+        else:
+            flash(f'Sale complete! Invoice {sale.invoice_number}', 'success')
+        response = redirect(url_for('billing.invoice', sale_id=sale.id))
+    if replayed:
+        response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _replay_completed_sale(cashier_id, key):
+    """
+    Response for a checkout whose key already produced a sale, or None.
+
+    The original transaction is not re-run: the cart the retry carries
+    (if any) is discarded and the original invoice is returned.
+    """
+    sale = Sale.query.filter_by(idempotency_key=key, cashier_id=cashier_id).first()
+    if sale is None:
+        return None
+
+    clear_cart()
+    session.pop('customer_id', None)
+    current_app.logger.info(f"Checkout retry for {sale.invoice_number} (key {key}) answered from the original sale.")
+
+    receipt_items = [
+        {
+            'name': item.product.name if item.product else '',
+            'qty': item.quantity,
+            'price': float(item.price_at_sale),
+            'subtotal': float(item.subtotal),
+        }
+        for item in sorted(sale.items, key=lambda i: i.id)
+    ]
+    return _completed_sale_response(sale, receipt_items, replayed=True)
+
+
 @billing.route('/complete', methods=['POST'])
 @login_required
 def complete():
     """
     Finalise the sale:
-      1. Lock each variant row with SELECT … FOR UPDATE
+      1. Lock every cart variant in ONE ordered SELECT … FOR UPDATE
+         (or, with CHECKOUT_STOCK_MODE='atomic', deduct all stock in ONE
+         conditional UPDATE … WHERE stock >= qty RETURNING)
       2. Verify stock is sufficient for every item
-      3. Deduct stock
+      3. Deduct stock, price lines, allocate discounts, validate tenders
       4. Generate invoice number
-      5. Persist Sale + SaleItems
+      5. Persist Sale, then bulk-insert SaleItems / SalePayments / AppliedPromotions
       6. Commit
       7. Clear cart
       8. Redirect to printable invoice
+
+    With an idempotency key (see _idempotency_key) a repeat submission
+    returns the original sale instead of running again; the unique index
+    on sales.idempotency_key settles concurrent duplicates.
+
+    The number of SQL statements issued while variant locks are held does
+    not grow with basket size; per-phase timings and statement counts are
+    logged and returned in the Server-Timing response header.
     """
+    cashier_id = session.get('user_id')
+    try:
+        idempotency_key = _idempotency_key()
+    except ValueError as exc:
+        flash(str(exc), 'error')
+        return redirect(url_for('billing.index'))
+
+    if idempotency_key:
+        replay = _replay_completed_sale(cashier_id, idempotency_key)
+        if replay is not None:
+            return replay
+
     cart = get_cart()
 
     if not cart:
         flash('Cart is empty. Add products before completing a sale.', 'error')
         return redirect(url_for('billing.index'))
 
-    cashier_id = session.get('user_id')
     customer_id = session.get('customer_id')
+    trace = start_checkout_trace(db.engine)
 
     try:
         # ── Lock all variant rows in a deterministic order ────────
-        # Sorting by variant_id prevents deadlocks when two concurrent
-        # transactions try to lock the same rows in different orders.
+        # Both helpers lock ORDER BY id so two concurrent baskets
+        # sharing SKUs always acquire row locks in the same order.
+        # 'atomic' mode deducts stock with one conditional UPDATE
+        # instead of lock → check → write.
         variant_ids = sorted(int(pid) for pid in cart.keys())
+        atomic_stock = current_app.config.get('CHECKOUT_STOCK_MODE') == 'atomic'
+
+        with trace.phase('lock'):
+            if atomic_stock:
+                locked_by_id = decrement_stock_atomic(
+                    db.session,
+                    {int(pid): item['quantity'] for pid, item in cart.items()},
+                )
+            else:
+                locked_by_id = lock_variants(db.session, variant_ids)
 
         locked_variants = {}
         for vid in variant_ids:
-            # SELECT … FOR UPDATE — holds a row-level lock until COMMIT/ROLLBACK
-            variant = (
-                db.session.query(ProductVariant)
-                .filter(ProductVariant.id == vid)
-                .with_for_update()
-                .first()
-            )
+            variant = locked_by_id.get(vid)
             if variant is None or not variant.is_active or variant.product is None or not variant.product.is_active:
                 raise ValueError(f'Variant ID {vid} no longer exists.')
             locked_variants[str(vid)] = variant
 
         # ── Stock validation (all-or-nothing) ─────────────────────
-        for pid_str, item in cart.items():
-            variant  = locked_variants[pid_str]
-            required = item['quantity']
-            if variant.stock < required:
-                raise ValueError(
-                    f'Insufficient stock for "{variant.product.name}". '
-                    f'Available: {variant.stock}, requested: {required}.'
-                )
+        # Already enforced by the UPDATE's WHERE clause in atomic mode.
+        if not atomic_stock:
+            for pid_str, item in cart.items():
+                variant  = locked_variants[pid_str]
+                required = item['quantity']
+                if variant.stock < required:
+                    raise ValueError(
+                        f'Insufficient stock for "{variant.product.name}". '
+                        f'Available: {variant.stock}, requested: {required}.'
+                    )
 
 
         subtotal_before_discount = Decimal('0.00')
@@ -559,7 +1012,8 @@ def complete():
             gst_rate = Decimal(item['gst_percent']) / Decimal('100')
 
             line_subtotal_base = (price * qty).quantize(Decimal('0.01'))
-            variant.stock -= qty
+            if not atomic_stock:
+                variant.stock -= qty
 
             subtotal_before_discount += line_subtotal_base
             line_items.append({
@@ -573,7 +1027,8 @@ def complete():
                 'unit_label': 'kg' if item.get('is_weighed') else None,
             })
 
-        promo_result = _get_promo_result(cart)
+        with trace.phase('promotions'):
+            promo_result = _get_promo_result(cart, use_cache=False)
         promo_discount = Decimal('0.00')
         promo_applied_entries = []
         if promo_result and promo_result.total_discount > 0:
@@ -637,27 +1092,11 @@ def complete():
                 line['discounted_subtotal'] = line['line_subtotal_base']
 
         gst_total = Decimal('0.00')
-        sale_items = []
         for line in line_items:
-            line_gst = (
+            line['line_gst'] = (
                 line['discounted_subtotal'] * line['gst_rate']
             ).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
-            gst_total += line_gst
-
-            sale_items.append(SaleItem(
-                product_id=int(line['variant'].product_id),
-                variant_id=int(line['variant'].id),
-                quantity=line['qty'],
-                price_at_sale=line['price'],
-                snapshot_size=line['variant'].size,
-                snapshot_color=line['variant'].color,
-                gst_percent=line['gst_percent'],
-                subtotal=line['discounted_subtotal'],
-                weight_kg=line['weight_kg'],
-                unit_label=line['unit_label'],
-            ))
-            # Explicitly link variant to avoid lazy-loading detached error later
-            sale_items[-1].variant = line['variant']
+            gst_total += line['line_gst']
 
         # Capture item names for receipt payload BEFORE commit
         receipt_items_snapshot = []
@@ -669,29 +1108,11 @@ def complete():
                 'subtotal': float(line['discounted_subtotal'])
             })
 
-        invoice_number = generate_invoice_number(db.session)
-
         grand_total = subtotal_total + gst_total
-        # ── Persist Sale ──────────────────────────────────────────
-        total_discount_amount = (promo_discount + manual_discount_amount).quantize(Decimal('0.01'))
-        
-        sale = Sale(
-            invoice_number=invoice_number,
-            cashier_id=cashier_id,
-            customer_id=customer_id,
-            total_amount=subtotal_total,
-            discount_percent=manual_discount_percent,
-            discount_amount=total_discount_amount,  # Persist TOTAL discount (promo + manual)
-            gst_total=gst_total,
-            grand_total=grand_total,
-        )
-        db.session.add(sale)
-        db.session.flush() # Ensure sale.id is available
-        
+
         # ── Process Payments ──────────────────────────────────────
-        # Sum of line items is our definitive Total Revenue
-        
-        # Parse inputs
+        # Tenders are validated before the invoice number is allocated so
+        # that a rejected payment never touches the invoice_sequences lock.
         try:
             p_cash    = Decimal(request.form.get('payment_cash') or '0')
             p_card    = Decimal(request.form.get('payment_card') or '0')
@@ -699,7 +1120,7 @@ def complete():
             p_loyalty = Decimal(request.form.get('payment_loyalty') or '0')
             p_gift    = Decimal(request.form.get('payment_gift') or '0')
             gift_code = request.form.get('gift_card_code', '').strip()
-            
+
             for method_name, amount in {
                 'cash': p_cash,
                 'card': p_card,
@@ -723,139 +1144,151 @@ def complete():
                  p_cash = grand_total
              else:
                  raise ValueError(f"Insufficient payment. Paid: {total_tendered}, Total: {grand_total}")
-        
-        # If Card/Other used, record them exactly
+
         # If Card/Other used, record them exactly
+        payment_rows = []
         if p_card > 0:
-            db.session.add(SalePayment(sale=sale, payment_method='card', amount=p_card))
+            payment_rows.append({'payment_method': 'card', 'amount': p_card})
         if p_upi > 0:
-            db.session.add(SalePayment(sale=sale, payment_method='upi', amount=p_upi))
-            
-        # ── Handle Loyalty Redemption ──
-        if p_loyalty > 0:
-             if not customer_id:
-                 raise ValueError("Cannot redeem points without a customer attached.")
-             
-             customer_obj = db.session.get(Customer, customer_id)
-             # Assumption: 1 Point = ₹1.00
-             points_needed = int(p_loyalty) 
-             if customer_obj.points < points_needed:
-                 raise ValueError(f"Insufficient points. Has {customer_obj.points}, needs {points_needed}.")
-             
-             customer_obj.points -= points_needed
-             db.session.add(SalePayment(sale=sale, payment_method='loyalty', amount=p_loyalty))
-             
-        # ── Handle Gift Card Redemption ──
-        if p_gift > 0:
-            if not gift_code:
-                raise ValueError("Gift card code required.")
-            gc = GiftCard.query.filter_by(code=gift_code, is_active=True).with_for_update().first()
-            if not gc:
-                 raise ValueError("Invalid gift card.")
-            if gc.balance < p_gift:
-                 raise ValueError(f"Insufficient gift card balance. Available: {gc.balance}")
-            
-            gc.balance -= p_gift
-            db.session.add(SalePayment(sale=sale, payment_method='gift_card', amount=p_gift))
-
-        # Determine Cash Revenue (Revenue = Total - NonCash)
-        cash_revenue = grand_total - p_card - p_upi - p_loyalty - p_gift
-        if cash_revenue > 0:
-             db.session.add(SalePayment(sale=sale, payment_method='cash', amount=cash_revenue))
-
-        # ── Accrue Loyalty Points ──
-        if customer_id and grand_total > 0:
-            # Rule: 1 Point per ₹100
-             new_points = int(grand_total // 100)
-             if new_points > 0:
-                 customer_obj = db.session.get(Customer, customer_id) # Re-fetch or use existing
-                 customer_obj.points += new_points
+            payment_rows.append({'payment_method': 'upi', 'amount': p_upi})
+
+        customer_obj = None
+        with trace.phase('tenders'):
+            # ── Handle Loyalty Redemption ──
+            if p_loyalty > 0:
+                if not customer_id:
+                    raise ValueError("Cannot redeem points without a customer attached.")
+
+                customer_obj = db.session.get(Customer, customer_id)
+                if customer_obj is None:
+                    raise ValueError("Customer not found.")
+                # Assumption: 1 Point = ₹1.00
+                points_needed = int(p_loyalty)
+                if customer_obj.points < points_needed:
+                    raise ValueError(f"Insufficient points. Has {customer_obj.points}, needs {points_needed}.")
+
+                customer_obj.points -= points_needed
+                payment_rows.append({'payment_method': 'loyalty', 'amount': p_loyalty})
+
+            # ── Handle Gift Card Redemption ──
+            if p_gift > 0:
+                if not gift_code:
+                    raise ValueError("Gift card code required.")
+                gc = GiftCard.query.filter_by(code=gift_code, is_active=True).with_for_update().first()
+                if not gc:
+                    raise ValueError("Invalid gift card.")
+                if gc.balance < p_gift:
+                    raise ValueError(f"Insufficient gift card balance. Available: {gc.balance}")
+
+                gc.balance -= p_gift
+                payment_rows.append({'payment_method': 'gift_card', 'amount': p_gift})
+
+            # Determine Cash Revenue (Revenue = Total - NonCash)
+            cash_revenue = grand_total - p_card - p_upi - p_loyalty - p_gift
+            if cash_revenue > 0:
+                payment_rows.append({'payment_method': 'cash', 'amount': cash_revenue})
+
+            # ── Post-commit side effects (see app/billing/events.py) ──
+            effects = [
+                ('inventory.broadcast', {'variant_ids': [line['variant'].id for line in line_items]}),
+                ('rollups.sale', {}),
+            ]
+            if customer_id and grand_total > 0:
+                # Rule: 1 Point per ₹100
+                new_points = int(grand_total // 100)
+                if new_points > 0:
+                    effects.append(('loyalty.accrue', {'customer_id': customer_id, 'points': new_points}))
+            if promo_applied_entries:
+                effects.append(('promotions.count_uses', {
+                    'promotion_ids': [e.promo_id for e in promo_applied_entries],
+                }))
+            if cash_revenue > 0:
+                effects.append(('cash_session.add_revenue', {'amount': str(cash_revenue)}))
+
+        with trace.phase('invoice'):
+            invoice_series = resolve_invoice_series(db.session, cashier_id)
+            invoice_number = generate_invoice_number(db.session, series=invoice_series)
+
+        with trace.phase('persist'):
+            # ── Persist Sale ──────────────────────────────────────
+            sale = Sale(
+                invoice_number=invoice_number,
+                cashier_id=cashier_id,
+                customer_id=customer_id,
+                total_amount=subtotal_total,
+                discount_percent=manual_discount_percent,
+                discount_amount=total_discount_amount,  # Persist TOTAL discount (promo + manual)
+                gst_total=gst_total,
+                grand_total=grand_total,
+                idempotency_key=idempotency_key,
+            )
+            db.session.add(sale)
+            db.session.flush()   # assigns sale.id; also writes stock/tender changes
+
+            bulk_insert(db.session, SaleItem, [
+                {
+                    'sale_id': sale.id,
+                    'product_id': int(line['variant'].product_id),
+                    'variant_id': int(line['variant'].id),
+                    'quantity': line['qty'],
+                    'price_at_sale': line['price'],
+                    'snapshot_size': line['variant'].size,
+                    'snapshot_color': line['variant'].color,
+                    'gst_percent': line['gst_percent'],
+                    'subtotal': line['discounted_subtotal'],
+                    'weight_kg': line['weight_kg'],
+                    'unit_label': line['unit_label'],
+                }
+                for line in line_items
+            ])
+            bulk_insert(db.session, SalePayment, [
+                {'sale_id': sale.id, 'reference': None, **row} for row in payment_rows
+            ])
+
+            # ── Persist applied promotions ────────────────────────
+            from app.promotions.models import AppliedPromotion
+            bulk_insert(db.session, AppliedPromotion, [
+                {
+                    'sale_id': sale.id,
+                    'promotion_id': entry.promo_id,
+                    'promo_name': entry.promo_name,
+                    'discount_amount': entry.discount_amount,
+                    'description': entry.description,
+                }
+                for entry in promo_applied_entries
+            ])
+
+            # ── Outbox: applied after commit, outside the sale's locks ──
+            bulk_insert(db.session, SaleEvent, sale_event_rows(sale.id, effects))
 
-        
-        # update current session total
-        active_session = CashSession.query.filter(
-            CashSession.cashier_id == cashier_id,
-            CashSession.end_time == None
-        ).first()
-        
-        if active_session and cash_revenue > 0:
-             active_session.system_total += cash_revenue
-             db.session.add(active_session)
+        # ── Final Commit ──────────────────────────────────────────
+        with trace.phase('commit'):
+            db.session.expire_on_commit = False # Keep objects attached after commit if needed
+            db.session.commit()
 
-        db.session.flush()   # assigns sale.id without committing
+        # ── Freeze Invoice Snapshot (HTML) ────────────────────────
+        # After commit: no row locks are held while the template renders.
+        with trace.phase('snapshot'):
+            freeze_invoice_snapshot(sale.id)
 
-        for si in sale_items:
-            si.sale_id = sale.id
-            db.session.add(si)
-        
-        sale.items = sale_items
-        db.session.flush()
-
-        # ── Persist applied promotions ────────────────────────────
-        from app.promotions.models import AppliedPromotion
-        for entry in promo_applied_entries:
-            ap = AppliedPromotion(
-                sale_id         = sale.id,
-                promotion_id    = entry.promo_id,
-                promo_name      = entry.promo_name,
-                discount_amount = entry.discount_amount,
-                description     = entry.description,
-            )
-            db.session.add(ap)
-            # Increment use counter
-            if entry.promo_id:
-                from app.promotions.models import Promotion
-                promo_row = db.session.get(Promotion, entry.promo_id)
-                if promo_row:
-                    promo_row.current_uses += 1
-
-        # ── Generate & Store Invoice Snapshot (HTML) ──────────────
-        # Ensure we have a clean, eager-loaded object for the template
-        db.session.expire_on_commit = False # Keep objects attached after commit if needed
-        sale = db.session.query(Sale).options(
-            joinedload(Sale.items).joinedload(SaleItem.variant).joinedload(ProductVariant.product),
-            joinedload(Sale.cashier),
-            joinedload(Sale.customer),
-            joinedload(Sale.payments)
-        ).filter_by(id=sale.id).first()
+        with trace.phase('events'):
+            dispatch_sale_events(sale.id)
 
-        try:
-            invoice_html = render_template(
-                'billing/invoice.html',
-                title=f'Invoice {sale.invoice_number}',
-                sale=sale,
-                reprint_mode=False
-            )
-            sale.print_html = invoice_html
-        except Exception as e:
-            current_app.logger.error(f"Failed to generate invoice snapshot: {e}")
-
-        # ── Final Commit ──────────────────────────────────────────
-        db.session.commit()
+        with trace.phase('print'):
+            push_print_job(sale, receipt_items_snapshot)
 
         clear_cart()
         session.pop('customer_id', None) # Detach customer after sale
-        
-        current_app.logger.info(f"Sale completed by User ID {cashier_id}: {invoice_number} | Total: {sale.grand_total}")
-        
-        # Build JSON receipt payload for hardware agent
-        receipt_data = {
-            'invoice_number': sale.invoice_number,
-            'subtotal': float(sale.total_amount),
-            'gst_total': float(sale.gst_total),
-            'grand_total': float(sale.grand_total),
-            'items': receipt_items_snapshot
-        }
 
-        if request.headers.get('Accept') == 'application/json':
-            return jsonify({
-                'status': 'success',
-                'redirect': url_for('billing.invoice', sale_id=sale.id),
-                'receipt': receipt_data
-            })
+        current_app.logger.info(f"Sale completed by User ID {cashier_id}: {invoice_number} | Total: {sale.grand_total}")
+        current_app.logger.info(
+            f"Checkout timings {invoice_number} ({len(line_items)} lines): {trace.summary()}"
+        )
 
-        flash(f'Sale complete! Invoice {invoice_number}', 'success')
-        return redirect(url_for('billing.invoice', sale_id=sale.id))
+        # Redirect, or JSON receipt payload for the hardware agent
+        response = _completed_sale_response(sale, receipt_items_snapshot)
+        response.headers['Server-Timing'] = trace.server_timing()
+        return response
 
     except ValueError as exc:
         db.session.rollback()
@@ -865,6 +1298,11 @@ def complete():
 
     except IntegrityError as exc:
         db.session.rollback()
+        # A concurrent retry with the same key committed first.
+        if idempotency_key:
+            replay = _replay_completed_sale(cashier_id, idempotency_key)
+            if replay is not None:
+                return replay
         current_app.logger.error(f"Sale rollback (IntegrityError): {str(exc)}")
         flash('A database error occurred. Please try again.', 'error')
         return redirect(url_for('billing.index'))
@@ -875,6 +1313,9 @@ def complete():
         flash('An unexpected error occurred. Please try again.', 'error')
         return redirect(url_for('billing.index'))
 
+    finally:
+        stop_checkout_trace()
+
 
 # ── PRINTABLE INVOICE ─────────────────────────────────────────────
 
@@ -908,16 +1349,18 @@ def reprint(sale_id):
     # Log reprint action
     current_app.logger.info(f"Invoice Reprint: User {session.get('user_id')} reprinted Sale {sale.id} ({sale.invoice_number})")
 
-    if sale.print_html:
-        return sale.print_html
-    else:
-        # Fallback for old sales without snapshot
-        return render_template(
-            'billing/invoice.html',
-            title=f'Invoice {sale.invoice_number}',
-            sale=sale,
-            reprint_mode=True,
-        )
+    # Returns the stored snapshot, or freezes it now if the post-commit
+    # freeze failed or was interrupted.
+    snapshot = freeze_invoice_snapshot(sale.id)
+    if snapshot:
+        return snapshot
+
+    return render_template(
+        'billing/invoice.html',
+        title=f'Invoice {sale.invoice_number}',
+        sale=sale,
+        reprint_mode=True,
+    )
 
 
 # ── RETURNS & REFUNDS ─────────────────────────────────────────────
@@ -928,23 +1371,47 @@ def reprint(sale_id):
 @login_required
 def mark_printed(sale_id):
     sale = db.session.get(Sale, sale_id)
-    if sale:
-        sale.is_printed = True
-        db.session.commit()
-        # Return empty string with 200 OK for safer HTMX swapping
-        return '', 200
-    return 'Sale not found', 404
+    if sale is None:
+        return 'Sale not found', 404
+    # Same path as socket acks, so other screens drop the job too.
+    # Cashiers can only mark their own sales; the reply lists what changed.
+    done = mark_sales_printed([sale.id], cashier_id=_print_scope())
+    return jsonify({'sale_ids': sorted(i for ids in done.values() for i in ids)})
+
+
+@billing.route('/print-ack', methods=['POST'])
+@login_required
+def print_ack():
+    """
+    Batch ack over HTTP: what a closing billing screen hands to
+    navigator.sendBeacon when its socket ack has not gone out yet.
+    """
+    try:
+        sale_ids = parse_sale_ids(request.form.getlist('sale_ids'))
+    except ValueError as exc:
+        return jsonify({'error': str(exc)}), 400
+    done = mark_sales_printed(sale_ids, cashier_id=_print_scope())
+    return jsonify({'sale_ids': sorted(i for ids in done.values() for i in ids)})
+
+
+def _print_scope():
+    """None (every sale) for admins, else the logged-in cashier's id."""
+    return None if session.get('role') == 'admin' else session['user_id']
+
+
 @billing.route('/print-queue')
 @login_required
 def print_queue():
-    """List sales from today that haven't been marked as printed."""
-    cutoff = datetime.utcnow() - timedelta(days=7)
-    sales = Sale.query.filter(
-        Sale.created_at >= cutoff,
-        Sale.is_printed == False
-    ).order_by(Sale.created_at.desc()).all()
-    
-    return render_template('billing/print_queue.html', sales=sales)
+    """
+    Unprinted sales from the last week (a cashier's own; all for admins).
+    The page then stays current through Socket.IO pushes
+    (static/js/print_jobs.js), not reloads.
+    """
+    scope = _print_scope()
+    sales = unprinted_sales_query(scope).all()
+
+    return render_template('billing/print_queue.html', sales=sales,
+                           print_scope='all' if scope is None else 'own')
 
 
 @billing.route('/exchange/<int:sale_id>', methods=['GET', 'POST'])
@@ -1133,7 +1600,9 @@ def exchange_process(sale_id):
             ))
             db.session.add(exchange_return)
 
-            exchange_invoice_number = generate_invoice_number(db.session)
+            exchange_invoice_number = generate_invoice_number(
+                db.session, series=resolve_invoice_series(db.session, session['user_id'])
+            )
             exchange_sale = Sale(
                 invoice_number=exchange_invoice_number,
                 cashier_id=session['user_id'],
@@ -1206,14 +1675,26 @@ def exchange_process(sale_id):
                 f'new gross {new_line_total:.2f}, delta {difference:.2f}.'
             )
 
-            exchange_sale.print_html = render_template(
-                'billing/invoice.html',
-                title=f'Invoice {exchange_sale.invoice_number}',
-                sale=exchange_sale,
-                reprint_mode=False,
+            # ── Outbox: rollups for both sides of the exchange ────
+            bulk_insert(
+                db.session, SaleEvent,
+                sale_event_rows(exchange_sale.id, [('rollups.sale', {})])
+                + sale_event_rows(sale_locked.id, [('rollups.return', {'return_id': exchange_return.id})]),
             )
 
             db.session.commit()
+            freeze_invoice_snapshot(exchange_sale.id)
+            dispatch_sale_events(exchange_sale.id)
+            dispatch_sale_events(exchange_return.sale_id)
+            push_print_job(exchange_sale, [
+                {
+                    'name': item.product.name if item.product else '',
+                    'qty': item.quantity,
+                    'price': float(item.price_at_sale),
+                    'subtotal': float(item.subtotal),
+                }
+                for item in exchange_sale.items
+            ])
 
             if difference > 0:
                 flash(
@@ -1389,7 +1870,12 @@ def returns_process(sale_id):
 
             new_return.total_refunded = total_refund
             db.session.add(new_return)
+            db.session.flush()
+            bulk_insert(db.session, SaleEvent, sale_event_rows(
+                sale_locked.id, [('rollups.return', {'return_id': new_return.id})],
+            ))
             db.session.commit()
+            dispatch_sale_events(sale_id)
 
             flash(f'Return processed successfully. Refund: Rs {total_refund:,.2f}', 'success')
             return redirect(url_for('billing.returns_process', sale_id=sale_locked.id))
@@ -0,0 +1,160 @@
+"""
+app/billing/snapshot.py
+-----------------------
+Frozen HTML invoice snapshots (Sale.print_html), served by /billing/reprint.
+
+Rendering billing/invoice.html used to happen inside the checkout (and
+exchange) transaction, i.e. while the invoice-sequence row and every
+sold variant row were still locked, so template time added directly to
+every other counter's wait. The snapshot is now frozen right after the
+sale commits, in its own short transaction. If that step fails, or the
+process dies between the two commits, the first reprint freezes it
+instead.
+
+Snapshots are stored zlib-compressed in sale_snapshots, not inline in
+sales: every sales listing (reports, print queue, exports) used to drag
+several kilobytes of HTML per row off disk. Sale.print_html is now a
+property that loads the snapshot only when accessed. Rows frozen before
+the move still sit in the deferred sales.print_html column until
+migrate_sale_snapshots.py back-fills them (backfill_sale_snapshots).
+
+Freezing is write-once: the INSERT does nothing if the sale already has
+a snapshot, so whichever request gets there first wins and later callers
+read that stored HTML back. The template is rendered with
+frozen_snapshot=True so the output reflects the sale as it was at
+checkout (e.g. not yet marked printed), not whatever state it has
+reached by the time of a late freeze.
+"""
+import zlib
+from typing import Optional
+
+from flask import current_app, render_template
+from sqlalchemy import update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import joinedload
+
+from app import db
+
+
+SNAPSHOT_ENCODING = 'zlib'
+SNAPSHOT_LEVEL = 6
+
+
+def compress_snapshot(html: str) -> bytes:
+    return zlib.compress(html.encode('utf-8'), SNAPSHOT_LEVEL)
+
+
+def decompress_snapshot(body: bytes, encoding: str = SNAPSHOT_ENCODING) -> str:
+    if encoding != SNAPSHOT_ENCODING:
+        raise ValueError(f'Unknown snapshot encoding {encoding!r}.')
+    return zlib.decompress(body).decode('utf-8')
+
+
+def snapshot_row(sale_id: int, html: str) -> dict:
+    return {
+        'sale_id': sale_id,
+        'encoding': SNAPSHOT_ENCODING,
+        'body': compress_snapshot(html),
+        'raw_size': len(html.encode('utf-8')),
+    }
+
+
+def load_invoice_snapshot(sale_id: int) -> Optional[str]:
+    """Stored snapshot HTML for ``sale_id`` (new table first, then legacy column)."""
+    from app.billing.models import Sale, SaleSnapshot
+
+    row = db.session.query(SaleSnapshot.body, SaleSnapshot.encoding).filter_by(sale_id=sale_id).first()
+    if row is not None:
+        return decompress_snapshot(row.body, row.encoding)
+    return db.session.query(Sale.legacy_print_html).filter_by(id=sale_id).scalar()
+
+
+def render_invoice_snapshot(sale) -> str:
+    return render_template(
+        'billing/invoice.html',
+        title=f'Invoice {sale.invoice_number}',
+        sale=sale,
+        reprint_mode=False,
+        frozen_snapshot=True,
+    )
+
+
+def freeze_invoice_snapshot(sale_id: int) -> Optional[str]:
+    """
+    Render and store the invoice snapshot for a committed sale, once.
+
+    Commits its own transaction. Returns the stored HTML, or None when the
+    sale does not exist or rendering failed (logged; a later reprint retries).
+    """
+    from app.billing.models import Sale, SaleItem, SaleSnapshot
+    from app.inventory.models import ProductVariant
+
+    try:
+        stored = load_invoice_snapshot(sale_id)
+        if stored:
+            return stored
+
+        sale = db.session.query(Sale).options(
+            joinedload(Sale.items).joinedload(SaleItem.variant).joinedload(ProductVariant.product),
+            joinedload(Sale.cashier),
+            joinedload(Sale.customer),
+            joinedload(Sale.payments)
+        ).filter_by(id=sale_id).populate_existing().first()
+        if sale is None:
+            return None
+
+        html = render_invoice_snapshot(sale)
+        result = db.session.execute(
+            insert(SaleSnapshot)
+            .values(**snapshot_row(sale_id, html))
+            .on_conflict_do_nothing(index_elements=['sale_id'])
+        )
+        db.session.commit()
+
+        if result.rowcount == 0:
+            # Another request froze it first; serve that copy.
+            return load_invoice_snapshot(sale_id)
+        db.session.expire(sale, ['snapshot'])
+        return html
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Failed to freeze invoice snapshot for sale {sale_id}: {e}")
+        return None
+
+
+def backfill_sale_snapshots(batch_size: int = 500) -> int:
+    """
+    Move legacy sales.print_html values into sale_snapshots, one committed
+    batch at a time (short transactions; safe to interrupt and re-run).
+    Returns the number of sales moved.
+    """
+    from app.billing.models import Sale, SaleSnapshot
+
+    moved = 0
+    while True:
+        rows = (
+            db.session.query(Sale.id, Sale.legacy_print_html)
+            .filter(Sale.legacy_print_html.isnot(None))
+            .order_by(Sale.id.asc())
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+            .all()
+        )
+        if not rows:
+            db.session.commit()
+            return moved
+
+        ids = [sale_id for sale_id, _html in rows]
+        db.session.execute(
+            insert(SaleSnapshot)
+            .values([snapshot_row(sale_id, html) for sale_id, html in rows])
+            .on_conflict_do_nothing(index_elements=['sale_id'])
+        )
+        db.session.execute(
+            update(Sale)
+            .where(Sale.id.in_(ids))
+            .values({Sale.legacy_print_html: None})
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        moved += len(ids)
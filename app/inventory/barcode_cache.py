@@ -0,0 +1,336 @@
+"""
+app/inventory/barcode_cache.py
+------------------------------
+Barcode → variant resolution for the billing scanner, in two tiers.
+
+  1. in-process LRU of immutable VariantSnapshot objects (per worker)
+  2. Flask-Caching (Redis when REDIS_URL is set) — shared by all workers,
+     so a barcode one counter resolved is warm for every other one
+
+A warm scan therefore resolves without touching the database. Snapshots
+carry what the scanner needs (names, price, GST, weighed flag) plus a
+stock *hint* taken when the snapshot was built. The hint only decides
+whether a scan is accepted into the cart; when it says "no", the scanner
+re-reads stock before rejecting (refresh_stock_hint), and checkout still
+locks and verifies stock authoritatively.
+
+Invalidation: invalidate_barcodes() drops the local entry and the shared
+one, and publishes the barcode on a Redis channel. Every worker runs a
+subscriber thread that evicts its own LRU entry. Without Redis there is
+a single process and the local eviction is enough. Local entries also
+expire after BARCODE_CACHE_LOCAL_TTL as a backstop for messages missed
+while a subscriber was reconnecting.
+"""
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+from decimal import Decimal
+from typing import Optional
+
+from flask import current_app
+from sqlalchemy.orm import joinedload
+
+from app import cache, db
+
+
+SNAPSHOT_KEY_PREFIX = 'barcode_snapshot_'
+INVALIDATION_CHANNEL = 'barcode_invalidate'
+
+
+@dataclass(frozen=True)
+class ProductSnapshot:
+    id:           int
+    name:         str
+    gst_percent:  int
+    is_active:    bool
+    is_weighed:   bool
+    price_per_kg: Optional[Decimal]
+
+
+@dataclass(frozen=True)
+class VariantSnapshot:
+    """Read-only stand-in for a ProductVariant (with .product) on the scan path."""
+    id:         int
+    product_id: int
+    barcode:    str
+    size:       str
+    color:      str
+    price:      Decimal
+    stock:      int               # hint — see module docstring
+    is_active:  bool
+    product:    ProductSnapshot
+
+    @classmethod
+    def from_model(cls, variant) -> 'VariantSnapshot':
+        product = variant.product
+        return cls(
+            id=variant.id,
+            product_id=variant.product_id,
+            barcode=variant.barcode,
+            size=variant.size,
+            color=variant.color,
+            price=variant.price,
+            stock=variant.stock,
+            is_active=variant.is_active,
+            product=ProductSnapshot(
+                id=product.id,
+                name=product.name,
+                gst_percent=product.gst_percent,
+                is_active=product.is_active,
+                is_weighed=product.is_weighed,
+                price_per_kg=product.price_per_kg,
+            ),
+        )
+
+
+class _LocalLRU:
+    """Thread-safe LRU with a per-entry max age."""
+
+    def __init__(self, max_size: int, ttl_seconds: int):
+        self.max_size = max_size
+        self.ttl = ttl_seconds
+        self._data = OrderedDict()   # barcode -> (expires_at, snapshot)
+        self._lock = threading.Lock()
+
+    def get(self, barcode):
+        with self._lock:
+            entry = self._data.get(barcode)
+            if entry is None:
+                return None
+            expires_at, snapshot = entry
+            if expires_at < time.monotonic():
+                del self._data[barcode]
+                return None
+            self._data.move_to_end(barcode)
+            return snapshot
+
+    def set(self, barcode, snapshot) -> None:
+        with self._lock:
+            self._data[barcode] = (time.monotonic() + self.ttl, snapshot)
+            self._data.move_to_end(barcode)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def discard(self, barcode) -> None:
+        with self._lock:
+            self._data.pop(barcode, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class BarcodeCache:
+    def __init__(self, app, max_size: int, local_ttl: int, shared_ttl: int, redis_url=None):
+        self.app = app
+        self.local = _LocalLRU(max_size, local_ttl)
+        self.shared_ttl = shared_ttl
+        self.redis_url = redis_url
+        self._redis = None
+        self._subscriber = None
+        self._lock = threading.Lock()
+
+    # ── Redis pub/sub ─────────────────────────────────────────────
+    def _client(self):
+        if self._redis is None:
+            import redis
+            self._redis = redis.Redis.from_url(self.redis_url)
+        return self._redis
+
+    def _ensure_subscriber(self) -> None:
+        # Started on first lookup so CLI commands never spawn threads.
+        if not self.redis_url or self._subscriber is not None:
+            return
+        with self._lock:
+            if self._subscriber is None:
+                self._subscriber = threading.Thread(
+                    target=self._listen, name='barcode-cache-invalidation', daemon=True,
+                )
+                self._subscriber.start()
+
+    def _listen(self) -> None:
+        backoff = 1
+        while True:
+            try:
+                pubsub = self._client().pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(INVALIDATION_CHANNEL)
+                # Anything published while we were not subscribed is lost.
+                self.local.clear()
+                backoff = 1
+                for message in pubsub.listen():
+                    data = message.get('data')
+                    if isinstance(data, bytes):
+                        data = data.decode('utf-8', 'replace')
+                    if data:
+                        self.local.discard(data)
+            except Exception as exc:
+                self.app.logger.warning(f"Barcode cache subscriber disconnected: {exc}")
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+
+    # ── Lookup ────────────────────────────────────────────────────
+    def get(self, barcode: str) -> Optional[VariantSnapshot]:
+        self._ensure_subscriber()
+        snapshot = self.local.get(barcode)
+        if snapshot is not None:
+            return snapshot
+
+        try:
+            snapshot = cache.get(SNAPSHOT_KEY_PREFIX + barcode)
+        except Exception:
+            snapshot = None
+        if snapshot is None:
+            snapshot = _load_snapshot(barcode)
+            if snapshot is None:
+                return None   # unknown / inactive barcodes are not cached
+            self._set_shared(snapshot)
+
+        self.local.set(barcode, snapshot)
+        return snapshot
+
+    def get_many(self, barcodes) -> dict:
+        """{barcode: snapshot} for the known ones; all misses in one IN query."""
+        self._ensure_subscriber()
+        found, missing = {}, []
+        for barcode in dict.fromkeys(barcodes):
+            snapshot = self.local.get(barcode)
+            if snapshot is not None:
+                found[barcode] = snapshot
+            else:
+                missing.append(barcode)
+        if not missing:
+            return found
+
+        try:
+            shared = cache.get_many(*[SNAPSHOT_KEY_PREFIX + b for b in missing])
+        except Exception:
+            shared = [None] * len(missing)
+        still_missing = []
+        for barcode, snapshot in zip(missing, shared):
+            if snapshot is None:
+                still_missing.append(barcode)
+            else:
+                found[barcode] = snapshot
+                self.local.set(barcode, snapshot)
+
+        for snapshot in _load_snapshots(still_missing):
+            self.put(snapshot)
+            found[snapshot.barcode] = snapshot
+        return found
+
+    def put(self, snapshot: VariantSnapshot) -> None:
+        self._set_shared(snapshot)
+        self.local.set(snapshot.barcode, snapshot)
+
+    def _set_shared(self, snapshot: VariantSnapshot) -> None:
+        try:
+            cache.set(SNAPSHOT_KEY_PREFIX + snapshot.barcode, snapshot, timeout=self.shared_ttl)
+        except Exception:
+            pass
+
+    # ── Invalidation ──────────────────────────────────────────────
+    def invalidate(self, barcodes) -> None:
+        for barcode in barcodes:
+            self.local.discard(barcode)
+            try:
+                cache.delete(SNAPSHOT_KEY_PREFIX + barcode)
+            except Exception:
+                pass
+            if self.redis_url:
+                try:
+                    self._client().publish(INVALIDATION_CHANNEL, barcode)
+                except Exception as exc:
+                    self.app.logger.warning(f"Barcode invalidation not published for {barcode}: {exc}")
+
+    def clear(self) -> None:
+        """Drop this process's entries (tests, diagnostics)."""
+        self.local.clear()
+
+
+def _load_snapshots(barcodes) -> list:
+    from app.inventory.models import ProductVariant
+
+    if not barcodes:
+        return []
+    variants = (
+        db.session.query(ProductVariant)
+        .options(joinedload(ProductVariant.product))
+        .filter(
+            ProductVariant.barcode.in_(barcodes),
+            ProductVariant.is_active.is_(True),
+        )
+        .all()
+    )
+    return [
+        VariantSnapshot.from_model(v)
+        for v in variants
+        if v.product is not None and v.product.is_active
+    ]
+
+
+def _load_snapshot(barcode: str) -> Optional[VariantSnapshot]:
+    snapshots = _load_snapshots([barcode])
+    return snapshots[0] if snapshots else None
+
+
+def _barcode_cache() -> BarcodeCache:
+    return current_app.extensions['barcode_cache']
+
+
+def get_variant_snapshot(barcode: str) -> Optional[VariantSnapshot]:
+    """Active variant + product for ``barcode``, or None."""
+    return _barcode_cache().get(barcode)
+
+
+def get_variant_snapshots(barcodes) -> dict:
+    """{barcode: VariantSnapshot} for the active ones among ``barcodes``."""
+    return _barcode_cache().get_many(barcodes)
+
+
+def refresh_stock_hints(snapshots) -> dict:
+    """
+    Re-read stock for ``snapshots`` in one query and republish the ones
+    that changed. Returns {variant_id: snapshot}.
+    """
+    from app.inventory.models import ProductVariant
+
+    by_id = {s.id: s for s in snapshots}
+    if not by_id:
+        return {}
+    rows = (
+        db.session.query(ProductVariant.id, ProductVariant.stock)
+        .filter(ProductVariant.id.in_(list(by_id)))
+        .all()
+    )
+    for variant_id, stock in rows:
+        snapshot = by_id[variant_id]
+        if stock != snapshot.stock:
+            by_id[variant_id] = replace(snapshot, stock=stock)
+            _barcode_cache().put(by_id[variant_id])
+    return by_id
+
+
+def refresh_stock_hint(snapshot: VariantSnapshot) -> VariantSnapshot:
+    """Re-read one variant's stock and republish the snapshot with it."""
+    return refresh_stock_hints([snapshot])[snapshot.id]
+
+
+def invalidate_barcodes(*barcodes) -> None:
+    """Call after committing a change to these variants or their product."""
+    _barcode_cache().invalidate([b for b in barcodes if b])
+
+
+def init_barcode_cache(app):
+    barcode_cache = BarcodeCache(
+        app,
+        max_size=int(app.config.get('BARCODE_CACHE_SIZE', 20000)),
+        local_ttl=int(app.config.get('BARCODE_CACHE_LOCAL_TTL', 300)),
+        shared_ttl=int(app.config.get('BARCODE_CACHE_TTL', 3600)),
+        redis_url=app.config.get('BARCODE_CACHE_REDIS_URL'),
+    )
+    app.extensions['barcode_cache'] = barcode_cache
+    return barcode_cache
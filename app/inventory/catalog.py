@@ -0,0 +1,169 @@
+"""
+app/inventory/catalog.py
+------------------------
+Versioned catalog for billing terminals (offline barcode/price lookup).
+
+Every product/variant create, edit, delete and restore in
+app/inventory/routes.py calls record_catalog_change() before its commit,
+appending a catalog_changes row in the same transaction. The highest row
+id is the catalog version.
+
+GET /inventory/api/catalog serves either
+
+  - the full snapshot: one positional row per sellable variant, gzipped
+    once per version and cached (Flask-Caching), with ETag "catalog-<v>"
+    so an unchanged terminal gets a 304; or
+  - ?since=<v>: only the variants touched after version v (rows to upsert
+    plus ids to drop), typically a few hundred bytes.
+
+A delta re-reads the last CATALOG_DELTA_OVERLAP changes before ``since``:
+ids are allocated before commit, so a slow transaction can become
+visible after a higher version was already served. Re-sending a few rows
+is harmless; the terminal upserts by variant id.
+"""
+import gzip
+import json
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, or_
+
+from app import cache, db
+
+
+CATALOG_FIELDS = (
+    'variant_id', 'barcode', 'name', 'size', 'color',
+    'price', 'gst_percent', 'is_weighed', 'price_per_kg',
+)
+
+CATALOG_DELTA_OVERLAP = 50
+SNAPSHOT_KEY_PREFIX = 'catalog_snapshot_'
+SNAPSHOT_TTL = 24 * 3600
+
+
+def record_catalog_change(product_id, variant_ids=None) -> None:
+    """
+    Log a catalog edit in the caller's transaction, with the prices it
+    leaves in effect. ``variant_ids`` None means the product itself
+    changed (name, GST, weighed, active).
+    """
+    from app.inventory.models import CatalogChange, Product, ProductVariant
+
+    product = db.session.get(Product, product_id)
+    price_per_kg = product.price_per_kg if product is not None else None
+    if variant_ids is None:
+        db.session.add(CatalogChange(product_id=product_id, price_per_kg=price_per_kg))
+        return
+    prices = dict(
+        db.session.query(ProductVariant.id, ProductVariant.price)
+        .filter(ProductVariant.id.in_(variant_ids))
+        .all()
+    )
+    for variant_id in variant_ids:
+        db.session.add(CatalogChange(
+            product_id=product_id,
+            variant_id=variant_id,
+            price=prices.get(variant_id),
+            price_per_kg=price_per_kg,
+        ))
+
+
+def catalog_version() -> int:
+    from app.inventory.models import CatalogChange
+
+    return db.session.query(func.coalesce(func.max(CatalogChange.id), 0)).scalar()
+
+
+def _catalog_rows(*filters) -> list:
+    from app.inventory.models import Product, ProductVariant
+
+    rows = (
+        db.session.query(
+            ProductVariant.id, ProductVariant.barcode, Product.name,
+            ProductVariant.size, ProductVariant.color, ProductVariant.price,
+            Product.gst_percent, Product.is_weighed, Product.price_per_kg,
+        )
+        .join(Product, ProductVariant.product_id == Product.id)
+        .filter(ProductVariant.is_active.is_(True), Product.is_active.is_(True), *filters)
+        .order_by(ProductVariant.id.asc())
+        .all()
+    )
+    return [
+        [vid, barcode, name, size, color, str(price), gst, bool(weighed),
+         str(per_kg) if per_kg is not None else None]
+        for vid, barcode, name, size, color, price, gst, weighed, per_kg in rows
+    ]
+
+
+def catalog_snapshot(version: int) -> bytes:
+    """Gzipped JSON of the full catalog at ``version`` (built once per version)."""
+    key = f"{SNAPSHOT_KEY_PREFIX}{version}"
+    try:
+        body = cache.get(key)
+    except Exception:
+        body = None
+    if body is None:
+        payload = {'version': version, 'full': True, 'fields': CATALOG_FIELDS, 'items': _catalog_rows()}
+        body = gzip.compress(json.dumps(payload, separators=(',', ':')).encode('utf-8'))
+        try:
+            cache.set(key, body, timeout=SNAPSHOT_TTL)
+        except Exception:
+            pass
+    return body
+
+
+def catalog_delta(since: int, version: int):
+    """
+    Changes after ``since`` up to ``version`` as a dict, or None when the
+    log no longer reaches back that far (terminal needs the snapshot).
+    """
+    from app.inventory.models import CatalogChange, ProductVariant
+
+    oldest = db.session.query(func.min(CatalogChange.id)).scalar()
+    if since > version or (oldest is not None and since < oldest - 1):
+        return None
+
+    changes = (
+        db.session.query(CatalogChange.product_id, CatalogChange.variant_id)
+        .filter(
+            CatalogChange.id > max(since - CATALOG_DELTA_OVERLAP, 0),
+            CatalogChange.id <= version,
+        )
+        .distinct()
+        .all()
+    )
+    variant_ids = {vid for _pid, vid in changes if vid is not None}
+    product_ids = {pid for pid, vid in changes if vid is None}
+
+    touched = []
+    if variant_ids or product_ids:
+        touched = [
+            vid for (vid,) in db.session.query(ProductVariant.id).filter(or_(
+                ProductVariant.id.in_(variant_ids),
+                ProductVariant.product_id.in_(product_ids),
+            )).all()
+        ]
+    items = _catalog_rows(ProductVariant.id.in_(touched)) if touched else []
+    live = {row[0] for row in items}
+    return {
+        'version': version,
+        'since': since,
+        'full': False,
+        'fields': CATALOG_FIELDS,
+        'items': items,
+        'removed': sorted(set(touched) - live),
+    }
+
+
+def prune_catalog_changes(older_than_days: int = 30) -> int:
+    """Drop old log rows; terminals older than that fetch the snapshot."""
+    from app.inventory.models import CatalogChange
+
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    latest = catalog_version()
+    deleted = (
+        db.session.query(CatalogChange)
+        .filter(CatalogChange.created_at < cutoff, CatalogChange.id < latest)   # keep the version
+        .delete(synchronize_session=False)
+    )
+    db.session.commit()
+    return deleted
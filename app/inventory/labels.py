@@ -0,0 +1,230 @@
+"""
+app/inventory/labels.py
+-----------------------
+Price/barcode label PDFs (50 × 30 mm), from one label up to sheets of
+thousands for a goods receipt.
+
+Barcodes are vector drawings from reportlab's barcode module (EAN-13 for
+valid 12/13-digit values, otherwise Code 128), not 300-dpi rasters. Each
+distinct variant's label is drawn ONCE per document as a PDF form
+XObject; every further copy is a one-line reference to it, so a
+1,000-label sheet of a few dozen variants costs a few dozen drawings.
+
+Layouts:
+  roll  one label per page, for label printers
+  a4    4 × 9 grid per A4 page
+
+The document is written to a spooled temporary file (spills to disk past
+LABEL_SPOOL_BYTES) and streamed from there, so large sheets are not held
+in memory.
+"""
+import tempfile
+from decimal import Decimal
+
+from reportlab.graphics import renderPDF
+from reportlab.graphics.barcode import createBarcodeDrawing
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import mm
+from reportlab.pdfgen import canvas
+
+from app import db
+
+
+LABEL_WIDTH = 50 * mm
+LABEL_HEIGHT = 30 * mm
+LABEL_MARGIN = 2.5 * mm
+BARCODE_HEIGHT = 12 * mm
+
+LABEL_LAYOUTS = ('a4', 'roll')
+LABEL_SHEET_MAX = 5000
+LABEL_MAX_COPIES = 1000
+LABEL_SPOOL_BYTES = 8 * 1024 * 1024
+
+
+def ean13_checksum(payload_12: str) -> int:
+    """Compute EAN-13 checksum for the first 12 digits."""
+    total = 0
+    for idx, ch in enumerate(payload_12):
+        digit = int(ch)
+        total += digit if idx % 2 == 0 else digit * 3
+    return (10 - (total % 10)) % 10
+
+
+def barcode_drawing(raw_barcode: str):
+    """
+    Vector barcode for a variant. Uses EAN-13 for valid numeric 12/13-digit
+    values, otherwise Code128. Returns (Drawing, type label).
+    """
+    value = (raw_barcode or '').strip()
+    if not value:
+        raise ValueError('Barcode value is empty.')
+
+    if value.isdigit() and len(value) in (12, 13):
+        if len(value) == 12 or ean13_checksum(value[:12]) == int(value[12]):
+            drawing = createBarcodeDrawing(
+                'EAN13', value=value[:12], barHeight=BARCODE_HEIGHT,
+                barWidth=0.33 * mm, humanReadable=False,
+            )
+            return drawing, 'EAN-13'
+
+    drawing = createBarcodeDrawing(
+        'Code128', value=value, barHeight=BARCODE_HEIGHT,
+        barWidth=0.25 * mm, humanReadable=False, quiet=False,
+    )
+    return drawing, 'Code128'
+
+
+def _draw_label(pdf, variant) -> None:
+    """One label at the origin of the current coordinate system."""
+    name = (variant.product.name or '').strip()
+    if len(name) > 30:
+        name = f'{name[:27]}...'
+    detail = f'{variant.size}/{variant.color}'
+    price_text = f'Rs {Decimal(str(variant.price)).quantize(Decimal("0.01"))}'
+
+    pdf.setFont('Helvetica-Bold', 7.5)
+    pdf.drawString(LABEL_MARGIN, LABEL_HEIGHT - LABEL_MARGIN - 1.5 * mm, name)
+    pdf.setFont('Helvetica', 6.5)
+    pdf.drawString(LABEL_MARGIN, LABEL_HEIGHT - LABEL_MARGIN - 5.0 * mm, detail)
+    pdf.drawRightString(LABEL_WIDTH - LABEL_MARGIN, LABEL_HEIGHT - LABEL_MARGIN - 5.0 * mm, price_text)
+
+    drawing, barcode_type = barcode_drawing(variant.barcode)
+    # Narrow the bars (never widen them) to fit the label width.
+    scale = min(1.0, (LABEL_WIDTH - 2 * LABEL_MARGIN) / drawing.width)
+    pdf.saveState()
+    pdf.translate((LABEL_WIDTH - drawing.width * scale) / 2, LABEL_MARGIN + 4.0 * mm)
+    pdf.scale(scale, 1)
+    renderPDF.draw(drawing, pdf, 0, 0)
+    pdf.restoreState()
+
+    pdf.setFont('Helvetica', 6)
+    pdf.drawCentredString(LABEL_WIDTH / 2, LABEL_MARGIN + 1.2 * mm, f'{variant.barcode} ({barcode_type})')
+
+
+def _slots(layout):
+    """(pagesize, [(x, y), …] label origins per page, top-left first)."""
+    if layout == 'roll':
+        return (LABEL_WIDTH, LABEL_HEIGHT), [(0, 0)]
+
+    page_width, page_height = A4
+    cols = int(page_width // LABEL_WIDTH)
+    rows = int(page_height // LABEL_HEIGHT)
+    left = (page_width - cols * LABEL_WIDTH) / 2
+    bottom = (page_height - rows * LABEL_HEIGHT) / 2
+    return A4, [
+        (left + col * LABEL_WIDTH, bottom + (rows - 1 - row) * LABEL_HEIGHT)
+        for row in range(rows) for col in range(cols)
+    ]
+
+
+def render_label_sheet(lines, layout='a4', title='Labels'):
+    """
+    Write a label PDF for ``lines`` — [(variant, copies), …] — and return
+    a file object positioned at the start.
+    """
+    if layout not in LABEL_LAYOUTS:
+        raise ValueError(f'Unknown label layout "{layout}".')
+
+    pagesize, slots = _slots(layout)
+    out = tempfile.SpooledTemporaryFile(max_size=LABEL_SPOOL_BYTES)
+    pdf = canvas.Canvas(out, pagesize=pagesize)
+    pdf.setTitle(title)
+
+    forms = set()
+    slot = 0
+    for variant, copies in lines:
+        form = f'label{variant.id}'
+        if form not in forms:
+            pdf.beginForm(form, 0, 0, LABEL_WIDTH, LABEL_HEIGHT)
+            _draw_label(pdf, variant)
+            pdf.endForm()
+            forms.add(form)
+
+        for _ in range(copies):
+            if slot == len(slots):
+                pdf.showPage()
+                slot = 0
+            x, y = slots[slot]
+            pdf.saveState()
+            pdf.translate(x, y)
+            pdf.doForm(form)
+            pdf.restoreState()
+            slot += 1
+
+    pdf.showPage()
+    pdf.save()
+    out.seek(0)
+    return out
+
+
+def _check_total(lines) -> list:
+    total = sum(copies for _variant, copies in lines)
+    if total == 0:
+        raise ValueError('Select at least one label to print.')
+    if total > LABEL_SHEET_MAX:
+        raise ValueError(f'At most {LABEL_SHEET_MAX} labels per sheet (requested {total}).')
+    return lines
+
+
+def variant_label_lines(variant_ids, copies) -> list:
+    """
+    Pair form lists ``variant_id`` / ``copies`` into [(variant, copies)],
+    skipping zero-copy rows. Raises ValueError on bad input.
+    """
+    from app.inventory.models import ProductVariant
+    from sqlalchemy.orm import joinedload
+
+    if len(variant_ids) != len(copies):
+        raise ValueError('Each variant needs a copy count.')
+
+    wanted = {}
+    for raw_id, raw_copies in zip(variant_ids, copies):
+        try:
+            variant_id, count = int(raw_id), int(raw_copies or 0)
+        except (TypeError, ValueError):
+            raise ValueError('Invalid variant or copy count.')
+        if not 0 <= count <= LABEL_MAX_COPIES:
+            raise ValueError(f'Copies must be 0-{LABEL_MAX_COPIES}.')
+        if count:
+            wanted[variant_id] = wanted.get(variant_id, 0) + count
+
+    variants = {
+        v.id: v for v in (
+            db.session.query(ProductVariant)
+            .options(joinedload(ProductVariant.product))
+            .filter(ProductVariant.id.in_(wanted), ProductVariant.is_active.is_(True))
+            .all()
+        )
+    } if wanted else {}
+    missing = set(wanted) - set(variants)
+    if missing:
+        raise ValueError(f'Variant ID {min(missing)} not found.')
+    return _check_total([(variants[vid], count) for vid, count in wanted.items()])
+
+
+def grn_label_lines(grn_id) -> list:
+    """One label per piece received on a GRN (stock goes to each product's default variant)."""
+    from app.inventory.models import Product
+    from app.purchasing.models import GoodsReceipt, GoodsReceiptItem, PurchaseOrderItem
+    from sqlalchemy.orm import joinedload, selectinload
+
+    grn = (
+        db.session.query(GoodsReceipt)
+        .options(
+            selectinload(GoodsReceipt.items)
+            .joinedload(GoodsReceiptItem.po_item)
+            .joinedload(PurchaseOrderItem.product)
+            .selectinload(Product.variants)
+        )
+        .filter_by(id=grn_id)
+        .first()
+    )
+    if grn is None:
+        raise ValueError('Goods receipt not found.')
+
+    lines = []
+    for item in sorted(grn.items, key=lambda i: i.id):
+        variant = item.po_item.product.default_variant
+        if variant is not None:
+            lines.append((variant, item.received_qty))
+    return _check_total(lines)
@@ -210,3 +210,25 @@ class ProductBatch(db.Model):
 
     def __repr__(self):
         return f"<Batch {self.batch_number!r} P:{self.product_id} qty:{self.quantity} exp:{self.expiry_date}>"
+
+
+class CatalogChange(db.Model):
+    """
+    Append-only log of catalog edits for the terminal delta feed
+    (app/inventory/catalog.py). The id is the catalog version; a row with
+    variant_id NULL means every variant of the product changed. price /
+    price_per_kg are the prices in effect from this version on, so offline
+    sales can be checked against what a terminal was actually serving.
+    """
+    __tablename__ = 'catalog_changes'
+
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, nullable=False)
+    variant_id = db.Column(db.Integer, nullable=True)
+    price = db.Column(db.Numeric(10, 2), nullable=True)          # variant rows only
+    price_per_kg = db.Column(db.Numeric(10, 2), nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+    def __repr__(self):
+        target = f"V:{self.variant_id}" if self.variant_id else 'all variants'
+        return f"<CatalogChange {self.id} P:{self.product_id} {target}>"
@@ -1,14 +1,15 @@
-import io
-from decimal import Decimal
+import gzip
 from datetime import date, timedelta
 
-from flask import abort, current_app, flash, redirect, render_template, request, send_file, session, url_for
+from flask import abort, current_app, flash, jsonify, redirect, render_template, request, send_file, session, url_for
 from sqlalchemy import func
 from sqlalchemy.exc import IntegrityError
 
-from app import db, cache, socketio
-from app.auth.decorators import admin_required
+from app import db, socketio
+from app.auth.decorators import admin_required, login_required
 from app.inventory import inventory
+from app.inventory.barcode_cache import invalidate_barcodes
+from app.inventory.catalog import catalog_delta, catalog_snapshot, catalog_version, record_catalog_change
 from app.inventory.models import InventoryLog, Product, ProductBatch, ProductVariant
 from app.inventory.validators import (
     parse_product_form,
@@ -16,13 +17,21 @@ from app.inventory.validators import (
     validate_product_form,
     validate_variant_form,
 )
+from app.reporting.apparel import invalidate_apparel_cache
 
 
-def _invalidate_barcode_cache(barcode: str):
+def _invalidate_barcode_cache(*barcodes: str):
     try:
-        cache.delete(f"barcode_lookup_{barcode}")
+        invalidate_barcodes(*barcodes)
     except Exception:
-        pass
+        current_app.logger.exception(f"Barcode cache invalidation failed for {barcodes}")
+
+
+def _invalidate_apparel_cache():
+    try:
+        invalidate_apparel_cache()
+    except Exception:
+        current_app.logger.exception("Apparel report cache invalidation failed")
 
 
 def _load_product_or_404(product_id: int) -> Product:
@@ -61,59 +70,6 @@ def _find_size_color_conflict(product_id: int, size: str, color: str, exclude_va
     return query.first()
 
 
-def _ean13_checksum(payload_12: str) -> int:
-    """Compute EAN-13 checksum for the first 12 digits."""
-    total = 0
-    for idx, ch in enumerate(payload_12):
-        digit = int(ch)
-        total += digit if idx % 2 == 0 else digit * 3
-    return (10 - (total % 10)) % 10
-
-
-def _generate_variant_barcode_image(raw_barcode: str):
-    """
-    Generate a barcode image using python-barcode.
-    Uses EAN-13 for valid numeric 12/13-digit values, otherwise Code128.
-    """
-    try:
-        from barcode import Code128, EAN13
-        from barcode.writer import ImageWriter
-    except Exception as exc:
-        raise RuntimeError(
-            'Barcode libraries are missing. Install python-barcode, Pillow, and reportlab.'
-        ) from exc
-
-    barcode_value = (raw_barcode or '').strip()
-    if not barcode_value:
-        raise ValueError('Barcode value is empty.')
-
-    writer_options = {
-        'module_width': 0.22,
-        'module_height': 10.0,
-        'quiet_zone': 1.0,
-        'font_size': 8,
-        'text_distance': 1.2,
-        'dpi': 300,
-        'write_text': True,
-    }
-
-    # Prefer EAN-13 when barcode is compatible; otherwise fallback to Code128.
-    if barcode_value.isdigit() and len(barcode_value) in (12, 13):
-        ean_payload = None
-        if len(barcode_value) == 12:
-            ean_payload = barcode_value
-        else:
-            expected_checksum = _ean13_checksum(barcode_value[:12])
-            if expected_checksum == int(barcode_value[12]):
-                ean_payload = barcode_value[:12]
-        if ean_payload is not None:
-            image = EAN13(ean_payload, writer=ImageWriter()).render(writer_options=writer_options)
-            return image, 'EAN-13'
-
-    image = Code128(barcode_value, writer=ImageWriter()).render(writer_options=writer_options)
-    return image, 'Code128'
-
-
 @inventory.route('/')
 @admin_required
 def index():
@@ -176,13 +132,17 @@ def edit(product_id):
         errors = validate_product_form(form_data)
         if not errors:
             data = parse_product_form(form_data)
+            regrouped = (product.brand, product.category) != (data['brand'], data['category'])
             for field, value in data.items():
                 setattr(product, field, value)
+            record_catalog_change(product.id)
             try:
                 db.session.commit()
                 # ── Cache Invalidation ──
                 for variant in product.variants:
                     _invalidate_barcode_cache(variant.barcode)
+                if regrouped:
+                    _invalidate_apparel_cache()
                 
                 # ── Real-time Broadcast ──
                 for v in product.variants:
@@ -229,6 +189,7 @@ def delete(product_id):
     """Deactivate a product (soft delete)."""
     product = _load_product_or_404(product_id)
     product.is_active = False
+    record_catalog_change(product.id)
     db.session.commit()
     # ── Cache Invalidation ──
     for variant in product.variants:
@@ -256,6 +217,7 @@ def restore(product_id):
     """Reactivate an archived product."""
     product = _load_product_or_404(product_id)
     product.is_active = True
+    record_catalog_change(product.id)
     db.session.commit()
     current_app.logger.info("Admin restored product: %s", product.name)
     flash(f'Product "{product.name}" restored successfully.', 'success')
@@ -275,68 +237,21 @@ def variants(product_id):
 def print_variant_label(variant_id):
     """
     Generate a small printable PDF label for a variant.
-    Includes product name, size, color, price, and barcode image.
+    Includes product name, size, color, price, and barcode.
     """
     variant = db.session.get(ProductVariant, variant_id)
     if variant is None or variant.product is None:
         abort(404)
 
     try:
-        barcode_image, barcode_type = _generate_variant_barcode_image(variant.barcode)
-
-        from reportlab.lib.units import mm
-        from reportlab.lib.utils import ImageReader
-        from reportlab.pdfgen import canvas
-
-        label_width = 50 * mm
-        label_height = 30 * mm
-        margin = 2.5 * mm
-
-        buffer = io.BytesIO()
-        pdf = canvas.Canvas(buffer, pagesize=(label_width, label_height))
-        pdf.setTitle(f'Label {variant.id}')
-
-        name = (variant.product.name or '').strip()
-        if len(name) > 30:
-            name = f'{name[:27]}...'
-
-        detail = f'{variant.size}/{variant.color}'
-        price_text = f'Rs {Decimal(str(variant.price)).quantize(Decimal("0.01"))}'
-
-        pdf.setFont('Helvetica-Bold', 7.5)
-        pdf.drawString(margin, label_height - margin - 1.5 * mm, name)
-        pdf.setFont('Helvetica', 6.5)
-        pdf.drawString(margin, label_height - margin - 5.0 * mm, detail)
-        pdf.drawRightString(label_width - margin, label_height - margin - 5.0 * mm, price_text)
-
-        image_reader = ImageReader(barcode_image)
-        barcode_x = margin
-        barcode_y = margin + 4.0 * mm
-        barcode_w = label_width - (2 * margin)
-        barcode_h = 14 * mm
-        pdf.drawImage(
-            image_reader,
-            barcode_x,
-            barcode_y,
-            width=barcode_w,
-            height=barcode_h,
-            preserveAspectRatio=True,
-            mask='auto',
-        )
-
-        pdf.setFont('Helvetica', 6)
-        pdf.drawCentredString(label_width / 2, margin + 1.2 * mm, f'{variant.barcode} ({barcode_type})')
+        from app.inventory.labels import render_label_sheet
 
-        pdf.showPage()
-        pdf.save()
-        buffer.seek(0)
-
-        filename = f'label_variant_{variant.id}.pdf'
+        pdf_file = render_label_sheet([(variant, 1)], layout='roll', title=f'Label {variant.id}')
         response = send_file(
-            buffer,
+            pdf_file,
             mimetype='application/pdf',
             as_attachment=False,
-            download_name=filename,
+            download_name=f'label_variant_{variant.id}.pdf',
         )
         response.headers['Cache-Control'] = 'no-store'
         return response
@@ -347,6 +262,43 @@ def print_variant_label(variant_id):
         return redirect(url_for('inventory.variants', product_id=variant.product_id))
 
 
+@inventory.route('/labels', methods=['GET', 'POST'])
+@admin_required
+def label_sheet():
+    """
+    Bulk label sheet PDF (app/inventory/labels.py).
+
+    POST variant_id / copies pairs (variants page), or ?grn_id=N for one
+    label per piece received on a goods receipt. layout = a4 | roll.
+    """
+    from app.inventory.labels import grn_label_lines, render_label_sheet, variant_label_lines
+
+    layout = request.values.get('layout', 'a4')
+    grn_id = request.values.get('grn_id', type=int)
+    try:
+        if grn_id is not None:
+            lines = grn_label_lines(grn_id)
+            title = f'Labels GRN {grn_id}'
+        else:
+            lines = variant_label_lines(request.values.getlist('variant_id'), request.values.getlist('copies'))
+            title = 'Labels'
+        pdf_file = render_label_sheet(lines, layout=layout, title=title)
+    except ValueError as exc:
+        flash(str(exc), 'error')
+        return redirect(request.referrer or url_for('inventory.index'))
+
+    labels = sum(copies for _variant, copies in lines)
+    current_app.logger.info(f"Label sheet: {labels} labels ({layout}) by User {session.get('user_id')}")
+    response = send_file(
+        pdf_file,
+        mimetype='application/pdf',
+        as_attachment=False,
+        download_name=f"labels_grn_{grn_id}.pdf" if grn_id is not None else 'labels.pdf',
+    )
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+
 @inventory.route('/<int:product_id>/variants/add', methods=['POST'])
 @admin_required
 def add_variant(product_id):
@@ -384,6 +336,7 @@ def add_variant(product_id):
                 reason=f'Variant Added ({variant.size}/{variant.color})',
             )
         )
+        record_catalog_change(product.id, [variant.id])
         db.session.commit()
         # ── Cache Invalidation ──
         _invalidate_barcode_cache(variant.barcode)
@@ -437,6 +390,7 @@ def edit_variant(product_id, variant_id):
 
         if not errors:
             old_stock = product.total_stock
+            old_barcode = variant.barcode
             data = parse_variant_form(form_data)
             data.pop('is_active', None)
             for field, value in data.items():
@@ -453,9 +407,10 @@ def edit_variant(product_id, variant_id):
                         reason=f'Variant Updated ({variant.size}/{variant.color})',
                     )
                 )
+                record_catalog_change(product.id, [variant.id])
                 db.session.commit()
-                # ── Cache Invalidation ──
-                _invalidate_barcode_cache(variant.barcode)
+                # ── Cache Invalidation ── (old barcode too, if it changed)
+                _invalidate_barcode_cache(old_barcode, variant.barcode)
                 
                 # ── Real-time Broadcast ──
                 socketio.emit('inventory_update', {
@@ -518,6 +473,7 @@ def delete_variant(product_id, variant_id):
             reason=f'Variant Deactivated ({variant.size}/{variant.color})',
         )
     )
+    record_catalog_change(product.id, [variant.id])
     db.session.commit()
     # ── Cache Invalidation ──
     _invalidate_barcode_cache(variant.barcode)
@@ -691,3 +647,42 @@ def add_batch(product_id):
         errors=errors,
         form_data=form_data,
     )
+
+
+# ── Terminal catalog (offline billing) ────────────────────────────
+
+@inventory.route('/api/catalog')
+@login_required
+def api_catalog():
+    """
+    Catalog for offline terminals (static/js/pwa.js keeps it in IndexedDB).
+
+    Without ``since``: the full gzipped snapshot, ETag-versioned.
+    With ``?since=<version>``: only variants changed after that version,
+    or the full snapshot if the change log no longer reaches back.
+    See app/inventory/catalog.py.
+    """
+    version = catalog_version()
+    since = request.args.get('since', type=int)
+
+    if since is not None:
+        delta = catalog_delta(since, version)
+        if delta is not None:
+            response = jsonify(delta)
+            response.headers['Cache-Control'] = 'no-store'
+            return response
+
+    etag = f'catalog-{version}'
+    if etag in request.if_none_match:
+        response = current_app.response_class(status=304)
+    else:
+        body = catalog_snapshot(version)
+        if 'gzip' in (request.headers.get('Accept-Encoding') or ''):
+            response = current_app.response_class(body, mimetype='application/json')
+            response.headers['Content-Encoding'] = 'gzip'
+        else:
+            response = current_app.response_class(gzip.decompress(body), mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
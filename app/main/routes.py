@@ -3,11 +3,10 @@ app/main/routes.py
 ──────────────────
 Dashboard — aggregates today's KPIs and top-selling products.
 """
-from datetime import date
 from decimal import Decimal
 
 from flask import render_template
-from sqlalchemy import func, cast, Date, desc
+from sqlalchemy import func, desc
 
 from app import db
 from app.main import main
@@ -169,11 +168,13 @@ def offline():
 @login_required
 def index():
     """Homepage — Mall Billing System dashboard."""
-    from app.inventory.models import Product, ProductVariant, LOW_STOCK_THRESHOLD, ProductBatch
-    from app.billing.models import Sale, SaleItem, Return
+    from app.inventory.models import Product, LOW_STOCK_THRESHOLD, ProductBatch
+    from app.billing.models import Return
+    from app.reporting.models import ItemDailyRollup, SalesHourlyRollup
+    from app.reporting.query import store_today
     from datetime import timedelta
 
-    today = date.today()
+    today = store_today()
 
     # ── Inventory stats ───────────────────────────────────────────
     product_count   = Product.query.count()
@@ -181,35 +182,31 @@ def index():
         Product.stock <= LOW_STOCK_THRESHOLD
     ).count()
 
-    # ── Today's billing KPIs ──────────────────────────────────────
-    # Single query: count + sum + avg for today's sales
+    # ── Today's billing KPIs (hourly rollup) ─────────────────────
     today_agg = db.session.query(
-        func.count(Sale.id).label('tx_count'),
-        func.coalesce(func.sum(Sale.total_amount + Sale.gst_total), 0).label('revenue'),
-        func.coalesce(func.avg(Sale.total_amount + Sale.gst_total), 0).label('avg_bill'),
+        func.coalesce(func.sum(SalesHourlyRollup.sales_count), 0).label('tx_count'),
+        func.coalesce(
+            func.sum(SalesHourlyRollup.total_amount + SalesHourlyRollup.gst_total), 0
+        ).label('revenue'),
     ).filter(
-        cast(Sale.created_at, Date) == today
+        SalesHourlyRollup.day == today
     ).first()
 
-    todays_count   = today_agg.tx_count  if today_agg else 0
-    todays_revenue = Decimal(str(today_agg.revenue  or 0))
-    todays_avg     = Decimal(str(today_agg.avg_bill or 0))
+    todays_count   = int(today_agg.tx_count) if today_agg else 0
+    todays_revenue = Decimal(str(today_agg.revenue or 0))
+    todays_avg     = (
+        (todays_revenue / todays_count).quantize(Decimal('0.01')) if todays_count else Decimal('0')
+    )
 
-    # ── Top 5 selling products today ─────────────────────────────
-    # JOIN sale_items → sales (filtered to today) → products
-    # GROUP BY product, ORDER BY total qty sold DESC, LIMIT 5
+    # ── Top 5 selling products today (daily item rollup) ─────────
     top_products = db.session.query(
         Product.name.label('name'),
-        func.sum(SaleItem.quantity).label('qty_sold'),
-        func.sum(SaleItem.subtotal).label('revenue'),
-    ).join(
-        ProductVariant, ProductVariant.product_id == Product.id
-    ).join(
-        SaleItem, SaleItem.variant_id == ProductVariant.id
+        func.sum(ItemDailyRollup.quantity).label('qty_sold'),
+        func.sum(ItemDailyRollup.net_sales).label('revenue'),
     ).join(
-        Sale, Sale.id == SaleItem.sale_id
+        ItemDailyRollup, ItemDailyRollup.product_id == Product.id
     ).filter(
-        cast(Sale.created_at, Date) == today
+        ItemDailyRollup.day == today
     ).group_by(
         Product.id, Product.name
     ).order_by(
@@ -20,6 +20,7 @@ def run_auto_migration(app):
             import app.promotions.models
             import app.customers.models
             import app.purchasing.models
+            import app.reporting.models
             
             # 1. Create missing tables
             db.create_all()
@@ -50,6 +51,11 @@ def run_auto_migration(app):
                     conn.execute(text("ALTER TABLE sales ADD COLUMN IF NOT EXISTS discount_amount NUMERIC(12,2) DEFAULT 0 NOT NULL"))
                     # Sales: grand_total (persisted total after discounts + gst)
                     conn.execute(text("ALTER TABLE sales ADD COLUMN IF NOT EXISTS grand_total NUMERIC(10,2)"))
+                    # Sales: idempotency_key (retried / offline checkouts)
+                    conn.execute(text("ALTER TABLE sales ADD COLUMN IF NOT EXISTS idempotency_key VARCHAR(64)"))
+                    conn.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS uq_sales_idempotency_key ON sales (idempotency_key)"))
+                    # ...and the duplicate unique constraint an earlier create_all added
+                    conn.execute(text("ALTER TABLE sales DROP CONSTRAINT IF EXISTS sales_idempotency_key_key"))
                     
                     # Products: is_active
                     conn.execute(text("ALTER TABLE products ADD COLUMN IF NOT EXISTS is_active BOOLEAN DEFAULT TRUE NOT NULL"))
@@ -61,9 +67,14 @@ def run_auto_migration(app):
                     conn.execute(text("ALTER TABLE products ADD COLUMN IF NOT EXISTS description TEXT"))
                     # Products: price_per_kg
                     conn.execute(text("ALTER TABLE products ADD COLUMN IF NOT EXISTS price_per_kg NUMERIC(10,2)"))
+                    # CatalogChanges: prices in effect from each version (offline sale checks)
+                    conn.execute(text("ALTER TABLE catalog_changes ADD COLUMN IF NOT EXISTS price NUMERIC(10,2)"))
+                    conn.execute(text("ALTER TABLE catalog_changes ADD COLUMN IF NOT EXISTS price_per_kg NUMERIC(10,2)"))
                     
                     # CashSessions: closing_notes
                     conn.execute(text("ALTER TABLE cash_sessions ADD COLUMN IF NOT EXISTS closing_notes VARCHAR(255)"))
+                    # CashSessions: counter_code (per-counter invoice series)
+                    conn.execute(text("ALTER TABLE cash_sessions ADD COLUMN IF NOT EXISTS counter_code VARCHAR(6)"))
                     
                     # Users: is_active
                     conn.execute(text("ALTER TABLE users ADD COLUMN IF NOT EXISTS is_active BOOLEAN DEFAULT TRUE NOT NULL"))
@@ -114,7 +125,17 @@ def run_auto_migration(app):
                     # Performance indexes for reporting queries
                     conn.execute(text("CREATE INDEX IF NOT EXISTS ix_product_variants_barcode ON product_variants (barcode)"))
                     conn.execute(text("CREATE INDEX IF NOT EXISTS ix_sale_items_variant_id ON sale_items (variant_id)"))
+                    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_sale_items_sale_id ON sale_items (sale_id)"))
                     conn.execute(text("CREATE INDEX IF NOT EXISTS ix_sales_created_at ON sales (created_at)"))
+                    # Pushed print jobs: the first time the print-backlog index is
+                    # created, mark existing sales printed so terminals don't reprint
+                    # a week of history on the first deploy.
+                    if conn.execute(text("SELECT to_regclass('ix_sales_unprinted')")).scalar() is None:
+                        backfilled = conn.execute(text(
+                            "UPDATE sales SET is_printed = TRUE WHERE is_printed IS NOT TRUE"
+                        )).rowcount
+                        logger.info(f"[INFO] Marked {backfilled} existing sales printed before enabling pushed print jobs.")
+                    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_sales_unprinted ON sales (created_at) WHERE is_printed = false"))
 
                     # Legacy data cleanup:
                     # 1) Create a default variant for products that still only have legacy product-level stock/price/barcode.
@@ -240,5 +261,12 @@ def run_auto_migration(app):
                 except Exception as e:
                     logger.error(f"[WARN] SQL Patch warning: {e}")
 
+            # 3. Dashboard rollups: fill any history older than them, one
+            #    day per short transaction (afterwards kept current via
+            #    sale_events; `flask rebuild-rollups` for repairs).
+            from app.reporting.rollups import backfill_rollups
+            logger.info("[INFO] Backfilling sales rollups...")
+            logger.info(f"[OK] Sales rollups checked: {backfill_rollups()} day(s) rebuilt.")
+
         except Exception as e:
             logger.error(f"[ERROR] Migration wrapper failed: {e}")
@@ -0,0 +1,75 @@
+"""
+app/promotions/cache.py
+-----------------------
+Process-wide compiled promotion set plus the generation token that
+invalidates it.
+
+get_compiled_promotions() returns a CompiledPromotionSet (see engine.py)
+built from get_active_promotions() and reuses it until
+promotion_set_token() changes. Anything else derived from the active
+promotions (e.g. a cart's cached PromoResult) is keyed by the same token.
+
+The token changes:
+  - whenever a Promotion row is inserted/updated/deleted through the ORM
+    and the transaction commits (listeners in models.py — covers the
+    admin routes, scripts and fixtures alike),
+  - when checkout pushes a promotion's current_uses up to max_uses,
+  - when the promotions table is (re)created,
+  - at midnight, because start/end dates are part of validity.
+
+The generation lives in the shared Flask-Caching backend, so with Redis
+an admin edit on one worker invalidates the compiled set on all of them.
+It is a timestamp rather than a counter: if the cache evicts the key,
+the replacement value is new too, so an old generation can never come
+back and revive entries cached under it.
+"""
+import time
+from datetime import date
+
+from app import cache
+
+
+GENERATION_KEY = 'promotions_generation'
+
+# (token, CompiledPromotionSet) — replaced as a whole, so readers never
+# see a half-built set.
+_compiled = (None, None)
+
+
+def _generation() -> int:
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        generation = time.time_ns()
+        cache.set(GENERATION_KEY, generation, timeout=0)
+    return generation
+
+
+def promotion_set_token() -> str:
+    return f"{date.today().isoformat()}.{_generation()}"
+
+
+def invalidate_promotions() -> None:
+    """Move every promotion-derived cache entry to a new generation."""
+    cache.set(GENERATION_KEY, time.time_ns(), timeout=0)
+
+
+def get_compiled_promotions(refresh: bool = False):
+    """
+    Return the compiled set of promotions valid today.
+
+    ``refresh=True`` always reloads from the database (checkout uses it so
+    usage limits are enforced against committed data) and republishes the
+    result for later callers.
+    """
+    global _compiled
+    from app.promotions.engine import compile_promotions
+    from app.promotions.routes import get_active_promotions
+
+    token = promotion_set_token()
+    cached_token, compiled = _compiled
+    if not refresh and compiled is not None and cached_token == token:
+        return compiled
+
+    compiled = compile_promotions(get_active_promotions())
+    _compiled = (token, compiled)
+    return compiled
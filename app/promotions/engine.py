@@ -8,14 +8,26 @@ with applied discounts, descriptions, and the updated grand total.
 
 No DB writes happen here — only reads. The caller (billing route or
 admin tester) decides how to act on the result.
+
+Promotions are first compiled (compile_promotions) into plain, immutable
+rules: JSON params are parsed once, item-level rules are indexed by
+product_id and bill-level rules are kept apart. Evaluation then walks the
+cart once and only touches the rules indexed under each line's product,
+so cost grows with (cart lines × promos on those products) instead of
+(all promos × all lines). app.promotions.cache keeps a compiled set per
+process so the billing screen does not recompile on every scan.
 """
 from __future__ import annotations
 from dataclasses import dataclass, field
-from typing import List, Optional, Union
+from operator import attrgetter
+from typing import Dict, List, Optional, Union
 from decimal import Decimal, ROUND_HALF_UP
 
 
 Q = Decimal('0.01')   # quantize target
+HUNDRED = Decimal('100')
+
+ITEM_PROMO_TYPES = ('percentage_item', 'fixed_item', 'buy_x_get_y')
 
 
 @dataclass
@@ -37,86 +49,118 @@ class PromoResult:
     discounted_total: Decimal = Decimal('0')
 
 
-# ── Individual handlers ───────────────────────────────────────────
+# ── Compiled rules ────────────────────────────────────────────────
 
-def _handle_percentage_item(promo, cart: dict) -> Decimal:
-    """Apply a percentage discount to specific product(s) in cart."""
-    params      = promo.params_dict
-    product_ids = {str(p) for p in params.get('product_ids', [])}
-    percent     = Decimal(str(params.get('percent', 0)))
+@dataclass(frozen=True, eq=False)
+class CompiledPromotion:
+    """One promotion with its params already parsed (hashable by identity)."""
+    promo_id:    Optional[int]
+    name:        str
+    promo_type:  str
+    stackable:   bool
+    order:       int                  # position in the source list (tie-breaks)
+    description: str
+    percent:     Decimal = Decimal('0')
+    amount:      Decimal = Decimal('0')
+    product_ids: frozenset = frozenset()
+    buy_qty:     int = 1
+    free_qty:    int = 1
 
-    discount = Decimal('0')
-    for _, item in cart.items():
-        if str(item.get('product_id')) in product_ids:
-            price = Decimal(item['price'])
-            qty   = Decimal(item['quantity'])
-            line  = (price * qty).quantize(Q)
-            discount += (line * percent / Decimal('100')).quantize(Q)
-    return discount
 
+@dataclass
+class CompiledPromotionSet:
+    """Promotions valid today, indexed for evaluation."""
+    by_product: Dict[str, List[CompiledPromotion]] = field(default_factory=dict)
+    bill_level: List[CompiledPromotion] = field(default_factory=list)
+    count:      int = 0
+
+    def __len__(self) -> int:
+        return self.count
+
+
+def _compile_one(promo, order: int) -> Optional[CompiledPromotion]:
+    params = promo.params_dict
+    common = dict(
+        promo_id=promo.id,
+        name=promo.name,
+        promo_type=promo.promo_type,
+        stackable=promo.stackable,
+        order=order,
+    )
 
-def _handle_fixed_item(promo, cart: dict) -> Decimal:
-    """Apply a fixed ₹ discount to specific product(s) in cart (capped at line total)."""
-    params      = promo.params_dict
-    product_ids = {str(p) for p in params.get('product_ids', [])}
-    amount      = Decimal(str(params.get('amount', 0)))
-
-    discount = Decimal('0')
-    for _, item in cart.items():
-        if str(item.get('product_id')) in product_ids:
-            price    = Decimal(item['price'])
-            qty      = Decimal(item['quantity'])
-            line     = (price * qty).quantize(Q)
-            discount += min(amount, line)   # cap at line total
-    return discount
+    if promo.promo_type == 'percentage_item':
+        return CompiledPromotion(
+            description=f"{params.get('percent')}% off selected item(s)",
+            percent=Decimal(str(params.get('percent', 0))),
+            product_ids=frozenset(str(p) for p in params.get('product_ids', [])),
+            **common,
+        )
 
+    if promo.promo_type == 'fixed_item':
+        return CompiledPromotion(
+            description=f"₹{params.get('amount')} off selected item(s)",
+            amount=Decimal(str(params.get('amount', 0))),
+            product_ids=frozenset(str(p) for p in params.get('product_ids', [])),
+            **common,
+        )
 
-def _handle_bill_percentage(promo, cart: dict, cart_subtotal: Decimal) -> Decimal:
-    """Apply a percentage off the entire bill subtotal."""
-    percent = Decimal(str(promo.params_dict.get('percent', 0)))
-    return (cart_subtotal * percent / Decimal('100')).quantize(Q)
+    if promo.promo_type == 'bill_percentage':
+        return CompiledPromotion(
+            description=f"{params.get('percent')}% off entire bill",
+            percent=Decimal(str(params.get('percent', 0))),
+            **common,
+        )
 
+    if promo.promo_type == 'buy_x_get_y':
+        return CompiledPromotion(
+            description=f"Buy {params.get('buy_qty')} Get {params.get('free_qty')} Free",
+            product_ids=frozenset([str(params.get('product_id', ''))]),
+            buy_qty=int(params.get('buy_qty', 1)),
+            free_qty=int(params.get('free_qty', 1)),
+            **common,
+        )
 
-def _handle_buy_x_get_y(promo, cart: dict) -> Decimal:
-    """
-    Buy X, Get Y free for a specific product.
-    Aggregates quantity across all variants of the same product in the cart.
-    """
-    params     = promo.params_dict
-    product_id = str(params.get('product_id', ''))
-    buy_qty    = int(params.get('buy_qty', 1))
-    free_qty   = int(params.get('free_qty', 1))
+    return None   # unknown type — skip
 
-    # Aggregate quantities for this product across all variants
-    total_qty = 0
-    unit_price = Decimal('0')
-    found = False
 
-    for item in cart.values():
-        if str(item.get('product_id')) == product_id:
-            total_qty += int(item['quantity'])
-            # We use the price of the first variant found as representative, 
-            # or ideally the cheapest/most expensive? 
-            # Standard retail logic uses the item price for each free unit.
-            if not found:
-                unit_price = Decimal(item['price'])
-                found = True
+def compile_promotions(promotions: list) -> CompiledPromotionSet:
+    """
+    Compile Promotion objects into an indexed, ORM-free rule set.
 
-    if not found or total_qty < (buy_qty + free_qty):
-        return Decimal('0')
+    Promotions not valid today (inactive, out of date range, max_uses
+    reached) are dropped here, so the result must be rebuilt when any of
+    those change — see app.promotions.cache.
+    """
+    compiled = CompiledPromotionSet()
+    for order, promo in enumerate(promotions):
+        if not promo.is_valid_today:
+            continue
+        rule = _compile_one(promo, order)
+        if rule is None:
+            continue
+        compiled.count += 1
+        if rule.promo_type in ITEM_PROMO_TYPES:
+            for product_id in rule.product_ids:
+                compiled.by_product.setdefault(product_id, []).append(rule)
+        else:
+            compiled.bill_level.append(rule)
+    return compiled
 
-    # Number of full cycles: e.g. buy 2 get 1 → cycle = 3 units
-    cycle       = buy_qty + free_qty
-    full_cycles = total_qty // cycle
-    free_units  = full_cycles * free_qty
 
-    return (unit_price * Decimal(free_units)).quantize(Q)
+# ── Cart subtotal helpers ─────────────────────────────────────────
 
+def _line_subtotal(item) -> Decimal:
+    stamped = item.get('line_subtotal')   # billing Cart lines carry it
+    if stamped is not None:
+        return Decimal(stamped)
+    return (Decimal(item['price']) * Decimal(item['quantity'])).quantize(Q)
 
-# ── Cart subtotal helper ──────────────────────────────────────────
 
 def _cart_subtotal(cart: dict) -> Decimal:
     """Sum of price × qty for all items (pre-GST)."""
+    maintained = getattr(cart, 'subtotal', None)   # billing Cart keeps it running
+    if isinstance(maintained, Decimal):
+        return maintained
     total = Decimal('0')
     for item in cart.values():
         total += (Decimal(item['price']) * Decimal(item['quantity'])).quantize(Q)
@@ -125,9 +169,12 @@ def _cart_subtotal(cart: dict) -> Decimal:
 
 # ── Main public function ──────────────────────────────────────────
 
-def evaluate_promotions(cart: dict, promotions: list) -> PromoResult:
+def evaluate_promotions(cart: dict, promotions: Union[list, CompiledPromotionSet]) -> PromoResult:
     """
-    Evaluate a list of Promotion objects against the current cart.
+    Evaluate promotions against the current cart.
+
+    ``promotions`` is either a list of Promotion objects (compiled on the
+    fly) or a CompiledPromotionSet from compile_promotions().
 
     Stacking rules:
     1. Evaluate all promotions individually first.
@@ -138,6 +185,9 @@ def evaluate_promotions(cart: dict, promotions: list) -> PromoResult:
 
     Returns a PromoResult. All amounts are positive (discounts subtract).
     """
+    if not isinstance(promotions, CompiledPromotionSet):
+        promotions = compile_promotions(promotions or [])
+
     if not cart or not promotions:
         subtotal = _cart_subtotal(cart) if cart else Decimal('0')
         result = PromoResult(original_total=subtotal, discounted_total=subtotal)
@@ -145,51 +195,59 @@ def evaluate_promotions(cart: dict, promotions: list) -> PromoResult:
 
     subtotal = _cart_subtotal(cart)
 
-    # Evaluate each promotion individually
-    stackable_entries: List[AppliedEntry]     = []
-    non_stackable_entries: List[AppliedEntry] = []
+    # ── One pass over the cart, touching only indexed rules ───────
+    discounts: Dict[CompiledPromotion, Decimal] = {}
+    bogof_state: Dict[CompiledPromotion, list] = {}   # rule → [total_qty, unit_price]
 
-    for promo in promotions:
-        if not promo.is_valid_today:
+    for item in cart.values():
+        rules = promotions.by_product.get(str(item.get('product_id')))
+        if not rules:
             continue
+        line = _line_subtotal(item)
+        for rule in rules:
+            if rule.promo_type == 'percentage_item':
+                disc = (line * rule.percent / HUNDRED).quantize(Q)
+                discounts[rule] = discounts.get(rule, Decimal('0')) + disc
+            elif rule.promo_type == 'fixed_item':
+                disc = min(rule.amount, line)   # cap at line total
+                discounts[rule] = discounts.get(rule, Decimal('0')) + disc
+            else:
+                # Buy X Get Y: aggregate quantity across all variants of the
+                # product; the first line found sets the price of free units.
+                state = bogof_state.get(rule)
+                if state is None:
+                    bogof_state[rule] = [int(item['quantity']), Decimal(item['price'])]
+                else:
+                    state[0] += int(item['quantity'])
+
+    for rule, (total_qty, unit_price) in bogof_state.items():
+        # Number of full cycles: e.g. buy 2 get 1 → cycle = 3 units
+        cycle = rule.buy_qty + rule.free_qty
+        if cycle <= 0 or total_qty < cycle:
+            continue
+        free_units = (total_qty // cycle) * rule.free_qty
+        discounts[rule] = (unit_price * Decimal(free_units)).quantize(Q)
 
-        disc = Decimal('0')
-
-        if promo.promo_type == 'percentage_item':
-            disc = _handle_percentage_item(promo, cart)
-            params = promo.params_dict
-            desc = f"{params.get('percent')}% off selected item(s)"
-
-        elif promo.promo_type == 'fixed_item':
-            disc = _handle_fixed_item(promo, cart)
-            params = promo.params_dict
-            desc = f"₹{params.get('amount')} off selected item(s)"
-
-        elif promo.promo_type == 'bill_percentage':
-            disc = _handle_bill_percentage(promo, cart, subtotal)
-            params = promo.params_dict
-            desc = f"{params.get('percent')}% off entire bill"
-
-        elif promo.promo_type == 'buy_x_get_y':
-            disc = _handle_buy_x_get_y(promo, cart)
-            params = promo.params_dict
-            desc = f"Buy {params.get('buy_qty')} Get {params.get('free_qty')} Free"
+    for rule in promotions.bill_level:
+        discounts[rule] = (subtotal * rule.percent / HUNDRED).quantize(Q)
 
-        else:
-            continue   # unknown type — skip
+    stackable_entries: List[AppliedEntry]     = []
+    non_stackable_entries: List[AppliedEntry] = []
 
+    for rule in sorted(discounts, key=attrgetter('order')):
+        disc = discounts[rule]
         if disc <= Decimal('0'):
             continue   # no discount applicable
 
         entry = AppliedEntry(
-            promo_id=promo.id,
-            promo_name=promo.name,
+            promo_id=rule.promo_id,
+            promo_name=rule.name,
             discount_amount=disc.quantize(Q),
-            description=desc,
-            stackable=promo.stackable,
+            description=rule.description,
+            stackable=rule.stackable,
         )
 
-        if promo.stackable:
+        if rule.stackable:
             stackable_entries.append(entry)
         else:
             non_stackable_entries.append(entry)
@@ -207,13 +265,9 @@ def evaluate_promotions(cart: dict, promotions: list) -> PromoResult:
         # Non-stackable beats everything — use only it
         final_entries = [best_non_stack]
     else:
-        # Use all stackable promos
+        # Use all stackable promos; in this branch stackable >= best
+        # non-stackable, so the non-stackable one is not added.
         final_entries = list(stackable_entries)
-        # Add the best non-stackable if it further increases the discount
-        if best_non_stack and best_non_stack.discount_amount > Decimal('0'):
-            # Only add if stackable_total > 0 (i.e., non-stack beat standalone, so skip)
-            # Actually in this branch stackable >= non-stack, so we already won with stackable
-            pass
 
     total_discount   = sum((e.discount_amount for e in final_entries), start=Decimal('0')).quantize(Q)
     # Cap discount at subtotal to never produce negative totals
@@ -11,6 +11,12 @@ Promotion.params is a JSON-encoded dict whose schema depends on promo_type:
 """
 import json
 from datetime import datetime, date
+from itertools import chain
+
+from flask import has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
 from app import db
 
 
@@ -106,3 +112,39 @@ class AppliedPromotion(db.Model):
 
     def __repr__(self):
         return f'<AppliedPromo sale={self.sale_id} promo={self.promo_name!r} disc={self.discount_amount}>'
+
+
+# ── Compiled promotion set invalidation (see app/promotions/cache.py) ──
+
+# Set in Session.info when the transaction touched promotions; read on commit.
+PROMOTIONS_CHANGED_KEY = 'promotions_changed'
+
+
+def _invalidate_compiled_promotions():
+    if has_app_context():
+        from app.promotions.cache import invalidate_promotions
+        invalidate_promotions()
+
+
+@event.listens_for(Session, 'after_flush')
+def _note_promotion_changes(session, flush_context):
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, Promotion):
+            session.info[PROMOTIONS_CHANGED_KEY] = True
+            return
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_on_commit(session):
+    if session.info.pop(PROMOTIONS_CHANGED_KEY, False):
+        _invalidate_compiled_promotions()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_on_rollback(session):
+    session.info.pop(PROMOTIONS_CHANGED_KEY, None)
+
+
+@event.listens_for(Promotion.__table__, 'after_create')
+def _invalidate_on_table_create(target, connection, **kw):
+    _invalidate_compiled_promotions()
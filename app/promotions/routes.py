@@ -8,6 +8,7 @@ from app.auth.decorators import admin_required
 from app.promotions import promotions
 from app.promotions.models import PROMO_TYPE_CHOICES, Promotion
 from app.promotions.engine import evaluate_promotions
+from app.promotions.cache import get_compiled_promotions
 from app.inventory.models import Product
 
 
@@ -291,7 +292,7 @@ def tester_preview():
             'gst_percent': product.gst_percent,
         }
 
-    active_promos = get_active_promotions()
+    active_promos = get_compiled_promotions()
     promo_result  = evaluate_promotions(mock_cart, active_promos)
 
     return render_template('promotions/_preview.html', 
@@ -300,6 +301,6 @@ def tester_preview():
 
 def get_active_promotions():
     """Return a list of all currently active and valid promotions."""
-    all_active = Promotion.query.filter_by(is_active=True).all()
+    all_active = Promotion.query.filter_by(is_active=True).order_by(Promotion.id).all()
     # Filter by date ranges and usage limits in Python for simplicity
     return [p for p in all_active if p.is_valid_today]
@@ -6,6 +6,9 @@ URL prefix: /reporting
 """
 from flask import Blueprint
 
+from app.utils.replica import use_reporting_replica
+
 reporting = Blueprint('reporting', __name__)
+reporting.before_request(use_reporting_replica)   # reads go to REPORTING_DATABASE_URL if set
 
 from app.reporting import routes  # noqa: E402, F401
@@ -0,0 +1,133 @@
+"""
+app/reporting/apparel.py
+------------------------
+Apparel report: units and gross sales by size, color, brand and
+category, plus a size × color matrix.
+
+One GROUPING SETS query over the daily item rollup
+(app/reporting/models.py) produces every breakdown in a single scan.
+GROUPING() tells the sets apart. Sizes and colors are cut to the top N
+by units; brands and categories are listed in full by gross sales. The
+result is cached per date range. The cache key carries the range's sale
+count from the hourly rollup, which the same transaction updates, so a
+new sale in the range reads fresh while older ranges stay cached. Brand
+and category are read from the product at query time, so a product edit
+that changes them calls invalidate_apparel_cache(), which moves every
+range to a new key generation.
+"""
+import secrets
+
+from sqlalchemy import func, select, tuple_
+
+from app import cache, db
+from app.inventory.models import Product
+from app.reporting.models import ItemDailyRollup, SalesHourlyRollup
+
+
+APPAREL_TOP_N = 10
+APPAREL_CACHE_PREFIX = 'apparel:'
+APPAREL_GENERATION_KEY = 'apparel-generation'
+
+# GROUPING(size, color, brand, category): a set bit marks a column rolled up.
+_SETS = {
+    0b0111: 'sizes',
+    0b1011: 'colors',
+    0b1101: 'brands',
+    0b1110: 'categories',
+    0b0011: 'matrix',
+}
+_KEYS = {'sizes': 'size', 'colors': 'color', 'brands': 'brand', 'categories': 'category'}
+
+
+def _grouped_rows(days):
+    r = ItemDailyRollup
+    brand = func.coalesce(func.nullif(Product.brand, ''), 'Unbranded')
+    category = func.coalesce(func.nullif(Product.category, ''), 'Uncategorized')
+    stmt = (
+        select(
+            r.size,
+            r.color,
+            brand.label('brand'),
+            category.label('category'),
+            func.grouping(r.size, r.color, brand, category).label('grouping_id'),
+            func.sum(r.quantity).label('units_sold'),
+            func.sum(r.gross_sales).label('gross_sales'),
+        )
+        .join(Product, Product.id == r.product_id)
+        .where(*days.day_filter(r.day))
+        .group_by(func.grouping_sets(
+            tuple_(r.size), tuple_(r.color), tuple_(brand), tuple_(category),
+            tuple_(r.size, r.color),
+        ))
+    )
+    return db.session.execute(stmt).all()
+
+
+def _by_units(rows):
+    return sorted(rows, key=lambda row: (row['units_sold'], row['gross_sales']), reverse=True)
+
+
+def _by_sales(rows):
+    return sorted(rows, key=lambda row: row['gross_sales'], reverse=True)
+
+
+def _build(days, top_n) -> dict:
+    sets = {name: [] for name in _SETS.values()}
+    for row in _grouped_rows(days):
+        name = _SETS.get(row.grouping_id)
+        if name == 'matrix':
+            sets[name].append(row)
+        elif name is not None:
+            label = getattr(row, _KEYS[name])
+            if label:   # sizes/colors recorded blank are left out
+                sets[name].append({
+                    _KEYS[name]: label,
+                    'units_sold': int(row.units_sold or 0),
+                    'gross_sales': row.gross_sales or 0,
+                })
+
+    summary = {
+        'sizes': _by_units(sets['sizes'])[:top_n],
+        'colors': _by_units(sets['colors'])[:top_n],
+        'brands': _by_sales(sets['brands']),
+        'categories': _by_sales(sets['categories']),
+    }
+    sizes = [row['size'] for row in summary['sizes']]
+    colors = [row['color'] for row in summary['colors']]
+    summary['matrix'] = {
+        'sizes': sizes,
+        'colors': colors,
+        'cells': {
+            (row.size, row.color): int(row.units_sold or 0)
+            for row in sets['matrix'] if row.size in sizes and row.color in colors
+        },
+    }
+    return summary
+
+
+def _range_sales(days) -> int:
+    return db.session.execute(
+        select(func.coalesce(func.sum(SalesHourlyRollup.sales_count), 0))
+        .where(*days.day_filter(SalesHourlyRollup.day))
+    ).scalar()
+
+
+def invalidate_apparel_cache() -> None:
+    """Drop every cached summary (a product's brand or category changed)."""
+    cache.set(APPAREL_GENERATION_KEY, secrets.token_hex(4), timeout=0)
+
+
+def apparel_summary(days, top_n=APPAREL_TOP_N) -> dict:
+    """
+    {'sizes', 'colors': top-N rows ranked by units then gross sales,
+    'brands', 'categories': every row ranked by gross sales,
+    'matrix': {'sizes', 'colors', 'cells': {(size, color): units}}}
+    for ``days`` (a DateRange).
+    """
+    generation = cache.get(APPAREL_GENERATION_KEY) or '0'
+    key = f'{APPAREL_CACHE_PREFIX}{generation}:{days.start}:{days.end}:{top_n}:{_range_sales(days)}'
+    summary = cache.get(key)
+    if summary is None:
+        summary = _build(days, top_n)
+        cache.set(key, summary)
+    return summary
@@ -0,0 +1,173 @@
+"""
+app/reporting/exports.py
+------------------------
+Streaming CSV exports.
+
+Rows are read from a server-side cursor (yield_per) as plain column
+tuples: no ORM objects, no per-row lazy loads, no invoice snapshot.
+Per-sale figures such as item counts are aggregated in SQL. The CSV
+text goes out in chunks of about EXPORT_CHUNK_BYTES, gzip-compressed on
+the fly when the client accepts it. Memory stays flat however many rows
+the range holds.
+"""
+import csv
+import io
+import zlib
+
+from flask import Response, request, stream_with_context
+from sqlalchemy import func, select
+from sqlalchemy.orm import aliased
+
+from app import db
+from app.billing.models import Sale, SaleItem
+from app.inventory.models import Product, ProductVariant
+from app.reporting.query import store_time
+
+
+EXPORT_YIELD_PER = 2000
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+SALE_GRAND_TOTAL = func.coalesce(Sale.grand_total, Sale.total_amount + Sale.gst_total)
+
+
+def stream_rows(stmt, yield_per=EXPORT_YIELD_PER):
+    """Iterate ``stmt`` through a server-side cursor, ``yield_per`` rows per fetch."""
+    yield from db.session.execute(stmt.execution_options(yield_per=yield_per))
+
+
+def csv_chunks(header, rows):
+    """CSV text for ``header`` + ``rows`` in chunks of ~EXPORT_CHUNK_BYTES."""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(header)
+    for row in rows:
+        writer.writerow(row)
+        if buf.tell() >= EXPORT_CHUNK_BYTES:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate(0)
+    yield buf.getvalue()
+
+
+def _gzipped(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)   # gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def csv_response(filename, header, rows, content_type='text/csv') -> Response:
+    """Stream ``rows`` as a CSV download, gzip-encoded if the client accepts it."""
+    chunks = csv_chunks(header, rows)
+    headers = {
+        'Content-Disposition': f'attachment; filename="{filename}"',
+        'Content-Type': content_type,
+        'Vary': 'Accept-Encoding',
+    }
+    if request.accept_encodings['gzip']:
+        chunks = _gzipped(chunks)
+        headers['Content-Encoding'] = 'gzip'
+    return Response(stream_with_context(chunks), headers=headers)
+
+
+# ── Exports ───────────────────────────────────────────────────────
+
+SALES_HEADER = ['Date', 'Invoice #', 'Cashier ID', 'Total Amount', 'GST Total', 'Items']
+
+
+def sales_rows(days):
+    """One row per sale in ``days`` (a DateRange), newest first."""
+    in_range = days.filter(Sale.created_at)
+    item_counts = (
+        select(SaleItem.sale_id, func.sum(SaleItem.quantity).label('items'))
+        .join(Sale, Sale.id == SaleItem.sale_id)
+        .where(*in_range)
+        .group_by(SaleItem.sale_id)
+        .subquery()
+    )
+    stmt = (
+        select(
+            store_time(Sale.created_at).label('created_at'),
+            Sale.invoice_number,
+            Sale.cashier_id,
+            SALE_GRAND_TOTAL.label('grand_total'),
+            Sale.gst_total,
+            func.coalesce(item_counts.c['items'], 0).label('items'),
+        )
+        .outerjoin(item_counts, item_counts.c.sale_id == Sale.id)
+        .where(*in_range)
+        .order_by(Sale.created_at.desc())
+    )
+    for r in stream_rows(stmt):
+        yield (r.created_at.strftime('%Y-%m-%d %H:%M'), r.invoice_number, r.cashier_id,
+               r.grand_total, r.gst_total, r.items)
+
+
+GST_LINES_HEADER = [
+    'Date', 'Invoice #', 'Barcode', 'Product', 'Size', 'Color', 'Qty',
+    'Unit Price', 'Taxable Value', 'GST %', 'GST Amount', 'Line Total',
+]
+
+
+def gst_line_rows(days):
+    """One row per sale line in ``days`` with its taxable value and GST, oldest first."""
+    gst_amount = func.round(SaleItem.subtotal * SaleItem.gst_percent / 100, 2)
+    stmt = (
+        select(
+            store_time(Sale.created_at).label('created_at'),
+            Sale.invoice_number,
+            ProductVariant.barcode,
+            Product.name,
+            SaleItem.snapshot_size,
+            SaleItem.snapshot_color,
+            SaleItem.quantity,
+            SaleItem.price_at_sale,
+            SaleItem.subtotal,
+            SaleItem.gst_percent,
+            gst_amount.label('gst_amount'),
+            (SaleItem.subtotal + gst_amount).label('line_total'),
+        )
+        .select_from(SaleItem)
+        .join(Sale, Sale.id == SaleItem.sale_id)
+        .join(Product, Product.id == SaleItem.product_id)
+        .outerjoin(ProductVariant, ProductVariant.id == SaleItem.variant_id)
+        .where(*days.filter(Sale.created_at))
+        .order_by(Sale.created_at, SaleItem.id)
+    )
+    for r in stream_rows(stmt):
+        yield (r.created_at.strftime('%Y-%m-%d %H:%M'), *r[1:])
+
+
+INVENTORY_HEADER = ['Barcode', 'Product Name', 'Stock', 'Price', 'GST %', 'Value']
+
+
+def inventory_rows():
+    """Active products with stock over active variants and the first variant's price."""
+    totals = (
+        select(
+            ProductVariant.product_id,
+            func.sum(ProductVariant.stock).label('stock'),
+            func.min(ProductVariant.id).label('first_id'),
+        )
+        .where(ProductVariant.is_active.is_(True))
+        .group_by(ProductVariant.product_id)
+        .subquery()
+    )
+    first = aliased(ProductVariant)
+    stmt = (
+        select(
+            Product.barcode,
+            Product.name,
+            func.coalesce(totals.c.stock, Product._legacy_stock).label('stock'),
+            func.coalesce(first.price, Product._legacy_price).label('price'),
+            Product.gst_percent,
+        )
+        .outerjoin(totals, totals.c.product_id == Product.id)
+        .outerjoin(first, first.id == totals.c.first_id)
+        .where(Product.is_active.is_(True))
+        .order_by(Product.name)
+    )
+    for r in stream_rows(stmt):
+        yield (r.barcode, r.name, r.stock, r.price, r.gst_percent, r.stock * r.price)
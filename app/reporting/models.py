@@ -0,0 +1,71 @@
+"""
+app/reporting/models.py
+-----------------------
+Pre-aggregated sales rollups read by the dashboards and chart APIs.
+
+Maintained by app/reporting/rollups.py: sales and returns add to them
+through the sale_events outbox after commit, and `flask rebuild-rollups`
+recomputes them from the raw tables.
+
+  rollup_sales_hourly     day × hour × cashier            sales and refunds
+  rollup_payments_hourly  day × hour × cashier × method   tenders
+  rollup_items_daily      day × product × size × color    units and revenue
+
+Sale-level totals live apart from the tender rows so a split-tender sale
+is counted once. Category and brand are read through products at query
+time, so re-categorising a product re-labels its history as the raw-row
+reports always did.
+"""
+from app import db
+
+
+class SalesHourlyRollup(db.Model):
+    __tablename__ = 'rollup_sales_hourly'
+
+    day = db.Column(db.Date, primary_key=True)
+    hour = db.Column(db.SmallInteger, primary_key=True)
+    cashier_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+
+    sales_count = db.Column(db.Integer, nullable=False, default=0)
+    total_amount = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    gst_total = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    discount_amount = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    grand_total = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    returns_count = db.Column(db.Integer, nullable=False, default=0)
+    refunded_amount = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<SalesHourlyRollup {self.day} {self.hour:02d}h cashier={self.cashier_id} n={self.sales_count}>"
+
+
+class PaymentHourlyRollup(db.Model):
+    __tablename__ = 'rollup_payments_hourly'
+
+    day = db.Column(db.Date, primary_key=True)
+    hour = db.Column(db.SmallInteger, primary_key=True)
+    cashier_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    payment_method = db.Column(db.String(20), primary_key=True)
+
+    payments_count = db.Column(db.Integer, nullable=False, default=0)
+    amount = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<PaymentHourlyRollup {self.day} {self.hour:02d}h {self.payment_method} {self.amount}>"
+
+
+class ItemDailyRollup(db.Model):
+    __tablename__ = 'rollup_items_daily'
+
+    day = db.Column(db.Date, primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), primary_key=True)
+    size = db.Column(db.String(10), primary_key=True)
+    color = db.Column(db.String(50), primary_key=True)
+
+    quantity = db.Column(db.Integer, nullable=False, default=0)
+    net_sales = db.Column(db.Numeric(14, 2), nullable=False, default=0)      # Σ subtotal (ex-GST)
+    gross_sales = db.Column(db.Numeric(16, 4), nullable=False, default=0)    # Σ subtotal incl. GST
+    returned_qty = db.Column(db.Integer, nullable=False, default=0)
+    refunded_amount = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<ItemDailyRollup {self.day} product={self.product_id} {self.size}/{self.color} qty={self.quantity}>"
@@ -0,0 +1,137 @@
+"""
+app/reporting/query.py
+----------------------
+Date ranges for reporting queries.
+
+Reports are cut on calendar days in the store's timezone
+(STORE_TIMEZONE), while created_at columns hold naive UTC. A DateRange
+turns inclusive store days into half-open UTC bounds:
+
+    created_at >= start_at AND created_at < end_at
+
+ix_sales_created_at can serve that directly. cast(created_at, Date) >= …
+cannot, because the cast has to be computed for every row first.
+
+Either end of a range may be open (None), as the reports' filter forms
+allow. store_day() / store_hour() group rows by local day or hour in SQL;
+the sales rollups are bucketed with them.
+"""
+from datetime import date, datetime, time, timedelta, timezone
+from typing import NamedTuple, Optional
+from zoneinfo import ZoneInfo
+
+from flask import current_app, request
+from sqlalchemy import Date, Integer, cast, extract, func
+
+
+def store_timezone() -> ZoneInfo:
+    return ZoneInfo(current_app.config.get('STORE_TIMEZONE') or 'UTC')
+
+
+def store_today() -> date:
+    return datetime.now(store_timezone()).date()
+
+
+def utc_start_of(day: date) -> datetime:
+    """Naive UTC instant at which store day ``day`` begins."""
+    local_midnight = datetime.combine(day, time.min, tzinfo=store_timezone())
+    return local_midnight.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def store_time(column):
+    """SQL: naive-UTC ``column`` as naive store-local time."""
+    return func.timezone(current_app.config.get('STORE_TIMEZONE') or 'UTC', func.timezone('UTC', column))
+
+
+def store_day(column):
+    return cast(store_time(column), Date)
+
+
+def store_hour(column):
+    return cast(extract('hour', store_time(column)), Integer)
+
+
+class DateRange(NamedTuple):
+    """Inclusive store days; None leaves that end open."""
+    start: Optional[date]
+    end: Optional[date]
+
+    @property
+    def start_at(self) -> Optional[datetime]:
+        return utc_start_of(self.start) if self.start is not None else None
+
+    @property
+    def end_at(self) -> Optional[datetime]:
+        """Exclusive: the start of the day after ``end``."""
+        return utc_start_of(self.end + timedelta(days=1)) if self.end is not None else None
+
+    @property
+    def days(self) -> list:
+        """Every day in a closed range, in order (chart axes)."""
+        return [self.start + timedelta(days=i) for i in range((self.end - self.start).days + 1)]
+
+    def filter(self, column) -> list:
+        """Half-open clauses on a naive-UTC timestamp column."""
+        clauses = []
+        if self.start is not None:
+            clauses.append(column >= self.start_at)
+        if self.end is not None:
+            clauses.append(column < self.end_at)
+        return clauses
+
+    def day_filter(self, column) -> list:
+        """Clauses on a column that already holds store days (rollups)."""
+        clauses = []
+        if self.start is not None:
+            clauses.append(column >= self.start)
+        if self.end is not None:
+            clauses.append(column <= self.end)
+        return clauses
+
+
+def date_range(start=None, end=None) -> DateRange:
+    """A DateRange, swapping the ends if they were given backwards."""
+    if start is not None and end is not None and end < start:
+        start, end = end, start
+    return DateRange(start, end)
+
+
+def last_days(days: int) -> DateRange:
+    """The ``days`` store days ending today."""
+    today = store_today()
+    return DateRange(today - timedelta(days=days - 1), today)
+
+
+def month_to_date() -> DateRange:
+    today = store_today()
+    return DateRange(today.replace(day=1), today)
+
+
+def parse_day(value) -> Optional[date]:
+    """ISO date from a form/query value; None if empty or malformed."""
+    try:
+        return date.fromisoformat((value or '').strip())
+    except ValueError:
+        return None
+
+
+def request_range(start_arg='start_date', end_arg='end_date', default=None) -> DateRange:
+    """
+    DateRange from query params. An end that is missing or malformed
+    falls back to ``default`` (a DateRange), or stays open without one.
+    """
+    start = parse_day(request.args.get(start_arg))
+    end = parse_day(request.args.get(end_arg))
+    if default is not None:
+        start = start if start is not None else default.start
+        end = end if end is not None else default.end
+    return date_range(start, end)
+
+
+def request_days(default=30, max_days=365) -> int:
+    """``?days=N`` clamped to 1..max_days."""
+    try:
+        days = int(request.args.get('days', default))
+    except (TypeError, ValueError):
+        days = default
+    return max(1, min(days, max_days))
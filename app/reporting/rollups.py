@@ -0,0 +1,313 @@
+"""
+app/reporting/rollups.py
+------------------------
+Maintenance, rebuild and verification of the sales rollups
+(app/reporting/models.py).
+
+Each sale and return writes a rollup event into the sale_events outbox
+in its own transaction (SALE_EVENT, RETURN_EVENT). After commit the
+event handler adds that one sale or return to the rollups with
+INSERT … SELECT … ON CONFLICT DO UPDATE. The sale transaction never
+touches the shared counter rows, and the outbox claim keeps a
+redelivered event from being counted twice.
+
+`flask patch-db` (run before every deploy's web start) calls
+backfill_rollups(): history older than the rollups is filled one store
+day per transaction, newest first, so the lock is only held for a day at
+a time and an interrupted deploy resumes where it stopped.
+
+`flask rebuild-rollups` recomputes a day range from the raw tables with
+the same SELECTs and then verifies it. The rebuild holds ROLLUP_LOCK
+exclusively while handlers take it shared. It leaves out sales and
+returns whose rollup event is still pending; the worker adds those once
+the rebuild commits. So rebuilding on a trading day neither drops a sale
+nor counts it twice.
+
+Buckets are store-timezone days and hours (app/reporting/query.py).
+After changing STORE_TIMEZONE, rebuild.
+"""
+from datetime import timedelta
+
+from sqlalchemy import String, cast, delete, exists, func, literal, select, union_all
+from sqlalchemy.dialects.postgresql import JSONB, insert as pg_insert
+
+from app import db
+from app.billing.events import MAX_ATTEMPTS
+from app.billing.models import Return, ReturnItem, Sale, SaleEvent, SaleItem, SalePayment
+from app.reporting.models import ItemDailyRollup, PaymentHourlyRollup, SalesHourlyRollup
+from app.reporting.query import date_range, store_day, store_hour, store_today
+
+
+SALE_EVENT = 'rollups.sale'
+RETURN_EVENT = 'rollups.return'
+
+ROLLUP_LOCK = 0x524F4C4C   # pg advisory lock key: handlers shared, rebuild exclusive
+
+
+# ── Source aggregations ───────────────────────────────────────────
+
+def _sales_hourly(*where):
+    day, hour = store_day(Sale.created_at), store_hour(Sale.created_at)
+    return (
+        select(
+            day.label('day'),
+            hour.label('hour'),
+            Sale.cashier_id.label('cashier_id'),
+            func.count(Sale.id).label('sales_count'),
+            func.sum(Sale.total_amount).label('total_amount'),
+            func.sum(Sale.gst_total).label('gst_total'),
+            func.sum(Sale.discount_amount).label('discount_amount'),
+            func.sum(func.coalesce(Sale.grand_total, Sale.total_amount + Sale.gst_total)).label('grand_total'),
+            literal(0).label('returns_count'),
+            literal(0).label('refunded_amount'),
+        )
+        .where(*where)
+        .group_by(day, hour, Sale.cashier_id)
+    )
+
+
+def _returns_hourly(*where):
+    day, hour = store_day(Return.created_at), store_hour(Return.created_at)
+    return (
+        select(
+            day.label('day'),
+            hour.label('hour'),
+            Return.processed_by.label('cashier_id'),
+            literal(0).label('sales_count'),
+            literal(0).label('total_amount'),
+            literal(0).label('gst_total'),
+            literal(0).label('discount_amount'),
+            literal(0).label('grand_total'),
+            func.count(Return.id).label('returns_count'),
+            func.sum(Return.total_refunded).label('refunded_amount'),
+        )
+        .where(*where)
+        .group_by(day, hour, Return.processed_by)
+    )
+
+
+def _payments_hourly(*where):
+    day, hour = store_day(Sale.created_at), store_hour(Sale.created_at)
+    return (
+        select(
+            day.label('day'),
+            hour.label('hour'),
+            Sale.cashier_id.label('cashier_id'),
+            SalePayment.payment_method.label('payment_method'),
+            func.count(SalePayment.id).label('payments_count'),
+            func.sum(SalePayment.amount).label('amount'),
+        )
+        .select_from(SalePayment)
+        .join(Sale, Sale.id == SalePayment.sale_id)
+        .where(*where)
+        .group_by(day, hour, Sale.cashier_id, SalePayment.payment_method)
+    )
+
+
+def _items_daily(*where):
+    day = store_day(Sale.created_at)
+    gross = SaleItem.subtotal + ((SaleItem.subtotal * SaleItem.gst_percent) / 100)
+    return (
+        select(
+            day.label('day'),
+            SaleItem.product_id.label('product_id'),
+            SaleItem.snapshot_size.label('size'),
+            SaleItem.snapshot_color.label('color'),
+            func.sum(SaleItem.quantity).label('quantity'),
+            func.sum(SaleItem.subtotal).label('net_sales'),
+            func.sum(gross).label('gross_sales'),
+            literal(0).label('returned_qty'),
+            literal(0).label('refunded_amount'),
+        )
+        .select_from(SaleItem)
+        .join(Sale, Sale.id == SaleItem.sale_id)
+        .where(*where)
+        .group_by(day, SaleItem.product_id, SaleItem.snapshot_size, SaleItem.snapshot_color)
+    )
+
+
+def _returned_items_daily(*where):
+    day = store_day(Return.created_at)
+    return (
+        select(
+            day.label('day'),
+            SaleItem.product_id.label('product_id'),
+            SaleItem.snapshot_size.label('size'),
+            SaleItem.snapshot_color.label('color'),
+            literal(0).label('quantity'),
+            literal(0).label('net_sales'),
+            literal(0).label('gross_sales'),
+            func.sum(ReturnItem.quantity).label('returned_qty'),
+            func.sum(ReturnItem.refund_amount).label('refunded_amount'),
+        )
+        .select_from(ReturnItem)
+        .join(Return, Return.id == ReturnItem.return_id)
+        .join(SaleItem, SaleItem.id == ReturnItem.sale_item_id)
+        .where(*where)
+        .group_by(day, SaleItem.product_id, SaleItem.snapshot_size, SaleItem.snapshot_color)
+    )
+
+
+# (rollup, sale-side source, return-side source)
+ROLLUPS = (
+    (SalesHourlyRollup, _sales_hourly, _returns_hourly),
+    (PaymentHourlyRollup, _payments_hourly, None),
+    (ItemDailyRollup, _items_daily, _returned_items_daily),
+)
+
+
+def _columns(model):
+    table = model.__table__
+    keys = [c.name for c in table.primary_key.columns]
+    measures = [c.name for c in table.columns if not c.primary_key]
+    return table, keys, measures
+
+
+def _ordered(model, source):
+    """``source`` with its columns in the rollup table's column order."""
+    _table, keys, measures = _columns(model)
+    sub = source.subquery()
+    return select(*(sub.c[name] for name in keys + measures))
+
+
+def _add(model, source) -> int:
+    table, keys, measures = _columns(model)
+    stmt = pg_insert(table).from_select(keys + measures, _ordered(model, source))
+    stmt = stmt.on_conflict_do_update(
+        index_elements=keys,
+        set_={name: table.c[name] + stmt.excluded[name] for name in measures},
+    )
+    return db.session.execute(stmt).rowcount
+
+
+# ── Incremental (sale_events handlers) ────────────────────────────
+
+def apply_sale(sale_id) -> None:
+    """Add one committed sale to the rollups. The caller commits."""
+    db.session.execute(select(func.pg_advisory_xact_lock_shared(ROLLUP_LOCK)))
+    for model, sale_source, _return_source in ROLLUPS:
+        _add(model, sale_source(Sale.id == sale_id))
+
+
+def apply_return(return_id) -> None:
+    """Add one committed return to the rollups. The caller commits."""
+    db.session.execute(select(func.pg_advisory_xact_lock_shared(ROLLUP_LOCK)))
+    for model, _sale_source, return_source in ROLLUPS:
+        if return_source is not None:
+            _add(model, return_source(Return.id == return_id))
+
+
+# ── Rebuild / verify ──────────────────────────────────────────────
+
+def _pending(event_type, *match):
+    return exists().where(
+        SaleEvent.event_type == event_type,
+        SaleEvent.processed_at.is_(None),
+        SaleEvent.attempts < MAX_ATTEMPTS,
+        *match,
+    )
+
+
+def _filters(start, end):
+    """
+    WHERE clauses for the sale- and return-side sources over days
+    start..end (half-open on created_at), leaving out rows whose rollup
+    event has not been applied yet.
+    """
+    sale_where = [~_pending(SALE_EVENT, SaleEvent.sale_id == Sale.id)]
+    return_where = [~_pending(
+        RETURN_EVENT,
+        SaleEvent.sale_id == Return.sale_id,
+        cast(SaleEvent.payload, JSONB)['return_id'].astext == cast(Return.id, String),
+    )]
+    days = date_range(start, end)
+    sale_where += days.filter(Sale.created_at)
+    return_where += days.filter(Return.created_at)
+    return sale_where, return_where
+
+
+def _day_range(table, start, end) -> list:
+    return date_range(start, end).day_filter(table.c.day)
+
+
+def rebuild_rollups(start=None, end=None) -> dict:
+    """
+    Recompute the rollups for days start..end (inclusive, either open)
+    from the raw tables and commit. Returns {table name: rows written}.
+    """
+    db.session.execute(select(func.pg_advisory_xact_lock(ROLLUP_LOCK)))
+    sale_where, return_where = _filters(start, end)
+
+    written = {}
+    for model, sale_source, return_source in ROLLUPS:
+        table = model.__table__
+        db.session.execute(delete(table).where(*_day_range(table, start, end)))
+        rows = _add(model, sale_source(*sale_where))
+        if return_source is not None:
+            rows += _add(model, return_source(*return_where))
+        written[table.name] = rows
+
+    db.session.commit()
+    return written
+
+
+def backfill_rollups() -> int:
+    """
+    Rebuild, one day per transaction and newest first, every day from the
+    first sale up to and including the first day the rollups hold. An
+    interrupted run resumes from the oldest day it reached; once history
+    is complete this re-checks a single day. Returns the days rebuilt.
+    """
+    first_sale = db.session.execute(select(func.min(store_day(Sale.created_at)))).scalar()
+    first_rolled = db.session.execute(select(func.min(SalesHourlyRollup.day))).scalar()
+    db.session.commit()
+    if first_sale is None:
+        return 0
+
+    day, rebuilt = first_rolled or store_today(), 0
+    while day >= first_sale:
+        rebuild_rollups(day, day)
+        day -= timedelta(days=1)
+        rebuilt += 1
+    return rebuilt
+
+
+def verify_rollups(start=None, end=None) -> list:
+    """
+    Compare per-day rollup totals with the raw tables over days
+    start..end. Returns [(table, day, measure, expected, actual), …] for
+    every difference; an empty list means the rollups are exact.
+    """
+    db.session.execute(select(func.pg_advisory_xact_lock(ROLLUP_LOCK)))
+    sale_where, return_where = _filters(start, end)
+
+    mismatches = []
+    for model, sale_source, return_source in ROLLUPS:
+        table, _keys, measures = _columns(model)
+        sources = [_ordered(model, sale_source(*sale_where))]
+        if return_source is not None:
+            sources.append(_ordered(model, return_source(*return_where)))
+        raw = union_all(*sources).subquery() if len(sources) > 1 else sources[0].subquery()
+
+        expected = {
+            row.day: row for row in db.session.execute(
+                select(raw.c.day, *(func.sum(raw.c[name]).label(name) for name in measures))
+                .group_by(raw.c.day)
+            )
+        }
+        actual = {
+            row.day: row for row in db.session.execute(
+                select(table.c.day, *(func.sum(table.c[name]).label(name) for name in measures))
+                .where(*_day_range(table, start, end))
+                .group_by(table.c.day)
+            )
+        }
+        for day in sorted(set(expected) | set(actual)):
+            for name in measures:
+                want = getattr(expected.get(day), name, None) or 0
+                got = getattr(actual.get(day), name, None) or 0
+                if want != got:
+                    mismatches.append((table.name, day, name, want, got))
+
+    db.session.commit()   # releases ROLLUP_LOCK
+    return mismatches
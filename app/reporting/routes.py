@@ -3,71 +3,24 @@ app/reporting/routes.py
 -----------------------
 Reporting & Analytics routes.
 """
-import csv
-import io
-from datetime import datetime, date, timedelta
 from decimal import Decimal, ROUND_HALF_UP
 
-from flask import (
-    render_template, request, Response, stream_with_context,
-)
-from sqlalchemy import func, desc, Date, cast
+from flask import abort, render_template
+from sqlalchemy import func, desc
 
 from app.reporting import reporting
 from app.auth.decorators import admin_required
 from app import db
 from app.billing.models import Sale, SaleItem, SalePayment
-from app.inventory.models import Product, ProductVariant
+from app.inventory.models import Product
 from app.purchasing.models import PurchaseOrder, PurchaseOrderItem, POStatus
-
-
-# ── Helpers ───────────────────────────────────────────────────────
-
-def _get_date_range():
-    """Parse start/end dates from query params, default to current month."""
-    today = date.today()
-    start_date = today.replace(day=1)
-    end_date = today
-
-    start_str = (request.args.get('start_date') or '').strip()
-    end_str = (request.args.get('end_date') or '').strip()
-
-    if start_str:
-        try:
-            start_date = date.fromisoformat(start_str)
-        except ValueError:
-            pass
-
-    if end_str:
-        try:
-            end_date = date.fromisoformat(end_str)
-        except ValueError:
-            pass
-
-    if end_date < start_date:
-        start_date, end_date = end_date, start_date
-
-    return start_date, end_date
-
-
-def _get_datetime_bounds():
-    """
-    Build an index-friendly datetime range:
-      created_at >= start_dt AND created_at < end_dt_exclusive
-    """
-    start_date, end_date = _get_date_range()
-    start_dt = datetime.combine(start_date, datetime.min.time())
-    end_dt_exclusive = datetime.combine(end_date + timedelta(days=1), datetime.min.time())
-    return start_date, end_date, start_dt, end_dt_exclusive
-
-
-def _parse_days(default=30, max_days=365):
-    raw = request.args.get('days', default)
-    try:
-        days = int(raw)
-    except (TypeError, ValueError):
-        days = default
-    return max(1, min(days, max_days))
+from app.reporting.apparel import apparel_summary
+from app.reporting.exports import (
+    GST_LINES_HEADER, INVENTORY_HEADER, SALES_HEADER,
+    csv_response, gst_line_rows, inventory_rows, sales_rows,
+)
+from app.reporting.models import ItemDailyRollup, PaymentHourlyRollup, SalesHourlyRollup
+from app.reporting.query import last_days, month_to_date, request_days, request_range, store_today
 
 
 # ── Dashboard ─────────────────────────────────────────────────────
@@ -75,23 +28,18 @@ def _parse_days(default=30, max_days=365):
 @reporting.route('/')
 @admin_required
 def index():
-    today = date.today()
-    
-    # 1. Today's Sales
-    today_sales_total = db.session.query(
-        func.sum(func.coalesce(Sale.grand_total, Sale.total_amount + Sale.gst_total))
-    )\
-        .filter(cast(Sale.created_at, Date) == today).scalar() or Decimal('0')
-    
-    today_sales_count = db.session.query(func.count(Sale.id))\
-        .filter(cast(Sale.created_at, Date) == today).scalar() or 0
+    today = store_today()
+
+    # 1. Today's Sales / 2. This Month's Sales (from the hourly rollup)
+    today_sales_total, today_sales_count = db.session.query(
+        func.coalesce(func.sum(SalesHourlyRollup.grand_total), 0),
+        func.coalesce(func.sum(SalesHourlyRollup.sales_count), 0),
+    ).filter(SalesHourlyRollup.day == today).one()
 
-    # 2. This Month's Sales
     month_start = today.replace(day=1)
     month_sales_total = db.session.query(
-        func.sum(func.coalesce(Sale.grand_total, Sale.total_amount + Sale.gst_total))
-    )\
-        .filter(cast(Sale.created_at, Date) >= month_start).scalar() or Decimal('0')
+        func.coalesce(func.sum(SalesHourlyRollup.grand_total), 0)
+    ).filter(SalesHourlyRollup.day >= month_start).scalar()
 
     # 3. Inventory Value (Cost vs Selling)
     # Estimate cost using weighted average if available, else 0 (simplified)
@@ -120,13 +68,12 @@ def index():
 @reporting.route('/sales')
 @admin_required
 def sales_report():
-    start_date, end_date = _get_date_range()
-    
+    days = request_range(default=month_to_date())
+
     # Query sales in range
     # Join with User to show cashier name? Not strictly needed if just IDs
     sales = Sale.query.filter(
-        cast(Sale.created_at, Date) >= start_date,
-        cast(Sale.created_at, Date) <= end_date
+        *days.filter(Sale.created_at)
     ).order_by(Sale.created_at.desc()).all()
 
     # Summaries
@@ -139,16 +86,15 @@ def sales_report():
     payment_stats = db.session.query(
         SalePayment.payment_method, func.sum(SalePayment.amount)
     ).join(Sale).filter(
-        cast(Sale.created_at, Date) >= start_date,
-        cast(Sale.created_at, Date) <= end_date
+        *days.filter(Sale.created_at)
     ).group_by(SalePayment.payment_method).all()
     
     payment_summary = {mode: amt for mode, amt in payment_stats}
 
     return render_template('reporting/sales_report.html',
                            sales=sales,
-                           start_date=start_date,
-                           end_date=end_date,
+                           start_date=days.start,
+                           end_date=days.end,
                            total_revenue=total_revenue,
                            total_gst=total_gst,
                            payment_summary=payment_summary)
@@ -158,101 +104,22 @@ def sales_report():
 @admin_required
 def apparel_report():
     """
-    Apparel analytics:
-      1) Top selling sizes
-      2) Top selling colors
-      3) Sales by brand
-      4) Sales by category
-    All metrics are computed in SQL aggregation queries.
+    Apparel analytics: top sizes, colors, brands and categories, plus a
+    size × color matrix. One GROUPING SETS query over the daily item
+    rollup, cached per date range (app/reporting/apparel.py).
     """
-    start_date, end_date, start_dt, end_dt_exclusive = _get_datetime_bounds()
-
-    gross_sales_expr = SaleItem.subtotal + ((SaleItem.subtotal * SaleItem.gst_percent) / 100)
-    brand_label = func.coalesce(func.nullif(Product.brand, ''), 'Unbranded')
-    category_label = func.coalesce(func.nullif(Product.category, ''), 'Uncategorized')
-
-    top_sizes = (
-        db.session.query(
-            SaleItem.snapshot_size.label('size'),
-            func.sum(SaleItem.quantity).label('units_sold'),
-            func.sum(gross_sales_expr).label('gross_sales'),
-        )
-        .join(Sale, Sale.id == SaleItem.sale_id)
-        .filter(
-            Sale.created_at >= start_dt,
-            Sale.created_at < end_dt_exclusive,
-            SaleItem.snapshot_size.isnot(None),
-            SaleItem.snapshot_size != '',
-        )
-        .group_by(SaleItem.snapshot_size)
-        .order_by(desc('units_sold'), desc('gross_sales'))
-        .limit(10)
-        .all()
-    )
-
-    top_colors = (
-        db.session.query(
-            SaleItem.snapshot_color.label('color'),
-            func.sum(SaleItem.quantity).label('units_sold'),
-            func.sum(gross_sales_expr).label('gross_sales'),
-        )
-        .join(Sale, Sale.id == SaleItem.sale_id)
-        .filter(
-            Sale.created_at >= start_dt,
-            Sale.created_at < end_dt_exclusive,
-            SaleItem.snapshot_color.isnot(None),
-            SaleItem.snapshot_color != '',
-        )
-        .group_by(SaleItem.snapshot_color)
-        .order_by(desc('units_sold'), desc('gross_sales'))
-        .limit(10)
-        .all()
-    )
-
-    sales_by_brand = (
-        db.session.query(
-            brand_label.label('brand'),
-            func.sum(SaleItem.quantity).label('units_sold'),
-            func.sum(gross_sales_expr).label('gross_sales'),
-        )
-        .join(ProductVariant, ProductVariant.id == SaleItem.variant_id)
-        .join(Product, Product.id == ProductVariant.product_id)
-        .join(Sale, Sale.id == SaleItem.sale_id)
-        .filter(
-            Sale.created_at >= start_dt,
-            Sale.created_at < end_dt_exclusive,
-        )
-        .group_by(brand_label)
-        .order_by(desc('gross_sales'))
-        .all()
-    )
-
-    sales_by_category = (
-        db.session.query(
-            category_label.label('category'),
-            func.sum(SaleItem.quantity).label('units_sold'),
-            func.sum(gross_sales_expr).label('gross_sales'),
-        )
-        .join(ProductVariant, ProductVariant.id == SaleItem.variant_id)
-        .join(Product, Product.id == ProductVariant.product_id)
-        .join(Sale, Sale.id == SaleItem.sale_id)
-        .filter(
-            Sale.created_at >= start_dt,
-            Sale.created_at < end_dt_exclusive,
-        )
-        .group_by(category_label)
-        .order_by(desc('gross_sales'))
-        .all()
-    )
+    days = request_range(default=month_to_date())
+    summary = apparel_summary(days)
 
     return render_template(
         'reporting/apparel_report.html',
-        start_date=start_date,
-        end_date=end_date,
-        top_sizes=top_sizes,
-        top_colors=top_colors,
-        sales_by_brand=sales_by_brand,
-        sales_by_category=sales_by_category,
+        start_date=days.start,
+        end_date=days.end,
+        top_sizes=summary['sizes'],
+        top_colors=summary['colors'],
+        sales_by_brand=summary['brands'],
+        sales_by_category=summary['categories'],
+        matrix=summary['matrix'],
     )
 
 
@@ -261,7 +128,7 @@ def apparel_report():
 @reporting.route('/gst')
 @admin_required
 def gst_report():
-    start_date, end_date = _get_date_range()
+    days = request_range(default=month_to_date())
 
     # Output Tax (Sales) - Grouped by GST %
     # Need to join SaleItem -> Product to get % info, or store it on SaleItem snapshot
@@ -274,10 +141,8 @@ def gst_report():
         SaleItem.gst_percent,
         func.sum(SaleItem.subtotal)
     ).join(Sale, SaleItem.sale_id == Sale.id)\
-     .filter(
-         cast(Sale.created_at, Date) >= start_date,
-         cast(Sale.created_at, Date) <= end_date
-     ).group_by(SaleItem.gst_percent).all()
+     .filter(*days.filter(Sale.created_at))\
+     .group_by(SaleItem.gst_percent).all()
 
     # Calc tax amounts
     gst_summary = []
@@ -305,8 +170,7 @@ def gst_report():
      .filter(
          PurchaseOrder.status == POStatus.RECEIVED,
          # Filter by expected_date or updated_at? Let's use updated_at as proxy for receipt
-         cast(PurchaseOrder.updated_at, Date) >= start_date,
-         cast(PurchaseOrder.updated_at, Date) <= end_date
+         *days.filter(PurchaseOrder.updated_at),
      ).group_by(Product.gst_percent).all()
 
     input_summary = []
@@ -325,8 +189,8 @@ def gst_report():
         total_input_tax += tax_amt
 
     return render_template('reporting/gst_report.html',
-                           start_date=start_date,
-                           end_date=end_date,
+                           start_date=days.start,
+                           end_date=days.end,
                            output_summary=gst_summary,
                            total_output_tax=total_output_tax,
                            total_taxable_value=total_taxable_value,
@@ -370,64 +234,17 @@ def inventory_report():
 @reporting.route('/export/<report_type>')
 @admin_required
 def export_csv(report_type):
-    start_date, end_date = _get_date_range()
-    
-    def generate():
-        data = io.StringIO()
-        w = csv.writer(data)
-
-        if report_type == 'sales':
-            w.writerow(['Date', 'Invoice #', 'Cashier ID', 'Total Amount', 'GST Total', 'Items'])
-            yield data.getvalue()
-            data.seek(0)
-            data.truncate(0)
-
-            sales = Sale.query.filter(
-                cast(Sale.created_at, Date) >= start_date,
-                cast(Sale.created_at, Date) <= end_date
-            ).order_by(Sale.created_at.desc()).all()
-
-            for s in sales:
-                item_count = sum(i.quantity for i in s.items)
-                w.writerow([
-                    s.created_at.strftime('%Y-%m-%d %H:%M'),
-                    s.invoice_number,
-                    s.cashier_id,
-                    s.computed_grand_total,
-                    s.gst_total,
-                    item_count
-                ])
-                yield data.getvalue()
-                data.seek(0)
-                data.truncate(0)
-
-        elif report_type == 'inventory':
-            w.writerow(['Barcode', 'Product Name', 'Stock', 'Price', 'GST %', 'Value'])
-            yield data.getvalue()
-            data.seek(0)
-            data.truncate(0)
-
-            products = Product.query.filter(Product.is_active == True).order_by(Product.name).all()
-            for p in products:
-                w.writerow([
-                    p.barcode,
-                    p.name,
-                    p.stock,
-                    p.price,
-                    p.gst_percent,
-                    p.stock * p.price
-                ])
-                yield data.getvalue()
-                data.seek(0)
-                data.truncate(0)
-        
-        # Add GST export if needed
-
-    headers = {
-        'Content-Disposition': f'attachment; filename={report_type}_report_{date.today()}.csv',
-        'Content-Type': 'text/csv'
-    }
-    return Response(stream_with_context(generate()), headers=headers)
+    filename = f'{report_type}_report_{store_today()}.csv'
+
+    if report_type == 'sales':
+        days = request_range(default=month_to_date())
+        return csv_response(filename, SALES_HEADER, sales_rows(days))
+    if report_type == 'gst':
+        days = request_range(default=month_to_date())
+        return csv_response(filename, GST_LINES_HEADER, gst_line_rows(days))
+    if report_type == 'inventory':
+        return csv_response(filename, INVENTORY_HEADER, inventory_rows())
+    abort(404)
 
 
 # ── Analytics Page ────────────────────────────────────────────────
@@ -450,31 +267,23 @@ def api_revenue_trend():
     Returns daily revenue totals for the last N days.
     Query param: days (default 30)
     """
-    days = _parse_days(30, 365)
-    today = date.today()
-    start = today - timedelta(days=days - 1)
+    days = last_days(request_days(30, 365))
 
     rows = (
         db.session.query(
-            cast(Sale.created_at, Date).label('day'),
-            func.coalesce(
-                func.sum(func.coalesce(Sale.grand_total, Sale.total_amount + Sale.gst_total)),
-                0
-            ).label('revenue')
+            SalesHourlyRollup.day,
+            func.sum(SalesHourlyRollup.grand_total).label('revenue'),
         )
-        .filter(cast(Sale.created_at, Date) >= start)
-        .group_by(cast(Sale.created_at, Date))
-        .order_by(cast(Sale.created_at, Date))
+        .filter(*days.day_filter(SalesHourlyRollup.day))
+        .group_by(SalesHourlyRollup.day)
+        .order_by(SalesHourlyRollup.day)
         .all()
     )
 
     # Build a full date series (fill gaps with 0)
-    revenue_by_day = {str(r.day): float(r.revenue) for r in rows}
-    labels, values = [], []
-    for i in range(days):
-        d = str(start + timedelta(days=i))
-        labels.append(d)
-        values.append(revenue_by_day.get(d, 0))
+    revenue_by_day = {r.day: float(r.revenue) for r in rows}
+    labels = [str(d) for d in days.days]
+    values = [revenue_by_day.get(d, 0) for d in days.days]
 
     return jsonify({'labels': labels, 'values': values})
 
@@ -485,18 +294,15 @@ def api_payment_methods():
     """
     Returns revenue breakdown by payment method for the last N days.
     """
-    days = _parse_days(30, 365)
-    today = date.today()
-    start = today - timedelta(days=days - 1)
+    days = last_days(request_days(30, 365))
 
     rows = (
         db.session.query(
-            SalePayment.payment_method,
-            func.coalesce(func.sum(SalePayment.amount), 0).label('total')
+            PaymentHourlyRollup.payment_method,
+            func.sum(PaymentHourlyRollup.amount).label('total'),
         )
-        .join(Sale, Sale.id == SalePayment.sale_id)
-        .filter(cast(Sale.created_at, Date) >= start)
-        .group_by(SalePayment.payment_method)
+        .filter(*days.day_filter(PaymentHourlyRollup.day))
+        .group_by(PaymentHourlyRollup.payment_method)
         .all()
     )
 
@@ -511,18 +317,15 @@ def api_top_products():
     """
     Returns top 10 products by revenue for the last N days.
     """
-    days = _parse_days(30, 365)
-    today = date.today()
-    start = today - timedelta(days=days - 1)
+    days = last_days(request_days(30, 365))
 
     rows = (
         db.session.query(
             Product.name,
-            func.coalesce(func.sum(SaleItem.subtotal), 0).label('revenue')
+            func.sum(ItemDailyRollup.net_sales).label('revenue'),
         )
-        .join(SaleItem, SaleItem.product_id == Product.id)
-        .join(Sale, Sale.id == SaleItem.sale_id)
-        .filter(cast(Sale.created_at, Date) >= start)
+        .join(ItemDailyRollup, ItemDailyRollup.product_id == Product.id)
+        .filter(*days.day_filter(ItemDailyRollup.day))
         .group_by(Product.name)
         .order_by(desc('revenue'))
         .limit(10)
@@ -541,19 +344,16 @@ def api_hourly_heatmap():
     Returns average number of transactions per hour of the day
     for the last N days.
     """
-    days = _parse_days(30, 365)
-    today = date.today()
-    start = today - timedelta(days=days - 1)
+    days = last_days(request_days(30, 365))
 
-    from sqlalchemy import extract
     rows = (
         db.session.query(
-            extract('hour', Sale.created_at).label('hour'),
-            func.count(Sale.id).label('txn_count')
+            SalesHourlyRollup.hour,
+            func.sum(SalesHourlyRollup.sales_count).label('txn_count'),
         )
-        .filter(cast(Sale.created_at, Date) >= start)
-        .group_by(extract('hour', Sale.created_at))
-        .order_by(extract('hour', Sale.created_at))
+        .filter(*days.day_filter(SalesHourlyRollup.day))
+        .group_by(SalesHourlyRollup.hour)
+        .order_by(SalesHourlyRollup.hour)
         .all()
     )
 
@@ -570,18 +370,15 @@ def api_category_breakdown():
     Returns revenue breakdown by product category for the last N days.
     Products without a category are grouped as 'Uncategorised'.
     """
-    days = _parse_days(30, 365)
-    today = date.today()
-    start = today - timedelta(days=days - 1)
+    days = last_days(request_days(30, 365))
 
     rows = (
         db.session.query(
             func.coalesce(Product.category, 'Uncategorised').label('category'),
-            func.coalesce(func.sum(SaleItem.subtotal), 0).label('revenue')
+            func.sum(ItemDailyRollup.net_sales).label('revenue'),
         )
-        .join(SaleItem, SaleItem.product_id == Product.id)
-        .join(Sale, Sale.id == SaleItem.sale_id)
-        .filter(cast(Sale.created_at, Date) >= start)
+        .join(ItemDailyRollup, ItemDailyRollup.product_id == Product.id)
+        .filter(*days.day_filter(ItemDailyRollup.day))
         .group_by(func.coalesce(Product.category, 'Uncategorised'))
         .order_by(desc('revenue'))
         .all()
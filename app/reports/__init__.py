@@ -1,5 +1,8 @@
 from flask import Blueprint
 
+from app.utils.replica import use_reporting_replica
+
 reports = Blueprint('reports', __name__)
+reports.before_request(use_reporting_replica)   # reads go to REPORTING_DATABASE_URL if set
 
 from app.reports import routes  # noqa: F401, E402
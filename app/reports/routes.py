@@ -9,13 +9,10 @@ Routes:
   GET  /reports/export.csv          → filtered CSV download
   GET  /reports/cashier-summary     → sales grouped by cashier
 """
-import csv
-import io
-from datetime import date, datetime, timedelta
 from decimal import Decimal
 
-from flask import render_template, request, redirect, url_for, flash, Response
-from sqlalchemy import func, cast, Date, desc
+from flask import render_template, request, redirect, url_for, flash
+from sqlalchemy import func, desc, select
 
 from app import db
 from app.reports import reports
@@ -23,6 +20,8 @@ from app.auth.models import User
 from app.billing.models import Sale, SaleItem
 from app.inventory.models import Product
 from app.auth.decorators import admin_required
+from app.reporting.exports import SALE_GRAND_TOTAL, csv_response, stream_rows
+from app.reporting.query import DateRange, parse_day, request_range, store_time, store_today
 
 # ── Constants ─────────────────────────────────────────────────────
 PAGE_SIZE = 20   # rows per page on the sales list
@@ -32,33 +31,21 @@ PAGE_SIZE = 20   # rows per page on the sales list
 
 def _apply_filters(query, start_str, end_str, cashier_id_str):
     """
-    Apply date-range and cashier filters to a Sale query.
+    Apply date-range and cashier filters to a Sale query (or select()).
 
-    Date filtering uses SQLAlchemy's cast(Sale.created_at, Date) so the
-    comparison is purely date-based (ignores time component).
+    Dates are store days (app/reporting/query.py), applied as half-open
+    bounds on Sale.created_at so ix_sales_created_at can be used.
 
     Returns:
         (filtered_query, start_date, end_date, cashier_id)
         Dates are Python date objects (or None if not supplied).
     """
-    start_date  = None
-    end_date    = None
     cashier_id  = None
 
-    # ── Date range ────────────────────────────────────────────────
-    if start_str:
-        try:
-            start_date = datetime.strptime(start_str, '%Y-%m-%d').date()
-            query = query.filter(cast(Sale.created_at, Date) >= start_date)
-        except ValueError:
-            pass   # ignore malformed date — don't crash
-
-    if end_str:
-        try:
-            end_date = datetime.strptime(end_str, '%Y-%m-%d').date()
-            query = query.filter(cast(Sale.created_at, Date) <= end_date)
-        except ValueError:
-            pass
+    # ── Date range (malformed dates are ignored) ──────────────────
+    days = DateRange(parse_day(start_str), parse_day(end_str))
+    query = query.filter(*days.filter(Sale.created_at))
+    start_date, end_date = days
 
     # ── Cashier filter ────────────────────────────────────────────
     if cashier_id_str:
@@ -206,18 +193,10 @@ def cashier_summary():
     ).join(Sale, Sale.cashier_id == User.id)
 
     # Date filter on the joined query
-    if start_str:
-        try:
-            start_date = datetime.strptime(start_str, '%Y-%m-%d').date()
-            rows_q = rows_q.filter(cast(Sale.created_at, Date) >= start_date)
-        except ValueError:
-            start_str = ''
-    if end_str:
-        try:
-            end_date = datetime.strptime(end_str, '%Y-%m-%d').date()
-            rows_q = rows_q.filter(cast(Sale.created_at, Date) <= end_date)
-        except ValueError:
-            end_str = ''
+    days = DateRange(parse_day(start_str), parse_day(end_str))
+    rows_q = rows_q.filter(*days.filter(Sale.created_at))
+    start_str = start_str if days.start else ''
+    end_str = end_str if days.end else ''
 
     rows = (
         rows_q
@@ -256,28 +235,44 @@ def export_csv():
     """
     Stream a CSV of filtered sales to the browser.
 
-    Uses Python's csv module + io.StringIO — no temp files, no disk I/O.
-    The same _apply_filters() helper is reused so the CSV always matches
-    what the user sees on the reports page.
+    Rows come off a server-side cursor as plain columns (cashier name
+    joined in SQL) and are written in chunks, gzip-encoded when the
+    browser accepts it — see app/reporting/exports.py. The same
+    _apply_filters() helper is reused so the CSV always matches what the
+    user sees on the reports page.
     """
     start_str      = request.args.get('start', '')
     end_str        = request.args.get('end', '')
     cashier_id_str = request.args.get('cashier', '')
 
-    # Fetch ALL matching rows (no pagination for export)
-    # Note: 'items' is a backref from SaleItem, so we access it as attribute on instance,
-    # but for query options on the class, we need to be careful.
-    # Safe bet: separate query or standard lazy loading.
-    q = Sale.query.order_by(desc(Sale.created_at))
-    q, _, _, _ = _apply_filters(q, start_str, end_str, cashier_id_str)
-    sales = q.all()
-
-    # ── Build CSV in memory ───────────────────────────────────────
-    buf = io.StringIO()
-    writer = csv.writer(buf)
-
-    # Header row
-    writer.writerow([
+    local_time = store_time(Sale.created_at)
+    stmt = (
+        select(
+            Sale.invoice_number,
+            local_time.label('created_at'),
+            User.name.label('cashier'),
+            Sale.total_amount,
+            Sale.gst_total,
+            SALE_GRAND_TOTAL.label('grand_total'),
+        )
+        .join(User, User.id == Sale.cashier_id)
+        .order_by(desc(Sale.created_at))
+    )
+    stmt, _, _, _ = _apply_filters(stmt, start_str, end_str, cashier_id_str)
+
+    def rows():
+        for r in stream_rows(stmt):
+            yield (
+                r.invoice_number,
+                r.created_at.strftime('%Y-%m-%d'),
+                r.created_at.strftime('%H:%M:%S'),
+                r.cashier,
+                f'{r.total_amount:.2f}',
+                f'{r.gst_total:.2f}',
+                f'{r.grand_total:.2f}',
+            )
+
+    header = [
         'Invoice Number',
         'Date',
         'Time',
@@ -285,35 +280,15 @@ def export_csv():
         'Subtotal (excl. GST)',
         'GST Total',
         'Grand Total',
-    ])
-
-    # Data rows
-    for sale in sales:
-        writer.writerow([
-            sale.invoice_number,
-            sale.created_at.strftime('%Y-%m-%d'),
-            sale.created_at.strftime('%H:%M:%S'),
-            sale.cashier.name,
-            f'{sale.total_amount:.2f}',
-            f'{sale.gst_total:.2f}',
-            f'{sale.computed_grand_total:.2f}',
-        ])
+    ]
 
     # ── Build filename with date range ────────────────────────────
-    today    = date.today().strftime('%Y%m%d')
+    today    = store_today().strftime('%Y%m%d')
     filename = f'sales_export_{today}.csv'
     if start_str:
         filename = f'sales_{start_str}_to_{end_str or today}.csv'
 
-    # ── Return as file download ───────────────────────────────────
-    return Response(
-        buf.getvalue(),
-        mimetype='text/csv',
-        headers={
-            'Content-Disposition': f'attachment; filename="{filename}"',
-            'Content-Type': 'text/csv; charset=utf-8',
-        }
-    )
+    return csv_response(filename, header, rows(), content_type='text/csv; charset=utf-8')
 
 # ═══════════════════════════════════════════════════════════════════
 # 5. RECONCILIATION REPORT (Split Tenders)
@@ -325,29 +300,21 @@ def reconciliation():
     """
     Daily breakdown of payments by method (Cash, Card, UPI, etc.).
     """
-    from app.billing.models import SalePayment
-    
-    start_str = request.args.get('start', date.today().strftime('%Y-%m-%d'))
-    end_str   = request.args.get('end', date.today().strftime('%Y-%m-%d'))
-    
-    try:
-        start_date = datetime.strptime(start_str, '%Y-%m-%d').date()
-        end_date   = datetime.strptime(end_str, '%Y-%m-%d').date()
-    except ValueError:
-        start_date = date.today()
-        end_date   = date.today()
+    from app.reporting.models import PaymentHourlyRollup
+
+    today = store_today()
+    days = request_range('start', 'end', default=DateRange(today, today))
+    start_str, end_str = days.start.isoformat(), days.end.isoformat()
 
-    # Query: Sum amounts by payment_method, within date range
+    # Query: Sum amounts by payment_method, within date range (hourly rollup)
     rows = (
         db.session.query(
-            SalePayment.payment_method,
-            func.count(SalePayment.id).label('tx_count'),
-            func.sum(SalePayment.amount).label('total_amount'),
+            PaymentHourlyRollup.payment_method,
+            func.sum(PaymentHourlyRollup.payments_count).label('tx_count'),
+            func.sum(PaymentHourlyRollup.amount).label('total_amount'),
         )
-        .join(Sale)
-        .filter(cast(Sale.created_at, Date) >= start_date)
-        .filter(cast(Sale.created_at, Date) <= end_date)
-        .group_by(SalePayment.payment_method)
+        .filter(*days.day_filter(PaymentHourlyRollup.day))
+        .group_by(PaymentHourlyRollup.payment_method)
         .order_by(desc('total_amount'))
         .all()
     )
@@ -123,4 +123,8 @@ def seed_history():
         db.session.commit() # Commit daily
         current_date += timedelta(days=1)
 
+    # Backdated rows bypass the sale_events outbox; recompute their rollups.
+    from app.reporting.rollups import rebuild_rollups
+    rebuild_rollups(start=start_date, end=end_date)
+
     click.echo(f"✅ Generated {total_sales_generated} historical sales.")
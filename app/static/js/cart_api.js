@@ -0,0 +1,320 @@
+/**
+ * Mall Billing System — Cart Delta Renderer
+ * =========================================
+ * Drives the scanner form and the cart row buttons through the JSON
+ * cart API (/billing/api/cart/*). Each response names only the lines
+ * that changed, so a scan patches one row, the promotions list and the
+ * footer instead of swapping the whole billing/_cart.html partial.
+ *
+ * Row / promotion markup comes from the <template> elements rendered by
+ * the same Jinja macros as the server-side rows (data-field hooks).
+ * Structural changes — first line added, last line removed, weighed
+ * items that need the weight modal — fall back to the HTMX partial.
+ * Several weighed items in one burst get the modal one after another.
+ *
+ * Requests are serialised so every call carries the cart token produced
+ * by the previous one; if the server sees a different token it answers
+ * with every line (full: true) and the table is rebuilt from that.
+ *
+ * Scans arriving within SCAN_COALESCE_MS of each other, or while the
+ * previous request is still in flight, are sent as one add-many call
+ * (repeated consecutive barcodes become one line with a quantity).
+ *
+ * A refused request (4xx/5xx) shows its error inline and the cart stays
+ * as it was. Only OFFLINE_AFTER_FAILURES network failures in a row switch
+ * the page to the offline POS (/offline, served by the service worker),
+ * which bills from the cached catalog and queues sales for
+ * /billing/api/sync. A failed request is not retried, because it may
+ * have reached the server; the cashier rescans.
+ */
+
+(function () {
+    const section = document.getElementById('cart-section');
+    if (!section) return;
+
+    const cfg = section.dataset;
+    const money = new Intl.NumberFormat('en-US', { minimumFractionDigits: 2, maximumFractionDigits: 2 });
+    const fmt = value => '₹' + money.format(parseFloat(value) || 0);
+
+    const SCAN_COALESCE_MS = 40;
+    const OFFLINE_AFTER_FAILURES = 3;
+
+    let queue = Promise.resolve();
+    let buffered = [];
+    let flushTimer = null;
+    let networkFailures = 0;
+    let pendingWeights = [];
+    let weighing = false;
+
+    function enqueue(task) {
+        queue = queue.then(task, task);
+        return queue;
+    }
+
+    function currentToken() {
+        const holder = section.querySelector('[data-cart-token]');
+        return holder ? holder.dataset.cartToken : '';
+    }
+
+    function setField(root, name, text) {
+        const el = root.querySelector(`[data-field="${name}"]`);
+        if (el) el.textContent = text;
+    }
+
+    function clone(templateId) {
+        const tpl = document.getElementById(templateId);
+        return tpl ? tpl.content.firstElementChild.cloneNode(true) : null;
+    }
+
+    // ── Fallback: full HTML partial ────────────────────────────────────────
+    function refreshPartial(url, values) {
+        const opts = { target: '#cart-section', swap: 'innerHTML' };
+        if (values) {
+            opts.values = values;
+            return htmx.ajax('POST', url, opts);
+        }
+        return htmx.ajax('GET', url || cfg.refreshUrl, opts);
+    }
+
+    // ── Rendering ──────────────────────────────────────────────────────────
+    function showError(message) {
+        const box = document.getElementById('cart-error');
+        if (!box) return;
+        setField(box, 'error', message || '');
+        box.classList.toggle('hidden', !message);
+    }
+
+    function fillRow(tr, line) {
+        tr.dataset.variantId = line.id;
+        tr.dataset.barcode = line.barcode || '';
+        tr.dataset.price = line.price;
+
+        setField(tr, 'name', (line.is_weighed ? '⚖️ ' : '') + line.name);
+        setField(tr, 'barcode', line.barcode || '');
+        setField(tr, 'quantity', line.quantity);
+        setField(tr, 'price', fmt(line.price));
+        setField(tr, 'line_subtotal', fmt(line.line_subtotal));
+
+        const variant = tr.querySelector('[data-field="variant"]');
+        if (variant) {
+            variant.textContent = `${line.size ?? ''} / ${line.color ?? ''}`;
+            variant.classList.toggle('hidden', !(line.size || line.color));
+        }
+        tr.querySelector('.stock-limit-badge')?.classList.toggle('hidden', !line.at_limit);
+        const incr = tr.querySelector('[data-cart-action="incr"]');
+        if (incr) incr.disabled = line.at_limit;
+    }
+
+    function renderLines(data) {
+        const tbody = document.querySelector('#cart-lines tbody');
+        const rowFor = id => tbody.querySelector(`tr[data-variant-id="${id}"]`);
+
+        if (data.full) {
+            const keep = new Set(data.lines.map(line => String(line.id)));
+            tbody.querySelectorAll('tr[data-variant-id]').forEach(tr => {
+                if (!keep.has(tr.dataset.variantId)) tr.remove();
+            });
+        }
+        data.removed.forEach(id => rowFor(id)?.remove());
+        data.lines.forEach(line => {
+            let tr = rowFor(line.id);
+            if (!tr) {
+                tr = clone('cart-row-template');
+                tbody.appendChild(tr);
+            }
+            fillRow(tr, line);
+        });
+    }
+
+    function renderPromotions(promotions) {
+        const box = document.getElementById('cart-promotions');
+        if (!box) return;
+        const entries = promotions.applied.map(p => {
+            const el = clone('cart-promo-template');
+            setField(el, 'promo_name', p.name);
+            setField(el, 'description', p.description);
+            setField(el, 'discount', '-' + fmt(p.discount));
+            return el;
+        });
+        box.querySelector('[data-promo-list]').replaceChildren(...entries);
+        box.classList.toggle('hidden', entries.length === 0);
+    }
+
+    function renderTotals(totals) {
+        const text = (id, value) => {
+            const el = document.getElementById(id);
+            if (el) el.textContent = value;
+        };
+        const input = (id, value) => {
+            const el = document.getElementById(id);
+            if (el) el.value = parseFloat(value).toFixed(2);
+        };
+
+        text('cart-item-count', `${totals.items} Unique SKUs`);
+        text('cart-subtotal', fmt(totals.subtotal));
+        text('cart-gst', fmt(totals.gst));
+        text('cart-payable', fmt(totals.payable));
+        text('total-due-display', fmt(totals.payable));
+
+        input('base-subtotal', totals.subtotal);
+        input('base-gst', totals.base_gst);
+        input('promo-discount', totals.promo_discount);
+        input('total-due', totals.payable);
+        if (typeof window.updatePaymentStatus === 'function') window.updatePaymentStatus();
+    }
+
+    function apply(data) {
+        const lines = document.getElementById('cart-lines');
+
+        // The table, footer and payment modal only exist for a non-empty
+        // cart; let the server render them when that changes.
+        if (!lines && data.totals.items > 0) return refreshPartial();
+        if (lines && data.totals.items === 0) return refreshPartial();
+
+        showError(data.error);
+        const holder = section.querySelector('[data-cart-token]');
+        if (holder) holder.dataset.cartToken = data.token;
+        if (!lines) return;
+
+        renderLines(data);
+        renderPromotions(data.promotions);
+        renderTotals(data.totals);
+    }
+
+    // ── API calls ──────────────────────────────────────────────────────────
+    async function send(url, body, headers = {}) {
+        let response;
+        try {
+            response = await fetch(url, {
+                method: 'POST',
+                body,
+                headers: { 'Accept': 'application/json', 'X-CSRFToken': cfg.csrfToken, ...headers },
+            });
+        } catch (err) {
+            // Network down (not an HTTP error): give it a few requests
+            // before continuing in offline billing.
+            networkFailures += 1;
+            if (networkFailures < OFFLINE_AFTER_FAILURES) {
+                showError('Connection problem: the last change was not saved. Please try again.');
+                return null;
+            }
+            showError('Connection lost. Switching to offline billing…');
+            window.location.href = cfg.offlineUrl || '/offline';
+            return null;
+        }
+        networkFailures = 0;
+
+        const type = response.headers.get('Content-Type') || '';
+        if (type.includes('application/json')) {
+            const data = await response.json();
+            if (response.ok) return data;
+            showError(data.error || `Request failed (${response.status}).`);
+            return null;
+        }
+        if (response.ok) {
+            // An HTML page instead of JSON: the login redirect after the
+            // session expired, or the cash session was closed.
+            window.location.reload();
+            return null;
+        }
+        showError(`Request failed (${response.status}). Refresh the page if this keeps happening.`);
+        return null;
+    }
+
+    function post(url, values) {
+        const body = new FormData();
+        Object.entries(values).forEach(([k, v]) => body.append(k, v));
+        body.append('token', currentToken());
+        return send(url, body);
+    }
+
+    function postJson(url, payload) {
+        const body = JSON.stringify({ ...payload, token: currentToken() });
+        return send(url, body, { 'Content-Type': 'application/json' });
+    }
+
+    function coalesce(barcodes) {
+        const items = [];
+        barcodes.forEach(barcode => {
+            const last = items[items.length - 1];
+            if (last && last.barcode === barcode) last.qty += 1;
+            else items.push({ barcode, qty: 1 });
+        });
+        return items;
+    }
+
+    async function flushScans() {
+        const barcodes = buffered;
+        buffered = [];
+        if (barcodes.length === 0) return;
+
+        let data, weighed;
+        if (barcodes.length === 1) {
+            data = await post(cfg.apiAdd, { barcode: barcodes[0] });
+            weighed = data && data.needs_weight ? [barcodes[0]] : [];
+        } else {
+            data = await postJson(cfg.apiAddMany, { items: coalesce(barcodes) });
+            weighed = data ? (data.errors || []).filter(e => e.needs_weight).map(e => e.barcode) : [];
+        }
+        if (!data) return;
+        apply(data);
+        pendingWeights.push(...weighed);
+        promptWeights();
+    }
+
+    // Weighed items: the HTML endpoint answers with the weight modal. One
+    // modal at a time; the next opens once the previous one is closed.
+    function promptWeights() {
+        if (weighing || pendingWeights.length === 0) return;
+        weighing = true;
+        refreshPartial(cfg.addItemUrl, { barcode: pendingWeights.shift() }).then(() => {
+            const overlay = document.getElementById('weight-modal-overlay');
+            if (!overlay) {
+                weighing = false;
+                return promptWeights();
+            }
+            new MutationObserver((_records, observer) => {
+                if (overlay.isConnected) return;
+                observer.disconnect();
+                weighing = false;
+                promptWeights();
+            }).observe(document.body, { childList: true, subtree: true });
+        });
+    }
+
+    function scan(barcode) {
+        if (!barcode) return showError('Please enter a barcode.');
+        buffered.push(barcode);
+        if (flushTimer) return;
+        flushTimer = setTimeout(() => {
+            flushTimer = null;
+            enqueue(flushScans);
+        }, SCAN_COALESCE_MS);
+    }
+
+    function lineAction(variantId, action) {
+        return enqueue(async () => {
+            const data = action === 'remove'
+                ? await post(cfg.apiRemove, { variant_id: variantId })
+                : await post(cfg.apiUpdate, { variant_id: variantId, action });
+            if (data) apply(data);
+        });
+    }
+
+    // ── Wiring ─────────────────────────────────────────────────────────────
+    document.querySelector('form[data-cart-scan]')?.addEventListener('submit', function (e) {
+        e.preventDefault();
+        const input = this.querySelector('[name="barcode"]');
+        const barcode = input.value.trim();
+        this.reset();
+        input.focus();
+        scan(barcode);
+    });
+
+    section.addEventListener('click', function (e) {
+        const button = e.target.closest('[data-cart-action]');
+        if (!button || button.disabled) return;
+        const row = button.closest('tr[data-variant-id]');
+        if (row) lineAction(row.dataset.variantId, button.dataset.cartAction);
+    });
+})();
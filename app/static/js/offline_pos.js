@@ -0,0 +1,197 @@
+/**
+ * Mall Billing System — Offline POS
+ * =================================
+ * Minimal billing screen on the /offline page (served from the service
+ * worker cache when the server is unreachable). Barcodes resolve against
+ * the IndexedDB catalog kept by pwa.js, so scanning stays at local
+ * latency; a saved sale is queued with a fresh idempotency key and sent
+ * to /billing/api/sync when the network returns.
+ *
+ * Amounts are kept in paise and rounded per line like the server
+ * (line subtotal, then line GST). Each line carries the unit price it was
+ * charged at (per kg when weighed), and the sale the catalog version it
+ * was priced from, so /billing/api/sync records what the customer
+ * actually paid even if catalog prices change before the sync.
+ */
+
+(function () {
+    const root = document.getElementById('offline-pos');
+    if (!root || !window.OfflineBilling) return;
+
+    const money = new Intl.NumberFormat('en-US', { minimumFractionDigits: 2, maximumFractionDigits: 2 });
+    const fmt = paise => '₹' + money.format(paise / 100);
+    const toPaise = value => Math.round((parseFloat(value) || 0) * 100);
+    const toRupees = paise => (paise / 100).toFixed(2);
+
+    const scanForm = document.getElementById('offline-scan-form');
+    const payForm = document.getElementById('offline-pay-form');
+    const tbody = document.getElementById('offline-lines');
+    const saveBtn = document.getElementById('offline-save-btn');
+
+    let lines = new Map();   // variant_id -> line
+
+    function newKey() {
+        return (window.crypto && crypto.randomUUID)
+            ? crypto.randomUUID()
+            : Date.now().toString(36) + Math.random().toString(36).slice(2);
+    }
+
+    function say(message, isError = false) {
+        const el = document.getElementById('offline-message');
+        el.textContent = message || '';
+        el.classList.toggle('error', isError);
+    }
+
+    // ── Pricing ────────────────────────────────────────────────────────────
+    function lineAmounts(line) {
+        const subtotal = line.unitPaise * line.qty;
+        const gst = Math.round(subtotal * line.gst_percent / 100);
+        return { subtotal, gst };
+    }
+
+    function totals() {
+        let subtotal = 0, gst = 0;
+        lines.forEach(line => {
+            const amounts = lineAmounts(line);
+            subtotal += amounts.subtotal;
+            gst += amounts.gst;
+        });
+        return { subtotal, gst, total: subtotal + gst };
+    }
+
+    // ── Rendering ──────────────────────────────────────────────────────────
+    function cell(text, className) {
+        const td = document.createElement('td');
+        td.textContent = text;
+        if (className) td.className = className;
+        return td;
+    }
+
+    function render() {
+        const rows = [];
+        lines.forEach(line => {
+            const tr = document.createElement('tr');
+            const label = line.weight_kg ? `${line.name} (${line.weight_kg} kg)` : `${line.name} ${line.size || ''}/${line.color || ''}`;
+            tr.append(
+                cell(label),
+                cell(line.weight_kg ? '' : `× ${line.qty}`, 'num'),
+                cell(fmt(lineAmounts(line).subtotal), 'num'),
+            );
+            const remove = document.createElement('button');
+            remove.type = 'button';
+            remove.textContent = '✕';
+            remove.addEventListener('click', () => { lines.delete(line.variant_id); render(); });
+            const td = document.createElement('td');
+            td.append(remove);
+            tr.append(td);
+            rows.push(tr);
+        });
+        tbody.replaceChildren(...rows);
+
+        const t = totals();
+        document.getElementById('offline-total').textContent = fmt(t.total);
+        document.getElementById('offline-gst').textContent = t.gst ? `incl. GST ${fmt(t.gst)}` : '';
+        saveBtn.disabled = lines.size === 0;
+    }
+
+    async function renderQueue() {
+        const el = document.getElementById('offline-queue-status');
+        const queued = await OfflineBilling.queuedSales();
+        const flagged = queued.filter(s => s.status !== 'pending').length;
+        el.textContent = queued.length
+            ? `${queued.length} queued${flagged ? `, ${flagged} flagged` : ''}`
+            : '';
+    }
+
+    // ── Scanning ───────────────────────────────────────────────────────────
+    async function scan(barcode) {
+        const item = await OfflineBilling.lookupBarcode(barcode);
+        if (!item) {
+            return say(`"${barcode}" is not in the offline catalog.`, true);
+        }
+
+        const existing = lines.get(item.variant_id);
+        if (item.is_weighed) {
+            const weight = parseFloat(window.prompt(`Weight of ${item.name} (kg):`, '') || '');
+            if (!(weight > 0) || !item.price_per_kg) return say(`"${item.name}" must be weighed.`, true);
+            const weightKg = weight.toFixed(3);
+            lines.set(item.variant_id, {
+                ...item, qty: 1, weight_kg: weightKg,
+                unitPaise: Math.round(toPaise(item.price_per_kg) * parseFloat(weightKg)),
+            });
+        } else if (existing) {
+            existing.qty += 1;
+        } else {
+            lines.set(item.variant_id, { ...item, qty: 1, weight_kg: null, unitPaise: toPaise(item.price) });
+        }
+        say(`Added ${item.name}.`);
+        render();
+    }
+
+    scanForm.addEventListener('submit', function (e) {
+        e.preventDefault();
+        const input = this.elements.barcode;
+        const barcode = input.value.trim();
+        this.reset();
+        input.focus();
+        if (barcode) scan(barcode).catch(err => say(`Lookup failed: ${err}`, true));
+    });
+
+    // ── Saving ─────────────────────────────────────────────────────────────
+    payForm.addEventListener('submit', async function (e) {
+        e.preventDefault();
+        if (lines.size === 0) return;
+
+        const { total } = totals();
+        let cash = toPaise(this.elements.cash.value);
+        const card = toPaise(this.elements.card.value);
+        const upi = toPaise(this.elements.upi.value);
+        if (cash + card + upi === 0) cash = total;   // quick complete: full cash
+        if (cash + card + upi < total) {
+            return say(`Insufficient payment. Paid: ${fmt(cash + card + upi)}, Total: ${fmt(total)}`, true);
+        }
+        if (card + upi > total) {
+            return say('Card/UPI payments exceed the sale total.', true);
+        }
+
+        const sale = {
+            key: newKey(),
+            captured_at: new Date().toISOString(),
+            catalog_version: localStorage.getItem('catalogVersion'),
+            items: [...lines.values()].map(line => line.weight_kg
+                ? { variant_id: line.variant_id, weight_kg: line.weight_kg, price: line.price_per_kg }
+                : { variant_id: line.variant_id, qty: line.qty, price: toRupees(line.unitPaise) }),
+            payments: { cash: toRupees(cash), card: toRupees(card), upi: toRupees(upi) },
+            total: toRupees(total),
+        };
+
+        try {
+            await OfflineBilling.queueSale(sale);
+            await OfflineBilling.registerSync();
+        } catch (err) {
+            return say(`Could not save the sale on this terminal: ${err}`, true);
+        }
+
+        const change = cash + card + upi - total;
+        lines = new Map();
+        this.reset();
+        render();
+        say(`Sale saved offline (${fmt(total)}${change > 0 ? `, change ${fmt(change)}` : ''}). It will sync when the connection returns.`);
+        renderQueue();
+        scanForm.elements.barcode.focus();
+    });
+
+    // ── Reconnect ──────────────────────────────────────────────────────────
+    window.addEventListener('offline-queue-changed', renderQueue);
+    window.addEventListener('online', () => {
+        // Do not reload over a sale in progress; pwa.js drains the queue.
+        if (lines.size === 0) {
+            window.location.href = '/billing/';
+        } else {
+            say('Connection restored. Save this sale, then return to billing.');
+        }
+    });
+
+    render();
+    renderQueue();
+})();
@@ -0,0 +1,135 @@
+/**
+ * Mall Billing System — Print Jobs
+ * ================================
+ * Socket.IO client for pushed receipt printing (app/billing/print_jobs.py).
+ *
+ * On every (re)connect the screen subscribes to its print room and gets
+ * the backlog of unprinted sales; after that, each committed sale arrives
+ * as a print_job push. Jobs are handed to onJob once per page (backlog and
+ * live push can overlap); onJob returns true when it handled the job.
+ *
+ * ack(saleId) calls within ACK_BATCH_MS are sent as ONE print_ack; the
+ * server answers every screen with print_done, passed to onDone. ack()
+ * resolves to true only if the server actually marked that sale printed.
+ *
+ * start({ scope: 'all' }) follows every cashier's jobs (admins, print
+ * queue page); otherwise only the user's own sales arrive.
+ *
+ * release(saleId) gives a job back (e.g. the printer reported an error):
+ * it is delivered again with the next backlog, requested after
+ * RETRY_MS. settled(saleId, ms) resolves once the sale's ack has been
+ * answered or released, or after ms, so a screen can wait for its
+ * receipt before navigating away. Acks still pending when the page is
+ * hidden go out with navigator.sendBeacon to start({ ackUrl }).
+ *
+ * Exposed as window.PrintJobs = { start, ack, release, settled, resync, connected }.
+ */
+
+(function () {
+    const ACK_BATCH_MS = 250;
+    const RETRY_MS = 5000;
+
+    let socket = null;
+    let handlers = { onJob: () => false, onDone: () => {} };
+    let scope = 'own';
+    let ackUrl = null;
+    let retryTimer = null;
+    const waiters = new Map();     // sale id → [resolve, …] (settled)
+    const handled = new Set();
+    let pendingAcks = new Map();   // sale id → [resolve, …]
+    let ackTimer = null;
+
+    function deliver(job) {
+        if (handled.has(job.sale_id)) return;
+        if (handlers.onJob(job)) handled.add(job.sale_id);
+    }
+
+    function flushAcks() {
+        ackTimer = null;
+        if (pendingAcks.size === 0) return;
+        const batch = pendingAcks;
+        pendingAcks = new Map();
+        socket.emit('print_ack', { sale_ids: [...batch.keys()], scope }, reply => {
+            const ok = Boolean(reply && reply.ok);
+            if (!ok) console.error('Print ack failed:', reply && reply.error);
+            const marked = new Set(ok ? reply.sale_ids : []);
+            batch.forEach((resolvers, id) => {
+                if (!ok) handled.delete(id);   // backlog retries them
+                resolvers.forEach(resolve => resolve(marked.has(id)));
+                settle(id);
+            });
+        });
+    }
+
+    function settle(saleId) {
+        (waiters.get(saleId) || []).forEach(resolve => resolve());
+        waiters.delete(saleId);
+    }
+
+    function settled(saleId, ms) {
+        return new Promise(resolve => {
+            if (!waiters.has(saleId)) waiters.set(saleId, []);
+            waiters.get(saleId).push(resolve);
+            setTimeout(resolve, ms);
+        });
+    }
+
+    function release(saleId) {
+        handled.delete(saleId);
+        settle(saleId);
+        if (!retryTimer) {
+            retryTimer = setTimeout(() => { retryTimer = null; resync(); }, RETRY_MS);
+        }
+    }
+
+    // The page is going away: hand unsent acks to the browser.
+    function beaconAcks() {
+        if (pendingAcks.size === 0 || !ackUrl || !navigator.sendBeacon) return;
+        clearTimeout(ackTimer);
+        ackTimer = null;
+        const form = new FormData();
+        const token = document.querySelector('meta[name="csrf-token"]');
+        if (token) form.append('csrf_token', token.content);
+        pendingAcks.forEach((_resolvers, id) => form.append('sale_ids', id));
+        navigator.sendBeacon(ackUrl, form);
+        pendingAcks = new Map();
+    }
+
+    function ack(saleId) {
+        return new Promise(resolve => {
+            if (!pendingAcks.has(saleId)) pendingAcks.set(saleId, []);
+            pendingAcks.get(saleId).push(resolve);
+            if (!ackTimer) ackTimer = setTimeout(flushAcks, ACK_BATCH_MS);
+        });
+    }
+
+    function connected() {
+        return Boolean(socket && socket.connected);
+    }
+
+    function resync() {
+        if (socket && socket.connected) socket.emit('print_subscribe', { scope });
+    }
+
+    function start(options) {
+        if (socket || typeof io !== 'function') return;
+        const { scope: requested, ackUrl: url, ...callbacks } = options || {};
+        handlers = { ...handlers, ...callbacks };
+        scope = requested === 'all' ? 'all' : 'own';
+        ackUrl = url || null;
+        window.addEventListener('pagehide', beaconAcks);
+
+        if (!window.socket) {
+            window.socket = io({ transports: ['websocket'], reconnection: true });
+        }
+        socket = window.socket;
+
+        socket.on('connect', resync);
+        socket.on('print_backlog', data => data.jobs.forEach(deliver));
+        socket.on('print_job', deliver);
+        socket.on('print_done', data => handlers.onDone(data.sale_ids));
+        resync();
+    }
+
+    window.PrintJobs = { start, ack, release, settled, resync, connected };
+})();
@@ -1,116 +1,203 @@
 /**
  * Mall Billing System — PWA Controller
  * ====================================
- * Handles IndexedDB for offline transactions and 
- * coordinates with the Service Worker for background sync.
+ * IndexedDB for offline billing, shared by every page of the app:
+ *
+ *   catalog       — copy of /inventory/api/catalog, keyed by barcode
+ *                   (indexed by variant_id), refreshed from the billing
+ *                   screen while online: the full snapshot once, then
+ *                   ?since=<version> deltas of only the changed variants
+ *   offlineSales  — sales captured by the offline POS (offline_pos.js),
+ *                   keyed by their idempotency key
+ *
+ * Queued sales are sent to /billing/api/sync in batches when the network
+ * returns (online event, SW background sync, or page load). The server
+ * answers per sale: recorded / duplicate sales leave the queue, conflicts
+ * (e.g. stock now insufficient) and rejected sales stay, flagged, for a
+ * manager to resolve.
+ *
+ * Exposed as window.OfflineBilling.
  */
 
 const DB_NAME = 'MallBillingDB';
-const DB_VERSION = 1;
-const STORE_NAME = 'offlineSales';
+const DB_VERSION = 3;
+const SALES_STORE = 'offlineSales';
+const CATALOG_STORE = 'catalog';
 
-let db;
+const CATALOG_URL = '/inventory/api/catalog';
+const SYNC_URL = '/billing/api/sync';
+const CATALOG_MAX_AGE_MS = 60 * 1000;   // deltas are a few hundred bytes
+const SYNC_BATCH = 50;
 
 // ── Initialize IndexedDB ───────────────────────────────────────────────
-const request = indexedDB.open(DB_NAME, DB_VERSION);
-
-request.onupgradeneeded = (event) => {
-    db = event.target.result;
-    if (!db.objectStoreNames.contains(STORE_NAME)) {
-        db.createObjectStore(STORE_NAME, { keyPath: 'id', autoIncrement: true });
-        console.log('IndexedDB: Object store created.');
-    }
-};
-
-request.onsuccess = (event) => {
-    db = event.target.result;
-    console.log('IndexedDB: Success.');
-    // Check if we have pending items to sync on startup
-    syncOfflineSales();
-};
+const dbReady = new Promise((resolve, reject) => {
+    const request = indexedDB.open(DB_NAME, DB_VERSION);
+
+    request.onupgradeneeded = (event) => {
+        const db = event.target.result;
+        if (event.oldVersion < 2) {
+            // v1 queued raw checkout forms that relied on the server-side
+            // cart still existing; they cannot be replayed as sales.
+            if (db.objectStoreNames.contains(SALES_STORE)) db.deleteObjectStore(SALES_STORE);
+            db.createObjectStore(SALES_STORE, { keyPath: 'key' });
+            db.createObjectStore(CATALOG_STORE, { keyPath: 'barcode' });
+            console.log('IndexedDB: Object stores created.');
+        }
+        if (event.oldVersion < 3) {
+            // Deltas address variants by id (a barcode can change).
+            const catalog = event.target.transaction.objectStore(CATALOG_STORE);
+            catalog.clear();
+            catalog.createIndex('variant_id', 'variant_id', { unique: true });
+            localStorage.removeItem('catalogVersion');
+        }
+    };
 
-request.onerror = (event) => {
-    console.error('IndexedDB Error:', event.target.error);
-};
+    request.onsuccess = (event) => resolve(event.target.result);
+    request.onerror = (event) => {
+        console.error('IndexedDB Error:', event.target.error);
+        reject(event.target.error);
+    };
+});
 
-// ── Save Sale to IndexedDB ─────────────────────────────────────────────
-async function saveSaleOffline(saleData) {
+async function withStore(storeName, mode, fn) {
+    const db = await dbReady;
     return new Promise((resolve, reject) => {
-        const transaction = db.transaction([STORE_NAME], 'readwrite');
-        const store = transaction.objectStore(STORE_NAME);
-
-        const sale = {
-            data: saleData,
-            timestamp: new Date().toISOString(),
-            synced: false
-        };
-
-        const addRequest = store.add(sale);
-        addRequest.onsuccess = () => {
-            console.log('Sale saved offline.');
-            resolve(true);
-        };
-        addRequest.onerror = () => reject(addRequest.error);
+        const transaction = db.transaction([storeName], mode);
+        const result = fn(transaction.objectStore(storeName));
+        transaction.oncomplete = () => resolve(result && 'result' in result ? result.result : undefined);
+        transaction.onerror = () => reject(transaction.error);
     });
 }
 
-// ── Sync Offline Sales to Server ───────────────────────────────────────
-async function syncOfflineSales() {
-    if (!navigator.onLine) return;
-
-    const transaction = db.transaction([STORE_NAME], 'readonly');
-    const store = transaction.objectStore(STORE_NAME);
-    const getAllRequest = store.getAll();
-
-    getAllRequest.onsuccess = async () => {
-        const sales = getAllRequest.result.filter(s => !s.synced);
-        if (sales.length === 0) return;
-
-        console.log(`Syncing ${sales.length} offline sales...`);
-
-        for (const sale of sales) {
-            try {
-                const response = await fetch('/billing/complete', {
-                    method: 'POST',
-                    body: new URLSearchParams(sale.data),
-                    headers: {
-                        'Content-Type': 'application/x-www-form-urlencoded',
-                        'X-Offline-Sync': 'true' // Custom header to track sync source
-                    }
-                });
-
-                if (response.ok) {
-                    await deleteSale(sale.id);
-                    console.log(`Sale ${sale.id} synced and removed from local storage.`);
-                }
-            } catch (err) {
-                console.error(`Failed to sync sale ${sale.id}:`, err);
-            }
-        }
-    };
+function csrfToken() {
+    const meta = document.querySelector('meta[name="csrf-token"]');
+    return meta ? meta.content : null;
 }
 
-async function deleteSale(id) {
-    return new Promise((resolve) => {
-        const transaction = db.transaction([STORE_NAME], 'readwrite');
-        const store = transaction.objectStore(STORE_NAME);
-        store.delete(id).onsuccess = () => resolve();
+function toast(message, type = 'info') {
+    window.dispatchEvent(new CustomEvent('toast', { detail: { message, type } }));
+}
+
+// ── Catalog ────────────────────────────────────────────────────────────
+async function refreshCatalog(force = false) {
+    if (!navigator.onLine) return false;
+    const fetchedAt = parseInt(localStorage.getItem('catalogFetchedAt') || '0', 10);
+    if (!force && Date.now() - fetchedAt < CATALOG_MAX_AGE_MS) return false;
+
+    const version = localStorage.getItem('catalogVersion');
+    const url = version === null || force ? CATALOG_URL : `${CATALOG_URL}?since=${version}`;
+    // The full snapshot is revalidated by the browser cache (ETag / 304).
+    const response = await fetch(url, { headers: { 'Accept': 'application/json' } });
+    const type = response.headers.get('Content-Type') || '';
+    if (!response.ok || !type.includes('application/json')) return false;
+
+    const data = await response.json();
+    const toEntry = row => {
+        const entry = {};
+        data.fields.forEach((field, i) => entry[field] = row[i]);
+        return entry;
+    };
+    await withStore(CATALOG_STORE, 'readwrite', store => {
+        if (data.full) {
+            store.clear();
+            data.items.forEach(row => store.put(toEntry(row)));
+            return;
+        }
+        // Drop by variant id first: an edited variant may have a new barcode.
+        const stale = data.removed.concat(data.items.map(row => row[0]));
+        let pending = stale.length;
+        const upsert = () => data.items.forEach(row => store.put(toEntry(row)));
+        if (pending === 0) return;
+        stale.forEach(variantId => {
+            const request = store.index('variant_id').getKey(variantId);
+            request.onsuccess = () => {
+                const done = () => { if (--pending === 0) upsert(); };
+                if (request.result === undefined) return done();
+                store.delete(request.result).onsuccess = done;
+            };
+        });
     });
+    localStorage.setItem('catalogVersion', String(data.version));
+    localStorage.setItem('catalogFetchedAt', String(Date.now()));
+    console.log(`PWA: Offline catalog ${data.full ? 'loaded' : 'updated'} (${data.items.length} variants, v${data.version}).`);
+    return true;
 }
 
-// ── Listen for Online event to trigger sync ────────────────────────────
-window.addEventListener('online', () => {
-    console.log('Network restored. Triggering sync...');
-    syncOfflineSales();
-});
+function lookupBarcode(barcode) {
+    return withStore(CATALOG_STORE, 'readonly', store => store.get(barcode))
+        .then(entry => entry || null);
+}
 
-// ── Message Listener from Service Worker ──────────────────────────────
-navigator.serviceWorker.addEventListener('message', event => {
-    if (event.data && event.data.type === 'TRIGGER_SYNC') {
-        console.log('PWA: Received sync trigger from SW.');
-        syncOfflineSales();
+// ── Offline sale queue ─────────────────────────────────────────────────
+function queueSale(sale) {
+    return withStore(SALES_STORE, 'readwrite', store => store.put({ ...sale, status: 'pending' }));
+}
+
+function queuedSales() {
+    return withStore(SALES_STORE, 'readonly', store => store.getAll());
+}
+
+let syncing = null;
+
+function syncOfflineSales() {
+    // One sync at a time; callers share the running one.
+    if (!syncing) syncing = runSync().finally(() => { syncing = null; });
+    return syncing;
+}
+
+async function runSync() {
+    const token = csrfToken();
+    if (!navigator.onLine || !token) return;   // needs a logged-in page
+
+    const pending = (await queuedSales()).filter(s => s.status === 'pending');
+    if (pending.length === 0) return;
+    console.log(`Syncing ${pending.length} offline sales...`);
+
+    const counts = { recorded: 0, duplicate: 0, conflict: 0, rejected: 0 };
+    for (let i = 0; i < pending.length; i += SYNC_BATCH) {
+        const batch = pending.slice(i, i + SYNC_BATCH);
+        let data;
+        try {
+            const response = await fetch(SYNC_URL, {
+                method: 'POST',
+                body: JSON.stringify({
+                    sales: batch.map(({ key, captured_at, items, payments }) => ({ key, captured_at, items, payments })),
+                }),
+                headers: {
+                    'Accept': 'application/json',
+                    'Content-Type': 'application/json',
+                    'X-CSRFToken': token,
+                },
+            });
+            const type = response.headers.get('Content-Type') || '';
+            if (!response.ok || !type.includes('application/json')) break;   // retry on the next trigger
+            data = await response.json();
+        } catch (err) {
+            console.error('Offline sync failed:', err);
+            break;
+        }
+
+        await withStore(SALES_STORE, 'readwrite', store => {
+            data.results.forEach((result, j) => {
+                counts[result.status] = (counts[result.status] || 0) + 1;
+                if (result.status === 'recorded' || result.status === 'duplicate') {
+                    store.delete(batch[j].key);
+                } else {
+                    store.put({ ...batch[j], status: result.status, error: result.error });
+                }
+            });
+        });
     }
-});
+
+    const synced = counts.recorded + counts.duplicate;
+    if (synced) toast(`Synced ${synced} offline sale${synced === 1 ? '' : 's'}.`, 'success');
+    if (counts.conflict || counts.rejected) {
+        toast(`${counts.conflict + counts.rejected} offline sale(s) need attention (stock or price changed).`, 'warning');
+    }
+    window.dispatchEvent(new CustomEvent('offline-queue-changed'));
+}
+
+window.OfflineBilling = { refreshCatalog, lookupBarcode, queueSale, queuedSales, syncOfflineSales };
 
 // ── Register Background Sync ──────────────────────────────────────────
 async function registerSync() {
@@ -124,32 +211,26 @@ async function registerSync() {
         }
     }
 }
+window.OfflineBilling.registerSync = registerSync;
 
-// ── Intercept Billing Form ─────────────────────────────────────────────
-// This is used if the page logic doesn't already handle the offline state.
-document.addEventListener('submit', async (e) => {
-    if (e.target.action && e.target.action.includes('/billing/complete')) {
-        if (!navigator.onLine) {
-            e.preventDefault();
-            const formData = new FormData(e.target);
-            const data = {};
-            formData.forEach((value, key) => data[key] = value);
-
-            try {
-                await saveSaleOffline(data);
-                // Register sync tag so SW knows to try later
-                await registerSync();
-
-                // Dispatch a toast or alert
-                window.dispatchEvent(new CustomEvent('toast', {
-                    detail: { message: 'Offline: Sale saved locally. It will sync automatically when Wi-Fi returns.', type: 'warning' }
-                }));
-                // Optional: redirect to home or clear cart UI
-                setTimeout(() => window.location.href = '/', 2000);
-            } catch (err) {
-                console.error(err);
-                alert('Critical Error: Could not save sale offline.');
-            }
-        }
+// ── Listen for Online event to trigger sync ────────────────────────────
+window.addEventListener('online', () => {
+    console.log('Network restored. Triggering sync...');
+    syncOfflineSales();
+});
+
+// ── Message Listener from Service Worker ──────────────────────────────
+navigator.serviceWorker?.addEventListener('message', event => {
+    if (event.data && event.data.type === 'TRIGGER_SYNC') {
+        console.log('PWA: Received sync trigger from SW.');
+        syncOfflineSales();
+    }
+});
+
+// ── Startup: drain the queue, keep the billing screen's catalog fresh ──
+dbReady.then(() => {
+    syncOfflineSales();
+    if (document.getElementById('cart-section')) {
+        refreshCatalog().catch(err => console.error('PWA: Catalog refresh failed:', err));
     }
 });
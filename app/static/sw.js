@@ -5,17 +5,22 @@
  *   - Static assets (CSS/JS/fonts/images): Cache-first, update in background.
  *   - Navigation / HTML pages: Network-first. Fall back to /offline if no network.
  *   - API JSON: Network-first with short timeout; no offline cache.
+ *   - Offline billing: /offline is the offline POS (offline_pos.js), so
+ *     it and its scripts are pre-cached; catalog and queued sales live in
+ *     IndexedDB (pwa.js) and sync through /billing/api/sync.
  *
  * Cache versioning: bump CACHE_VERSION when deploying breaking changes.
  */
 
-const CACHE_VERSION = 'v1.1.0';
+const CACHE_VERSION = 'v1.5.0';
 const SHELL_CACHE = `mall-shell-${CACHE_VERSION}`;
 const STATIC_CACHE = `mall-static-${CACHE_VERSION}`;
 
 // Core app shell — always cached on install
 const SHELL_URLS = [
     '/offline',
+    '/static/js/pwa.js',
+    '/static/js/offline_pos.js',
 ];
 
 // Static assets to pre-cache (cache-first forever until version bump)
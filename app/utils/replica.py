@@ -0,0 +1,153 @@
+"""
+app/utils/replica.py
+--------------------
+Optional read replica for the reporting blueprints.
+
+With REPORTING_DATABASE_URL set, a second engine (the 'reporting' bind,
+with its own small pool) sits next to the primary. Blueprints that
+register use_reporting_replica() as a before_request hook send their
+plain SELECTs there. Flushes, INSERT/UPDATE/DELETE, SELECT … FOR UPDATE
+and anything outside such a request stay on the primary, so a month-end
+report never holds a connection the checkout counters need.
+
+A request only goes to the replica while it is reachable and at most
+REPORTING_MAX_LAG_SECONDS behind. Each process checks this at most once
+every REPORTING_REPLICA_CHECK_SECONDS; otherwise the request reads the
+primary. Replica connections are read-only (default_transaction_read_only),
+so a second role on the primary itself can stand in for a replica when
+testing. The streaming check reads pg_stat_wal_receiver, which needs
+pg_read_all_stats; without it lag is taken from the last replay time.
+"""
+import threading
+import time
+
+from flask import current_app, g, has_app_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.sql.selectable import SelectBase
+
+
+REPLICA_BIND = 'reporting'
+
+# Seconds of replay lag (NULL: nothing replayed yet). A replica that is
+# still streaming and has replayed everything it received is current even
+# when the primary is idle. One whose WAL receiver has stopped is only
+# as fresh as its last replayed transaction.
+LAG_SQL = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN EXISTS (SELECT 1 FROM pg_stat_wal_receiver WHERE status = 'streaming')
+             AND pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+""")
+
+
+class RoutingSession(Session):
+    """Session that sends reads to the replica when the request opted in."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and _is_read(clause) and _replica_requested():
+            return self._db.engines[REPLICA_BIND]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _is_read(clause) -> bool:
+    return isinstance(clause, SelectBase) and getattr(clause, '_for_update_arg', None) is None
+
+
+def _replica_requested() -> bool:
+    return has_app_context() and g.get('reporting_replica', False)
+
+
+class ReplicaHealth:
+    """Per-process, rate-limited view of whether the replica may be read."""
+
+    def __init__(self, app, max_lag: float, check_every: float):
+        self.app = app
+        self.max_lag = max_lag
+        self.check_every = check_every
+        self._usable = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    def usable(self, engine) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            if self._checked_at is not None and now - self._checked_at < self.check_every:
+                return bool(self._usable)
+            self._checked_at = now
+            self._set(self._probe(engine))
+            return self._usable
+
+    def mark_down(self, reason) -> None:
+        """Stop using the replica until the next check (e.g. it dropped mid-request)."""
+        with self._lock:
+            self._checked_at = time.monotonic()
+            self._set((False, reason))
+
+    def _probe(self, engine):
+        try:
+            with engine.connect() as conn:
+                lag = conn.execute(LAG_SQL).scalar()
+        except SQLAlchemyError as exc:
+            return False, f'unreachable ({exc.__class__.__name__})'
+        if lag is None:
+            return False, 'has not replayed anything yet'
+        lag = float(lag)
+        if lag > self.max_lag:
+            return False, f'{lag:.0f}s behind (max {self.max_lag:.0f}s)'
+        return True, None
+
+    def _set(self, result) -> None:
+        usable, reason = result
+        if usable != self._usable:
+            if usable:
+                self.app.logger.info('Reporting replica in use.')
+            else:
+                self.app.logger.warning(f'Reporting replica {reason}; reports read the primary.')
+        self._usable = usable
+
+
+def use_reporting_replica() -> None:
+    """before_request hook: read from the replica for this request if it is usable."""
+    health = current_app.extensions.get('reporting_replica')
+    if health is None:
+        return
+    from app import db
+    g.reporting_replica = health.usable(db.engines[REPLICA_BIND])
+
+
+def replica_failed(exc) -> None:
+    """Called on OperationalError: if this request was on the replica, fall back from now on."""
+    health = current_app.extensions.get('reporting_replica')
+    if health is not None and g.get('reporting_replica', False):
+        health.mark_down(f'failed mid-request ({exc.__class__.__name__})')
+
+
+def replica_binds(app) -> dict:
+    """SQLALCHEMY_BINDS entry for REPORTING_DATABASE_URL, or {} when unset."""
+    url = app.config.get('REPORTING_DATABASE_URL')
+    if not url:
+        return {}
+    if not url.startswith('postgresql://'):
+        raise RuntimeError('REPORTING_DATABASE_URL must start with postgresql://')
+    options = dict(app.config.get('REPORTING_ENGINE_OPTIONS') or {})
+    connect_args = dict(options.pop('connect_args', {}))
+    connect_args['options'] = ' '.join(filter(None, [
+        connect_args.get('options'), '-c default_transaction_read_only=on',
+    ]))
+    return {REPLICA_BIND: {'url': url, 'connect_args': connect_args, **options}}
+
+
+def init_reporting_replica(app):
+    if not app.config.get('REPORTING_DATABASE_URL'):
+        return None
+    health = ReplicaHealth(
+        app,
+        max_lag=float(app.config.get('REPORTING_MAX_LAG_SECONDS', 30)),
+        check_every=float(app.config.get('REPORTING_REPLICA_CHECK_SECONDS', 5)),
+    )
+    app.extensions['reporting_replica'] = health
+    return health
@@ -0,0 +1,164 @@
+"""
+EXPLAIN and timings for report date filters: cast(created_at, Date)
+comparisons (before) against the half-open created_at bounds from
+app/reporting/query.py (after).
+
+With --seed N, N synthetic sales (plus one cash payment each) are
+bulk-inserted first, spread over the last --spread-days days, and
+ANALYZEd. Their invoice numbers start with BENCH-; --cleanup deletes
+them afterwards. These rows bypass the sale_events outbox, so they
+never reach the dashboard rollups.
+
+For every report query and range width this prints the median
+wall-clock time of both variants and the top plan node (Seq Scan or
+Index/Bitmap scan on sales). Full EXPLAIN (ANALYZE, BUFFERS) output is
+written to --out.
+
+Run against a scratch copy of the database:
+    python bench_reporting_ranges.py --seed 3000000 [--days 1 7 30] [--cleanup]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from datetime import timedelta
+
+from sqlalchemy import Date, cast, desc, func, select, text
+
+os.environ['FLASK_RUN_FROM_CLI'] = '1'
+sys.path.insert(0, os.getcwd())
+
+from app import create_app, db  # noqa: E402
+from app.billing.models import Sale, SalePayment  # noqa: E402
+from app.reporting.query import DateRange, store_today  # noqa: E402
+
+
+TIMING_RUNS = 5
+SEED_BATCH = 250_000
+
+
+def seed(rows, spread_days):
+    cashier_id = db.session.execute(text("SELECT id FROM users ORDER BY id LIMIT 1")).scalar()
+    if cashier_id is None:
+        raise RuntimeError('Create a user first (flask seed-admin).')
+
+    offset = db.session.execute(text("SELECT COUNT(*) FROM sales WHERE invoice_number LIKE 'BENCH-%'")).scalar()
+    for first in range(offset + 1, offset + rows + 1, SEED_BATCH):
+        last = min(first + SEED_BATCH - 1, offset + rows)
+        db.session.execute(text("""
+            WITH new_sales AS (
+                INSERT INTO sales (invoice_number, cashier_id, total_amount, discount_percent, discount_amount,
+                                   gst_total, grand_total, payment_method, is_printed, created_at)
+                SELECT 'BENCH-' || g, :cashier_id, amt, 0, 0, round(amt * 0.12, 2), round(amt * 1.12, 2),
+                       'cash', TRUE, (NOW() AT TIME ZONE 'UTC') - random() * :spread * INTERVAL '1 day'
+                FROM (SELECT g, round((100 + random() * 4900)::numeric, 2) AS amt
+                      FROM generate_series(:first, :last) AS g) AS s
+                RETURNING id, grand_total
+            )
+            INSERT INTO sale_payments (sale_id, payment_method, amount)
+            SELECT id, 'cash', grand_total FROM new_sales
+        """), {'cashier_id': cashier_id, 'spread': spread_days, 'first': first, 'last': last})
+        db.session.commit()
+        print(f"  seeded {last - offset}/{rows}")
+    db.session.execute(text("ANALYZE sales"))
+    db.session.execute(text("ANALYZE sale_payments"))
+    db.session.commit()
+
+
+def cleanup():
+    db.session.execute(text("""
+        DELETE FROM sale_payments WHERE sale_id IN (SELECT id FROM sales WHERE invoice_number LIKE 'BENCH-%')
+    """))
+    deleted = db.session.execute(text("DELETE FROM sales WHERE invoice_number LIKE 'BENCH-%'")).rowcount
+    db.session.commit()
+    print(f"Deleted {deleted} BENCH- sales.")
+
+
+def _cast_filter(days):
+    return [cast(Sale.created_at, Date) >= days.start, cast(Sale.created_at, Date) <= days.end]
+
+
+def queries(days):
+    """(name, before, after) for the shapes the reports run."""
+    shapes = {
+        'sales listing (page 1)': lambda where: (
+            select(Sale.id, Sale.invoice_number, Sale.created_at, Sale.grand_total)
+            .where(*where).order_by(desc(Sale.created_at)).limit(20)
+        ),
+        'range totals': lambda where: (
+            select(func.count(Sale.id), func.sum(func.coalesce(Sale.grand_total, Sale.total_amount + Sale.gst_total)))
+            .where(*where)
+        ),
+        'payment breakdown': lambda where: (
+            select(SalePayment.payment_method, func.sum(SalePayment.amount))
+            .join(Sale, Sale.id == SalePayment.sale_id)
+            .where(*where).group_by(SalePayment.payment_method)
+        ),
+    }
+    return [
+        (name, build(_cast_filter(days)), build(days.filter(Sale.created_at)))
+        for name, build in shapes.items()
+    ]
+
+
+def explain(stmt) -> str:
+    compiled = stmt.compile(dialect=db.engine.dialect)
+    rows = db.session.connection().exec_driver_sql(
+        'EXPLAIN (ANALYZE, BUFFERS) ' + str(compiled), compiled.params,
+    ).all()
+    return '\n'.join(row[0] for row in rows)
+
+
+def median_ms(stmt) -> float:
+    timings = []
+    for _ in range(TIMING_RUNS):
+        started = time.perf_counter()
+        db.session.execute(stmt).all()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def _scan(plan) -> str:
+    for line in plan.splitlines():
+        if ' on sales' in line and 'Scan' in line:
+            return line.strip().split('  (')[0].lstrip('-> ')
+    return '?'
+
+
+def bench(widths, out_path):
+    total = db.session.execute(text("SELECT COUNT(*) FROM sales")).scalar()
+    today = store_today()
+    print(f"{total} sales rows")
+    print(f"{'query':<24} {'days':>5} {'before ms':>10} {'after ms':>9}  plan before → after")
+
+    with open(out_path, 'w') as out:
+        for width in widths:
+            days = DateRange(today - timedelta(days=width - 1), today)
+            for name, before, after in queries(days):
+                plans = (explain(before), explain(after))
+                timings = (median_ms(before), median_ms(after))
+                db.session.rollback()
+                print(f"{name:<24} {width:>5} {timings[0]:>10.1f} {timings[1]:>9.1f}  "
+                      f"{_scan(plans[0])} → {_scan(plans[1])}")
+                for label, plan, ms in zip(('before', 'after'), plans, timings):
+                    out.write(f"=== {name} | {width} day(s) | {label} | median {ms:.1f} ms ===\n{plan}\n\n")
+    print(f"Plans written to {out_path}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--seed', type=int, default=0, help='synthetic sales to insert first')
+    parser.add_argument('--spread-days', type=int, default=730, help='history the seeded sales span')
+    parser.add_argument('--days', type=int, nargs='+', default=[1, 7, 30], help='report range widths')
+    parser.add_argument('--out', default=os.path.join('logs', 'reporting_explain.txt'))
+    parser.add_argument('--cleanup', action='store_true', help='delete BENCH- sales afterwards')
+    args = parser.parse_args()
+
+    app = create_app(os.environ.get('FLASK_ENV', 'development'))
+    with app.app_context():
+        if args.seed:
+            seed(args.seed, args.spread_days)
+        bench(args.days, args.out)
+        if args.cleanup:
+            cleanup()
@@ -1,5 +1,6 @@
 import os
 from datetime import timedelta
+from decimal import Decimal
 from sqlalchemy.pool import NullPool
 
 
@@ -23,6 +24,9 @@ class Config:
         "pool_size": 20,       # Base number of connections
         "max_overflow": 10,    # Extra connections allowed during spikes
         "pool_timeout": 30,    # Seconds to wait for a connection
+        # Batch ORM executemany UPDATEs (e.g. stock deductions at checkout)
+        # into a single round trip via psycopg2.extras.execute_batch.
+        "executemany_mode": "values_plus_batch",
     }
     # Sessions expire after 8 hours (one work shift)
     PERMANENT_SESSION_LIFETIME = timedelta(hours=8)
@@ -32,6 +36,15 @@ class Config:
     LOCAL_PRODUCTION = False
     ALLOW_SCHEMA_FIX_ROUTE = os.environ.get('ALLOW_SCHEMA_FIX_ROUTE', 'false').lower() == 'true'
 
+    # ── Checkout ─────────────────────────────────────────────────
+    # 'lock'   → SELECT … FOR UPDATE all cart variants, check, then write
+    # 'atomic' → single UPDATE … SET stock = stock - qty WHERE stock >= qty
+    #            (shorter critical section on hot SKUs)
+    CHECKOUT_STOCK_MODE = os.environ.get('CHECKOUT_STOCK_MODE', 'lock').lower()
+    # 'global'  → one gap-free series per year:        2026-0042
+    # 'counter' → one gap-free series per counter/year: 2026-C03-000042
+    INVOICE_SERIES_MODE = os.environ.get('INVOICE_SERIES_MODE', 'global').lower()
+
     # ── Caching ──────────────────────────────────────────────────
     CACHE_DEFAULT_TIMEOUT = 3600 # 1 hour
     CACHE_REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
@@ -42,6 +55,56 @@ class Config:
     else:
         CACHE_TYPE = "SimpleCache"
 
+    # ── Cart storage ─────────────────────────────────────────────
+    # 'server'  → cart kept server-side, only a short cart id travels in
+    #             the session cookie. Needs REDIS_URL in production; without
+    #             it carts stay in the cookie (in-process only for dev/tests,
+    #             since gunicorn's --max-requests recycling would drop them)
+    # 'session' → legacy: whole cart serialised into the signed cookie
+    CART_BACKEND = os.environ.get('CART_BACKEND', 'server').lower()
+    CART_REDIS_URL = os.environ.get('REDIS_URL')
+
+    # ── Barcode → variant snapshots (scanner) ────────────────────
+    # In-process LRU in front of the shared cache; REDIS_URL also enables
+    # pub/sub invalidation across workers.
+    BARCODE_CACHE_SIZE = int(os.environ.get('BARCODE_CACHE_SIZE', 20000))
+    BARCODE_CACHE_LOCAL_TTL = int(os.environ.get('BARCODE_CACHE_LOCAL_TTL', 300))
+    BARCODE_CACHE_TTL = 3600
+    BARCODE_CACHE_REDIS_URL = os.environ.get('REDIS_URL')
+
+    # ── Sale side effects (loyalty, promo uses, cash total, broadcasts) ──
+    # 'async'  → applied after commit by an in-process worker pool
+    # 'inline' → applied in the request right after commit
+    SALE_EVENTS_MODE = os.environ.get('SALE_EVENTS_MODE', 'async').lower()
+    SALE_EVENT_WORKERS = int(os.environ.get('SALE_EVENT_WORKERS', 2))
+    SALE_EVENT_SWEEP_SECONDS = int(os.environ.get('SALE_EVENT_SWEEP_SECONDS', 30))
+
+    # ── Reporting ────────────────────────────────────────────────
+    # IANA zone whose calendar days reports are cut on (created_at is
+    # stored as UTC). Changing it needs `flask rebuild-rollups`.
+    STORE_TIMEZONE = os.environ.get('STORE_TIMEZONE', 'UTC')
+    # Optional read replica (or a read-only role) for /reporting and
+    # /reports, on its own pool. Reports fall back to the primary while it
+    # is unreachable or more than REPORTING_MAX_LAG_SECONDS behind.
+    REPORTING_DATABASE_URL = os.environ.get('REPORTING_DATABASE_URL')
+    REPORTING_MAX_LAG_SECONDS = int(os.environ.get('REPORTING_MAX_LAG_SECONDS', 30))
+    REPORTING_REPLICA_CHECK_SECONDS = int(os.environ.get('REPORTING_REPLICA_CHECK_SECONDS', 5))
+    REPORTING_ENGINE_OPTIONS = {
+        "pool_size": 5,
+        "max_overflow": 5,
+        "connect_args": {"connect_timeout": 3},
+    }
+
+    # ── Offline billing (static/js/offline_pos.js) ───────────────
+    # Queued sales accepted per /billing/api/sync request
+    OFFLINE_SYNC_MAX_BATCH = int(os.environ.get('OFFLINE_SYNC_MAX_BATCH', 50))
+    # A captured price within this fraction of a price the terminal's
+    # catalog version served is taken as is; a lower one is booked as a
+    # discount, a higher one rejected
+    OFFLINE_PRICE_TOLERANCE = Decimal(os.environ.get('OFFLINE_PRICE_TOLERANCE', '0'))
+    # Oldest capture time accepted, and never before the open cash session
+    OFFLINE_MAX_AGE_HOURS = int(os.environ.get('OFFLINE_MAX_AGE_HOURS', 24))
+
 class DevelopmentConfig(Config):
     """Development environment configuration."""
     DEBUG = True
@@ -71,9 +134,14 @@ class TestingConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = _database_url_from_env()
     CACHE_TYPE = "SimpleCache"
+    CART_REDIS_URL = None
+    BARCODE_CACHE_REDIS_URL = None
+    SALE_EVENTS_MODE = 'inline'
+    REPORTING_ENGINE_OPTIONS = {"connect_args": {"connect_timeout": 3}}
 
     SQLALCHEMY_ENGINE_OPTIONS = {
-        "poolclass": NullPool
+        "poolclass": NullPool,
+        "executemany_mode": "values_plus_batch",
     }
     WTF_CSRF_ENABLED = False
     WTF_CSRF_CHECK_DEFAULT = False
@@ -34,7 +34,7 @@ os.environ["TEST_DATABASE_URL"] = TEST_DATABASE_URL
 
 # ---- App + DB setup ----
 from app import create_app
-from app import db
+from app import db, cache
 
 # Ensure all models are imported at the session level so db.create_all() 
 # always knows about them regardless of which test file is currently executing.
@@ -66,5 +66,7 @@ def setup_database(app):
         db.session.remove()
         db.drop_all()
         db.create_all()
+        cache.clear()   # ids restart after create_all; drop entries keyed by them
+        app.extensions['barcode_cache'].clear()
         yield
         db.session.remove()
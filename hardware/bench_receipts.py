@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Receipt build benchmark for the POS agent (Dummy printer, no hardware).
+
+Compares, per receipt:
+  - per-call   the previous print_receipt(): ~30 printer.set()/text() calls
+               plus a python-escpos CODE39 render
+  - template   ReceiptTemplate.build() + one raw write (pos_agent.print_receipt)
+
+and reports build time and the number of device writes. It then pushes
+--queue-jobs receipts through the agent's JobQueue on one persistent
+Dummy connection and reports end-to-end jobs per second.
+
+Run:
+    python bench_receipts.py [--receipts 2000] [--items 8] [--queue-jobs 500]
+"""
+import argparse
+import asyncio
+import time
+
+from escpos.printer import Dummy
+
+import pos_agent
+
+
+class CountingDummy(Dummy):
+    """Dummy that counts device writes."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.writes = 0
+
+    def _raw(self, msg):
+        self.writes += 1
+        super()._raw(msg)
+
+
+def print_receipt_per_call(printer, receipt_data):
+    """The agent's previous receipt formatter, kept for comparison."""
+    printer.set(align='center', bold=True, double_height=True, double_width=True)
+    printer.text("MALL BILLING\n")
+    printer.set(align='center', bold=False, double_height=False, double_width=False)
+    printer.text("The Premiere Shopping Destination\n")
+    printer.text("123 Commerce Way, Retail District\n")
+    printer.text(f"Tax Invoice: {receipt_data.get('invoice_number', 'N/A')}\n")
+    printer.text("-" * 48 + "\n")
+
+    printer.set(align='left')
+    for item in receipt_data.get('items', []):
+        printer.text(f"{item['qty']}x {item['name'][:25]}\n")
+        line2 = f"   @ {float(item['price']):.2f}"
+        total_str = f"{float(item['subtotal']):.2f}"
+        spaces = 48 - len(line2) - len(total_str)
+        printer.text(f"{line2}{' ' * max(1, spaces)}{total_str}\n")
+
+    printer.text("-" * 48 + "\n")
+    printer.set(align='right', bold=True)
+    printer.text(f"Subtotal: {float(receipt_data.get('subtotal', 0)):.2f}\n")
+    printer.text(f"GST: {float(receipt_data.get('gst_total', 0)):.2f}\n")
+    printer.set(double_height=True, double_width=True)
+    printer.text(f"TOTAL: {float(receipt_data.get('grand_total', 0)):.2f}\n")
+    printer.set(double_height=False, double_width=False)
+
+    printer.text("\n")
+    printer.set(align='center')
+    printer.text("Thank you for your purchase!\n")
+    printer.text("Please retain this receipt for returns.\n")
+    printer.text("\n\n")
+
+    inv = receipt_data.get('invoice_number', '')
+    if inv.replace('-', '').isalnum():
+        try:
+            printer.barcode(inv.replace('-', ''), 'CODE39', 64, 2, '', '')
+        except Exception:
+            pass
+    printer.cut()
+    printer.clear()
+
+
+def sample_receipt(items):
+    lines = [
+        {'name': f'Cotton T-Shirt Slim Fit #{i}', 'qty': 1 + i % 3, 'price': 499.0, 'subtotal': 499.0 * (1 + i % 3)}
+        for i in range(items)
+    ]
+    subtotal = sum(line['subtotal'] for line in lines)
+    return {
+        'invoice_number': '2026-C03-000123',
+        'subtotal': subtotal,
+        'gst_total': round(subtotal * 0.12, 2),
+        'grand_total': round(subtotal * 1.12, 2),
+        'items': lines,
+    }
+
+
+def run(label, fn, receipts, receipt):
+    printer = CountingDummy()
+    started = time.perf_counter()
+    for _ in range(receipts):
+        fn(printer, receipt)
+    elapsed = time.perf_counter() - started
+    print(
+        f"{label:<16} {elapsed / receipts * 1e6:9.1f} µs/receipt  "
+        f"{receipts / elapsed:9.0f} receipts/s  {printer.writes / receipts:6.1f} writes/receipt"
+    )
+
+
+def run_queue(jobs_count, receipt):
+    """Jobs/s through JobQueue → printer thread → one reused connection."""
+    opened = []
+
+    def factory():
+        opened.append(CountingDummy())
+        return opened[-1]
+
+    async def drive():
+        jobs = pos_agent.JobQueue(pos_agent.PrinterConnection(factory))
+        jobs.start()
+        replies = []
+
+        async def notify(reply):
+            if reply['status'] == 'success':
+                replies.append(reply['ref'])
+
+        started = time.perf_counter()
+        for i in range(jobs_count):
+            jobs.submit('print_receipt', receipt, ref=i, notify=notify)
+        await jobs.join()
+        elapsed = time.perf_counter() - started
+        await jobs.stop()
+        return replies, elapsed
+
+    replies, elapsed = asyncio.run(drive())
+    in_order = replies == list(range(jobs_count))
+    print(
+        f"{'job queue':<16} {jobs_count / elapsed:9.0f} jobs/s  "
+        f"{len(opened)} connection(s)  replies in order: {in_order}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='POS agent receipt build benchmark')
+    parser.add_argument('--receipts', type=int, default=2000)
+    parser.add_argument('--items', type=int, default=8)
+    parser.add_argument('--queue-jobs', type=int, default=500)
+    args = parser.parse_args()
+
+    receipt = sample_receipt(args.items)
+    print(f"{args.receipts} receipts × {args.items} items, Dummy printer")
+    run('per-call', print_receipt_per_call, args.receipts, receipt)
+    for width in sorted(pos_agent.WIDTH_PROFILES):
+        template = pos_agent.ReceiptTemplate(width)
+        run(f'template {width}', lambda p, r: pos_agent.print_receipt(p, r, template), args.receipts, receipt)
+    run_queue(args.queue_jobs, receipt)
+
+
+if __name__ == '__main__':
+    main()
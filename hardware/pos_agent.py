@@ -2,10 +2,27 @@
 """
 Mall Billing System - Local POS Hardware Agent
 ==============================================
-This script runs locally on the cashier's computer. It bridges the 
-cloud-based Mall Billing web app to the local USB/Network thermal 
+This script runs locally on the cashier's computer. It bridges the
+cloud-based Mall Billing web app to the local USB/Network thermal
 printer and cash drawer via a local WebSocket server.
 
+Printing never runs on the WebSocket event loop. print_receipt and
+open_drawer messages become jobs on an asyncio queue, executed one at a
+time by a single printer thread, so a slow or unplugged printer never
+delays other messages (ping answers immediately). The printer connection
+is opened once and kept; after a device error it is reopened with
+exponential backoff.
+
+Every job gets an id. The agent replies with its status as it moves
+queued → printing → success / error (with "retrying" between attempts).
+Replies echo the client's optional "ref" (e.g. the sale id).
+{"action": "job_status", "job_id": N} reports a recent job, and
+{"action": "retry", "job_id": N} re-queues a failed one.
+
+Receipts are assembled from pre-built ESC/POS byte blocks (ReceiptTemplate:
+header and footer encoded once, item lines column-aligned for the paper
+width) and sent to the printer in a single write.
+
 Install dependencies:
     pip install -r requirements.txt
 
@@ -14,134 +31,350 @@ Run:
 """
 
 import asyncio
+import functools
+import itertools
 import json
 import logging
+import textwrap
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from websockets.exceptions import ConnectionClosed
 from websockets.server import serve
 from escpos.printer import Usb, Network, Dummy
 
 # --- Configuration ---
 # Set your printer connection type here ('usb', 'network', 'dummy' for testing)
-PRINTER_TYPE = 'dummy' 
+PRINTER_TYPE = 'dummy'
 
 # If USB: Find these using `lsusb` (Linux) or Device Manager (Windows)
 USB_VENDOR_ID = 0x04b8
 USB_PRODUCT_ID = 0x0202
 
-# If Network: 
+# If Network:
 PRINTER_IP = '192.168.1.100'
 
 # WebSocket Port (must match the web app script)
 WS_PORT = 8765
 
+# Receipt paper: '58mm' (32 columns) or '80mm' (48 columns), and the
+# printer's character table
+PAPER_WIDTH = '80mm'
+RECEIPT_ENCODING = 'cp437'
+
+# Jobs: attempts per job, and seconds to wait before attempt N+1 (× N)
+JOB_MAX_ATTEMPTS = 3
+JOB_RETRY_DELAY = 1.0
+JOB_HISTORY = 500
+
+# Reconnect backoff after a printer error (seconds, doubling)
+RECONNECT_BACKOFF_MIN = 0.5
+RECONNECT_BACKOFF_MAX = 30.0
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 def get_printer():
-    """Initializes and returns the escpos printer object based on config."""
-    try:
-        if PRINTER_TYPE == 'usb':
-            # Note: On Windows, libusb is required for standard python-escpos USB support.
-            # Alternatively, you can share the printer and use win32print, but Dummy 
-            # is used here as a safe cross-platform default for demonstration.
-            return Usb(USB_VENDOR_ID, USB_PRODUCT_ID, timeout=0, in_ep=0x81, out_ep=0x03)
-        elif PRINTER_TYPE == 'network':
-            return Network(PRINTER_IP)
-        else:
-            logging.info("Using Dummy printer (output goes to console/memory only).")
-            return Dummy()
-    except Exception as e:
-        logging.error(f"Failed to connect to printer: {e}")
-        return None
+    """Opens and returns the escpos printer object based on config (raises on failure)."""
+    if PRINTER_TYPE == 'usb':
+        # Note: On Windows, libusb is required for standard python-escpos USB support.
+        # Alternatively, you can share the printer and use win32print, but Dummy
+        # is used here as a safe cross-platform default for demonstration.
+        return Usb(USB_VENDOR_ID, USB_PRODUCT_ID, timeout=0, in_ep=0x81, out_ep=0x03)
+    elif PRINTER_TYPE == 'network':
+        return Network(PRINTER_IP)
+    else:
+        logging.info("Using Dummy printer (output goes to console/memory only).")
+        return Dummy()
 
-def print_receipt(receipt_data):
-    """Formats and prints the receipt using ESC/POS."""
-    printer = get_printer()
-    if not printer:
-        return False, "Printer connection failed"
 
-    try:
-        # Header
-        printer.set(align='center', bold=True, double_height=True, double_width=True)
-        printer.text("MALL BILLING\n")
-        printer.set(align='center', bold=False, double_height=False, double_width=False)
-        printer.text("The Premiere Shopping Destination\n")
-        printer.text("123 Commerce Way, Retail District\n")
-        printer.text(f"Tax Invoice: {receipt_data.get('invoice_number', 'N/A')}\n")
-        printer.text("-" * 48 + "\n")
-
-        # Items
-        printer.set(align='left')
+class PrinterConnection:
+    """
+    One long-lived printer connection. Only the job thread touches it.
+
+    Opened on first use. When a job fails the device is closed and the
+    next job reopens it; failed opens wait an exponentially growing
+    backoff before the next attempt.
+    """
+
+    def __init__(self, factory=get_printer):
+        self._factory = factory
+        self._printer = None
+        self._failures = 0
+        self._retry_at = 0.0
+
+    def _connect(self):
+        now = time.monotonic()
+        if now < self._retry_at:
+            raise ConnectionError(f"Printer unavailable, reconnecting in {self._retry_at - now:.1f}s")
+        try:
+            self._printer = self._factory()
+        except Exception as e:
+            self._failures += 1
+            delay = min(RECONNECT_BACKOFF_MAX, RECONNECT_BACKOFF_MIN * 2 ** (self._failures - 1))
+            self._retry_at = now + delay
+            logging.error(f"Failed to connect to printer (retry in {delay:.1f}s): {e}")
+            raise ConnectionError(f"Printer connection failed: {e}")
+        self._failures = 0
+        logging.info(f"Printer connected ({type(self._printer).__name__}).")
+        return self._printer
+
+    def run(self, fn, *args):
+        """Call fn(printer, *args); on error drop the connection and re-raise."""
+        printer = self._printer or self._connect()
+        try:
+            return fn(printer, *args)
+        except Exception:
+            self.close()
+            raise
+
+    def close(self):
+        if self._printer is None:
+            return
+        try:
+            self._printer.close()
+        except Exception:
+            pass
+        self._printer = None
+
+
+def _flush_dummy(printer, label):
+    """Log (at debug level) and discard what a Dummy printer collected."""
+    if isinstance(printer, Dummy):
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug(f"--- DUMMY {label} ---\n{printer.output.decode('utf-8', errors='ignore')}")
+        printer.clear()
+
+
+# ESC/POS commands used by ReceiptTemplate
+ESC_INIT = b'\x1b@'
+ALIGN_LEFT, ALIGN_CENTER, ALIGN_RIGHT = b'\x1ba\x00', b'\x1ba\x01', b'\x1ba\x02'
+BOLD_ON, BOLD_OFF = b'\x1bE\x01', b'\x1bE\x00'
+SIZE_NORMAL, SIZE_DOUBLE = b'\x1d!\x00', b'\x1d!\x11'
+BARCODE_SETUP = b'\x1dh\x40' + b'\x1dw\x02' + b'\x1dH\x00'   # height 64, width 2, no HRI
+BARCODE_CODE39 = b'\x1dk\x04'                                  # GS k m=4 … NUL
+FEED_AND_CUT = b'\x1dVA\x03'
+
+WIDTH_PROFILES = {'58mm': 32, '80mm': 48}
+
+
+class ReceiptTemplate:
+    """
+    Receipt layout for one paper width. The static header and footer are
+    encoded once; build() only formats the per-sale lines and joins
+    everything into one buffer for a single printer write.
+    """
+
+    def __init__(self, width=PAPER_WIDTH, encoding=RECEIPT_ENCODING):
+        if width not in WIDTH_PROFILES:
+            raise ValueError(f"Unknown paper width {width!r}; use one of {sorted(WIDTH_PROFILES)}")
+        self.width = width
+        self.cols = WIDTH_PROFILES[width]
+        self.encoding = encoding
+
+        self.header = b''.join([
+            ESC_INIT,
+            ALIGN_CENTER, BOLD_ON, SIZE_DOUBLE, self._line("MALL BILLING"),
+            BOLD_OFF, SIZE_NORMAL,
+            self._wrapped("The Premiere Shopping Destination"),
+            self._wrapped("123 Commerce Way, Retail District"),
+        ])
+        self.rule = self._line("-" * self.cols)
+        self.footer = b''.join([
+            b'\n', ALIGN_CENTER,
+            self._wrapped("Thank you for your purchase!"),
+            self._wrapped("Please retain this receipt for returns."),
+            b'\n\n',
+        ])
+
+    def _encode(self, text):
+        return text.encode(self.encoding, errors='replace')
+
+    def _line(self, text):
+        return self._encode(text[:self.cols] + "\n")
+
+    def _wrapped(self, text):
+        return b''.join(self._line(part) for part in textwrap.wrap(text, self.cols))
+
+    def _columns(self, left, right):
+        left = left[:max(0, self.cols - len(right) - 1)]
+        return self._line(f"{left}{' ' * max(1, self.cols - len(left) - len(right))}{right}")
+
+    def build(self, receipt_data):
+        """ESC/POS bytes for one receipt (same fields as the checkout receipt JSON)."""
+        invoice = str(receipt_data.get('invoice_number', 'N/A'))
+        parts = [self.header, self._line(f"Tax Invoice: {invoice}"), self.rule, ALIGN_LEFT]
+
         for item in receipt_data.get('items', []):
-            # Format: 1x T-Shirt @ $20.00 = $20.00
-            line1 = f"{item['qty']}x {item['name'][:25]}"
-            printer.text(f"{line1}\n")
-            line2 = f"   @ {float(item['price']):.2f}"
-            total_str = f"{float(item['subtotal']):.2f}"
-            # Right align the total
-            spaces = 48 - len(line2) - len(total_str)
-            printer.text(f"{line2}{' ' * max(1, spaces)}{total_str}\n")
-
-        printer.text("-" * 48 + "\n")
-
-        # Totals
-        printer.set(align='right', bold=True)
-        printer.text(f"Subtotal: {float(receipt_data.get('subtotal', 0)):.2f}\n")
-        printer.text(f"GST: {float(receipt_data.get('gst_total', 0)):.2f}\n")
-        
-        printer.set(double_height=True, double_width=True)
-        printer.text(f"TOTAL: {float(receipt_data.get('grand_total', 0)):.2f}\n")
-        printer.set(double_height=False, double_width=False)
-
-        printer.text("\n")
-        printer.set(align='center')
-        printer.text("Thank you for your purchase!\n")
-        printer.text("Please retain this receipt for returns.\n")
-        printer.text("\n\n")
-
-        # Print Barcode (if invoice number is clean alphanumeric)
-        inv = receipt_data.get('invoice_number', '')
-        if inv.replace('-', '').isalnum():
-            try:
-                printer.barcode(inv.replace('-', ''), 'CODE39', 64, 2, '', '')
-            except Exception:
-                pass # skip barcode if unsupported by specific model
+            # 1x T-Shirt
+            #    @ 20.00                      20.00
+            parts.append(self._line(f"{item['qty']}x {item['name']}"))
+            parts.append(self._columns(f"   @ {float(item['price']):.2f}", f"{float(item['subtotal']):.2f}"))
 
-        # Cut paper
-        printer.cut()
-        
-        if isinstance(printer, Dummy):
-            logging.info("--- DUMMY PRINTER OUTPUT ---")
-            print(printer.output.decode('utf-8', errors='ignore'))
-            logging.info("----------------------------")
+        parts += [
+            self.rule,
+            ALIGN_RIGHT, BOLD_ON,
+            self._line(f"Subtotal: {float(receipt_data.get('subtotal', 0)):.2f}"),
+            self._line(f"GST: {float(receipt_data.get('gst_total', 0)):.2f}"),
+            SIZE_DOUBLE,
+            self._line(f"TOTAL: {float(receipt_data.get('grand_total', 0)):.2f}"[:self.cols // 2]),
+            SIZE_NORMAL, BOLD_OFF,
+            self.footer,
+        ]
 
-        printer.close()
-        return True, "Printed successfully"
+        # Barcode (if invoice number is clean alphanumeric)
+        code = invoice.replace('-', '').upper()
+        if code.isalnum() and code.isascii():
+            parts += [BARCODE_SETUP, BARCODE_CODE39, code.encode('ascii'), b'\x00', b'\n']
+
+        parts.append(FEED_AND_CUT)
+        return b''.join(parts)
+
+
+RECEIPT_TEMPLATE = ReceiptTemplate()
 
-    except Exception as e:
-        logging.error(f"Printing error: {e}")
-        return False, str(e)
 
+def print_receipt(printer, receipt_data, template=None):
+    """Prints the receipt as one ESC/POS buffer. Raises on printer errors."""
+    printer._raw((template or RECEIPT_TEMPLATE).build(receipt_data))
+    _flush_dummy(printer, 'RECEIPT')
+    return "Printed successfully"
 
-def open_cash_drawer():
+
+def open_cash_drawer(printer, _data=None):
     """Sends the standard ESC/POS pulse to kick the RJ11 cash drawer."""
-    printer = get_printer()
-    if not printer:
-        return False, "Printer connection failed"
+    # Standard kick drawer pulse
+    printer.cashdraw(2)
+    if isinstance(printer, Dummy):
+        logging.info("🔔 [DUMMY] Cash drawer kicked open!")
+    _flush_dummy(printer, 'DRAWER')
+    return "Drawer opened"
 
-    try:
-        # Standard kick drawer pulse 
-        printer.cashdraw(2)
-        
-        if isinstance(printer, Dummy):
-            logging.info("🔔 [DUMMY] Cash drawer kicked open!")
-
-        printer.close()
-        return True, "Drawer opened"
-    except Exception as e:
-        logging.error(f"Drawer error: {e}")
-        return False, str(e)
 
+JOB_ACTIONS = {
+    'print_receipt': print_receipt,
+    'open_drawer': open_cash_drawer,
+}
+
+
+class Job:
+    __slots__ = ('id', 'action', 'data', 'ref', 'notify', 'status', 'attempts', 'message')
+
+    def __init__(self, job_id, action, data, ref, notify):
+        self.id = job_id
+        self.action = action
+        self.data = data
+        self.ref = ref
+        self.notify = notify
+        self.status = 'queued'
+        self.attempts = 0
+        self.message = None
+
+    def reply(self):
+        return {
+            'job_id': self.id,
+            'action': self.action,
+            'ref': self.ref,
+            'status': self.status,
+            'attempts': self.attempts,
+            'message': self.message,
+        }
+
+
+class JobQueue:
+    """
+    FIFO of printer jobs on the event loop, executed one at a time in a
+    single worker thread (one physical printer, receipts stay in order).
+    """
+
+    def __init__(self, connection, max_attempts=JOB_MAX_ATTEMPTS, retry_delay=JOB_RETRY_DELAY):
+        self.connection = connection
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.history = OrderedDict()    # job id -> Job (most recent JOB_HISTORY)
+        self._ids = itertools.count(1)
+        self._queue = None
+        self._worker = None
+        self._executor = None
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='printer')
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        await asyncio.get_running_loop().run_in_executor(self._executor, self.connection.close)
+        self._executor.shutdown(wait=True)
+
+    @property
+    def pending(self):
+        return self._queue.qsize()
+
+    async def join(self):
+        await self._queue.join()
+
+    def submit(self, action, data=None, ref=None, notify=None):
+        """Queue a job; returns it immediately (status 'queued')."""
+        if action not in JOB_ACTIONS:
+            raise ValueError(f"Unknown action {action!r}")
+        job = Job(next(self._ids), action, data or {}, ref, notify)
+        self.history[job.id] = job
+        while len(self.history) > JOB_HISTORY:
+            self.history.popitem(last=False)
+        self._queue.put_nowait(job)
+        return job
+
+    def retry(self, job_id):
+        job = self.history.get(job_id)
+        if job is None or job.status != 'error':
+            raise ValueError(f"Job {job_id} is not a failed job")
+        job.status, job.attempts, job.message = 'queued', 0, None
+        self._queue.put_nowait(job)
+        return job
+
+    async def _update(self, job, status, message=None):
+        job.status, job.message = status, message
+        if job.notify is not None:
+            await job.notify(job.reply())
 
-async def handle_request(websocket):
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._process(job, loop)
+            except Exception as e:  # never let one job kill the worker
+                logging.error(f"Job {job.id} crashed: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _process(self, job, loop):
+        handler = JOB_ACTIONS[job.action]
+        while True:
+            job.attempts += 1
+            await self._update(job, 'printing')
+            try:
+                message = await loop.run_in_executor(
+                    self._executor, self.connection.run, handler, job.data,
+                )
+            except Exception as e:
+                logging.error(f"Job {job.id} ({job.action}) attempt {job.attempts} failed: {e}")
+                if job.attempts >= self.max_attempts:
+                    await self._update(job, 'error', str(e))
+                    return
+                await self._update(job, 'retrying', str(e))
+                await asyncio.sleep(self.retry_delay * job.attempts)
+            else:
+                await self._update(job, 'success', message)
+                return
+
+
+async def handle_request(websocket, jobs):
     """WebSocket connection handler."""
     client_ip = websocket.remote_address[0]
     logging.info(f"Client connected from {client_ip}")
@@ -152,42 +385,65 @@ async def handle_request(websocket):
         await websocket.close()
         return
 
+    async def reply(payload):
+        # Jobs outlive their connection; a closed socket just stops updates.
+        try:
+            await websocket.send(json.dumps(payload))
+        except ConnectionClosed:
+            pass
+
     try:
         async for message in websocket:
             try:
                 payload = json.loads(message)
-                action = payload.get("action")
-                
-                if action == "print_receipt":
-                    logging.info("Received print job.")
-                    success, msg = print_receipt(payload.get("data", {}))
-                    await websocket.send(json.dumps({"status": "success" if success else "error", "message": msg}))
-                
-                elif action == "open_drawer":
-                    logging.info("Received open drawer request.")
-                    success, msg = open_cash_drawer()
-                    await websocket.send(json.dumps({"status": "success" if success else "error", "message": msg}))
-                
-                elif action == "ping":
-                    await websocket.send(json.dumps({"status": "ok", "message": "pos_agent online"}))
-                
-                else:
-                    await websocket.send(json.dumps({"status": "error", "message": "Unknown action"}))
-                    
             except json.JSONDecodeError:
-                await websocket.send(json.dumps({"status": "error", "message": "Invalid JSON payload"}))
-                
+                await reply({"status": "error", "message": "Invalid JSON payload"})
+                continue
+            action = payload.get("action") if isinstance(payload, dict) else None
+
+            if action in JOB_ACTIONS:
+                job = jobs.submit(action, payload.get("data"), payload.get("ref"), reply)
+                logging.info(f"Queued job {job.id} ({action}), {jobs.pending} pending.")
+                await reply(job.reply())
+
+            elif action == "ping":
+                await reply({"status": "ok", "message": "pos_agent online", "pending": jobs.pending})
+
+            elif action == "job_status":
+                job = jobs.history.get(payload.get("job_id"))
+                if job is None:
+                    await reply({"status": "error", "message": "Unknown job"})
+                else:
+                    await reply(job.reply())
+
+            elif action == "retry":
+                try:
+                    job = jobs.retry(payload.get("job_id"))
+                except ValueError as e:
+                    await reply({"status": "error", "message": str(e)})
+                else:
+                    job.notify = reply
+                    await reply(job.reply())
+
+            else:
+                await reply({"status": "error", "message": "Unknown action"})
+
     except Exception as e:
         logging.error(f"WebSocket error: {e}")
     finally:
         logging.info("Client disconnected.")
 
 async def main():
-    async with serve(handle_request, "localhost", WS_PORT):
-        logging.info(f"🚀 POS Hardware Agent running on ws://localhost:{WS_PORT}")
-        logging.info(f"Target Printer Type: {PRINTER_TYPE.upper()}")
-        logging.info("Waiting for web app connection...")
-        await asyncio.Future()  # run forever
+    jobs = JobQueue(PrinterConnection())
+    jobs.start()
+    try:
+        async with serve(functools.partial(handle_request, jobs=jobs), "localhost", WS_PORT):
+            logging.info(f"🚀 POS Hardware Agent running on ws://localhost:{WS_PORT}")
+            logging.info(f"Target Printer Type: {PRINTER_TYPE.upper()}")
+            logging.info("Waiting for web app connection...")
+            await asyncio.Future()  # run forever
+    finally:
+        await jobs.stop()
 
 if __name__ == "__main__":
     try:
@@ -0,0 +1,104 @@
+"""
+Move invoice snapshots from sales.print_html into sale_snapshots.
+
+New sales already store their snapshot zlib-compressed in sale_snapshots
+(app/billing/snapshot.py). This back-fills the rows frozen before that
+change, in committed batches, and NULLs the inline copy so listings stop
+reading it.
+
+Reports, before and after:
+- size of sales (heap + TOAST + indexes) and of sale_snapshots
+- median time to fetch a 30-day sales listing the way the reports did
+  (SELECT sales.* … ORDER BY created_at DESC)
+
+NULLed values only become reusable space inside the table; pass --vacuum
+to return it to the OS with VACUUM FULL (takes an exclusive lock on
+sales — run it outside trading hours).
+
+Run:
+    python migrate_sale_snapshots.py [--batch-size 500] [--vacuum]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+from sqlalchemy import text
+
+os.environ['FLASK_RUN_FROM_CLI'] = '1'
+sys.path.insert(0, os.getcwd())
+
+from app import create_app, db  # noqa: E402
+from app.billing.snapshot import backfill_sale_snapshots  # noqa: E402
+
+
+REPORT_SQL = text("""
+    SELECT * FROM sales
+    WHERE created_at >= NOW() - INTERVAL '30 days'
+    ORDER BY created_at DESC
+""")
+TIMING_RUNS = 5
+
+
+def _mb(size):
+    return f"{(size or 0) / (1024 * 1024):.1f} MB"
+
+
+def measure():
+    sizes = db.session.execute(text("""
+        SELECT pg_total_relation_size('sales'),
+               pg_total_relation_size('sale_snapshots'),
+               (SELECT COUNT(*) FROM sales WHERE print_html IS NOT NULL)
+    """)).one()
+
+    timings, rows = [], 0
+    for _ in range(TIMING_RUNS):
+        started = time.perf_counter()
+        rows = len(db.session.execute(REPORT_SQL).all())
+        timings.append((time.perf_counter() - started) * 1000)
+    db.session.rollback()
+
+    return {
+        'sales_size': sizes[0],
+        'snapshots_size': sizes[1],
+        'inline': sizes[2],
+        'report_rows': rows,
+        'report_ms': statistics.median(timings),
+    }
+
+
+def print_report(label, stats):
+    print(
+        f"{label:<7} sales {_mb(stats['sales_size']):>10} | "
+        f"sale_snapshots {_mb(stats['snapshots_size']):>10} | "
+        f"inline snapshots {stats['inline']:>8} | "
+        f"30-day report {stats['report_rows']} rows in {stats['report_ms']:.1f} ms"
+    )
+
+
+def migrate_sale_snapshots(batch_size=500, vacuum=False, app=None):
+    app = app or create_app(os.environ.get('FLASK_ENV', 'development'))
+
+    with app.app_context():
+        if db.engine.dialect.name != 'postgresql':
+            raise RuntimeError('This migration requires PostgreSQL.')
+        db.create_all()   # sale_snapshots
+
+        print_report('before', measure())
+        moved = backfill_sale_snapshots(batch_size=batch_size)
+        print(f"Moved {moved} snapshots in batches of {batch_size}.")
+
+        if vacuum:
+            with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+                conn.execute(text("VACUUM (FULL, ANALYZE) sales"))
+        print_report('after', measure())
+        return moved
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--vacuum', action='store_true', help='VACUUM FULL sales afterwards')
+    args = parser.parse_args()
+    migrate_sale_snapshots(batch_size=args.batch_size, vacuum=args.vacuum)
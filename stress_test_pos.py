@@ -12,6 +12,16 @@ What it validates:
 - no HTTP 500 responses
 - no deadlock/IntegrityError markers in app logs (if log file available)
 - response-time metrics (avg / p95 / throughput)
+- checkout lock-hold window (avg / p95), read from the Server-Timing header
+  of /billing/complete: the lock … commit phases, i.e. how long each sale
+  keeps variant and invoice-sequence rows locked. Phases after commit
+  (the invoice snapshot) are reported separately; compare runs before and
+  after a change to measure the reduction.
+
+Both checkout stock modes are covered by the same invariants: run the
+server once with CHECKOUT_STOCK_MODE=lock (default) and once with
+CHECKOUT_STOCK_MODE=atomic, ideally with --hot-product-mode so every
+counter contends on the same SKUs.
 
 This script does NOT modify application code.
 """
@@ -34,8 +44,9 @@ import requests
 from sqlalchemy import create_engine, text
 
 
-INVOICE_RE = re.compile(r"Invoice\s*#\s*([0-9]{4}-[0-9]{4,})", re.IGNORECASE)
-FALLBACK_INVOICE_RE = re.compile(r"\b([0-9]{4}-[0-9]{4,})\b")
+# Matches both the global series (2026-0042) and per-counter series (2026-C03-000042).
+INVOICE_RE = re.compile(r"Invoice\s*#\s*([0-9]{4}-(?:[A-Z0-9]{1,6}-)?[0-9]{4,})", re.IGNORECASE)
+FALLBACK_INVOICE_RE = re.compile(r"\b([0-9]{4}-(?:[A-Z0-9]{1,6}-)?[0-9]{4,})\b")
 ADD_ITEM_ERROR_MARKERS = (
     "no product found",
     "out of stock",
@@ -58,6 +69,7 @@ class RequestMetric:
     ok: bool
     error: str = ""
     response_excerpt: str = ""
+    server_timing: str = ""
 
 
 @dataclass
@@ -65,6 +77,8 @@ class StressState:
     lock: threading.Lock = field(default_factory=threading.Lock)
     request_metrics: List[RequestMetric] = field(default_factory=list)
     complete_latencies_ms: List[float] = field(default_factory=list)
+    lock_hold_ms: List[float] = field(default_factory=list)
+    post_commit_ms: List[float] = field(default_factory=list)
     invoice_numbers: List[str] = field(default_factory=list)
     expected_sold_by_barcode: Counter = field(default_factory=Counter)
     successful_sales: int = 0
@@ -84,6 +98,10 @@ class StressState:
                 self.non_200_count += 1
             if metric.route == "/billing/complete":
                 self.complete_latencies_ms.append(metric.latency_ms)
+                locked, after = split_lock_window(parse_server_timing(metric.server_timing))
+                if locked is not None:
+                    self.lock_hold_ms.append(locked)
+                    self.post_commit_ms.append(after)
 
     def add_sale_success(self, invoice_number: str, sold_counter: Counter, burst: bool = False) -> None:
         with self.lock:
@@ -118,6 +136,24 @@ class StressState:
             self.sync_barrier_breaks += 1
 
 
+SERVER_TIMING_RE = re.compile(r"([A-Za-z0-9_-]+);dur=([0-9.]+)")
+
+
+def parse_server_timing(header: str) -> List[Tuple[str, float]]:
+    return [(name, float(dur)) for name, dur in SERVER_TIMING_RE.findall(header or "")]
+
+
+def split_lock_window(phases: List[Tuple[str, float]]) -> Tuple[Optional[float], float]:
+    """(ms from 'lock' through 'commit', ms after 'commit'); (None, 0) if not a checkout."""
+    names = [name for name, _ in phases]
+    if "lock" not in names or "commit" not in names:
+        return None, 0.0
+    start, end = names.index("lock"), names.index("commit")
+    locked = sum(dur for _, dur in phases[start:end + 1])
+    after = sum(dur for _, dur in phases[end + 1:])
+    return locked, after
+
+
 def percentile(values: List[float], pct: float) -> float:
     if not values:
         return 0.0
@@ -201,6 +237,11 @@ def request_with_metrics(
     try:
         resp = sess.request(method, url, timeout=timeout, allow_redirects=True, **kwargs)
         latency_ms = (time.perf_counter() - start) * 1000.0
+        # /billing/complete answers with a redirect; the timing header is on that hop.
+        server_timing = next(
+            (r.headers["Server-Timing"] for r in [*resp.history, resp] if "Server-Timing" in r.headers),
+            "",
+        )
         excerpt = ""
         if resp.status_code >= 400:
             try:
@@ -214,6 +255,7 @@ def request_with_metrics(
                 latency_ms=latency_ms,
                 ok=True,
                 response_excerpt=excerpt,
+                server_timing=server_timing,
             )
         )
         return resp
@@ -732,10 +774,17 @@ def assert_burst_sequential(burst_invoices: List[str]) -> Tuple[bool, str]:
     if len(years) != 1:
         return False, "Burst invoices span multiple years unexpectedly."
 
-    seqs = sorted(int(inv.split("-")[1]) for inv in unique)
-    for i in range(1, len(seqs)):
-        if seqs[i] != seqs[i - 1] + 1:
-            return False, "Burst invoice numbers are not contiguous."
+    # Per-counter invoice series are checked for contiguity independently.
+    seqs_by_series: Dict[str, List[int]] = {}
+    for inv in unique:
+        parts = inv.split("-")
+        series = parts[1] if len(parts) == 3 else ""
+        seqs_by_series.setdefault(series, []).append(int(parts[-1]))
+    for seqs in seqs_by_series.values():
+        seqs.sort()
+        for i in range(1, len(seqs)):
+            if seqs[i] != seqs[i - 1] + 1:
+                return False, "Burst invoice numbers are not contiguous."
     return True, "Burst invoices are sequential and contiguous."
 
 
@@ -901,6 +950,10 @@ def main() -> int:
     avg_ms = (sum(complete_lats) / len(complete_lats)) if complete_lats else 0.0
     p95_ms = percentile(complete_lats, 0.95) if complete_lats else 0.0
     throughput = (state.successful_sales / elapsed) if elapsed > 0 else 0.0
+    lock_lats = state.lock_hold_ms
+    avg_lock_ms = (sum(lock_lats) / len(lock_lats)) if lock_lats else 0.0
+    p95_lock_ms = percentile(lock_lats, 0.95) if lock_lats else 0.0
+    avg_post_commit_ms = (sum(state.post_commit_ms) / len(state.post_commit_ms)) if state.post_commit_ms else 0.0
 
     print("\n=== Final Summary ===")
     print(format_summary_row("Total sales completed:", str(state.successful_sales)))
@@ -910,6 +963,9 @@ def main() -> int:
     print(format_summary_row("Avg /billing/complete latency:", f"{avg_ms:.2f} ms"))
     print(format_summary_row("P95 /billing/complete latency:", f"{p95_ms:.2f} ms"))
     print(format_summary_row("Throughput:", f"{throughput:.2f} sales/sec"))
+    print(format_summary_row("Avg checkout lock hold:", f"{avg_lock_ms:.2f} ms"))
+    print(format_summary_row("P95 checkout lock hold:", f"{p95_lock_ms:.2f} ms"))
+    print(format_summary_row("Avg post-commit work:", f"{avg_post_commit_ms:.2f} ms"))
     print(format_summary_row("Duplicate invoices:", str(duplicate_invoices)))
     print(format_summary_row("Expected qty sold:", str(expected_total_sold)))
     print(format_summary_row("Actual stock deducted:", str(actual_total_deducted)))
@@ -0,0 +1,146 @@
+"""
+Per-scan cost of the billing cart as the basket grows.
+
+Scans N distinct apparel variants into one cart through /billing/add-item
+and records, for every scan, the request latency and the size of the
+session cookie the browser would send back on the next scan. Run once
+with CART_BACKEND='session' (legacy cookie cart) and once with 'server'
+(cart store keyed by cart_id): the cookie grows linearly in the first
+case and stays flat in the second.
+
+Run as a test:
+    pytest tasks/cart_scan_benchmark.py -q
+Or print the table:
+    python tasks/cart_scan_benchmark.py --lines 60 --every 10
+"""
+import argparse
+import importlib
+import os
+import sys
+import time
+from urllib.parse import urlsplit, urlunsplit
+
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+load_dotenv()
+
+
+def _resolve_test_database_url() -> str:
+    explicit = os.environ.get('TEST_DATABASE_URL')
+    if explicit:
+        return explicit
+    base = os.environ.get('DATABASE_URL')
+    if not base:
+        raise RuntimeError('Set TEST_DATABASE_URL or DATABASE_URL before running tests.')
+    if not base.startswith('postgresql://'):
+        raise RuntimeError('DATABASE_URL must start with postgresql://')
+    parts = urlsplit(base)
+    return urlunsplit((parts.scheme, parts.netloc, '/mall_test', parts.query, parts.fragment))
+
+
+TEST_DATABASE_URL = _resolve_test_database_url()
+
+
+def _make_app(cart_backend):
+    if not TEST_DATABASE_URL.startswith('postgresql://'):
+        raise RuntimeError('TEST_DATABASE_URL must start with postgresql://')
+    os.environ['DATABASE_URL'] = TEST_DATABASE_URL
+
+    app_mod = importlib.import_module('app')
+    from app.billing.cart_store import init_cart_store
+
+    app = app_mod.create_app('testing')
+    app.config.update(
+        TESTING=True,
+        WTF_CSRF_ENABLED=False,
+        SQLALCHEMY_DATABASE_URI=TEST_DATABASE_URL,
+        CART_BACKEND=cart_backend,
+    )
+    init_cart_store(app)
+    return app, app_mod.db
+
+
+def _seed(app, db, lines):
+    from app.auth.models import User, RoleEnum
+    from app.inventory.models import Product, ProductVariant
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        cashier = User(username='benchcashier', name='Bench Cashier', role=RoleEnum.cashier)
+        cashier.set_password('Bench123')
+        db.session.add(cashier)
+
+        product = Product(name='Cotton Kurta Regular Fit', barcode='BENCH-KURTA', gst_percent=12)
+        db.session.add(product)
+        db.session.flush()
+        for i in range(lines):
+            db.session.add(ProductVariant(
+                product_id=product.id,
+                size=('S', 'M', 'L', 'XL', 'XXL')[i % 5],
+                color=f'Shade {i:03d}',
+                barcode=f'BENCH-{i:05d}',
+                price='799.00',
+                stock=100,
+            ))
+        db.session.commit()
+
+
+def scan_basket(cart_backend, lines):
+    """
+    Seed ``lines`` variants, log in, open a session and scan each once.
+
+    Returns [(line_no, latency_ms, cookie_bytes)].
+    """
+    app, db = _make_app(cart_backend)
+    _seed(app, db, lines)
+
+    client = app.test_client()
+    client.post('/auth/login', data={'username': 'benchcashier', 'password': 'Bench123'})
+    client.post('/billing/session/open', data={'opening_cash': '100.00'})
+
+    samples = []
+    for i in range(lines):
+        start = time.perf_counter()
+        resp = client.post('/billing/add-item', data={'barcode': f'BENCH-{i:05d}'})
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if resp.status_code != 200:
+            raise RuntimeError(f'Scan {i + 1} returned {resp.status_code}')
+        cookie = client.get_cookie('session')
+        samples.append((i + 1, elapsed_ms, len(cookie.value) if cookie else 0))
+
+    with app.app_context():
+        db.session.remove()
+    return samples
+
+
+def test_server_cart_keeps_cookie_flat():
+    lines = 40
+    server = scan_basket('server', lines)
+    legacy = scan_basket('session', lines)
+
+    # Cart id only: same cookie size after the 1st and the 40th line.
+    assert server[-1][2] <= server[0][2] + 8, server
+    # Legacy cookie cart grows with every line.
+    assert legacy[-1][2] > legacy[0][2] * 2, legacy
+    assert server[-1][2] < legacy[-1][2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Cart scan cost vs basket size.')
+    parser.add_argument('--lines', type=int, default=60, help='Distinct variants to scan.')
+    parser.add_argument('--every', type=int, default=10, help='Print every Nth scan.')
+    args = parser.parse_args()
+
+    results = {backend: scan_basket(backend, args.lines) for backend in ('session', 'server')}
+
+    print(f'{"Line":<6} {"session ms":<12} {"session cookie":<16} {"server ms":<11} {"server cookie"}')
+    print('─' * 62)
+    for (n, s_ms, s_bytes), (_, r_ms, r_bytes) in zip(results['session'], results['server']):
+        if n == 1 or n % args.every == 0:
+            print(f'{n:<6} {s_ms:<12.1f} {s_bytes:<16} {r_ms:<11.1f} {r_bytes}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,211 @@
+"""
+Per-counter invoice series stress (INVOICE_SERIES_MODE = 'counter').
+
+Proves two things against PostgreSQL:
+  1. gap-freedom — N counters allocating concurrently, with some
+     transactions rolled back, leave every series contiguous from 1;
+  2. scaling — with a fixed lock-hold time per sale, wall time for the
+     global series grows with N counters while per-counter series stay
+     flat, because counters no longer queue on one row.
+
+Run as tests:
+    pytest tasks/invoice_series_stress.py -q
+Or print a scaling table:
+    python tasks/invoice_series_stress.py --counters 1 2 4 8 --sales 20 --hold-ms 20
+"""
+import argparse
+import importlib
+import os
+import sys
+import threading
+import time
+from datetime import datetime as real_datetime
+from urllib.parse import urlsplit, urlunsplit
+
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+load_dotenv()
+
+
+def _resolve_test_database_url() -> str:
+    explicit = os.environ.get('TEST_DATABASE_URL')
+    if explicit:
+        return explicit
+    base = os.environ.get('DATABASE_URL')
+    if not base:
+        raise RuntimeError('Set TEST_DATABASE_URL or DATABASE_URL before running tests.')
+    if not base.startswith('postgresql://'):
+        raise RuntimeError('DATABASE_URL must start with postgresql://')
+    parts = urlsplit(base)
+    return urlunsplit((parts.scheme, parts.netloc, '/mall_test', parts.query, parts.fragment))
+
+
+TEST_DATABASE_URL = _resolve_test_database_url()
+
+
+def _make_app():
+    if not TEST_DATABASE_URL.startswith('postgresql://'):
+        raise RuntimeError('TEST_DATABASE_URL must start with postgresql://')
+    os.environ['DATABASE_URL'] = TEST_DATABASE_URL
+
+    app_mod = importlib.import_module('app')
+    app = app_mod.create_app('testing')
+    app.config.update(
+        TESTING=True,
+        SQLALCHEMY_DATABASE_URI=TEST_DATABASE_URL,
+        INVOICE_SERIES_MODE='counter',
+    )
+    return app, app_mod.db
+
+
+def _fix_invoice_year(year):
+    import app.billing.invoice as invoice_mod
+
+    class FixedDateTime:
+        @classmethod
+        def now(cls):
+            return real_datetime(year, 1, 1, 9, 0, 0)
+
+    original = invoice_mod.datetime
+    invoice_mod.datetime = FixedDateTime
+    return lambda: setattr(invoice_mod, 'datetime', original)
+
+
+def run_counters(app, db, counters, sales_per_counter, hold_ms, per_counter=True, rollback_every=0):
+    """
+    Start ``counters`` threads that each allocate ``sales_per_counter``
+    invoice numbers, holding the sequence lock ``hold_ms`` before commit
+    (stand-in for the rest of the checkout transaction). Every
+    ``rollback_every``-th allocation is rolled back instead of committed.
+
+    Returns (committed_numbers, errors, wall_seconds).
+    """
+    from app.billing.invoice import generate_invoice_number
+
+    committed = []
+    errors = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(counters)
+
+    def worker(counter_idx):
+        series = f'C{counter_idx + 1:02d}' if per_counter else None
+        with app.app_context():
+            try:
+                barrier.wait(timeout=10)
+                for n in range(1, sales_per_counter + 1):
+                    inv = generate_invoice_number(db.session, series=series)
+                    if hold_ms:
+                        time.sleep(hold_ms / 1000.0)
+                    if rollback_every and n % rollback_every == 0:
+                        db.session.rollback()
+                        continue
+                    db.session.commit()
+                    with lock:
+                        committed.append(inv)
+            except Exception as exc:
+                db.session.rollback()
+                with lock:
+                    errors.append(exc)
+            finally:
+                db.session.remove()
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(counters)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return committed, errors, time.perf_counter() - start
+
+
+def _reset_schema(app, db):
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+
+
+def _assert_contiguous(numbers):
+    by_series = {}
+    for inv in numbers:
+        year, series, seq = inv.split('-')
+        by_series.setdefault(series, []).append(int(seq))
+    for series, seqs in by_series.items():
+        seqs.sort()
+        assert seqs == list(range(1, len(seqs) + 1)), f'Gap or duplicate in series {series}: {seqs}'
+    return by_series
+
+
+def test_counter_series_gap_free_under_concurrency_and_rollback():
+    app, db = _make_app()
+    restore = _fix_invoice_year(2027)
+    try:
+        _reset_schema(app, db)
+        committed, errors, _ = run_counters(
+            app, db, counters=4, sales_per_counter=15, hold_ms=0, rollback_every=4,
+        )
+        assert not errors
+        assert len(committed) == len(set(committed))
+        by_series = _assert_contiguous(committed)
+        assert sorted(by_series) == ['C01', 'C02', 'C03', 'C04']
+        # 15 attempts, every 4th rolled back → 12 committed, numbered 1..12
+        assert all(len(seqs) == 12 for seqs in by_series.values())
+
+        from app.billing.models import InvoiceSeriesSequence
+        with app.app_context():
+            rows = InvoiceSeriesSequence.query.filter_by(year=2027).all()
+            assert {r.series: r.last_seq for r in rows} == {s: 12 for s in by_series}
+    finally:
+        restore()
+
+
+def test_counter_series_scales_with_concurrent_counters():
+    app, db = _make_app()
+    restore = _fix_invoice_year(2027)
+    try:
+        counters, sales, hold_ms = 4, 5, 50
+
+        _reset_schema(app, db)
+        _, errors, global_wall = run_counters(app, db, counters, sales, hold_ms, per_counter=False)
+        assert not errors
+
+        _reset_schema(app, db)
+        _, errors, series_wall = run_counters(app, db, counters, sales, hold_ms, per_counter=True)
+        assert not errors
+
+        # Global: ~counters × sales × hold. Per-counter: ~sales × hold.
+        assert series_wall < global_wall * 0.6, (
+            f'per-counter {series_wall:.2f}s vs global {global_wall:.2f}s'
+        )
+    finally:
+        restore()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Invoice series scaling benchmark.')
+    parser.add_argument('--counters', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--sales', type=int, default=20, help='Allocations per counter.')
+    parser.add_argument('--hold-ms', type=int, default=20, help='Simulated lock hold per sale.')
+    args = parser.parse_args()
+
+    app, db = _make_app()
+    restore = _fix_invoice_year(2027)
+    try:
+        print(f'{"Counters":<10} {"Global (s)":<12} {"Per-counter (s)":<16} {"Speedup"}')
+        print('─' * 50)
+        for n in args.counters:
+            _reset_schema(app, db)
+            _, g_err, g_wall = run_counters(app, db, n, args.sales, args.hold_ms, per_counter=False)
+            _reset_schema(app, db)
+            committed, s_err, s_wall = run_counters(app, db, n, args.sales, args.hold_ms, per_counter=True)
+            if g_err or s_err:
+                print(f'{n:<10} errors: {g_err or s_err}')
+                continue
+            _assert_contiguous(committed)
+            print(f'{n:<10} {g_wall:<12.2f} {s_wall:<16.2f} {g_wall / s_wall:.1f}x')
+    finally:
+        restore()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""
+Promotion engine microbenchmark: 500 active promotions, 50-line carts.
+
+Compares evaluating straight from Promotion objects (params parsed and
+rules indexed on every call — roughly what every scan paid before the
+compiled set was cached) with evaluating a CompiledPromotionSet built
+once. Both paths must return identical PromoResults.
+
+No database is needed: promotions are transient ORM objects.
+
+Run as a test:
+    pytest tasks/promo_engine_benchmark.py -q
+Or print timings:
+    python tasks/promo_engine_benchmark.py --promos 500 --lines 50 --carts 200
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+CATALOGUE_SIZE = 2000
+
+
+def make_promotions(count, rng):
+    from app.promotions.models import Promotion
+
+    promos = []
+    for i in range(count):
+        roll = rng.random()
+        if roll < 0.4:
+            promo_type = 'percentage_item'
+            params = {'product_ids': rng.sample(range(1, CATALOGUE_SIZE + 1), rng.randint(1, 3)),
+                      'percent': rng.choice([5, 10, 15, 20])}
+        elif roll < 0.7:
+            promo_type = 'fixed_item'
+            params = {'product_ids': rng.sample(range(1, CATALOGUE_SIZE + 1), rng.randint(1, 3)),
+                      'amount': rng.choice([10, 25, 50])}
+        elif roll < 0.95:
+            promo_type = 'buy_x_get_y'
+            params = {'product_id': rng.randint(1, CATALOGUE_SIZE), 'buy_qty': 2, 'free_qty': 1}
+        else:
+            promo_type = 'bill_percentage'
+            params = {'percent': rng.choice([2, 5])}
+        promos.append(Promotion(
+            id=i + 1,
+            name=f'Promo {i + 1}',
+            promo_type=promo_type,
+            params=json.dumps(params),
+            is_active=True,
+            stackable=rng.random() < 0.7,
+            current_uses=0,
+        ))
+    return promos
+
+
+def make_cart(lines, rng):
+    cart = {}
+    for variant_id, product_id in enumerate(rng.sample(range(1, CATALOGUE_SIZE + 1), lines), start=1):
+        cart[str(variant_id)] = {
+            'product_id': product_id,
+            'name': f'Product {product_id}',
+            'price': str(Decimal(rng.randint(99, 2999)).quantize(Decimal('0.01'))),
+            'quantity': rng.randint(1, 4),
+            'gst_percent': 12,
+        }
+    return cart
+
+
+def run(promo_count=500, lines=50, carts=200, seed=7):
+    """Return (uncompiled_us, compiled_us, compile_ms) per evaluation."""
+    from app.promotions.engine import compile_promotions, evaluate_promotions
+
+    rng = random.Random(seed)
+    promos = make_promotions(promo_count, rng)
+    baskets = [make_cart(lines, rng) for _ in range(carts)]
+
+    start = time.perf_counter()
+    compiled = compile_promotions(promos)
+    compile_ms = (time.perf_counter() - start) * 1000
+
+    for cart in baskets:
+        assert evaluate_promotions(cart, promos) == evaluate_promotions(cart, compiled)
+
+    start = time.perf_counter()
+    for cart in baskets:
+        evaluate_promotions(cart, promos)
+    uncompiled_us = (time.perf_counter() - start) / carts * 1e6
+
+    start = time.perf_counter()
+    for cart in baskets:
+        evaluate_promotions(cart, compiled)
+    compiled_us = (time.perf_counter() - start) / carts * 1e6
+
+    return uncompiled_us, compiled_us, compile_ms
+
+
+def test_compiled_set_matches_and_is_faster():
+    uncompiled_us, compiled_us, _ = run(promo_count=500, lines=50, carts=50)
+    assert compiled_us * 5 < uncompiled_us, (uncompiled_us, compiled_us)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Promotion engine microbenchmark.')
+    parser.add_argument('--promos', type=int, default=500)
+    parser.add_argument('--lines', type=int, default=50)
+    parser.add_argument('--carts', type=int, default=200)
+    args = parser.parse_args()
+
+    uncompiled_us, compiled_us, compile_ms = run(args.promos, args.lines, args.carts)
+    print(f'{args.promos} promotions, {args.lines}-line carts, {args.carts} carts')
+    print('─' * 50)
+    print(f'{"Compile once":<28} {compile_ms:>10.2f} ms')
+    print(f'{"Evaluate (uncompiled)":<28} {uncompiled_us:>10.1f} µs/cart')
+    print(f'{"Evaluate (compiled set)":<28} {compiled_us:>10.1f} µs/cart')
+    print(f'{"Speedup":<28} {uncompiled_us / compiled_us:>10.1f}x')
+
+
+if __name__ == '__main__':
+    main()
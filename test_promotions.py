@@ -300,3 +300,49 @@ def test_applied_promo_persisted_on_sale(client):
         assert result.total_discount == Decimal('10.00')
         assert result.discounted_total == Decimal('90.00')
         assert len(result.applied) == 1
+
+
+# ── 10. Compiled promotion set: index + invalidation ─────────────
+
+def test_compiled_set_indexes_and_invalidates(client):
+    from app.billing.checkout import increment_promotion_uses
+    from app.promotions.cache import get_compiled_promotions
+
+    with client.application.app_context():
+        rice = make_product(name='Rice', price='100.00')
+        dal = make_product(name='Dal', price='50.00')
+        item_promo = make_promo(
+            name='Rice 10%', promo_type='percentage_item',
+            params=json.dumps({'product_ids': [rice.id], 'percent': 10}),
+        )
+        make_promo(name='Bill 5%', promo_type='bill_percentage', params=json.dumps({'percent': 5}))
+        capped = make_promo(
+            name='Dal ₹5', promo_type='fixed_item',
+            params=json.dumps({'product_ids': [dal.id], 'amount': 5}),
+            max_uses=1,
+        )
+
+        compiled = get_compiled_promotions()
+        assert len(compiled) == 3
+        assert set(compiled.by_product) == {str(rice.id), str(dal.id)}
+        assert [r.name for r in compiled.bill_level] == ['Bill 5%']
+        assert get_compiled_promotions() is compiled   # reused until something changes
+
+        # Same answer as evaluating the ORM objects directly.
+        cart = {**cart_from(rice, qty=2), **cart_from(dal, qty=1)}
+        promos = Promotion.query.order_by(Promotion.id).all()
+        assert evaluate_promotions(cart, compiled) == evaluate_promotions(cart, promos)
+
+        # Toggling a promotion through the ORM invalidates the set on commit.
+        item_promo.is_active = False
+        db.session.commit()
+        compiled = get_compiled_promotions()
+        assert len(compiled) == 2
+        assert str(rice.id) not in compiled.by_product
+
+        # A sale that uses up max_uses drops the promotion as well.
+        increment_promotion_uses(db.session, [capped.id])
+        db.session.commit()
+        compiled = get_compiled_promotions()
+        assert len(compiled) == 1
+        assert compiled.by_product == {}
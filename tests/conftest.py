@@ -1,7 +1,7 @@
 import os
 import pytest
 from sqlalchemy import text
-from app import create_app, db
+from app import create_app, db, cache
 
 # Force testing configuration
 os.environ['TEST_MODE'] = 'True'
@@ -43,6 +43,9 @@ def cleanup_db(_db, app):
             _db.session.execute(table.delete())
         _db.session.commit()
         _db.session.remove()
+        # Products are recreated with new ids; drop cached barcode snapshots.
+        cache.clear()
+        app.extensions['barcode_cache'].clear()
 
 @pytest.fixture(scope='function')
 def db_session(_db, app):
@@ -1,6 +1,8 @@
 import pytest
+from decimal import Decimal
 from app.inventory.models import Product, ProductVariant
 from app.billing.models import Sale, SaleItem
+from app.billing.cart import load_cart
 from sqlalchemy.orm import joinedload
 
 @pytest.fixture(scope='function')
@@ -39,14 +41,17 @@ def test_add_item_to_cart(client, cashier_user, setup_cart_items):
     assert resp2.status_code == 200
     
     with client.session_transaction() as sess:
-        cart = sess.get('cart', {})
-        # Re-fetch or use ID directly to avoid DetachedInstanceError
-        v1_id = v1.id
-        v2_id = v2.id
-        assert str(v1_id) in cart
-        assert str(v2_id) in cart
-        assert cart[str(v1_id)]['quantity'] == 1
-        assert cart[str(v2_id)]['quantity'] == 1
+        cart_id = sess.get('cart_id')
+        # The cookie only carries the cart id; the lines live in the cart store
+        assert 'cart' not in sess
+    cart = load_cart(cart_id)
+    # Re-fetch or use ID directly to avoid DetachedInstanceError
+    v1_id = v1.id
+    v2_id = v2.id
+    assert str(v1_id) in cart
+    assert str(v2_id) in cart
+    assert cart[str(v1_id)]['quantity'] == 1
+    assert cart[str(v2_id)]['quantity'] == 1
 
 def test_checkout_math_and_stock_deduction(client, cashier_user, db_session, setup_cart_items):
     """Test full checkout flow, verifying GST calculation, Subtotals, and Stock deductions."""
@@ -134,3 +139,718 @@ def test_checkout_insufficient_stock(client, cashier_user, db_session, setup_car
     
     # Verify target variant re-fetched successfully
     assert v1_reloaded.barcode == 'A1'
+
+
+def _server_timing_statements(header):
+    """Parse 'lock;dur=1.2;desc="1q", …' into {'lock': 1, …}."""
+    phases = {}
+    for part in header.split(','):
+        name, _dur, desc = part.strip().split(';')
+        phases[name] = int(desc.split('=', 1)[1].strip('"q'))
+    return phases
+
+def test_counter_invoice_series_numbers_each_counter_sequentially(app, client, cashier_user, db_session, setup_cart_items, monkeypatch):
+    """INVOICE_SERIES_MODE='counter': sales on one counter number 000001, 000002… on that counter's own row."""
+    from datetime import datetime
+    from app.billing.models import InvoiceSequence, InvoiceSeriesSequence
+
+    monkeypatch.setitem(app.config, 'INVOICE_SERIES_MODE', 'counter')
+    client.post('/auth/login', data={'username': 'testcashier', 'password': 'Cashier123'})
+    client.post('/billing/session/open', data={'opening_cash': '100.00', 'counter_code': 'c03'})
+    for _ in range(2):
+        client.post('/billing/add-item', data={'barcode': 'A1'})
+        client.post('/billing/complete', data={'payment_cash': '1.00'})
+
+    year = datetime.now().year
+    db_session.remove()
+    numbers = [s.invoice_number for s in db_session.query(Sale).order_by(Sale.id)]
+    assert numbers == [f'{year}-C03-000001', f'{year}-C03-000002']
+
+    row = db_session.get(InvoiceSeriesSequence, (year, 'C03'))
+    assert row.last_seq == 2
+    assert db_session.query(InvoiceSeriesSequence).count() == 1
+    assert db_session.query(InvoiceSequence).count() == 0   # the store-wide series is untouched
+
+def test_counter_invoice_series_restarts_each_year(app, db_session, monkeypatch):
+    """A counter's series starts again at 000001 on 1 January, on a new (year, series) row."""
+    from datetime import datetime
+    from app.billing import invoice
+    from app.billing.models import InvoiceSeriesSequence
+
+    clock = {'now': datetime(2026, 12, 31, 23, 59)}
+
+    class FrozenDatetime(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return clock['now']
+
+    monkeypatch.setattr(invoice, 'datetime', FrozenDatetime)
+
+    assert invoice.generate_invoice_number(db_session, 'C01') == '2026-C01-000001'
+    assert invoice.generate_invoice_number(db_session, 'C01') == '2026-C01-000002'
+    clock['now'] = datetime(2027, 1, 1, 0, 1)
+    assert invoice.generate_invoice_number(db_session, 'C01') == '2027-C01-000001'
+    assert invoice.generate_invoice_number(db_session, 'C02') == '2027-C02-000001'
+    db_session.commit()
+
+    rows = {(r.year, r.series): r.last_seq for r in db_session.query(InvoiceSeriesSequence)}
+    assert rows == {(2026, 'C01'): 2, (2027, 'C01'): 1, (2027, 'C02'): 1}
+
+def test_checkout_round_trips_independent_of_basket_size(client, cashier_user, db_session):
+    """Statements issued during checkout must not grow with the number of cart lines."""
+    for i in range(6):
+        p = Product(name=f'Shirt {i}', barcode=f'RT{i}', gst_percent=5)
+        db_session.add(p)
+        db_session.flush()
+        db_session.add(ProductVariant(
+            product_id=p.id, size='M', color='Blue', barcode=f'RT{i}', price='100.00', stock=20
+        ))
+    db_session.commit()
+
+    client.post('/auth/login', data={'username': 'testcashier', 'password': 'Cashier123'})
+    client.post('/billing/session/open', data={'opening_cash': '100.00'})
+
+    def checkout(barcodes):
+        for bc in barcodes:
+            client.post('/billing/add-item', data={'barcode': bc})
+        resp = client.post('/billing/complete', data={})
+        assert resp.status_code == 302
+        return _server_timing_statements(resp.headers['Server-Timing'])
+
+    small = checkout(['RT0'])
+    large = checkout([f'RT{i}' for i in range(1, 6)])
+
+    assert small['lock'] == 1
+    assert large['lock'] == 1
+    assert small['persist'] == large['persist']
+    assert sum(small.values()) == sum(large.values())
+
+    db_session.remove()
+    sale = db_session.query(Sale).options(joinedload(Sale.items)).order_by(Sale.id.desc()).first()
+    assert len(sale.items) == 5
+    assert len(sale.payments) == 1
+
+def test_atomic_stock_mode_deducts_and_rejects(app, client, cashier_user, db_session, setup_cart_items, monkeypatch):
+    """CHECKOUT_STOCK_MODE='atomic' deducts with one conditional UPDATE and refuses oversells."""
+    monkeypatch.setitem(app.config, 'CHECKOUT_STOCK_MODE', 'atomic')
+    v1, v2 = setup_cart_items
+    v1_id, v2_id = v1.id, v2.id
+
+    client.post('/auth/login', data={'username': 'testcashier', 'password': 'Cashier123'})
+    client.post('/billing/session/open', data={'opening_cash': '100.00'})
+
+    client.post('/billing/add-item', data={'barcode': 'A1'})
+    client.post('/billing/add-item', data={'barcode': 'A1'})
+    client.post('/billing/add-item', data={'barcode': 'C1'})
+    resp = client.post('/billing/complete', data={'payment_cash': '13.80'})
+    assert resp.status_code == 302
+
+    db_session.remove()
+    assert db_session.get(ProductVariant, v1_id).stock == 48
+    assert db_session.get(ProductVariant, v2_id).stock == 49
+
+    # Another counter sells the last units between scan and checkout.
+    client.post('/billing/add-item', data={'barcode': 'A1'})
+    client.post('/billing/add-item', data={'barcode': 'C1'})
+    db_session.get(ProductVariant, v1_id).stock = 0
+    db_session.commit()
+    db_session.remove()
+
+    response = client.post('/billing/complete', data={}, follow_redirects=True)
+    assert b'Insufficient stock' in response.data
+
+    db_session.remove()
+    assert db_session.query(Sale).count() == 1
+    assert db_session.get(ProductVariant, v1_id).stock == 0
+    assert db_session.get(ProductVariant, v2_id).stock == 49   # partial decrement rolled back
+
+def test_cart_running_totals_match_full_recompute(app, db_session, setup_cart_items):
+    """Per-line updates keep Cart totals equal to pricing every line from scratch."""
+    from app.billing.cart import (
+        get_cart, add_to_cart, update_cart_quantity, remove_from_cart, cart_totals,
+    )
+    v1, v2 = setup_cart_items
+
+    with app.test_request_context():
+        add_to_cart(v1)
+        add_to_cart(v2)
+        add_to_cart(v2)
+        update_cart_quantity(v1.id, 7)
+        cart = get_cart()
+        assert cart.version == 4
+        assert cart_totals(cart) == cart_totals(dict(cart))
+        assert cart_totals(cart)['grand_total'] == Decimal('30.60')   # 7×1.00 + 2×10.00×1.18
+
+        remove_from_cart(v2.id)
+        cart = get_cart()
+        assert cart.version == 5
+        assert cart_totals(cart) == cart_totals(dict(cart))
+        assert cart[str(v1.id)]['line_subtotal'] == '7.00'
+
+def test_cart_kept_in_session_while_store_unavailable(app, db_session, setup_cart_items, monkeypatch):
+    """A failed store write keeps the cart in the cookie; it moves back once the store answers."""
+    from flask import session
+    from app.billing.cart import get_cart, add_to_cart
+
+    v1, v2 = setup_cart_items
+    store = app.extensions['cart_store']
+
+    with app.test_request_context():
+        monkeypatch.setattr(store, 'save', lambda cart_id, cart: False)
+        add_to_cart(v1)
+        add_to_cart(v2)
+        assert set(session['cart']) == {str(v1.id), str(v2.id)}
+
+        monkeypatch.undo()
+        assert set(get_cart()) == {str(v1.id), str(v2.id)}
+        assert 'cart' not in session
+        assert set(load_cart(session['cart_id'])) == {str(v1.id), str(v2.id)}
+
+def test_promo_result_reused_until_cart_or_promotions_change(app, db_session, setup_cart_items, monkeypatch):
+    """The cart's PromoResult is served from cache until the cart version or promotion set moves."""
+    import app.promotions.engine as engine
+    from app.billing.cart import get_cart, add_to_cart
+    from app.billing.routes import _get_promo_result
+    from app.promotions.cache import invalidate_promotions
+
+    calls = []
+    real = engine.evaluate_promotions
+    monkeypatch.setattr(engine, 'evaluate_promotions', lambda *a: calls.append(1) or real(*a))
+    v1, _ = setup_cart_items
+
+    with app.test_request_context():
+        add_to_cart(v1)
+        first = _get_promo_result(get_cart())
+        again = _get_promo_result(get_cart())
+        assert len(calls) == 1
+        assert again.original_total == first.original_total == Decimal('1.00')
+
+        add_to_cart(v1)
+        assert _get_promo_result(get_cart()).original_total == Decimal('2.00')
+        assert len(calls) == 2
+
+        invalidate_promotions()
+        _get_promo_result(get_cart())
+        assert len(calls) == 3
+
+        _get_promo_result(get_cart(), use_cache=False)
+        assert len(calls) == 4
+
+def test_invoice_snapshot_frozen_after_commit(client, cashier_user, db_session, setup_cart_items):
+    """The snapshot is rendered after the sale commits and reprint serves it unchanged."""
+    client.post('/auth/login', data={'username': 'testcashier', 'password': 'Cashier123'})
+    client.post('/billing/session/open', data={'opening_cash': '100.00'})
+    client.post('/billing/add-item', data={'barcode': 'A1'})
+    resp = client.post('/billing/complete', data={'payment_cash': '1.00'})
+    assert resp.status_code == 302
+
+    phases = list(_server_timing_statements(resp.headers['Server-Timing']))
+    assert phases.index('snapshot') > phases.index('commit')
+
+    db_session.remove()
+    sale = db_session.query(Sale).order_by(Sale.id.desc()).first()
+    assert sale.print_html and sale.invoice_number in sale.print_html
+    frozen = sale.print_html
+
+    client.post(f'/billing/mark-printed/{sale.id}')
+    assert client.get(f'/billing/reprint/{sale.id}').get_data(as_text=True) == frozen
+
+    # Stored compressed, outside the sales row.
+    assert sale.snapshot.raw_size > len(sale.snapshot.body)
+    assert sale.legacy_print_html is None
+
+    # A sale whose post-commit freeze never happened is frozen on first reprint.
+    db_session.delete(sale.snapshot)
+    db_session.commit()
+    first = client.get(f'/billing/reprint/{sale.id}').get_data(as_text=True)
+    assert first == frozen
+    assert client.get(f'/billing/reprint/{sale.id}').get_data(as_text=True) == first
+
+def test_legacy_invoice_snapshots_backfilled(client, cashier_user, db_session, setup_cart_items):
+    """Inline sales.print_html rows move to sale_snapshots and reprint unchanged."""
+    from app.billing.snapshot import backfill_sale_snapshots
+
+    client.post('/auth/login', data={'username': 'testcashier', 'password': 'Cashier123'})
+    client.post('/billing/session/open', data={'opening_cash': '100.00'})
+    client.post('/billing/add-item', data={'barcode': 'A1'})
+    client.post('/billing/complete', data={'payment_cash': '1.00'})
+
+    db_session.remove()
+    sale = db_session.query(Sale).order_by(Sale.id.desc()).first()
+    legacy = '<html>legacy invoice</html>'
+    db_session.delete(sale.snapshot)
+    sale.legacy_print_html = legacy
+    db_session.commit()
+    assert client.get(f'/billing/reprint/{sale.id}').get_data(as_text=True) == legacy
+
+    assert backfill_sale_snapshots(batch_size=1) == 1
+    db_session.remove()
+    sale = db_session.get(Sale, sale.id)
+    assert sale.legacy_print_html is None
+    assert sale.print_html == legacy
+    assert client.get(f'/billing/reprint/{sale.id}').get_data(as_text=True) == legacy
+
+def test_sale_events_applied_once(client, cashier_user, db_session, setup_cart_items):
+    """Side effects go through the outbox and a redelivered event is a no-op."""
+    from app.billing.events import process_event, process_sale_events
+    from app.billing.models import CashSession, SaleEvent
+
+    client.post('/auth/login', data={'username': 'testcashier', 'password': 'Cashier123'})
+    client.post('/billing/session/open', data={'opening_cash': '100.00'})
+    client.post('/billing/add-item', data={'barcode': 'A1'})
+    resp = client.post('/billing/complete', data={'payment_cash': '1.00'})
+    assert resp.status_code == 302
+
+    db_session.remove()
+    events = db_session.query(SaleEvent).order_by(SaleEvent.id).all()
+    assert {e.event_type for e in events} == {'inventory.broadcast', 'rollups.sale', 'cash_session.add_revenue'}
+    assert all(e.processed_at is not None for e in events)   # TestingConfig runs them inline
+
+    # At-least-once delivery: the worker and the sweeper may both see an event.
+    assert not any(process_event(e) for e in events)
+    assert process_sale_events() == 0
+
+    db_session.remove()
+    cash = db_session.query(CashSession).one()
+    assert cash.system_total == Decimal('1.00')
+
+def test_scan_skips_identity_queries_once_cached(app, client, cashier_user, db_session, setup_cart_items):
+    """A repeat scan issues only its own lookups: no users / cash_sessions queries."""
+    from sqlalchemy import event
+    from app import db
+
+    client.post('/auth/login', data={'username': 'testcashier', 'password': 'Cashier123'})
+    client.post('/billing/session/open', data={'opening_cash': '100.00'})
+    client.post('/billing/add-item', data={'barcode': 'A1'})   # warms every cache
+
+    statements = []
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        resp = client.post('/billing/add-item', data={'barcode': 'A1'})
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+
+    assert resp.status_code == 200
+    assert b'Test Cashier' in resp.data
+    assert not [s for s in statements if 'FROM users' in s or 'FROM cash_sessions' in s]
+    assert len(statements) <= 2, statements   # variant + stock map
+
+    # Closing the session is picked up immediately, not after the TTL.
+    client.post('/billing/session/close', data={'closing_cash': '101.00'})
+    resp = client.post('/billing/add-item', data={'barcode': 'A1'})
+    assert resp.status_code == 302
+    assert '/billing/session/open' in resp.headers['Location']
+
+def test_cart_api_returns_only_changed_lines(client, cashier_user, db_session, setup_cart_items):
+    """JSON scans answer with the touched line; a stale token gets every line."""
+    client.post('/auth/login', data={'username': 'testcashier', 'password': 'Cashier123'})
+    client.post('/billing/session/open', data={'opening_cash': '100.00'})
+
+    first = client.post('/billing/api/cart/add', data={'barcode': 'A1', 'token': ''}).get_json()
+    assert first['full'] is False
+    assert [line['id'] for line in first['lines']] == [str(setup_cart_items[0].id)]
+    assert first['totals']['subtotal'] == '1.00'
+
+    second = client.post('/billing/api/cart/add', data={'barcode': 'C1', 'token': first['token']}).get_json()
+    assert second['full'] is False
+    assert [line['barcode'] for line in second['lines']] == ['C1']
+    assert second['totals'] == {
+        'items': 2, 'subtotal': '11.00', 'base_gst': '1.80', 'gst': '1.80',
+        'promo_discount': '0.00', 'payable': '12.80',
+    }
+
+    c1_id = second['lines'][0]['id']
+    removed = client.post('/billing/api/cart/remove', data={'variant_id': c1_id, 'token': second['token']}).get_json()
+    assert removed['lines'] == [] and removed['removed'] == [c1_id]
+
+    bad = client.post('/billing/api/cart/add', data={'barcode': 'NOPE', 'token': removed['token']}).get_json()
+    assert bad['error'] and bad['lines'] == [] and bad['token'] == removed['token']
+
+    stale = client.post('/billing/api/cart/update', data={
+        'variant_id': first['lines'][0]['id'], 'action': 'incr', 'token': first['token'],
+    }).get_json()
+    assert stale['full'] is True
+    assert [line['quantity'] for line in stale['lines']] == [2]
+
+    assert client.get('/billing/api/cart').get_json()['full'] is True
+
+def test_warm_scan_resolves_without_database(client, cashier_user, db_session, setup_cart_items):
+    """Barcode snapshots serve repeat scans; invalidation picks up edits."""
+    from sqlalchemy import event
+    from app import db
+    from app.inventory.barcode_cache import invalidate_barcodes
+
+    client.post('/auth/login', data={'username': 'testcashier', 'password': 'Cashier123'})
+    client.post('/billing/session/open', data={'opening_cash': '100.00'})
+    token = client.post('/billing/api/cart/add', data={'barcode': 'A1'}).get_json()['token']
+
+    statements = []
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        data = client.post('/billing/api/cart/add', data={'barcode': 'A1', 'token': token}).get_json()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    assert data['lines'][0]['quantity'] == 2
+    assert statements == []
+
+    v1 = db_session.get(ProductVariant, setup_cart_items[0].id)
+    v1.price = Decimal('2.50')
+    db_session.commit()
+    invalidate_barcodes('A1')
+    client.post('/billing/new-sale')
+    data = client.post('/billing/api/cart/add', data={'barcode': 'A1'}).get_json()
+    assert data['lines'][0]['price'] == '2.50'
+
+    # A stale stock hint is re-checked before a scan is refused.
+    v1 = db_session.get(ProductVariant, setup_cart_items[0].id)
+    v1.stock = 1
+    db_session.commit()
+    invalidate_barcodes('A1')
+    client.post('/billing/new-sale')
+    data = client.post('/billing/api/cart/add', data={'barcode': 'A1'}).get_json()   # hint: 1 in stock
+    v1 = db_session.get(ProductVariant, setup_cart_items[0].id)
+    v1.stock = 5   # restocked without invalidating
+    db_session.commit()
+    data = client.post('/billing/api/cart/add', data={'barcode': 'A1', 'token': data['token']}).get_json()
+    assert data['error'] is None
+    assert data['lines'][0]['quantity'] == 2
+
+def test_cart_api_add_many_applies_batch(client, cashier_user, db_session, setup_cart_items):
+    """A scan burst lands in one request; refused lines are reported per barcode."""
+    client.post('/auth/login', data={'username': 'testcashier', 'password': 'Cashier123'})
+    client.post('/billing/session/open', data={'opening_cash': '100.00'})
+
+    data = client.post('/billing/api/cart/add-many', json={
+        'items': [{'barcode': 'A1', 'qty': 3}, 'NOPE', 'C1', {'barcode': 'C1', 'qty': 60}],
+        'token': '',
+    }).get_json()
+
+    assert {line['barcode']: line['quantity'] for line in data['lines']} == {'A1': 3, 'C1': 1}
+    assert [(e['index'], e['barcode']) for e in data['errors']] == [(1, 'NOPE'), (3, 'C1')]
+    assert data['error'].endswith('(+1 more)')
+    assert data['totals']['subtotal'] == '13.00'
+
+    bad = client.post('/billing/api/cart/add-many', json={'items': []})
+    assert bad.status_code == 400
+
+def test_checkout_retry_with_idempotency_key_returns_original_sale(client, cashier_user, db_session, setup_cart_items):
+    """A resubmitted checkout with the same key never bills twice."""
+    client.post('/auth/login', data={'username': 'testcashier', 'password': 'Cashier123'})
+    client.post('/billing/session/open', data={'opening_cash': '100.00'})
+    client.post('/billing/add-item', data={'barcode': 'A1'})
+
+    first = client.post('/billing/complete', data={'payment_cash': '1.00', 'idempotency_key': 'retry-1'})
+    assert first.status_code == 302
+
+    # Retry after a lost response, with the cart restored on the terminal.
+    client.post('/billing/add-item', data={'barcode': 'A1'})
+    retry = client.post(
+        '/billing/complete', data={'payment_cash': '1.00'},
+        headers={'Idempotency-Key': 'retry-1', 'Accept': 'application/json'},
+    )
+    data = retry.get_json()
+    assert data['replayed'] is True
+    assert first.headers['Location'].endswith(data['redirect'])
+    assert [item['qty'] for item in data['receipt']['items']] == [1]
+
+    db_session.remove()
+    assert db_session.query(Sale).count() == 1
+    assert db_session.get(ProductVariant, setup_cart_items[0].id).stock == 49
+    assert client.post('/billing/complete', data={'idempotency_key': 'retry-2'}).status_code == 302
+    assert db_session.query(Sale).count() == 1   # cart was cleared by the replay
+
+def test_offline_sync_records_batch_and_reports_conflicts(client, cashier_user, db_session, setup_cart_items):
+    """Queued offline sales land in one batch at their captured prices; stock conflicts and repeats are reported per sale."""
+    from datetime import datetime, timedelta
+    from app.inventory.models import CatalogChange
+
+    v1, v2 = setup_cart_items
+    client.post('/auth/login', data={'username': 'testcashier', 'password': 'Cashier123'})
+    early = {'key': 'off-0', 'items': [{'variant_id': v1.id, 'qty': 1}], 'payments': {'cash': '1.00'}}
+    assert client.post('/billing/api/sync', json={'sales': [early]}).get_json()['results'][0]['status'] == 'conflict'
+    client.post('/billing/session/open', data={'opening_cash': '100.00'})
+
+    # Apple was served at 1.20 (version `served`) before dropping back to 1.00.
+    served = CatalogChange(product_id=v1.product_id, variant_id=v1.id, price=Decimal('1.20'))
+    db_session.add(served)
+    db_session.flush()
+    db_session.add(CatalogChange(product_id=v1.product_id, variant_id=v1.id, price=Decimal('1.00')))
+    db_session.commit()
+    served = served.id
+
+    captured_at = datetime.utcnow()
+    batch = {'sales': [
+        {'key': 'off-1', 'captured_at': captured_at.isoformat() + 'Z',
+         'items': [{'variant_id': v1.id, 'qty': 2, 'price': '1.00'}, {'variant_id': v2.id, 'qty': 1, 'price': '10.00'}],
+         'payments': {'cash': '14.00'}},
+        {'key': 'off-2', 'items': [{'variant_id': v2.id, 'qty': 60}], 'payments': {'cash': '800'}},
+        {'key': 'off-3', 'items': [{'variant_id': v1.id, 'qty': 1}], 'payments': {'cash': '0.50'}},
+        {'key': 'off-4', 'items': []},
+        {'key': 'off-5', 'catalog_version': served,
+         'items': [{'variant_id': v1.id, 'qty': 1, 'price': '1.20'}], 'payments': {'cash': '1.20'}},
+        {'key': 'off-6', 'items': [{'variant_id': v1.id, 'qty': 1, 'price': '0.50'}], 'payments': {'cash': '0.50'}},
+        {'key': 'off-7', 'items': [{'variant_id': v1.id, 'qty': 1, 'price': '9.00'}], 'payments': {'cash': '9.00'}},
+        {'key': 'off-8', 'captured_at': (captured_at - timedelta(days=3)).isoformat(),
+         'items': [{'variant_id': v1.id, 'qty': 1}], 'payments': {'cash': '1.00'}},
+    ]}
+    results = client.post('/billing/api/sync', json=batch).get_json()['results']
+    assert [r['status'] for r in results] == [
+        'recorded', 'conflict', 'rejected', 'rejected', 'recorded', 'recorded', 'rejected', 'rejected',
+    ]
+    assert 'Insufficient stock' in results[1]['error']
+    assert 'above every catalog price' in results[6]['error']
+    assert 'open cash session' in results[7]['error']
+
+    db_session.remove()
+    sale = db_session.query(Sale).filter_by(idempotency_key='off-1').one()
+    assert sale.grand_total == Decimal('13.80')
+    assert sale.created_at == captured_at
+    served_sale = db_session.query(Sale).filter_by(idempotency_key='off-5').one()
+    assert (served_sale.grand_total, served_sale.discount_amount) == (Decimal('1.20'), Decimal('0.00'))
+    assert served_sale.items[0].price_at_sale == Decimal('1.20')
+    cut = db_session.query(Sale).filter_by(idempotency_key='off-6').one()
+    assert (cut.grand_total, cut.discount_amount) == (Decimal('0.50'), Decimal('0.50'))
+    assert (cut.items[0].price_at_sale, cut.items[0].subtotal) == (Decimal('1.00'), Decimal('0.50'))
+    assert db_session.get(ProductVariant, v1.id).stock == 46
+
+    again = client.post('/billing/api/sync', json={'sales': batch['sales'][:1]}).get_json()['results']
+    assert again == [dict(results[0], status='duplicate')]
+    assert db_session.query(Sale).count() == 3
+
+def test_print_jobs_pushed_and_acked_in_batches(app, client, cashier_user, db_session, setup_cart_items):
+    """A committed sale is pushed to the cashier's print room; one ack marks the batch printed."""
+    from app import socketio
+
+    client.post('/auth/login', data={'username': 'testcashier', 'password': 'Cashier123'})
+    client.post('/billing/session/open', data={'opening_cash': '100.00'})
+    sio = socketio.test_client(app, flask_test_client=client)
+
+    assert sio.emit('print_subscribe', {}, callback=True)['ok'] is True
+    backlog = [m for m in sio.get_received() if m['name'] == 'print_backlog']
+    assert backlog[0]['args'][0]['jobs'] == []
+
+    sale_ids = []
+    for _ in range(2):
+        client.post('/billing/add-item', data={'barcode': 'A1'})
+        client.post('/billing/complete', data={'payment_cash': '1.00'})
+        jobs = [m['args'][0] for m in sio.get_received() if m['name'] == 'print_job']
+        assert len(jobs) == 1 and jobs[0]['items'][0]['name'] == 'Apple'
+        sale_ids.append(jobs[0]['sale_id'])
+
+    reply = sio.emit('print_ack', {'sale_ids': sale_ids}, callback=True)
+    assert reply == {'ok': True, 'sale_ids': sorted(sale_ids)}
+    assert any(m['name'] == 'print_done' for m in sio.get_received())
+
+    db_session.remove()
+    assert db_session.query(Sale).filter(Sale.id.in_(sale_ids), Sale.is_printed.is_(True)).count() == 2
+    assert sio.emit('print_ack', {'sale_ids': sale_ids}, callback=True)['sale_ids'] == []
+    assert sio.emit('print_ack', {'sale_ids': []}, callback=True)['ok'] is False
+    sio.disconnect()
+
+
+def test_print_jobs_scoped_to_own_sales_unless_admin_asks_for_all(app, client, admin_user, cashier_user, db_session, setup_cart_items):
+    """Billing screens relay only their own receipts; print:all is opt-in and admin-only."""
+    from app import socketio
+
+    client.post('/auth/login', data={'username': 'testcashier', 'password': 'Cashier123'})
+    client.post('/billing/session/open', data={'opening_cash': '100.00'})
+    client.post('/billing/add-item', data={'barcode': 'A1'})
+    client.post('/billing/complete', data={'payment_cash': '1.00'})
+    sale_id = db_session.query(Sale.id).scalar()
+
+    sio = socketio.test_client(app, flask_test_client=client)
+    assert sio.emit('print_subscribe', {'scope': 'all'}, callback=True)['ok'] is False
+    sio.disconnect()
+
+    client.get('/auth/logout')
+    client.post('/auth/login', data={'username': 'testadmin', 'password': 'Admin123'})
+    sio = socketio.test_client(app, flask_test_client=client)
+    sio.emit('print_subscribe', {}, callback=True)
+    assert [m['args'][0]['jobs'] for m in sio.get_received() if m['name'] == 'print_backlog'] == [[]]
+    assert sio.emit('print_ack', {'sale_ids': [sale_id]}, callback=True)['sale_ids'] == []
+
+    assert sio.emit('print_subscribe', {'scope': 'all'}, callback=True)['room'] == 'print:all'
+    backlog = [m['args'][0]['jobs'] for m in sio.get_received() if m['name'] == 'print_backlog']
+    assert [job['sale_id'] for job in backlog[0]] == [sale_id]
+    sio.disconnect()
+
+    assert client.post(f'/billing/mark-printed/{sale_id}').get_json() == {'sale_ids': [sale_id]}
+    assert client.post(f'/billing/mark-printed/{sale_id}').get_json() == {'sale_ids': []}
+
+
+def test_sales_rollups_follow_sales_and_returns(client, admin_user, cashier_user, db_session, setup_cart_items):
+    """Sales and returns reach the rollups via the outbox; a rebuild reproduces them exactly."""
+    from app.reporting.models import ItemDailyRollup, PaymentHourlyRollup, SalesHourlyRollup
+    from app.reporting.rollups import rebuild_rollups, verify_rollups
+
+    client.post('/auth/login', data={'username': 'testcashier', 'password': 'Cashier123'})
+    client.post('/billing/session/open', data={'opening_cash': '100.00'})
+    for barcode in ('A1', 'A1', 'C1'):
+        client.post('/billing/add-item', data={'barcode': barcode})
+    assert client.post('/billing/complete', data={'payment_cash': '20.00'}).status_code == 302
+
+    db_session.remove()
+    sale = db_session.query(Sale).one()
+    apple = next(i for i in sale.items if i.snapshot_size == 'D' and i.quantity == 2)
+    client.post(f'/billing/returns/process/{sale.id}', data={
+        'refund_method': 'cash', f'qty_{apple.id}': '1',
+    })
+
+    def snapshot():
+        db_session.remove()
+        hourly = db_session.query(SalesHourlyRollup).one()
+        payments = db_session.query(PaymentHourlyRollup).all()
+        items = {r.product_id: r for r in db_session.query(ItemDailyRollup)}
+        return (
+            (hourly.sales_count, hourly.grand_total, hourly.returns_count, hourly.refunded_amount),
+            sorted((p.payment_method, p.payments_count, p.amount) for p in payments),
+            {pid: (r.quantity, r.net_sales, r.gross_sales, r.returned_qty) for pid, r in items.items()},
+        )
+
+    incremental = snapshot()
+    assert incremental[0] == (1, Decimal('13.80'), 1, Decimal('1.00'))
+    assert incremental[1] == [('cash', 1, Decimal('13.80'))]
+    assert incremental[2][apple.product_id] == (2, Decimal('2.00'), Decimal('2.0000'), 1)
+    assert verify_rollups() == []
+
+    db_session.query(ItemDailyRollup).delete()
+    db_session.commit()
+    assert verify_rollups()
+    rebuild_rollups()
+    assert snapshot() == incremental
+    assert verify_rollups() == []
+
+    client.get('/auth/logout')
+    client.post('/auth/login', data={'username': 'testadmin', 'password': 'Admin123'})
+    data = client.get('/reporting/api/payment-methods?days=1').get_json()
+    assert data == {'labels': ['Cash'], 'values': [13.8]}
+
+
+def test_rollup_backfill_fills_history_older_than_rollups(client, cashier_user, db_session, setup_cart_items):
+    """Sales from before the rollups existed are filled in day by day; a finished backfill re-checks one day."""
+    from datetime import timedelta
+    from app.reporting.models import ItemDailyRollup, PaymentHourlyRollup, SalesHourlyRollup
+    from app.reporting.rollups import backfill_rollups, verify_rollups
+
+    client.post('/auth/login', data={'username': 'testcashier', 'password': 'Cashier123'})
+    client.post('/billing/session/open', data={'opening_cash': '100.00'})
+
+    def sell():
+        client.post('/billing/add-item', data={'barcode': 'A1'})
+        client.post('/billing/complete', data={'payment_cash': '1.00'})
+        db_session.remove()
+
+    sell()
+    old = db_session.query(Sale).one()
+    old.created_at -= timedelta(days=3)
+    for model in (SalesHourlyRollup, PaymentHourlyRollup, ItemDailyRollup):
+        db_session.query(model).delete()
+    db_session.commit()
+    sell()   # rollups now start today; the older sale is missing from them
+
+    assert verify_rollups()
+    assert backfill_rollups() == 4
+    assert verify_rollups() == []
+    assert backfill_rollups() == 1
+
+
+def test_report_ranges_cut_on_store_days(app, cashier_user, db_session, monkeypatch):
+    """Store days become half-open UTC bounds; rollups bucket on the same local day/hour."""
+    from datetime import date, datetime
+    from app.reporting.models import SalesHourlyRollup
+    from app.reporting.query import DateRange
+    from app.reporting.rollups import rebuild_rollups
+
+    monkeypatch.setitem(app.config, 'STORE_TIMEZONE', 'Asia/Kolkata')
+    # 20:00 UTC on 1 March is 01:30 on 2 March in the store.
+    sale = Sale(invoice_number='TZ-1', cashier_id=cashier_user.id, total_amount=Decimal('10.00'),
+                gst_total=Decimal('0.00'), grand_total=Decimal('10.00'),
+                created_at=datetime(2026, 3, 1, 20, 0))
+    db_session.add(sale)
+    db_session.commit()
+
+    march_2 = DateRange(date(2026, 3, 2), date(2026, 3, 2))
+    assert march_2.start_at == datetime(2026, 3, 1, 18, 30)
+    assert march_2.end_at == datetime(2026, 3, 2, 18, 30)
+    assert db_session.query(Sale).filter(*march_2.filter(Sale.created_at)).count() == 1
+    assert db_session.query(Sale).filter(*DateRange(None, date(2026, 3, 1)).filter(Sale.created_at)).count() == 0
+
+    rebuild_rollups()
+    row = db_session.query(SalesHourlyRollup).one()
+    assert (row.day, row.hour, row.sales_count) == (date(2026, 3, 2), 1, 1)
+
+
+def test_csv_exports_stream_plain_and_gzipped(client, admin_user, cashier_user, db_session, setup_cart_items):
+    """Exports aggregate in SQL, honour Accept-Encoding and include the GST line-item export."""
+    import csv
+    import gzip
+    import io
+
+    client.post('/auth/login', data={'username': 'testcashier', 'password': 'Cashier123'})
+    client.post('/billing/session/open', data={'opening_cash': '100.00'})
+    for barcode in ('A1', 'A1', 'C1'):
+        client.post('/billing/add-item', data={'barcode': barcode})
+    client.post('/billing/complete', data={'payment_cash': '20.00'})
+    client.get('/auth/logout')
+    client.post('/auth/login', data={'username': 'testadmin', 'password': 'Admin123'})
+
+    plain = client.get('/reporting/export/sales')
+    assert 'Content-Encoding' not in plain.headers
+    sales = list(csv.reader(io.StringIO(plain.get_data(as_text=True))))
+    assert sales[0][-1] == 'Items'
+    assert [row[-1] for row in sales[1:]] == ['3']
+
+    gst = client.get('/reporting/export/gst', headers={'Accept-Encoding': 'gzip'})
+    assert gst.headers['Content-Encoding'] == 'gzip'
+    lines = list(csv.reader(io.StringIO(gzip.decompress(gst.data).decode('utf-8'))))
+    assert [(r[2], r[6], r[8], r[10], r[11]) for r in lines[1:]] == [
+        ('A1', '2', '2.00', '0.00', '2.00'),
+        ('C1', '1', '10.00', '1.80', '11.80'),
+    ]
+
+    summary = client.get('/reports/export.csv')
+    rows = list(csv.reader(io.StringIO(summary.get_data(as_text=True))))
+    assert rows[1][3] == cashier_user.name
+    assert rows[1][-1] == '13.80'
+
+    assert client.get('/reporting/export/unknown').status_code == 404
+
+
+def test_apparel_summary_single_query_cached_per_range(client, cashier_user, db_session, setup_cart_items):
+    """GROUPING SETS breakdowns and matrix; a new sale or a regrouped product refreshes the cached summary."""
+    from app.reporting.apparel import apparel_summary, invalidate_apparel_cache
+    from app.reporting.query import last_days
+
+    cake_id = setup_cart_items[1].product_id
+
+    client.post('/auth/login', data={'username': 'testcashier', 'password': 'Cashier123'})
+    client.post('/billing/session/open', data={'opening_cash': '100.00'})
+
+    def sell(*barcodes):
+        for barcode in barcodes:
+            client.post('/billing/add-item', data={'barcode': barcode})
+        client.post('/billing/complete', data={'payment_cash': '50.00'})
+        db_session.remove()
+
+    sell('A1', 'A1', 'C1')
+    summary = apparel_summary(last_days(1))
+    assert summary['sizes'] == [{'size': 'D', 'units_sold': 3, 'gross_sales': Decimal('13.8000')}]
+    assert summary['brands'][0]['brand'] == 'Unbranded'
+    assert summary['categories'][0]['units_sold'] == 3
+    assert summary['matrix'] == {'sizes': ['D'], 'colors': ['D'], 'cells': {('D', 'D'): 3}}
+
+    sell('C1')
+    assert apparel_summary(last_days(1))['sizes'][0]['units_sold'] == 4
+
+    db_session.get(Product, cake_id).brand = 'Bakery'
+    db_session.commit()
+    assert [row['brand'] for row in apparel_summary(last_days(1))['brands']] == ['Unbranded']
+    invalidate_apparel_cache()
+    brands = apparel_summary(last_days(1))['brands']
+    assert [row['brand'] for row in brands] == ['Bakery', 'Unbranded']   # by gross sales: 23.60, 2.00
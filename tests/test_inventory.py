@@ -73,3 +73,65 @@ def test_delete_product(client, admin_user, db_session):
     db_session.remove()
     p_deleted = db_session.get(Product, product_id)
     assert p_deleted.is_active is False
+
+def test_catalog_snapshot_and_delta_feed(client, admin_user, db_session):
+    """Terminals get an ETag-versioned snapshot, then only the variants that changed."""
+    import gzip
+    import json
+
+    client.post('/auth/login', data={'username': 'testadmin', 'password': 'Admin123'})
+    p = Product(name='Shirt', barcode='SHIRT', gst_percent=5)
+    db_session.add(p)
+    db_session.commit()
+    for size, barcode in (('M', 'SH-M'), ('L', 'SH-L')):
+        client.post(f'/inventory/{p.id}/variants/add', data={
+            'size': size, 'color': 'Blue', 'barcode': barcode, 'price': '499.00', 'stock': '10',
+        })
+
+    full = client.get('/inventory/api/catalog', headers={'Accept-Encoding': 'gzip'})
+    assert full.headers['Content-Encoding'] == 'gzip'
+    snapshot = json.loads(gzip.decompress(full.data))
+    assert snapshot['full'] is True
+    assert sorted(row[1] for row in snapshot['items']) == ['SH-L', 'SH-M']
+    assert client.get('/inventory/api/catalog', headers={'If-None-Match': full.headers['ETag']}).status_code == 304
+
+    version = snapshot['version']
+    unchanged = client.get(f'/inventory/api/catalog?since={version}').get_json()
+    assert unchanged['items'] == [] and unchanged['removed'] == []
+
+    medium = db_session.query(ProductVariant).filter_by(barcode='SH-M').one()
+    large = db_session.query(ProductVariant).filter_by(barcode='SH-L').one()
+    client.post(f'/inventory/{p.id}/variants/{medium.id}/edit', data={
+        'size': 'M', 'color': 'Blue', 'barcode': 'SH-M2', 'price': '449.00', 'stock': '10',
+    })
+    client.post(f'/inventory/{p.id}/variants/{large.id}/delete')
+
+    delta = client.get(f'/inventory/api/catalog?since={version}').get_json()
+    assert delta['full'] is False and delta['version'] > version
+    assert [(row[0], row[1], row[5]) for row in delta['items']] == [(medium.id, 'SH-M2', '449.00')]
+    assert delta['removed'] == [large.id]
+
+
+def test_label_sheet_draws_each_variant_once(client, admin_user, db_session):
+    """A bulk sheet lays out every copy but draws each variant's label a single time."""
+    client.post('/auth/login', data={'username': 'testadmin', 'password': 'Admin123'})
+    p = Product(name='Label Tee', gst_percent=5)
+    db_session.add(p)
+    db_session.commit()
+    v1 = ProductVariant(product_id=p.id, size='M', color='Red', barcode='890100000001', price='299.00', stock=10)
+    v2 = ProductVariant(product_id=p.id, size='L', color='Red', barcode='LBL-TEE-L', price='299.00', stock=10)
+    db_session.add_all([v1, v2])
+    db_session.commit()
+
+    resp = client.post('/inventory/labels', data={
+        'variant_id': [v1.id, v2.id], 'copies': ['30', '10'], 'layout': 'a4',
+    })
+    assert resp.status_code == 200
+    assert resp.mimetype == 'application/pdf'
+    pdf = resp.get_data()
+    assert pdf.startswith(b'%PDF')
+    assert pdf.count(b'/Subtype /Form') == 2
+    assert pdf.count(b'/Type /Page') - pdf.count(b'/Type /Pages') == 2   # 40 labels, 36 per page
+
+    resp = client.post('/inventory/labels', data={'variant_id': [v1.id], 'copies': ['0']})
+    assert resp.status_code == 302
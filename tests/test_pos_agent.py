@@ -0,0 +1,110 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+pytest.importorskip('escpos')
+pytest.importorskip('websockets')
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'hardware'))
+import pos_agent  # noqa: E402
+from escpos.printer import Dummy  # noqa: E402
+
+
+RECEIPT = {
+    'invoice_number': '2026-0001',
+    'subtotal': 99.0,
+    'gst_total': 1.0,
+    'grand_total': 100.0,
+    'items': [{'name': 'Test Item', 'qty': 1, 'price': 99.0, 'subtotal': 99.0}] * 5,
+}
+
+
+def test_agent_job_queue_on_one_connection():
+    """Receipts run off the event loop on one reused Dummy connection, replies in order.
+
+    Throughput is measured by hardware/bench_receipts.py, not asserted here.
+    """
+    opened = []
+
+    def factory():
+        opened.append(Dummy())
+        return opened[-1]
+
+    async def run():
+        jobs = pos_agent.JobQueue(pos_agent.PrinterConnection(factory))
+        jobs.start()
+        replies = []
+
+        async def notify(reply):
+            replies.append(reply)
+
+        submitted = [jobs.submit('print_receipt', RECEIPT, ref=i, notify=notify) for i in range(500)]
+        # The loop stays free while the printer thread works.
+        assert jobs.pending > 0
+        await jobs.join()
+        await jobs.stop()
+        return submitted, replies
+
+    submitted, replies = asyncio.run(run())
+
+    assert len(opened) == 1
+    assert all(job.status == 'success' for job in submitted)
+    assert [r['ref'] for r in replies if r['status'] == 'success'] == list(range(500))
+
+
+def test_agent_retries_then_reconnects():
+    """A failing device is closed, reopened with backoff and the job retried."""
+    calls = {'open': 0}
+
+    class Flaky(Dummy):
+        def cashdraw(self, pin):
+            if calls['open'] == 1:
+                raise OSError('paper jam')
+            return super().cashdraw(pin)
+
+    def factory():
+        calls['open'] += 1
+        return Flaky()
+
+    async def run():
+        jobs = pos_agent.JobQueue(pos_agent.PrinterConnection(factory), retry_delay=0.01)
+        jobs.start()
+        statuses = []
+
+        async def notify(reply):
+            statuses.append(reply['status'])
+
+        job = jobs.submit('open_drawer', notify=notify)
+        await jobs.join()
+        await jobs.stop()
+        return job, statuses
+
+    job, statuses = asyncio.run(run())
+    assert statuses == ['printing', 'retrying', 'printing', 'success']
+    assert job.attempts == 2 and calls['open'] == 2
+
+
+@pytest.mark.parametrize('width,cols', [('58mm', 32), ('80mm', 48)])
+def test_receipt_template_single_write(width, cols):
+    """A receipt is one pre-assembled buffer, column-aligned for the paper width."""
+    writes = []
+
+    class Counting(Dummy):
+        def _raw(self, msg):
+            writes.append(msg)
+            super()._raw(msg)
+
+    template = pos_agent.ReceiptTemplate(width)
+    receipt = dict(RECEIPT, items=[{'name': 'X' * 80, 'qty': 2, 'price': 12.5, 'subtotal': 25.0}])
+    pos_agent.print_receipt(Counting(), receipt, template)
+
+    assert len(writes) == 1
+    body = writes[0]
+    assert body.startswith(template.header)
+    assert b'Tax Invoice: 2026-0001\n' in body and template.footer in body
+    text_lines = [line for line in body.split(b'\n') if b'\x1b' not in line and b'\x1d' not in line]
+    assert all(len(line) <= cols for line in text_lines)
+    assert b'   @ 12.50' + b' ' * (cols - 10 - 5) + b'25.00\n' in body
+    assert b'\x1dk\x04' + b'20260001' + b'\x00' in body
@@ -0,0 +1,46 @@
+from flask import g
+from sqlalchemy import create_engine, select, update
+from sqlalchemy.pool import NullPool
+
+from app import db
+from app.billing.models import Sale
+from app.utils.replica import REPLICA_BIND, ReplicaHealth, _is_read
+
+
+def test_replica_health_checks_lag_and_reachability(app):
+    """A primary reports no replay lag; an unreachable replica falls back; results are cached."""
+    health = ReplicaHealth(app, max_lag=30, check_every=60)
+    assert health.usable(db.engine) is True
+
+    health.mark_down('test')
+    assert health.usable(db.engine) is False   # until the next check is due
+
+    unreachable = create_engine('postgresql://nobody@127.0.0.1:1/none', connect_args={'connect_timeout': 1})
+    assert ReplicaHealth(app, max_lag=30, check_every=0).usable(unreachable) is False
+
+
+def test_only_plain_selects_go_to_replica():
+    assert _is_read(select(Sale.id))
+    assert not _is_read(select(Sale.id).with_for_update())
+    assert not _is_read(Sale.__table__.update().values(is_printed=True))
+    assert not _is_read(None)
+
+
+def test_report_reads_bound_to_replica_writes_to_primary(app, monkeypatch):
+    """Inside a request that opted in, SELECTs use the replica bind; DML and other requests stay on the primary."""
+    replica = create_engine(app.config['SQLALCHEMY_DATABASE_URI'], poolclass=NullPool)
+    monkeypatch.setitem(db.engines, REPLICA_BIND, replica)
+
+    with app.app_context():
+        session = db.session()
+        read, write = select(Sale.id), update(Sale).values(is_printed=True)
+        assert session.get_bind(clause=read) is db.engine
+
+        g.reporting_replica = True
+        assert session.get_bind(clause=read) is replica
+        assert session.get_bind(clause=read.with_for_update()) is db.engine
+        assert session.get_bind(clause=write) is db.engine
+        assert session.get_bind(mapper=Sale.__mapper__) is db.engine
+        assert db.session.execute(read).all() == []
+        db.session.remove()
+    replica.dispose()
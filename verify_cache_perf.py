@@ -1,7 +1,7 @@
 import time
-from app import create_app, db, cache
+from app import create_app
 from app.inventory.models import ProductVariant
-from decimal import Decimal
+from app.inventory.barcode_cache import get_variant_snapshot, invalidate_barcodes
 
 def benchmark_lookup():
     app = create_app('development')
@@ -12,44 +12,41 @@ def benchmark_lookup():
         if not variant:
             print("No active variants found in DB. Please add one first.")
             return
-        
+
         barcode = variant.barcode
-        cache_key = f"barcode_lookup_{barcode}"
-        
-        # 1. Clear Cache to ensure clean start
-        cache.delete(cache_key)
+        barcode_cache = app.extensions['barcode_cache']
+
+        # 1. Clear both tiers to ensure clean start
+        invalidate_barcodes(barcode)
         print(f"Testing Barcode: {barcode} ({variant.product.name} - {variant.size}/{variant.color})")
         print("-" * 50)
 
-        # 2. Database Hit (First Lookup)
+        # 2. Database Hit (First Lookup) — same path as billing/routes.py
         start_time = time.time()
-        # Simulated lookup logic from billing/routes.py
-        cached_val = cache.get(cache_key)
-        if cached_val is None:
-            v = ProductVariant.query.filter_by(barcode=barcode, is_active=True).first()
-            if v:
-                cache.set(cache_key, v, timeout=3600)
+        get_variant_snapshot(barcode)
         db_time = (time.time() - start_time) * 1000
-        print(f"1st Lookup (DB Hit):    {db_time:.2f} ms")
+        print(f"1st Lookup (DB Hit):       {db_time:.2f} ms")
 
-        # 3. Cache Hit (Second Lookup)
+        # 3. Shared cache hit (what another worker sees first)
+        barcode_cache.clear()
         start_time = time.time()
-        cached_val = cache.get(cache_key)
-        if cached_val is None:
-            v = ProductVariant.query.filter_by(barcode=barcode, is_active=True).first()
-            cache.set(cache_key, v, timeout=3600)
+        get_variant_snapshot(barcode)
+        shared_time = (time.time() - start_time) * 1000
+        print(f"2nd Lookup (Shared Cache): {shared_time:.2f} ms")
+
+        # 4. In-process hit (every later scan on this worker)
+        start_time = time.time()
+        get_variant_snapshot(barcode)
         cache_time = (time.time() - start_time) * 1000
-        print(f"2nd Lookup (Cache Hit): {cache_time:.2f} ms")
+        print(f"3rd Lookup (In-Process):   {cache_time:.2f} ms")
 
-        # 4. Invalidation Check
-        cache.delete(cache_key)
+        # 5. Invalidation Check
+        invalidate_barcodes(barcode)
         start_time = time.time()
-        cached_val = cache.get(cache_key)
-        if cached_val is None:
-            v = ProductVariant.query.filter_by(barcode=barcode, is_active=True).first()
+        get_variant_snapshot(barcode)
         invalidation_time = (time.time() - start_time) * 1000
-        print(f"3rd Lookup (After Del): {invalidation_time:.2f} ms")
-        
+        print(f"4th Lookup (After Del):    {invalidation_time:.2f} ms")
+
         print("-" * 50)
         improvement = ((db_time - cache_time) / db_time) * 100
         print(f"Performance Gain: {improvement:.1f}%")